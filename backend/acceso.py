@@ -0,0 +1,290 @@
+"""
+Decisiones de acceso a espacios desde un índice en memoria
+
+Reglas de autorización:
+- El responsable (persona) de una sede puede entrar a todos sus espacios.
+- Un usuario con al menos un rol puede entrar a los espacios de las sedes de
+  su empresa.
+- Los usuarios cuya persona o empresa está inactiva no entran a ningún
+  espacio (igual que en el login, aunque aún tengan un token vigente).
+
+El índice guarda usuario -> (empresa con acceso, sedes como responsable) y
+espacio -> (sede, empresa), así que cada decisión son dos búsquedas en
+diccionarios. Se reconstruye en segundo plano cuando se confirman cambios en
+las tablas de las que depende y, para ver los cambios hechos por otros
+workers, cuando pasan RECARGA_SEGUNDOS desde la última carga; mientras tanto
+se responde con la versión anterior.
+
+Los accesos concedidos se escriben en lotes desde otro hilo. Si un lote
+falla por una fila inválida (p. ej. el espacio se borró entre la decisión y
+la escritura) se reintenta fila a fila y las filas rechazadas se descartan y
+se registran en el log; si falla por otra causa (base caída) se reintenta
+hasta MAX_REINTENTOS veces antes de descartarlo.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+
+from backend import invalidacion, models
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE = int(os.getenv("ACCESO_TAMANO_LOTE", "500"))
+INTERVALO_ESCRITURA = float(os.getenv("ACCESO_INTERVALO_ESCRITURA_MS", "200")) / 1000
+MAX_REINTENTOS = int(os.getenv("ACCESO_MAX_REINTENTOS", "5"))
+MAX_PENDIENTES = int(os.getenv("ACCESO_MAX_PENDIENTES", "100000"))
+
+# Segundos tras los que se recarga el índice desde la BD (cambios de otros workers)
+RECARGA_SEGUNDOS = float(os.getenv("ACCESO_RECARGA_SEGUNDOS", "30"))
+
+# Tablas cuyo cambio invalida el índice de autorización
+_TABLAS_AUTORIZACION = (models.Usuario, models.UsuarioRol, models.Persona, models.Empresa, models.Sede,
+                        models.Bloque, models.Espacio)
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    usuarios: Dict[int, Tuple[Optional[int], FrozenSet[int]]]
+    espacios: Dict[int, Tuple[int, int]]
+
+
+@dataclass
+class Decision:
+    permitido: bool
+    motivo: str
+
+
+class IndiceAutorizacion:
+    def __init__(self, fabrica_sesiones=None):
+        self._fabrica_sesiones = fabrica_sesiones
+        self._snapshot: Optional[_Snapshot] = None
+        self._cargado_en: Optional[float] = None
+        self._sucio = threading.Event()
+        self._lock = threading.Lock()
+        self._reconstruyendo = False
+
+    def configurar(self, fabrica_sesiones):
+        self._fabrica_sesiones = fabrica_sesiones
+
+    @staticmethod
+    def construir(db_session: Session) -> _Snapshot:
+        sedes_responsable: Dict[int, set] = {}
+        espacios = {}
+        filas = (db_session.query(models.Espacio.id, models.Sede.id, models.Sede.empresa_id,
+                                  models.Sede.responsable_id)
+                 .join(models.Bloque, models.Espacio.bloque_id == models.Bloque.id)
+                 .join(models.Sede, models.Bloque.sede_id == models.Sede.id))
+        for espacio_id, sede_id, empresa_id, responsable_id in filas:
+            espacios[espacio_id] = (sede_id, empresa_id)
+            if responsable_id is not None:
+                sedes_responsable.setdefault(responsable_id, set()).add(sede_id)
+        con_rol = {usuario_id for (usuario_id,) in db_session.query(models.UsuarioRol.usuario_id).distinct()}
+        usuarios = {}
+        activos = (db_session.query(models.Usuario.id, models.Usuario.persona_id, models.Usuario.empresa_id)
+                   .join(models.Persona, models.Persona.id == models.Usuario.persona_id)
+                   .join(models.Empresa, models.Empresa.id == models.Usuario.empresa_id)
+                   .filter(models.Persona.activo.isnot(False), models.Empresa.activo.isnot(False)))
+        for usuario_id, persona_id, empresa_id in activos:
+            usuarios[usuario_id] = (empresa_id if usuario_id in con_rol else None,
+                                    frozenset(sedes_responsable.get(persona_id, ())))
+        return _Snapshot(usuarios=usuarios, espacios=espacios)
+
+    def cargar(self, db_session: Optional[Session] = None):
+        self._sucio.clear()
+        if db_session is not None:
+            self._snapshot = self.construir(db_session)
+        else:
+            with self._fabrica_sesiones() as sesion:
+                self._snapshot = self.construir(sesion)
+        self._cargado_en = time.monotonic()
+
+    def vencido(self) -> bool:
+        return (self._cargado_en is not None and RECARGA_SEGUNDOS > 0
+                and time.monotonic() - self._cargado_en > RECARGA_SEGUNDOS)
+
+    def invalidar(self):
+        """Marca el índice para reconstruirse en segundo plano"""
+        if self._snapshot is None:
+            return
+        with self._lock:
+            self._sucio.set()
+            if not self._reconstruyendo:
+                self._reconstruyendo = True
+                threading.Thread(target=self._reconstruir, name="indice-acceso", daemon=True).start()
+
+    def _reconstruir(self):
+        while True:
+            with self._lock:
+                if not self._sucio.is_set():
+                    self._reconstruyendo = False
+                    return
+            try:
+                self.cargar()
+            except Exception:
+                logger.exception("Error reconstruyendo el índice de acceso")
+                with self._lock:
+                    self._reconstruyendo = False
+                return
+
+    def decidir(self, usuario_id: int, espacio_id: int, db_session: Optional[Session] = None) -> Decision:
+        if self._snapshot is None:
+            self.cargar(db_session)
+        elif self.vencido() and not self._reconstruyendo:
+            self.invalidar()
+        snapshot = self._snapshot
+        espacio = snapshot.espacios.get(espacio_id)
+        if espacio is None:
+            return Decision(False, "Espacio no encontrado")
+        usuario = snapshot.usuarios.get(usuario_id)
+        if usuario is None:
+            return Decision(False, "Usuario no encontrado")
+        sede_id, empresa_id = espacio
+        empresa_con_rol, sedes_responsable = usuario
+        if sede_id in sedes_responsable:
+            return Decision(True, "Responsable de la sede")
+        if empresa_con_rol == empresa_id:
+            return Decision(True, "Rol en la empresa")
+        return Decision(False, "Sin permiso para el espacio")
+
+
+class EscritorAccesos:
+    """Acumula eventos de AccesoEspacio y los inserta en lotes"""
+
+    def __init__(self, fabrica_sesiones=None, tamano_lote: int = TAMANO_LOTE,
+                 intervalo: float = INTERVALO_ESCRITURA, max_reintentos: int = MAX_REINTENTOS,
+                 max_pendientes: int = MAX_PENDIENTES):
+        self._fabrica_sesiones = fabrica_sesiones
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self.max_reintentos = max_reintentos
+        self.descartados = 0
+        self._cola: "queue.Queue[dict]" = queue.Queue(maxsize=max_pendientes)
+        self._hilo: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+
+    def configurar(self, fabrica_sesiones):
+        self._fabrica_sesiones = fabrica_sesiones
+
+    def registrar(self, usuario_id: int, espacio_id: int, metodo_acceso: Optional[str]):
+        evento = {"usuario_id": usuario_id, "espacio_id": espacio_id,
+                  "fecha_acceso": datetime.utcnow(), "metodo_acceso": metodo_acceso}
+        try:
+            self._cola.put_nowait(evento)
+        except queue.Full:
+            self.descartados += 1
+            logger.error("Cola de accesos llena (%d); se descarta %s", self._cola.maxsize, evento)
+        if self._hilo is None or not self._hilo.is_alive():
+            self.iniciar()
+
+    def iniciar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._detener.clear()
+                self._hilo = threading.Thread(target=self._ejecutar, name="escritor-accesos", daemon=True)
+                self._hilo.start()
+
+    def detener(self):
+        """Escribe lo pendiente y termina el hilo"""
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+        self.vaciar()
+
+    def pendientes(self) -> int:
+        return self._cola.qsize()
+
+    def _tomar_lote(self, espera: float) -> List[dict]:
+        lote = []
+        try:
+            lote.append(self._cola.get(timeout=espera))
+            while len(lote) < self.tamano_lote:
+                lote.append(self._cola.get_nowait())
+        except queue.Empty:
+            pass
+        return lote
+
+    def _escribir(self, lote: List[dict]):
+        try:
+            with self._fabrica_sesiones() as sesion:
+                sesion.execute(insert(models.AccesoEspacio), lote)
+                sesion.commit()
+        except (IntegrityError, DataError):
+            self._escribir_por_fila(lote)
+
+    def _escribir_por_fila(self, lote: List[dict]):
+        """Inserta cada fila en su propio SAVEPOINT; descarta y registra las que la base rechaza"""
+        with self._fabrica_sesiones() as sesion:
+            for evento in lote:
+                try:
+                    with sesion.begin_nested():
+                        sesion.execute(insert(models.AccesoEspacio), [evento])
+                except (IntegrityError, DataError) as error:
+                    self.descartados += 1
+                    logger.error("Acceso descartado %s: %s", evento, str(error.orig).strip())
+            sesion.commit()
+
+    def _escribir_con_reintentos(self, lote: List[dict]):
+        for intento in range(1, self.max_reintentos + 2):
+            try:
+                self._escribir(lote)
+                return
+            except Exception:
+                if intento > self.max_reintentos:
+                    self.descartados += len(lote)
+                    logger.exception("Se descartan %d accesos tras %d intentos: %s", len(lote), intento, lote)
+                    return
+                logger.warning("Error escribiendo %d accesos (intento %d de %d)", len(lote), intento,
+                               self.max_reintentos + 1, exc_info=True)
+            time.sleep(self.intervalo * intento)
+
+    def vaciar(self):
+        lote = self._tomar_lote(0)
+        while lote:
+            self._escribir_con_reintentos(lote)
+            lote = self._tomar_lote(0)
+
+    def _ejecutar(self):
+        while not self._detener.is_set():
+            lote = self._tomar_lote(self.intervalo)
+            if lote:
+                self._escribir_con_reintentos(lote)
+
+
+class MedidorLatencia:
+    """Guarda las últimas duraciones de decisión para calcular percentiles"""
+
+    def __init__(self, capacidad: int = 10000):
+        self._muestras = deque(maxlen=capacidad)
+        self.total = 0
+
+    def registrar(self, segundos: float):
+        self._muestras.append(segundos)
+        self.total += 1
+
+    def percentiles(self) -> Dict[str, float]:
+        if not self._muestras:
+            return {"p50_us": 0.0, "p99_us": 0.0}
+        p50, p99 = np.percentile(np.fromiter(self._muestras, dtype=np.float64), [50, 99]) * 1e6
+        return {"p50_us": float(p50), "p99_us": float(p99)}
+
+
+indice = IndiceAutorizacion()
+escritor = EscritorAccesos()
+latencia = MedidorLatencia()
+
+
+@invalidacion.suscribir(*_TABLAS_AUTORIZACION)
+def _invalidar_indice(cambios):
+    indice.invalidar()
@@ -0,0 +1,385 @@
+"""
+Alertas de lecturas de sensores contra los objetivos de la fase actual
+
+Para cada estructura con una siembra activa se determina la fase vigente
+(CultivoFase de la variedad según los días transcurridos desde la siembra) y
+se compilan sus FaseNutriente en umbrales por métrica: objetivo ± TOLERANCIA.
+La métrica de un nutriente es su fórmula química (o su nombre) normalizada,
+p. ej. "EC" -> "ec", "NO3-" -> "no3".
+
+Los lotes de lecturas se clasifican de forma vectorizada; solo las lecturas
+de métricas cuyo estado puede cambiar recorren la máquina de estados, que
+exige ALERTAS_CONSECUTIVAS lecturas seguidas para abrir o cerrar una alerta
+y, con histéresis, solo la cierra cuando el valor vuelve a la banda
+objetivo ± TOLERANCIA * HISTERESIS.
+
+Los umbrales se recompilan solo para las estructuras afectadas cuando cambia
+una siembra, una fase del cultivo o sus nutrientes, y al terminar la fase;
+todos se recompilan cada ALERTAS_RECARGA_SEGUNDOS para ver los cambios
+hechos en otros workers. Las alertas abiertas de métricas que se quedan sin
+objetivo se cierran al procesar el siguiente lote de lecturas, no al compilar.
+"""
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from backend import invalidacion, models, schemas, telemetria
+
+logger = logging.getLogger(__name__)
+
+TOLERANCIA = float(os.getenv("ALERTAS_TOLERANCIA", "0.10"))
+HISTERESIS = float(os.getenv("ALERTAS_HISTERESIS", "0.5"))
+CONSECUTIVAS = int(os.getenv("ALERTAS_CONSECUTIVAS", "3"))
+# Segundos tras los que se recompilan todos los umbrales (cambios de otros workers)
+RECARGA_SEGUNDOS = float(os.getenv("ALERTAS_RECARGA_SEGUNDOS", "60"))
+
+NORMAL, BAJO, ALTO, SIN_CAMBIO = 0, -1, 1, 2
+TIPOS = {BAJO: "bajo", ALTO: "alto"}
+
+
+def metrica_de(nutriente) -> str:
+    """Métrica de lectura asociada a un nutriente"""
+    texto = unicodedata.normalize("NFKD", nutriente.formula_quimica or nutriente.nombre or "")
+    texto = texto.encode("ascii", "ignore").decode().lower()
+    return re.sub(r"[^a-z0-9]+", "_", texto).strip("_")
+
+
+def fase_actual(fases: List[Tuple[int, Optional[int]]], fecha_inicio: datetime,
+                ahora: datetime) -> Tuple[Optional[int], Optional[datetime]]:
+    """
+    Dadas las fases (cultivo_fase_id, duración en días) en orden, devuelve la
+    vigente y cuándo termina. Tras la última fase se mantiene la última (sin fin);
+    una fase sin duración no termina.
+    """
+    fin = fecha_inicio
+    for cultivo_fase_id, dias in fases:
+        if dias is None:
+            return cultivo_fase_id, None
+        fin = fin + timedelta(days=dias)
+        if ahora < fin:
+            return cultivo_fase_id, fin
+    return (fases[-1][0], None) if fases else (None, None)
+
+
+@dataclass
+class Regla:
+    metrica: str
+    cultivo_fase_id: int
+    nutriente_id: int
+    objetivo: float
+
+
+@dataclass
+class Transicion:
+    estructura_id: int
+    regla: Regla
+    anterior: int
+    nuevo: int
+    valor: float
+    fecha: datetime
+
+
+class MotorUmbrales:
+    def __init__(self, tolerancia: float = TOLERANCIA, histeresis: float = HISTERESIS,
+                 consecutivas: int = CONSECUTIVAS):
+        self.tolerancia = tolerancia
+        self.histeresis = histeresis
+        self.consecutivas = consecutivas
+        self._reglas: Dict[int, Dict[str, Regla]] = {}
+        self._vigencias: Dict[int, Optional[datetime]] = {}
+        # Una fila por (estructura, métrica): límites [min, max, min_histeresis, max_histeresis]
+        # y estado de la máquina (estado, candidato, lecturas seguidas del candidato)
+        self._claves: List[Tuple[int, str]] = []
+        self._filas: Dict[Tuple[int, str], int] = {}
+        self._limites = np.empty((0, 4))
+        self._estado = np.empty(0, dtype=np.int8)
+        self._candidato = np.empty(0, dtype=np.int8)
+        self._contador = np.empty(0, dtype=np.int32)
+        # Relaciones para recompilar solo lo afectado
+        self._variedad_de: Dict[int, int] = {}
+        self._variedad_de_fase: Dict[int, int] = {}
+        self._nutrientes_de: Dict[int, Set[int]] = {}
+        self._cargado = False
+        self._cargado_en = 0.0
+        self._sucias: Set[int] = set()
+        # Estructuras cuyas alertas abiertas hay que revisar tras compilar (None = todas)
+        self._por_revisar: Optional[Set[int]] = set()
+        self._lock = threading.RLock()
+
+    # ---------- Compilación ----------
+
+    def instalar(self, reglas_por_estructura: Dict[int, List[Regla]],
+                 vigencias: Optional[Dict[int, Optional[datetime]]] = None):
+        """Reemplaza las reglas de las estructuras dadas (lista vacía = sin reglas)"""
+        vigencias = vigencias or {}
+        with self._lock:
+            for estructura_id, reglas in reglas_por_estructura.items():
+                anteriores = self._reglas.pop(estructura_id, {})
+                self._vigencias.pop(estructura_id, None)
+                reglas = {r.metrica: r for r in reglas}
+                for metrica, regla in anteriores.items():
+                    nueva = reglas.get(metrica)
+                    if nueva is not None and nueva.objetivo != regla.objetivo:
+                        # Con otro objetivo se descarta el cambio en curso; el estado
+                        # (y la alerta abierta, si la hay) se revisa con las próximas lecturas
+                        self._contador[self._filas[(estructura_id, metrica)]] = 0
+                if reglas:
+                    self._reglas[estructura_id] = reglas
+                    self._vigencias[estructura_id] = vigencias.get(estructura_id)
+            self._reconstruir()
+
+    def _reconstruir(self):
+        claves, limites = [], []
+        for estructura_id, reglas in self._reglas.items():
+            for metrica, regla in reglas.items():
+                margen = abs(regla.objetivo) * self.tolerancia
+                claves.append((estructura_id, metrica))
+                limites.append((regla.objetivo - margen, regla.objetivo + margen,
+                                regla.objetivo - margen * self.histeresis,
+                                regla.objetivo + margen * self.histeresis))
+        # Conserva el estado de las filas que siguen existiendo
+        previas = np.array([self._filas.get(clave, -1) for clave in claves], dtype=np.int64)
+        conservadas = previas >= 0
+        estado = np.zeros(len(claves), dtype=np.int8)
+        candidato = np.zeros(len(claves), dtype=np.int8)
+        contador = np.zeros(len(claves), dtype=np.int32)
+        estado[conservadas] = self._estado[previas[conservadas]]
+        candidato[conservadas] = self._candidato[previas[conservadas]]
+        contador[conservadas] = self._contador[previas[conservadas]]
+        self._claves = claves
+        self._filas = {clave: fila for fila, clave in enumerate(claves)}
+        self._limites = np.array(limites, dtype=np.float64).reshape(-1, 4)
+        self._estado, self._candidato, self._contador = estado, candidato, contador
+
+    def compilar(self, db_session: Session, estructura_ids: Optional[Iterable[int]] = None,
+                 ahora: Optional[datetime] = None):
+        """Recompila las estructuras indicadas (todas si es None) desde la BD"""
+        ahora = ahora or datetime.utcnow()
+        consulta = db_session.query(models.Siembra).filter(models.Siembra.activo.is_(True))
+        if estructura_ids is not None:
+            estructura_ids = set(estructura_ids)
+            consulta = consulta.filter(models.Siembra.estructura_id.in_(estructura_ids))
+        # La siembra más reciente de cada estructura es la vigente
+        siembras: Dict[int, models.Siembra] = {}
+        for siembra in consulta.order_by(models.Siembra.fecha_inicio):
+            siembras[siembra.estructura_id] = siembra
+
+        variedades = {s.variedad_cultivo_id for s in siembras.values()}
+        fases: Dict[int, List[Tuple[int, Optional[int]]]] = {}
+        if variedades:
+            filas = (db_session.query(models.CultivoFase.id, models.CultivoFase.variedad_cultivo_id,
+                                      models.CultivoFase.duracion_dias,
+                                      models.FaseProduccion.duracion_estimada_dias)
+                     .outerjoin(models.FaseProduccion)
+                     .filter(models.CultivoFase.variedad_cultivo_id.in_(variedades))
+                     .order_by(models.CultivoFase.variedad_cultivo_id, models.CultivoFase.orden,
+                               models.CultivoFase.id))
+            for cultivo_fase_id, variedad_id, dias, dias_estimados in filas:
+                fases.setdefault(variedad_id, []).append(
+                    (cultivo_fase_id, dias if dias is not None else dias_estimados))
+
+        vigentes: Dict[int, Tuple[int, Optional[datetime]]] = {}
+        for estructura_id, siembra in siembras.items():
+            cultivo_fase_id, hasta = fase_actual(fases.get(siembra.variedad_cultivo_id, []),
+                                                 siembra.fecha_inicio, ahora)
+            if cultivo_fase_id is not None:
+                vigentes[estructura_id] = (cultivo_fase_id, hasta)
+        por_fase: Dict[int, List[Regla]] = {}
+        fase_ids = {cultivo_fase_id for cultivo_fase_id, _ in vigentes.values()}
+        if fase_ids:
+            filas = (db_session.query(models.FaseNutriente, models.Nutriente)
+                     .join(models.Nutriente)
+                     .filter(models.FaseNutriente.cultivo_fase_id.in_(fase_ids),
+                             models.FaseNutriente.cantidad.isnot(None)))
+            for fase_nutriente, nutriente in filas:
+                por_fase.setdefault(fase_nutriente.cultivo_fase_id, []).append(
+                    Regla(metrica_de(nutriente), fase_nutriente.cultivo_fase_id, nutriente.id,
+                          fase_nutriente.cantidad))
+
+        with self._lock:
+            afectadas = estructura_ids if estructura_ids is not None else set(self._reglas) | set(siembras)
+            reglas = {e: por_fase.get(vigentes[e][0], []) if e in vigentes else [] for e in afectadas}
+            for estructura_id in afectadas:
+                siembra = siembras.get(estructura_id)
+                if siembra is None:
+                    self._variedad_de.pop(estructura_id, None)
+                else:
+                    self._variedad_de[estructura_id] = siembra.variedad_cultivo_id
+                    for cultivo_fase_id, _ in fases.get(siembra.variedad_cultivo_id, []):
+                        self._variedad_de_fase[cultivo_fase_id] = siembra.variedad_cultivo_id
+                self._nutrientes_de[estructura_id] = {r.nutriente_id for r in reglas[estructura_id]}
+            self.instalar(reglas, {e: hasta for e, (_, hasta) in vigentes.items()})
+            self._sucias -= afectadas
+            if estructura_ids is None:
+                self._cargado, self._cargado_en = True, time.monotonic()
+                self._por_revisar = None
+            elif self._por_revisar is not None:
+                self._por_revisar |= afectadas
+
+    def cerrar_huerfanas(self, db_session: Session, ahora: Optional[datetime] = None) -> int:
+        """
+        Cierra las alertas abiertas de métricas que se quedaron sin objetivo en
+        la última compilación (no se cerrarían nunca); devuelve cuántas cerró
+        """
+        with self._lock:
+            revisar, self._por_revisar = self._por_revisar, set()
+            metricas = {e: set(reglas) for e, reglas in self._reglas.items()}
+        if revisar is not None and not revisar:
+            return 0
+        try:
+            abiertas = db_session.query(models.AlertaSensor).filter(models.AlertaSensor.fecha_fin.is_(None))
+            if revisar is not None:
+                abiertas = abiertas.filter(models.AlertaSensor.estructura_id.in_(revisar))
+            huerfanas = [a for a in abiertas if a.metrica not in metricas.get(a.estructura_id, ())]
+            for alerta in huerfanas:
+                alerta.fecha_fin = ahora or datetime.utcnow()
+            if huerfanas:
+                db_session.commit()
+        except Exception:
+            with self._lock:
+                if revisar is None or self._por_revisar is None:
+                    self._por_revisar = None
+                else:
+                    self._por_revisar |= revisar
+            raise
+        return len(huerfanas)
+
+    def asegurar_compilado(self, db_session: Session, ahora: Optional[datetime] = None):
+        ahora = ahora or datetime.utcnow()
+        with self._lock:
+            vencido = RECARGA_SEGUNDOS > 0 and time.monotonic() - self._cargado_en > RECARGA_SEGUNDOS
+            if not self._cargado or vencido:
+                pendientes = None
+            else:
+                pendientes = set(self._sucias)
+                pendientes.update(e for e, hasta in self._vigencias.items() if hasta is not None and hasta <= ahora)
+                if not pendientes:
+                    return
+        self.compilar(db_session, pendientes, ahora)
+
+    def marcar(self, estructura_ids: Iterable[int]):
+        with self._lock:
+            self._sucias.update(estructura_ids)
+
+    def aplicar(self, cambio: invalidacion.Cambio):
+        """Marca para recompilar las estructuras a las que afecta un cambio del catálogo"""
+        if not self._cargado:
+            return
+        valores, anteriores = cambio.valores, cambio.anteriores
+        if cambio.modelo is models.Siembra:
+            self.marcar(v for v in (valores.get("estructura_id"), anteriores.get("estructura_id")) if v)
+        elif cambio.modelo is models.CultivoFase:
+            variedades = {valores.get("variedad_cultivo_id"), anteriores.get("variedad_cultivo_id")}
+            self.marcar(e for e, v in list(self._variedad_de.items()) if v in variedades)
+        elif cambio.modelo is models.FaseNutriente:
+            variedades = {self._variedad_de_fase.get(valores.get("cultivo_fase_id")),
+                          self._variedad_de_fase.get(anteriores.get("cultivo_fase_id"))} - {None}
+            self.marcar(e for e, v in list(self._variedad_de.items()) if v in variedades)
+        elif cambio.modelo is models.Nutriente:
+            self.marcar(e for e, ids in list(self._nutrientes_de.items()) if cambio.id in ids)
+        elif cambio.modelo is models.FaseProduccion:
+            # La duración estimada puede mover la fase de cualquier siembra
+            self.marcar(list(self._reglas))
+
+    # ---------- Evaluación ----------
+
+    def evaluar(self, lecturas: List[schemas.LecturaSensorCreate]) -> List[Transicion]:
+        with self._lock:
+            if not self._filas or not lecturas:
+                return []
+            filas = np.fromiter((self._filas.get((l.estructura_id, l.metrica), -1) for l in lecturas),
+                                dtype=np.int64, count=len(lecturas))
+            indices = np.nonzero(filas >= 0)[0]
+            if not len(indices):
+                return []
+            filas = filas[indices]
+            valores = np.fromiter((lecturas[i].valor for i in indices), dtype=np.float64, count=len(indices))
+            limites = self._limites[filas]
+            clases = np.full(len(filas), SIN_CAMBIO, dtype=np.int8)
+            clases[(valores >= limites[:, 2]) & (valores <= limites[:, 3])] = NORMAL
+            clases[valores < limites[:, 0]] = BAJO
+            clases[valores > limites[:, 1]] = ALTO
+
+            # Solo recorren la máquina de estados las métricas con una lectura
+            # distinta de su estado o con un cambio ya en curso
+            activas = (clases != SIN_CAMBIO) & ((clases != self._estado[filas]) | (self._contador[filas] > 0))
+            candidatas = np.unique(filas[activas])
+            transiciones = []
+            for posicion in np.nonzero(np.isin(filas, candidatas) & (clases != SIN_CAMBIO))[0]:
+                fila, clase = filas[posicion], int(clases[posicion])
+                if clase == self._estado[fila]:
+                    self._contador[fila] = 0
+                    continue
+                if clase == self._candidato[fila]:
+                    self._contador[fila] += 1
+                else:
+                    self._candidato[fila], self._contador[fila] = clase, 1
+                if self._contador[fila] >= self.consecutivas:
+                    estructura_id, metrica = self._claves[fila]
+                    lectura = lecturas[indices[posicion]]
+                    transiciones.append(Transicion(estructura_id, self._reglas[estructura_id][metrica],
+                                                   int(self._estado[fila]), clase, lectura.valor,
+                                                   telemetria.a_utc(lectura.fecha)))
+                    self._estado[fila], self._contador[fila] = clase, 0
+            return transiciones
+
+    def registrar(self, db_session: Session, transiciones: List[Transicion]):
+        """Cierra y abre las filas de alerta_sensor correspondientes"""
+        for t in transiciones:
+            abiertas = db_session.query(models.AlertaSensor).filter(
+                models.AlertaSensor.estructura_id == t.estructura_id,
+                models.AlertaSensor.metrica == t.regla.metrica,
+                models.AlertaSensor.fecha_fin.is_(None)).all()
+            for alerta in abiertas:
+                if alerta.tipo != TIPOS.get(t.nuevo):
+                    alerta.fecha_fin = t.fecha
+            if t.nuevo != NORMAL and not any(a.tipo == TIPOS[t.nuevo] for a in abiertas):
+                db_session.add(models.AlertaSensor(
+                    estructura_id=t.estructura_id, cultivo_fase_id=t.regla.cultivo_fase_id,
+                    nutriente_id=t.regla.nutriente_id, metrica=t.regla.metrica, tipo=TIPOS[t.nuevo],
+                    objetivo=t.regla.objetivo, valor=t.valor, fecha_inicio=t.fecha))
+        if transiciones:
+            db_session.commit()
+
+    def procesar(self, db_session: Session, lecturas: List[schemas.LecturaSensorCreate]) -> int:
+        """Evalúa un lote ya aceptado; un fallo aquí no debe rechazar la ingesta"""
+        try:
+            self.asegurar_compilado(db_session)
+            self.cerrar_huerfanas(db_session)
+            transiciones = self.evaluar(lecturas)
+            self.registrar(db_session, transiciones)
+        except Exception:
+            db_session.rollback()
+            logger.exception("Error evaluando umbrales de lecturas")
+            return 0
+        return len(transiciones)
+
+    def umbrales(self, estructura_id: int) -> List[schemas.Umbral]:
+        with self._lock:
+            vigente_hasta = self._vigencias.get(estructura_id)
+            resultado = []
+            for metrica, regla in sorted(self._reglas.get(estructura_id, {}).items()):
+                minimo, maximo, _, _ = self._limites[self._filas[(estructura_id, metrica)]]
+                resultado.append(schemas.Umbral(metrica=metrica, cultivo_fase_id=regla.cultivo_fase_id,
+                                                nutriente_id=regla.nutriente_id, objetivo=regla.objetivo,
+                                                minimo=minimo, maximo=maximo, vigente_hasta=vigente_hasta))
+            return resultado
+
+
+motor = MotorUmbrales()
+
+
+@invalidacion.suscribir(models.Siembra, models.CultivoFase, models.FaseNutriente, models.Nutriente,
+                        models.FaseProduccion)
+def _marcar_afectadas(cambios):
+    for cambio in cambios:
+        motor.aplicar(cambio)
@@ -0,0 +1,204 @@
+"""
+Motor de identificación biométrica 1:N sobre MetodoAcceso.dato_biometrico
+
+Las plantillas activas se decodifican (base64 -> vector de bytes) y se guardan
+normalizadas en una matriz float32 contigua por tipo de método. Identificar es
+un producto matriz-vector (similitud coseno) sobre todas las filas a la vez.
+La matriz se mantiene incrementalmente: altas, cambios y bajas confirmadas
+de metodo_acceso actualizan solo su fila.
+"""
+import base64
+import binascii
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from backend import invalidacion, models
+
+# Longitud (en bytes) de una plantilla decodificada
+DIMENSION = int(os.getenv("BIOMETRIA_DIMENSION", "256"))
+
+# Filas evaluadas por bloque al buscar con presupuesto de latencia
+TAMANO_BLOQUE = 16384
+
+# Segundos tras los que se recarga todo desde la BD (cambios de otros workers)
+RECARGA_SEGUNDOS = float(os.getenv("BIOMETRIA_RECARGA_SEGUNDOS", "300"))
+
+
+def decodificar_plantilla(dato: Optional[str], dimension: int = DIMENSION) -> Optional[np.ndarray]:
+    """Devuelve el vector normalizado de una plantilla o None si no es válida"""
+    if not dato:
+        return None
+    try:
+        crudo = base64.b64decode(dato, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    if len(crudo) != dimension:
+        return None
+    vector = np.frombuffer(crudo, dtype=np.uint8).astype(np.float32)
+    norma = np.linalg.norm(vector)
+    if norma == 0:
+        return None
+    return vector / norma
+
+
+@dataclass
+class Coincidencia:
+    metodo_acceso_id: Optional[int]
+    usuario_id: Optional[int]
+    similitud: float
+    candidatos: int
+    completo: bool
+
+
+class IndiceBiometrico:
+    """Matriz contigua de plantillas de un mismo tipo de método"""
+
+    def __init__(self, dimension: int = DIMENSION, capacidad: int = 1024):
+        self.dimension = dimension
+        self._matriz = np.zeros((capacidad, dimension), dtype=np.float32)
+        self._metodos = np.zeros(capacidad, dtype=np.int64)
+        self._usuarios = np.zeros(capacidad, dtype=np.int64)
+        self._filas: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._filas)
+
+    def _crecer(self):
+        capacidad = self._matriz.shape[0] * 2
+        self._matriz = np.resize(self._matriz, (capacidad, self.dimension))
+        self._metodos = np.resize(self._metodos, capacidad)
+        self._usuarios = np.resize(self._usuarios, capacidad)
+
+    def insertar(self, metodo_id: int, usuario_id: int, vector: np.ndarray):
+        with self._lock:
+            fila = self._filas.get(metodo_id)
+            if fila is None:
+                fila = len(self._filas)
+                if fila == self._matriz.shape[0]:
+                    self._crecer()
+                self._filas[metodo_id] = fila
+            self._matriz[fila] = vector
+            self._metodos[fila] = metodo_id
+            self._usuarios[fila] = usuario_id
+
+    def eliminar(self, metodo_id: int):
+        """Quita una fila moviendo la última a su lugar para mantener la matriz compacta"""
+        with self._lock:
+            fila = self._filas.pop(metodo_id, None)
+            if fila is None:
+                return
+            ultima = len(self._filas)
+            if fila != ultima:
+                self._matriz[fila] = self._matriz[ultima]
+                self._metodos[fila] = self._metodos[ultima]
+                self._usuarios[fila] = self._usuarios[ultima]
+                self._filas[int(self._metodos[fila])] = fila
+
+    def identificar(self, consulta: np.ndarray, umbral: float,
+                    presupuesto_ms: Optional[float] = None) -> Coincidencia:
+        """
+        Busca la plantilla más similar. Con presupuesto se evalúa por bloques y
+        se devuelve el mejor resultado hallado al agotarse el tiempo.
+        """
+        limite = None if presupuesto_ms is None else time.perf_counter() + presupuesto_ms / 1000
+        with self._lock:
+            n = len(self._filas)
+            mejor_fila, mejor_similitud, evaluadas = -1, -1.0, 0
+            paso = n if limite is None else TAMANO_BLOQUE
+            while evaluadas < n:
+                similitudes = self._matriz[evaluadas:evaluadas + paso] @ consulta
+                fila = int(np.argmax(similitudes))
+                if similitudes[fila] > mejor_similitud:
+                    mejor_fila, mejor_similitud = evaluadas + fila, float(similitudes[fila])
+                evaluadas += len(similitudes)
+                if limite is not None and time.perf_counter() > limite:
+                    break
+            if mejor_fila < 0 or mejor_similitud < umbral:
+                return Coincidencia(None, None, max(mejor_similitud, 0.0), evaluadas, evaluadas == n)
+            return Coincidencia(int(self._metodos[mejor_fila]), int(self._usuarios[mejor_fila]),
+                                mejor_similitud, evaluadas, evaluadas == n)
+
+
+class MotorBiometrico:
+    """Un índice por tipo de método, cargado perezosamente desde la BD"""
+
+    def __init__(self, dimension: int = DIMENSION):
+        self.dimension = dimension
+        self._indices: Dict[str, IndiceBiometrico] = {}
+        self._cargado_en: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _indice(self, tipo: str) -> IndiceBiometrico:
+        indice = self._indices.get(tipo)
+        if indice is None:
+            indice = self._indices.setdefault(tipo, IndiceBiometrico(self.dimension))
+        return indice
+
+    def cargar(self, db_session: Session):
+        """Reconstruye todos los índices desde las plantillas activas"""
+        indices: Dict[str, IndiceBiometrico] = {}
+        filas = (db_session.query(models.MetodoAcceso.id, models.MetodoAcceso.usuario_id,
+                                  models.MetodoAcceso.tipo, models.MetodoAcceso.dato_biometrico)
+                 .filter(models.MetodoAcceso.activo.is_(True),
+                         models.MetodoAcceso.dato_biometrico.isnot(None))
+                 .yield_per(5000))
+        for metodo_id, usuario_id, tipo, dato in filas:
+            vector = decodificar_plantilla(dato, self.dimension)
+            if vector is not None:
+                if tipo not in indices:
+                    indices[tipo] = IndiceBiometrico(self.dimension)
+                indices[tipo].insertar(metodo_id, usuario_id, vector)
+        with self._lock:
+            self._indices = indices
+            self._cargado_en = time.monotonic()
+
+    def asegurar_cargado(self, db_session: Session):
+        vencido = (self._cargado_en is not None and RECARGA_SEGUNDOS > 0
+                   and time.monotonic() - self._cargado_en > RECARGA_SEGUNDOS)
+        if self._cargado_en is None or vencido:
+            self.cargar(db_session)
+
+    def sincronizar(self, cambio: invalidacion.Cambio):
+        """Refleja en memoria el estado confirmado de una fila de metodo_acceso"""
+        if self._cargado_en is None:
+            return
+        valores = cambio.valores
+        tipo_anterior = cambio.anteriores.get("tipo", valores.get("tipo"))
+        if cambio.eliminado:
+            self._indice(tipo_anterior).eliminar(cambio.id)
+            return
+        if tipo_anterior != valores["tipo"]:
+            self._indice(tipo_anterior).eliminar(cambio.id)
+        vector = None
+        if valores.get("activo", True):
+            vector = decodificar_plantilla(valores.get("dato_biometrico"), self.dimension)
+        if vector is None:
+            self._indice(valores["tipo"]).eliminar(cambio.id)
+        else:
+            self._indice(valores["tipo"]).insertar(cambio.id, valores["usuario_id"], vector)
+
+    def identificar(self, tipo: str, dato: str, umbral: float,
+                    presupuesto_ms: Optional[float] = None) -> Coincidencia:
+        consulta = decodificar_plantilla(dato, self.dimension)
+        if consulta is None:
+            raise ValueError(f"La plantilla debe ser base64 de {self.dimension} bytes")
+        indice = self._indices.get(tipo)
+        if indice is None:
+            return Coincidencia(None, None, 0.0, 0, True)
+        return indice.identificar(consulta, umbral, presupuesto_ms)
+
+
+motor = MotorBiometrico()
+
+
+@invalidacion.suscribir(models.MetodoAcceso)
+def _sincronizar_motor(cambios):
+    for cambio in cambios:
+        motor.sincronizar(cambio)
@@ -0,0 +1,266 @@
+"""
+Compresión de respuestas HTTP
+
+Middleware ASGI que negocia la codificación con `Accept-Encoding` (zstd, br,
+gzip, en ese orden de preferencia del servidor entre las que acepta el
+cliente y estén instaladas) y:
+
+- No comprime cuerpos menores que COMPRESION_MINIMO_BYTES ni tipos que no
+  sean texto/JSON, ni respuestas que ya traen Content-Encoding.
+- Si la respuesta llega en un solo mensaje, la comprime de una vez. El
+  resultado se guarda en una caché LRU indexada por el hash del cuerpo y la
+  codificación: los listados de catálogos que no cambian entre peticiones se
+  comprimen una sola vez. Al indexar por contenido no hace falta invalidar.
+- Si la respuesta es en streaming (varios mensajes, p. ej. NDJSON o CSV),
+  comprime cada fragmento con un compresor incremental y lo vacía para que el
+  cliente lo reciba sin esperar al final.
+"""
+import hashlib
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import anyio
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli es opcional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard es opcional
+    zstandard = None
+
+MINIMO_BYTES = int(os.getenv("COMPRESION_MINIMO_BYTES", "1024"))
+CACHE_BYTES = int(os.getenv("COMPRESION_CACHE_BYTES", str(32 * 1024 * 1024)))
+# Por encima de este tamaño la compresión de una vez se hace fuera del event loop
+HILO_BYTES = 64 * 1024
+
+NIVEL_GZIP = 6
+CALIDAD_BROTLI = 5
+NIVEL_ZSTD = 3
+
+_COMPRIMIBLES = ("text/", "application/json", "application/x-ndjson", "application/javascript",
+                 "application/xml", "image/svg+xml")
+
+
+class _Gzip:
+    def __init__(self):
+        self._c = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 31)
+
+    def comprimir(self, datos: bytes) -> bytes:
+        return self._c.compress(datos) + self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def terminar(self) -> bytes:
+        return self._c.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self):
+        self._c = brotli.Compressor(quality=CALIDAD_BROTLI)
+
+    def comprimir(self, datos: bytes) -> bytes:
+        return self._c.process(datos) + self._c.flush()
+
+    def terminar(self) -> bytes:
+        return self._c.finish()
+
+
+class _Zstd:
+    def __init__(self):
+        self._c = zstandard.ZstdCompressor(level=NIVEL_ZSTD).compressobj()
+
+    def comprimir(self, datos: bytes) -> bytes:
+        return self._c.compress(datos) + self._c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def terminar(self) -> bytes:
+        return self._c.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+# Codificación -> (compresor incremental, compresión de una vez)
+CODIFICACIONES: Dict[str, Tuple[Callable, Callable[[bytes], bytes]]] = {}
+if zstandard is not None:
+    CODIFICACIONES["zstd"] = (_Zstd, lambda datos: zstandard.ZstdCompressor(level=NIVEL_ZSTD).compress(datos))
+if brotli is not None:
+    CODIFICACIONES["br"] = (_Brotli, lambda datos: brotli.compress(datos, quality=CALIDAD_BROTLI))
+CODIFICACIONES["gzip"] = (_Gzip, lambda datos: zlib.compress(datos, NIVEL_GZIP, wbits=31))
+
+
+def negociar(accept_encoding: str, disponibles=None) -> Optional[str]:
+    """Codificación a usar según Accept-Encoding, o None para enviar sin comprimir"""
+    disponibles = list(CODIFICACIONES) if disponibles is None else disponibles
+    pesos = {}
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        q = 1.0
+        for parametro in parametros.split(";"):
+            clave, _, valor = parametro.strip().partition("=")
+            if clave == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        if nombre:
+            pesos[nombre] = q
+    comodin = pesos.get("*", 0.0)
+    candidatas = [(pesos.get(c, comodin), -i, c) for i, c in enumerate(disponibles)]
+    q, _, elegida = max(candidatas, default=(0.0, 0, None))
+    return elegida if q > 0 else None
+
+
+class CacheComprimidos:
+    """LRU de cuerpos comprimidos indexada por (hash del cuerpo, codificación)"""
+
+    def __init__(self, max_bytes: int = CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entradas: "OrderedDict[Tuple[bytes, str], bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    @staticmethod
+    def clave(cuerpo: bytes, codificacion: str) -> Tuple[bytes, str]:
+        return hashlib.blake2b(cuerpo, digest_size=16).digest(), codificacion
+
+    def obtener(self, clave) -> Optional[bytes]:
+        with self._lock:
+            comprimido = self._entradas.get(clave)
+            if comprimido is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return comprimido
+
+    def guardar(self, clave, comprimido: bytes):
+        if len(comprimido) > self.max_bytes // 4:
+            return
+        with self._lock:
+            if clave in self._entradas:
+                return
+            self._entradas[clave] = comprimido
+            self._bytes += len(comprimido)
+            while self._bytes > self.max_bytes:
+                _, viejo = self._entradas.popitem(last=False)
+                self._bytes -= len(viejo)
+
+    def bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entradas)
+
+
+cache = CacheComprimidos()
+
+
+def _comprimible(tipo: str) -> bool:
+    return tipo.startswith(_COMPRIMIBLES)
+
+
+class Compresion:
+    """Middleware ASGI de compresión (ver docstring del módulo)"""
+
+    def __init__(self, app, minimo: int = MINIMO_BYTES, cache: Optional[CacheComprimidos] = cache):
+        self.app = app
+        self.minimo = minimo
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        aceptadas = ""
+        for nombre, valor in scope["headers"]:
+            if nombre == b"accept-encoding":
+                aceptadas = valor.decode("latin-1")
+        codificacion = negociar(aceptadas) if aceptadas else None
+        if codificacion is None:
+            await self.app(scope, receive, send)
+            return
+        await _Respuesta(self, codificacion, send)(scope, receive)
+
+
+class _Respuesta:
+    """Estado de compresión de una respuesta"""
+
+    def __init__(self, middleware: Compresion, codificacion: str, send):
+        self.middleware = middleware
+        self.codificacion = codificacion
+        self.send = send
+        self.inicio = None
+        self.compresor = None
+        self.pasar = False
+
+    async def __call__(self, scope, receive):
+        await self.middleware.app(scope, receive, self.enviar)
+
+    async def enviar(self, mensaje):
+        if mensaje["type"] == "http.response.start":
+            self.inicio = mensaje
+            encabezados = {k.lower(): v for k, v in mensaje.get("headers", [])}
+            tipo = encabezados.get(b"content-type", b"").decode("latin-1")
+            largo = encabezados.get(b"content-length")
+            self.pasar = (b"content-encoding" in encabezados or not _comprimible(tipo)
+                          or mensaje["status"] in (204, 304)
+                          or (largo is not None and int(largo) < self.middleware.minimo))
+            if self.pasar:
+                await self.send(mensaje)
+            return
+        if mensaje["type"] != "http.response.body" or self.pasar:
+            await self.send(mensaje)
+            return
+
+        cuerpo = mensaje.get("body", b"")
+        mas = mensaje.get("more_body", False)
+        if self.compresor is None and not mas:
+            await self._de_una_vez(cuerpo)
+            return
+        if self.compresor is None:
+            self.compresor = CODIFICACIONES[self.codificacion][0]()
+            await self.send(self._inicio(None))
+        datos = self.compresor.comprimir(cuerpo) if cuerpo else b""
+        if not mas:
+            datos += self.compresor.terminar()
+        if datos or not mas:
+            await self.send({"type": "http.response.body", "body": datos, "more_body": mas})
+
+    async def _de_una_vez(self, cuerpo: bytes):
+        if len(cuerpo) < self.middleware.minimo:
+            await self.send(self.inicio)
+            await self.send({"type": "http.response.body", "body": cuerpo})
+            return
+        cache = self.middleware.cache
+        clave = cache.clave(cuerpo, self.codificacion) if cache is not None else None
+        comprimido = cache.obtener(clave) if cache is not None else None
+        if comprimido is None:
+            comprimir = CODIFICACIONES[self.codificacion][1]
+            if len(cuerpo) > HILO_BYTES:
+                comprimido = await anyio.to_thread.run_sync(comprimir, cuerpo)
+            else:
+                comprimido = comprimir(cuerpo)
+            if cache is not None:
+                cache.guardar(clave, comprimido)
+        await self.send(self._inicio(len(comprimido)))
+        await self.send({"type": "http.response.body", "body": comprimido})
+
+    def _inicio(self, largo: Optional[int]) -> dict:
+        encabezados: List[Tuple[bytes, bytes]] = []
+        vary = None
+        for nombre, valor in self.inicio.get("headers", []):
+            n = nombre.lower()
+            if n == b"content-length":
+                continue
+            if n == b"vary":
+                vary = valor
+                continue
+            encabezados.append((nombre, valor))
+        if largo is not None:
+            encabezados.append((b"content-length", str(largo).encode()))
+        encabezados.append((b"content-encoding", self.codificacion.encode()))
+        encabezados.append((b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"))
+        return {**self.inicio, "headers": encabezados}
@@ -0,0 +1,188 @@
+"""
+Conteo de consultas SQL por petición y detección de N+1
+
+Los eventos before/after_cursor_execute de todos los engines anotan cada
+sentencia en el Registro de la petición en curso (un ContextVar que el
+middleware crea al entrar; los endpoints síncronos corren en el threadpool
+con una copia del contexto, así que ven el mismo Registro). Los hilos de
+fondo (escritores, resumidor) no tienen Registro y no se cuentan.
+
+Por cada petición:
+- Si una misma forma de sentencia (la SQL con los parámetros normalizados)
+  se repite CONSULTAS_UMBRAL_REPETIDAS veces o más se registra un aviso: es
+  el patrón típico de una relación perezosa recorrida en un bucle.
+- Con API_DEBUG_CONSULTAS=1 la respuesta incluye el encabezado
+  X-Consultas-SQL con el número de sentencias, el tiempo en la base de datos
+  y cuántas formas se repitieron.
+
+Con PoolMedido como clase de pool (database.py) también se anota cuánto
+esperó la petición por una conexión.
+
+Otros módulos pueden recibir cada sentencia con su duración registrándose
+con `@consultas.suscribir` (lo usa lentas.py).
+
+`observar()` cuenta, mientras está activo, las sentencias de todas las
+peticiones y las del hilo que lo llamó; lo usa el fixture
+`assert_max_queries` de las pruebas.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+UMBRAL_REPETIDAS = int(os.getenv("CONSULTAS_UMBRAL_REPETIDAS", "5"))
+DEBUG = os.getenv("API_DEBUG_CONSULTAS", "0") == "1"
+ENCABEZADO = "X-Consultas-SQL"
+
+_PARAMETRO = re.compile(r"%\(\w+\)s|%s|\$\d+|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTA = re.compile(r"\(\?(?:\s*,\s*\?)*\)")
+_ESPACIOS = re.compile(r"\s+")
+
+
+def forma(sentencia: str) -> str:
+    """Sentencia con literales y parámetros reemplazados por ? (las listas IN quedan como (?...))"""
+    texto = _PARAMETRO.sub("?", sentencia)
+    texto = _LISTA.sub("(?...)", texto)
+    return _ESPACIOS.sub(" ", texto).strip()
+
+
+@dataclass
+class Registro:
+    cantidad: int = 0
+    segundos: float = 0.0
+    espera_pool: float = 0.0
+    formas: Counter = field(default_factory=Counter)
+    sentencias: List[str] = field(default_factory=list)
+    guardar_sentencias: bool = False
+    peticion: Optional[dict] = None
+
+    def anotar(self, sentencia: str, segundos: float):
+        self.cantidad += 1
+        self.segundos += segundos
+        self.formas[forma(sentencia)] += 1
+        if self.guardar_sentencias:
+            self.sentencias.append(sentencia)
+
+    def repetidas(self, umbral: int = UMBRAL_REPETIDAS) -> List[tuple]:
+        return [(f, n) for f, n in self.formas.most_common() if n >= umbral]
+
+    def encabezado(self) -> str:
+        return f"n={self.cantidad}; ms={self.segundos * 1000:.1f}; repetidas={len(self.repetidas())}"
+
+    def ruta(self) -> Optional[str]:
+        """Método y plantilla de ruta de la petición (el router la agrega al scope al resolverla)"""
+        if self.peticion is None:
+            return None
+        ruta = self.peticion.get("route")
+        return f"{self.peticion.get('method')} {getattr(ruta, 'path', self.peticion.get('path'))}"
+
+
+_actual: ContextVar[Optional[Registro]] = ContextVar("registro_consultas", default=None)
+_observadores: List[Tuple[Registro, int]] = []
+_lock = threading.Lock()
+_suscriptores: List[Callable[[Any, str, Any, float, bool], None]] = []
+
+
+def suscribir(callback: Callable[[Any, str, Any, float, bool], None]):
+    """Decorador: registra `callback(cursor, sentencia, parametros, segundos, executemany)` tras cada sentencia"""
+    _suscriptores.append(callback)
+    return callback
+
+
+def actual() -> Optional[Registro]:
+    return _actual.get()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _antes(conn, cursor, sentencia, parametros, contexto, executemany):
+    conn.info.setdefault("inicio_consultas", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _despues(conn, cursor, sentencia, parametros, contexto, executemany):
+    inicios = conn.info.get("inicio_consultas")
+    segundos = time.perf_counter() - inicios.pop() if inicios else 0.0
+    registro = _actual.get()
+    if registro is not None:
+        registro.anotar(sentencia, segundos)
+    if _observadores:
+        hilo = threading.get_ident()
+        with _lock:
+            for observador, hilo_observador in _observadores:
+                # Sentencias de peticiones o del propio hilo que observa, no de los hilos de fondo
+                if registro is not None or hilo == hilo_observador:
+                    observador.anotar(sentencia, segundos)
+    for callback in _suscriptores:
+        try:
+            callback(cursor, sentencia, parametros, segundos, executemany)
+        except Exception:
+            logger.exception("Error en un suscriptor de consultas")
+
+
+class PoolMedido(QueuePool):
+    """QueuePool que anota en el Registro de la petición el tiempo esperando (o abriendo) una conexión"""
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            registro = _actual.get()
+            if registro is not None:
+                registro.espera_pool += time.perf_counter() - inicio
+
+
+@contextmanager
+def observar() -> Iterator[Registro]:
+    """Cuenta las sentencias de este hilo y de las peticiones atendidas dentro del bloque"""
+    registro = Registro(guardar_sentencias=True)
+    entrada = (registro, threading.get_ident())
+    with _lock:
+        _observadores.append(entrada)
+    try:
+        yield registro
+    finally:
+        with _lock:
+            _observadores.remove(entrada)
+
+
+class MedirConsultas:
+    """Middleware ASGI: crea el Registro de cada petición, avisa de N+1 y agrega el encabezado en debug"""
+
+    def __init__(self, app, debug: bool = DEBUG, umbral: int = UMBRAL_REPETIDAS):
+        self.app = app
+        self.debug = debug
+        self.umbral = umbral
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        registro = Registro(peticion=scope)
+        token = _actual.set(registro)
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start" and self.debug:
+                mensaje = {**mensaje, "headers": [*mensaje.get("headers", []),
+                                                  (ENCABEZADO.lower().encode(), registro.encabezado().encode())]}
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _actual.reset(token)
+            for sentencia, veces in registro.repetidas(self.umbral):
+                logger.warning("Posible N+1 en %s %s: %d veces %s",
+                               scope.get("method"), scope.get("path"), veces, sentencia[:300])
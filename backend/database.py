@@ -4,6 +4,7 @@ Configuración de la base de datos
 import os
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from backend.consultas import PoolMedido
 from backend.models import Base
 
 # Configuración de la base de datos
@@ -19,7 +20,7 @@ DB_CONFIG = {
 DATABASE_URL = f"postgresql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
 
 # Crear engine
-engine = create_engine(DATABASE_URL, echo=False)
+engine = create_engine(DATABASE_URL, echo=False, poolclass=PoolMedido)
 
 # Crear sessionmaker
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
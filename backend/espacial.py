@@ -0,0 +1,247 @@
+"""
+Índice espacial de sedes (latitud/longitud)
+
+En memoria: arreglos NumPy con las coordenadas y una rejilla uniforme en
+grados para consultas por rectángulo; los k vecinos más cercanos se obtienen
+con haversine vectorizado sobre todas las sedes y argpartition. El índice se
+reconstruye en la siguiente consulta tras confirmarse un cambio en `sede` o,
+para ver los cambios de otros workers, cuando pasan RECARGA_SEGUNDOS desde
+la última carga.
+
+Alternativa en SQL: la columna `sede.geohash` (índice btree con
+varchar_pattern_ops) permite filtrar por prefijos de celdas sin cargar todas
+las sedes. Se calcula al escribir cada sede; para las sedes anteriores a la
+columna la rellena `python migrar.py --aplicar`.
+"""
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import event, or_
+from sqlalchemy.orm import Session
+
+from backend import invalidacion, models, schemas
+
+RADIO_TIERRA_KM = 6371.0088
+
+# Tamaño de celda de la rejilla en memoria (grados)
+CELDA_GRADOS = float(os.getenv("ESPACIAL_CELDA_GRADOS", "1.0"))
+
+# Con "0" las consultas usan la columna geohash en lugar del índice en memoria
+USAR_MEMORIA = os.getenv("ESPACIAL_INDICE_MEMORIA", "1") != "0"
+
+# Segundos tras los que se recarga el índice desde la BD (cambios de otros workers)
+RECARGA_SEGUNDOS = float(os.getenv("ESPACIAL_RECARGA_SEGUNDOS", "60"))
+
+PRECISION_GEOHASH = 9
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(latitud: float, longitud: float, precision: int = PRECISION_GEOHASH) -> str:
+    """Codifica una coordenada en geohash"""
+    lat_rango, lon_rango = [-90.0, 90.0], [-180.0, 180.0]
+    caracteres, bits, valor, es_longitud = [], 0, 0, True
+    while len(caracteres) < precision:
+        rango, coordenada = (lon_rango, longitud) if es_longitud else (lat_rango, latitud)
+        medio = (rango[0] + rango[1]) / 2
+        valor <<= 1
+        if coordenada >= medio:
+            valor |= 1
+            rango[0] = medio
+        else:
+            rango[1] = medio
+        es_longitud = not es_longitud
+        bits += 1
+        if bits == 5:
+            caracteres.append(_BASE32[valor])
+            bits, valor = 0, 0
+    return "".join(caracteres)
+
+
+def tamano_celda_geohash(precision: int) -> Tuple[float, float]:
+    """Alto y ancho (grados) de una celda geohash"""
+    bits = precision * 5
+    bits_lon = (bits + 1) // 2
+    return 180.0 / 2 ** (bits - bits_lon), 360.0 / 2 ** bits_lon
+
+
+def haversine_km(latitud: float, longitud: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """Distancia (km) desde un punto a muchos, vectorizada"""
+    lat1, lon1 = math.radians(latitud), math.radians(longitud)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _en_rectangulo(latitudes, longitudes, min_lat, min_lon, max_lat, max_lon) -> np.ndarray:
+    dentro_lat = (latitudes >= min_lat) & (latitudes <= max_lat)
+    if min_lon <= max_lon:
+        return dentro_lat & (longitudes >= min_lon) & (longitudes <= max_lon)
+    # El rectángulo cruza el antimeridiano
+    return dentro_lat & ((longitudes >= min_lon) | (longitudes <= max_lon))
+
+
+class IndiceSedes:
+    def __init__(self, celda: float = CELDA_GRADOS):
+        self.celda = celda
+        self._sedes: List[schemas.Sede] = []
+        self._latitudes = np.empty(0)
+        self._longitudes = np.empty(0)
+        self._rejilla: Dict[Tuple[int, int], np.ndarray] = {}
+        self._vigente = False
+        self._version = 0
+        self._cargado_en: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _clave(self, latitud: float, longitud: float) -> Tuple[int, int]:
+        return math.floor(latitud / self.celda), math.floor(longitud / self.celda)
+
+    def construir(self, sedes: List[schemas.Sede]):
+        sedes = [s for s in sedes if s.latitud is not None and s.longitud is not None]
+        latitudes = np.array([s.latitud for s in sedes], dtype=np.float64)
+        longitudes = np.array([s.longitud for s in sedes], dtype=np.float64)
+        filas: Dict[Tuple[int, int], List[int]] = {}
+        for fila, (latitud, longitud) in enumerate(zip(latitudes, longitudes)):
+            filas.setdefault(self._clave(latitud, longitud), []).append(fila)
+        self._sedes, self._latitudes, self._longitudes = sedes, latitudes, longitudes
+        self._rejilla = {clave: np.array(valor, dtype=np.int64) for clave, valor in filas.items()}
+
+    def _al_dia(self) -> bool:
+        return self._vigente and (RECARGA_SEGUNDOS <= 0 or time.monotonic() - self._cargado_en <= RECARGA_SEGUNDOS)
+
+    def cargar(self, db_session: Session):
+        if self._al_dia():
+            return
+        with self._lock:
+            if self._al_dia():
+                return
+            # Un cambio confirmado durante la carga deja el índice pendiente de otra recarga
+            version = self._version
+            sedes = db_session.query(models.Sede).filter(models.Sede.latitud.isnot(None),
+                                                         models.Sede.longitud.isnot(None)).all()
+            self.construir([schemas.Sede.model_validate(s) for s in sedes])
+            self._cargado_en = time.monotonic()
+            self._vigente = self._version == version
+
+    def invalidar(self):
+        self._version += 1
+        self._vigente = False
+
+    def en_rectangulo(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[schemas.Sede]:
+        if not self._sedes:
+            return []
+        fila_min, col_min = self._clave(min_lat, min_lon)
+        fila_max, col_max = self._clave(max_lat, max_lon)
+        celdas_lon = math.ceil(360 / self.celda)
+        if min_lon > max_lon:
+            col_max += celdas_lon
+        celdas = (fila_max - fila_min + 1) * (col_max - col_min + 1)
+        if celdas >= len(self._rejilla):
+            candidatas = np.arange(len(self._sedes))
+        else:
+            primera_col = math.floor(-180 / self.celda)
+            bloques = []
+            for fila in range(fila_min, fila_max + 1):
+                for col in range(col_min, col_max + 1):
+                    col_real = (col - primera_col) % celdas_lon + primera_col
+                    bloque = self._rejilla.get((fila, col_real))
+                    if bloque is not None:
+                        bloques.append(bloque)
+            if not bloques:
+                return []
+            candidatas = np.concatenate(bloques)
+        mascara = _en_rectangulo(self._latitudes[candidatas], self._longitudes[candidatas],
+                                 min_lat, min_lon, max_lat, max_lon)
+        return [self._sedes[i] for i in np.sort(candidatas[mascara])]
+
+    def cercanas(self, latitud: float, longitud: float, k: int) -> List[Tuple[schemas.Sede, float]]:
+        if not self._sedes or k <= 0:
+            return []
+        distancias = haversine_km(latitud, longitud, self._latitudes, self._longitudes)
+        k = min(k, len(distancias))
+        filas = np.argpartition(distancias, k - 1)[:k]
+        filas = filas[np.argsort(distancias[filas])]
+        return [(self._sedes[i], float(distancias[i])) for i in filas]
+
+
+indice = IndiceSedes()
+
+
+# ---------- Consultas SQL sobre sede.geohash ----------
+
+def _prefijos_rectangulo(min_lat, min_lon, max_lat, max_lon) -> List[str]:
+    """Prefijos geohash (a lo sumo 16 por tramo) que cubren el rectángulo"""
+    if min_lon > max_lon:
+        return sorted(set(_prefijos_rectangulo(min_lat, min_lon, max_lat, 180.0))
+                      | set(_prefijos_rectangulo(min_lat, -180.0, max_lat, max_lon)))
+    for precision in range(PRECISION_GEOHASH, 0, -1):
+        alto, ancho = tamano_celda_geohash(precision)
+        primera_fila, primera_col = math.floor(min_lat / alto), math.floor(min_lon / ancho)
+        filas = math.floor(max_lat / alto) - primera_fila + 1
+        columnas = math.floor(max_lon / ancho) - primera_col + 1
+        if filas * columnas <= 16:
+            return sorted({geohash(min((primera_fila + i + 0.5) * alto, 90.0),
+                                   min((primera_col + j + 0.5) * ancho, 180.0), precision)
+                           for i in range(filas) for j in range(columnas)})
+    return [""]
+
+
+def en_rectangulo_sql(db_session: Session, min_lat, min_lon, max_lat, max_lon) -> List[models.Sede]:
+    prefijos = _prefijos_rectangulo(min_lat, min_lon, max_lat, max_lon)
+    consulta = db_session.query(models.Sede).filter(
+        or_(*[models.Sede.geohash.like(f"{prefijo}%") for prefijo in prefijos]),
+        models.Sede.latitud.between(min_lat, max_lat))
+    if min_lon <= max_lon:
+        consulta = consulta.filter(models.Sede.longitud.between(min_lon, max_lon))
+    else:
+        consulta = consulta.filter(or_(models.Sede.longitud >= min_lon, models.Sede.longitud <= max_lon))
+    return consulta.order_by(models.Sede.id).all()
+
+
+def _mas_cercanas(latitud, longitud, sedes, k) -> List[Tuple[models.Sede, float]]:
+    distancias = haversine_km(latitud, longitud,
+                              np.array([s.latitud for s in sedes], dtype=np.float64),
+                              np.array([s.longitud for s in sedes], dtype=np.float64))
+    return [(sedes[i], float(distancias[i])) for i in np.argsort(distancias)[:k]]
+
+
+def cercanas_sql(db_session: Session, latitud: float, longitud: float, k: int) -> List[Tuple[models.Sede, float]]:
+    """
+    Busca en la celda geohash del punto y sus 8 vecinas, bajando la precisión
+    hasta que las k sedes halladas estén más cerca que el borde del área cubierta.
+    """
+    for precision in range(6, 0, -1):
+        alto, ancho = tamano_celda_geohash(precision)
+        prefijos = {geohash(min(max(latitud + i * alto, -90.0), 90.0),
+                            (longitud + j * ancho + 180) % 360 - 180, precision)
+                    for i in (-1, 0, 1) for j in (-1, 0, 1)}
+        sedes = db_session.query(models.Sede).filter(
+            or_(*[models.Sede.geohash.like(f"{prefijo}%") for prefijo in prefijos])).all()
+        if len(sedes) < k:
+            continue
+        resultado = _mas_cercanas(latitud, longitud, sedes, k)
+        # Todo punto a menos de una celda del consultado cae dentro del bloque 3x3
+        cubierto_km = RADIO_TIERRA_KM * math.radians(min(alto, ancho * math.cos(math.radians(latitud))))
+        if resultado[-1][1] <= cubierto_km:
+            return resultado
+    sedes = db_session.query(models.Sede).filter(models.Sede.latitud.isnot(None),
+                                                 models.Sede.longitud.isnot(None)).all()
+    return _mas_cercanas(latitud, longitud, sedes, k) if sedes else []
+
+
+@event.listens_for(models.Sede, "before_insert")
+@event.listens_for(models.Sede, "before_update")
+def _asignar_geohash(mapper, connection, sede):
+    if sede.latitud is not None and sede.longitud is not None:
+        sede.geohash = geohash(sede.latitud, sede.longitud)
+    else:
+        sede.geohash = None
+
+
+@invalidacion.suscribir(models.Sede)
+def _invalidar_indice(cambios):
+    indice.invalidar()
@@ -0,0 +1,154 @@
+"""
+Expansión de objetos relacionados en los listados (`expand=`)
+
+`GET /api/usuarios?expand=persona,empresa` devuelve cada usuario con sus
+objetos `persona` y `empresa` anidados; se admiten rutas como
+`espacio.bloque` hasta API_MAX_EXPANSION niveles. Las relaciones de muchos
+a uno se cargan en la misma consulta (joinedload) y cada colección con una
+consulta adicional (`cargar`), así que el número de consultas no depende del
+número de filas.
+
+Cada colección expandida trae a lo sumo API_MAX_EXPANSION_FILAS elementos
+por objeto (los de menor clave primaria): la consulta los limita por padre
+con un LATERAL ... LIMIT, de modo que `expand=accesos` no lee el historial
+completo de cada espacio.
+
+El esquema de respuesta se arma una vez por combinación de relaciones
+heredando del esquema de la entidad y agregando los campos anidados.
+"""
+import os
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Type
+
+from fastapi import HTTPException
+from pydantic import BaseModel, create_model
+from sqlalchemy import ARRAY, Integer, func, inspect, literal, select, true
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+
+from backend import schemas
+
+MAX_PROFUNDIDAD = int(os.getenv("API_MAX_EXPANSION", "2"))
+MAX_RUTAS = 8
+MAX_FILAS_COLECCION = int(os.getenv("API_MAX_EXPANSION_FILAS", "100"))
+
+Rutas = Tuple[Tuple[str, ...], ...]
+
+
+def _relacion(modelo: type, nombre: str):
+    relacion = inspect(modelo).relationships.get(nombre)
+    if relacion is None:
+        disponibles = ", ".join(sorted(inspect(modelo).relationships.keys()))
+        raise HTTPException(status_code=422,
+                            detail=f"{modelo.__name__} no tiene la relación {nombre!r} (disponibles: {disponibles})")
+    return relacion
+
+
+def parsear(modelo: type, texto: Optional[str]) -> Rutas:
+    """Convierte "persona,espacio.bloque" en (("espacio", "bloque"), ("persona",)) validando cada relación"""
+    if not texto:
+        return ()
+    rutas = set()
+    for parte in texto.split(","):
+        if not parte.strip():
+            continue
+        ruta = tuple(segmento.strip() for segmento in parte.split("."))
+        if len(ruta) > MAX_PROFUNDIDAD:
+            raise HTTPException(status_code=422,
+                                detail=f"expand admite como máximo {MAX_PROFUNDIDAD} niveles: {parte.strip()!r}")
+        actual = modelo
+        for segmento in ruta:
+            actual = _relacion(actual, segmento).mapper.class_
+        rutas.add(ruta)
+    if len(rutas) > MAX_RUTAS:
+        raise HTTPException(status_code=422, detail=f"expand admite como máximo {MAX_RUTAS} relaciones")
+    return tuple(sorted(rutas))
+
+
+def _arbol(rutas: Rutas) -> Dict[str, dict]:
+    arbol: Dict[str, dict] = {}
+    for ruta in rutas:
+        nodo = arbol
+        for segmento in ruta:
+            nodo = nodo.setdefault(segmento, {})
+    return arbol
+
+
+def _opciones(modelo: type, arbol: Dict[str, dict], padre=None) -> list:
+    resultado = []
+    for nombre, subarbol in arbol.items():
+        relacion = _relacion(modelo, nombre)
+        if relacion.uselist:
+            continue
+        atributo = getattr(modelo, nombre)
+        opcion = joinedload(atributo) if padre is None else padre.joinedload(atributo)
+        resultado.append(opcion)
+        resultado.extend(_opciones(relacion.mapper.class_, subarbol, opcion))
+    return resultado
+
+
+def opciones(modelo: type, rutas: Rutas) -> list:
+    """joinedload de las relaciones de muchos a uno de las rutas (las colecciones las carga `cargar`)"""
+    return _opciones(modelo, _arbol(rutas))
+
+
+def _coleccion(db_session: Session, relacion, objetos: list, subarbol: Dict[str, dict]) -> list:
+    """Carga en `objetos` la colección `relacion` con a lo sumo MAX_FILAS_COLECCION hijos por objeto"""
+    (local, remota), = relacion.local_remote_pairs
+    destino = relacion.mapper.class_
+    clave, = inspect(destino).primary_key
+    atributo_local = relacion.parent.get_property_by_column(local).key
+    atributo_remoto = relacion.mapper.get_property_by_column(remota).key
+    ids = sorted({getattr(objeto, atributo_local) for objeto in objetos})
+    padres = func.unnest(literal(ids, ARRAY(Integer))).table_valued("id").render_derived("padres")
+    primeros = (select(clave).where(remota == padres.c.id).order_by(clave)
+                .limit(MAX_FILAS_COLECCION).lateral("primeros"))
+    hijos = (db_session.query(destino).options(*_opciones(destino, subarbol))
+             .filter(clave.in_(select(primeros.c[clave.key]).select_from(padres).join(primeros, true())))
+             .order_by(clave).all())
+    por_padre: Dict[int, list] = {}
+    for hijo in hijos:
+        por_padre.setdefault(getattr(hijo, atributo_remoto), []).append(hijo)
+    for objeto in objetos:
+        set_committed_value(objeto, relacion.key, por_padre.get(getattr(objeto, atributo_local), []))
+    return hijos
+
+
+def _cargar(db_session: Session, modelo: type, objetos: list, arbol: Dict[str, dict]):
+    for nombre, subarbol in arbol.items():
+        relacion = _relacion(modelo, nombre)
+        if relacion.uselist:
+            hijos = _coleccion(db_session, relacion, objetos, subarbol)
+        else:
+            # Ya cargados por joinedload; un mismo objeto puede colgar de varios padres
+            hijos = list({id(hijo): hijo for hijo in (getattr(objeto, nombre) for objeto in objetos)
+                          if hijo is not None}.values())
+        if hijos and subarbol:
+            _cargar(db_session, relacion.mapper.class_, hijos, subarbol)
+
+
+def cargar(db_session: Session, modelo: type, objetos: list, rutas: Rutas):
+    """Carga las colecciones de las rutas en `objetos` (una consulta por colección)"""
+    if objetos:
+        _cargar(db_session, modelo, objetos, _arbol(rutas))
+
+
+def _esquema(modelo: type, base: Type[BaseModel], arbol: Dict[str, dict]) -> Type[BaseModel]:
+    if not arbol:
+        return base
+    campos = {}
+    for nombre, subarbol in arbol.items():
+        relacion = _relacion(modelo, nombre)
+        destino = relacion.mapper.class_
+        anidado = _esquema(destino, getattr(schemas, destino.__name__), subarbol)
+        if relacion.uselist:
+            campos[nombre] = (List[anidado], [])
+        else:
+            campos[nombre] = (Optional[anidado], None)
+    return create_model(f"{base.__name__}Expandido", __base__=base, **campos)
+
+
+@lru_cache(maxsize=256)
+def esquema(modelo: type, base: Type[BaseModel], rutas: Rutas) -> Type[BaseModel]:
+    """Esquema de `base` con los objetos de `rutas` anidados"""
+    return _esquema(modelo, base, _arbol(rutas))
@@ -0,0 +1,93 @@
+"""
+Notificación de cambios confirmados para los índices en memoria
+
+Los módulos con índices (acceso, espacial, ...) se suscriben a los modelos de
+los que dependen. Durante el flush se anotan las filas insertadas,
+modificadas o eliminadas y, solo si la transacción se confirma, se entrega la
+lista de cambios a cada suscriptor.
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Tuple, Type
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Cambio:
+    modelo: Type
+    id: Any
+    eliminado: bool
+    valores: Dict[str, Any] = field(default_factory=dict)
+    anteriores: Dict[str, Any] = field(default_factory=dict)
+
+
+_suscripciones: List[Tuple[Tuple[Type, ...], Callable[[List[Cambio]], None]]] = []
+
+
+def suscribir(*modelos: Type):
+    """Decorador: registra `callback(cambios)` para los modelos indicados"""
+    def decorador(callback: Callable[[List[Cambio]], None]):
+        _suscripciones.append((modelos, callback))
+        return callback
+    return decorador
+
+
+def _modelos_observados() -> Tuple[Type, ...]:
+    return tuple({modelo for modelos, _ in _suscripciones for modelo in modelos})
+
+
+def hay_pendientes(sesion: Session) -> bool:
+    """True si la sesión ya hizo flush de cambios observados que aún no se confirmaron"""
+    return bool(sesion.info.get("cambios_confirmables"))
+
+
+def _capturar(objeto, eliminado: bool) -> Cambio:
+    estado = inspect(objeto)
+    valores, anteriores = {}, {}
+    for atributo in estado.mapper.column_attrs:
+        clave = atributo.key
+        if clave in estado.dict:
+            valores[clave] = estado.dict[clave]
+        historia = estado.attrs[clave].history
+        if historia.deleted:
+            anteriores[clave] = historia.deleted[0]
+    identidad = estado.identity
+    return Cambio(type(objeto), identidad[0] if identidad else valores.get("id"),
+                  eliminado, valores, anteriores)
+
+
+@event.listens_for(Session, "after_flush")
+def _anotar_cambios(sesion, contexto):
+    observados = _modelos_observados()
+    if not observados:
+        return
+    cambios = sesion.info.setdefault("cambios_confirmables", [])
+    for objeto in (*sesion.new, *sesion.dirty):
+        if isinstance(objeto, observados):
+            cambios.append(_capturar(objeto, False))
+    for objeto in sesion.deleted:
+        if isinstance(objeto, observados):
+            cambios.append(_capturar(objeto, True))
+
+
+@event.listens_for(Session, "after_commit")
+def _notificar(sesion):
+    cambios = sesion.info.pop("cambios_confirmables", None)
+    if not cambios:
+        return
+    for modelos, callback in _suscripciones:
+        relevantes = [cambio for cambio in cambios if issubclass(cambio.modelo, modelos)]
+        if relevantes:
+            try:
+                callback(relevantes)
+            except Exception:
+                logger.exception("Error notificando cambios a %s", callback.__qualname__)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar(sesion):
+    sesion.info.pop("cambios_confirmables", None)
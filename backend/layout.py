@@ -0,0 +1,224 @@
+"""
+Índice 2D de la distribución de estructuras dentro de cada espacio
+
+Cada estructura ocupa el rectángulo [posicion_x, posicion_x + ancho] x
+[posicion_y, posicion_y + largo]. Por espacio se mantiene una rejilla uniforme
+(celda ~ 2x el tamaño mediano de las estructuras) que resuelve consultas de
+ventana y detección de solapamientos revisando solo las celdas afectadas.
+Las estructuras que cubrirían más de MAX_CELDAS celdas (mucho más grandes
+que la mediana) no se reparten en la rejilla: van a una lista aparte que se
+revisa en cada consulta. Las estructuras sin posición o sin dimensiones no
+se indexan.
+
+Los índices se cargan por espacio al primer uso (con un máximo en memoria,
+LRU), se actualizan con los cambios confirmados de `estructura` y se
+recargan cuando pasan RECARGA_SEGUNDOS (cambios de otros workers). Por eso
+sirven a las consultas de lectura; la verificación de solapamiento al crear
+o mover una estructura (`solapados_en_base`) consulta la base.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import REAL, cast
+from sqlalchemy.orm import Session
+
+from backend import invalidacion, models, schemas
+
+MAX_ESPACIOS = int(os.getenv("LAYOUT_MAX_ESPACIOS", "256"))
+MAX_CELDAS = int(os.getenv("LAYOUT_MAX_CELDAS", "64"))
+
+# Segundos tras los que se recarga el índice de un espacio desde la BD (cambios de otros workers)
+RECARGA_SEGUNDOS = float(os.getenv("LAYOUT_RECARGA_SEGUNDOS", "60"))
+
+Rectangulo = Tuple[float, float, float, float]
+
+
+def rectangulo(estructura) -> Optional[Rectangulo]:
+    """Rectángulo (x0, y0, x1, y1) de una estructura, o None si no está ubicada"""
+    x, y = estructura.posicion_x, estructura.posicion_y
+    ancho, largo = estructura.ancho, estructura.largo
+    if None in (x, y, ancho, largo) or ancho <= 0 or largo <= 0:
+        return None
+    return (x, y, x + ancho, y + largo)
+
+
+def se_solapan(a: Rectangulo, b: Rectangulo) -> bool:
+    """Solapamiento estricto: compartir un borde no cuenta"""
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class IndiceEspacio:
+    def __init__(self, estructuras: Iterable[schemas.Estructura] = (), max_celdas: int = MAX_CELDAS):
+        self.estructuras: Dict[int, schemas.Estructura] = {}
+        self.max_celdas = max_celdas
+        self.cargado_en = time.monotonic()
+        self._rectangulos: Dict[int, Rectangulo] = {}
+        self._celdas: Dict[Tuple[int, int], Set[int]] = {}
+        # Estructuras que cubren más de max_celdas celdas
+        self._grandes: Set[int] = set()
+        estructuras = list(estructuras)
+        tamanos = sorted(max(r[2] - r[0], r[3] - r[1])
+                         for r in filter(None, (rectangulo(e) for e in estructuras)))
+        self.celda = 2 * tamanos[len(tamanos) // 2] if tamanos else 1.0
+        for estructura in estructuras:
+            self.insertar(estructura)
+
+    def __len__(self):
+        return len(self.estructuras)
+
+    def _claves(self, r: Rectangulo):
+        for i in range(math.floor(r[0] / self.celda), math.floor(r[2] / self.celda) + 1):
+            for j in range(math.floor(r[1] / self.celda), math.floor(r[3] / self.celda) + 1):
+                yield i, j
+
+    def _numero_celdas(self, r: Rectangulo) -> int:
+        return ((math.floor(r[2] / self.celda) - math.floor(r[0] / self.celda) + 1)
+                * (math.floor(r[3] / self.celda) - math.floor(r[1] / self.celda) + 1))
+
+    def insertar(self, estructura: schemas.Estructura):
+        self.eliminar(estructura.id)
+        self.estructuras[estructura.id] = estructura
+        r = rectangulo(estructura)
+        if r is None:
+            return
+        self._rectangulos[estructura.id] = r
+        if self._numero_celdas(r) > self.max_celdas:
+            self._grandes.add(estructura.id)
+            return
+        for clave in self._claves(r):
+            self._celdas.setdefault(clave, set()).add(estructura.id)
+
+    def eliminar(self, estructura_id: int):
+        self.estructuras.pop(estructura_id, None)
+        r = self._rectangulos.pop(estructura_id, None)
+        if r is None:
+            return
+        if estructura_id in self._grandes:
+            self._grandes.discard(estructura_id)
+            return
+        for clave in self._claves(r):
+            celda = self._celdas.get(clave)
+            if celda is not None:
+                celda.discard(estructura_id)
+                if not celda:
+                    del self._celdas[clave]
+
+    def _candidatos(self, r: Rectangulo) -> Set[int]:
+        if self._numero_celdas(r) >= len(self._celdas):
+            return set(self._rectangulos)
+        candidatos = set(self._grandes)
+        for clave in self._claves(r):
+            candidatos.update(self._celdas.get(clave, ()))
+        return candidatos
+
+    def en_ventana(self, r: Rectangulo) -> List[schemas.Estructura]:
+        """Estructuras que intersecan la ventana (incluye las que solo la tocan)"""
+        ids = [i for i in self._candidatos(r)
+               if self._rectangulos[i][0] <= r[2] and r[0] <= self._rectangulos[i][2]
+               and self._rectangulos[i][1] <= r[3] and r[1] <= self._rectangulos[i][3]]
+        return [self.estructuras[i] for i in sorted(ids)]
+
+    def solapados_con(self, r: Rectangulo, excluir: Optional[int] = None) -> List[int]:
+        return sorted(i for i in self._candidatos(r)
+                      if i != excluir and se_solapan(r, self._rectangulos[i]))
+
+    def solapamientos(self) -> List[Tuple[int, int]]:
+        """Todos los pares de estructuras que se solapan"""
+        pares = set()
+        for ids in self._celdas.values():
+            ordenados = sorted(ids)
+            for n, a in enumerate(ordenados):
+                for b in ordenados[n + 1:]:
+                    if se_solapan(self._rectangulos[a], self._rectangulos[b]):
+                        pares.add((a, b))
+        for a in self._grandes:
+            for b, r in self._rectangulos.items():
+                if a != b and se_solapan(self._rectangulos[a], r):
+                    pares.add((min(a, b), max(a, b)))
+        return sorted(pares)
+
+
+def solapados_en_base(db_session: Session, estructura) -> List[int]:
+    """
+    Ids de las estructuras del mismo espacio que se solapan con `estructura`
+    según la base. Bloquea la fila del espacio hasta el final de la
+    transacción: dos altas concurrentes (en cualquier worker) en el mismo
+    espacio se verifican una después de la otra.
+    """
+    r = rectangulo(estructura)
+    if r is None:
+        return []
+    (db_session.query(models.Espacio.id).filter(models.Espacio.id == estructura.espacio_id)
+     .with_for_update().first())
+    # Los límites se comparan como REAL, el tipo de las columnas
+    x0, y0, x1, y1 = (cast(valor, REAL) for valor in r)
+    e = models.Estructura
+    consulta = db_session.query(e.id).filter(
+        e.espacio_id == estructura.espacio_id, e.ancho > 0, e.largo > 0,
+        e.posicion_x < x1, x0 < e.posicion_x + e.ancho, e.posicion_y < y1, y0 < e.posicion_y + e.largo)
+    if estructura.id is not None:
+        consulta = consulta.filter(e.id != estructura.id)
+    return sorted(i for (i,) in consulta)
+
+
+class IndicesLayout:
+    def __init__(self, max_espacios: int = MAX_ESPACIOS):
+        self.max_espacios = max_espacios
+        self._indices: "OrderedDict[int, IndiceEspacio]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _cargar(db_session: Session, espacio_id: int) -> IndiceEspacio:
+        estructuras = (db_session.query(models.Estructura)
+                       .filter(models.Estructura.espacio_id == espacio_id).all())
+        return IndiceEspacio(schemas.Estructura.model_validate(e) for e in estructuras)
+
+    def obtener(self, db_session: Session, espacio_id: int) -> IndiceEspacio:
+        if invalidacion.hay_pendientes(db_session):
+            # La sesión tiene cambios sin confirmar (p. ej. un lote) que el índice aún no refleja
+            return self._cargar(db_session, espacio_id)
+        with self._lock:
+            indice = self._indices.get(espacio_id)
+            vencido = (indice is not None and RECARGA_SEGUNDOS > 0
+                       and time.monotonic() - indice.cargado_en > RECARGA_SEGUNDOS)
+            if indice is not None and not vencido:
+                self._indices.move_to_end(espacio_id)
+                return indice
+            indice = self._cargar(db_session, espacio_id)
+            self._indices[espacio_id] = indice
+            self._indices.move_to_end(espacio_id)
+            if len(self._indices) > self.max_espacios:
+                self._indices.popitem(last=False)
+            return indice
+
+    def aplicar(self, cambio: invalidacion.Cambio):
+        with self._lock:
+            anterior = cambio.anteriores.get("espacio_id", cambio.valores.get("espacio_id"))
+            if anterior in self._indices:
+                self._indices[anterior].eliminar(cambio.id)
+            if cambio.eliminado:
+                return
+            actual = cambio.valores.get("espacio_id")
+            if actual in self._indices:
+                campos = schemas.Estructura.model_fields
+                try:
+                    estructura = schemas.Estructura(**{campo: cambio.valores.get(campo) for campo in campos})
+                except ValidationError:
+                    # Valores incompletos en el cambio: se recarga el espacio en el próximo uso
+                    del self._indices[actual]
+                    return
+                self._indices[actual].insertar(estructura)
+
+
+indices = IndicesLayout()
+
+
+@invalidacion.suscribir(models.Estructura)
+def _actualizar_indices(cambios):
+    for cambio in cambios:
+        indices.aplicar(cambio)
@@ -0,0 +1,273 @@
+"""
+Registro de consultas lentas con su plan de ejecución
+
+El log de consultas lentas de PostgreSQL no dice qué ruta de la API emitió
+cada sentencia. Con CONSULTAS_LENTAS_MS > 0, cada sentencia que tarda al
+menos ese umbral se guarda en una bitácora circular (las últimas
+CONSULTAS_LENTAS_CAPACIDAD) con:
+- la ruta que la emitió (método y plantilla, del Registro de consultas.py;
+  None para los hilos de fondo)
+- la SQL y la forma de los parámetros (tipo y largo de las listas, nunca los
+  valores)
+- para una fracción CONSULTAS_LENTAS_MUESTREO_PLAN de ellas, el plan de
+  `EXPLAIN (ANALYZE, BUFFERS)`
+
+Los planes se obtienen en un hilo aparte, con otra conexión y dentro de una
+transacción que se revierte, así que no ven los cambios sin confirmar de la
+petición original. Solo SELECT/WITH/VALUES se ejecutan con ANALYZE; para
+INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE/SHARE y las sentencias que llaman
+a nextval/setval o a los bloqueos consultivos (efectos que el rollback no
+deshace o que bloquean filas) se guarda el plan estimado (EXPLAIN sin
+ejecutar) y el resto de las sentencias no tiene plan.
+
+Para no guardar los valores de los parámetros, la sentencia se prepara
+(PREPARE, con $1, $2... en lugar de los valores) y se explica su plan
+genérico (plan_cache_mode = force_generic_plan), que muestra los parámetros
+y no sus valores; puede diferir del plan que usó la petición para esos
+valores concretos. De los errores al explicar solo se guarda el tipo.
+
+Se consulta en GET /api/admin/consultas-lentas (requiere un token con el
+rol de administrador, TOKEN_ADMIN_ROLE_ID).
+"""
+import logging
+import os
+import queue
+import random
+import re
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend import consultas
+
+logger = logging.getLogger(__name__)
+
+UMBRAL = float(os.getenv("CONSULTAS_LENTAS_MS", "0")) / 1000
+MUESTREO_PLAN = float(os.getenv("CONSULTAS_LENTAS_MUESTREO_PLAN", "0.1"))
+CAPACIDAD = int(os.getenv("CONSULTAS_LENTAS_CAPACIDAD", "200"))
+# Tope de duración de cada EXPLAIN ANALYZE
+LIMITE_PLAN_MS = int(os.getenv("CONSULTAS_LENTAS_LIMITE_PLAN_MS", "30000"))
+# Planes pendientes como máximo; si el hilo no da abasto se descartan
+PENDIENTES = 16
+
+_PRIMERA_PALABRA = re.compile(r"^\s*(?:--[^\n]*\n\s*|/\*.*?\*/\s*)*(\w+)", re.S)
+_MODIFICA = re.compile(r"\b(?:INSERT|UPDATE|DELETE|MERGE)\b", re.I)
+# Bloqueos de filas y funciones con efectos que no se revierten (secuencias) o que bloquean
+_EFECTOS = re.compile(r"\bFOR\s+(?:NO\s+KEY\s+UPDATE|UPDATE|KEY\s+SHARE|SHARE)\b"
+                      r"|\b(?:nextval|setval|pg_\w*advisory\w*)\s*\(", re.I)
+# Marcadores de parámetros de psycopg2 (paramstyle pyformat)
+_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_MARCADOR = re.compile(r"%\((\w+)\)s|%s|%%")
+_PREPARADA = "consulta_lenta_plan"
+
+
+def tipo_plan(sentencia: str) -> Optional[str]:
+    """'analyze', 'estimado' o None según la sentencia admita EXPLAIN y sea seguro ejecutarla"""
+    coincidencia = _PRIMERA_PALABRA.match(sentencia)
+    palabra = coincidencia.group(1).upper() if coincidencia else ""
+    if palabra in ("SELECT", "VALUES") or (palabra == "WITH" and not _MODIFICA.search(sentencia)):
+        return "estimado" if _EFECTOS.search(_LITERAL.sub("''", sentencia)) else "analyze"
+    if palabra in ("WITH", "INSERT", "UPDATE", "DELETE"):
+        return "estimado"
+    return None
+
+
+def _tipo(valor: Any) -> str:
+    if valor is None:
+        return "null"
+    if isinstance(valor, (list, tuple)):
+        internos = sorted({_tipo(v) for v in valor})
+        return f"{type(valor).__name__}[{'|'.join(internos)}]x{len(valor)}"
+    if isinstance(valor, (str, bytes)) and len(valor) > 64:
+        return f"{type(valor).__name__}x{len(valor)}"
+    return type(valor).__name__
+
+
+def _tipo_sql(valor: Any) -> str:
+    """Tipo de PostgreSQL con el que se declara un parámetro en PREPARE ("unknown" = inferirlo)"""
+    if isinstance(valor, bool):
+        return "boolean"
+    if isinstance(valor, int):
+        return "bigint"
+    if isinstance(valor, float):
+        return "double precision"
+    if isinstance(valor, Decimal):
+        return "numeric"
+    if isinstance(valor, str):
+        return "text"
+    if isinstance(valor, datetime):
+        return "timestamptz" if valor.tzinfo is not None else "timestamp"
+    if isinstance(valor, date):
+        return "date"
+    if isinstance(valor, list):
+        interno = next((_tipo_sql(v) for v in valor if v is not None), "unknown")
+        return "unknown" if interno == "unknown" else f"{interno}[]"
+    return "unknown"
+
+
+def a_posicionales(sentencia: str, parametros: Any) -> Tuple[str, List[Any]]:
+    """Reescribe los marcadores de psycopg2 como $1, $2... y devuelve los valores en ese orden"""
+    if parametros is None:
+        return sentencia, []
+    valores: List[Any] = []
+    posiciones: Dict[str, int] = {}
+    secuencia = iter(parametros) if not isinstance(parametros, dict) else iter(())
+
+    def reemplazar(coincidencia):
+        if coincidencia.group(0) == "%%":
+            return "%"
+        nombre = coincidencia.group(1)
+        if nombre is None:
+            valores.append(next(secuencia))
+            return f"${len(valores)}"
+        if nombre not in posiciones:
+            valores.append(parametros[nombre])
+            posiciones[nombre] = len(valores)
+        return f"${posiciones[nombre]}"
+    return _MARCADOR.sub(reemplazar, sentencia), valores
+
+
+def forma_parametros(parametros: Any, executemany: bool = False) -> Dict[str, str]:
+    """Tipo de cada parámetro (posición o nombre -> tipo); con executemany, los del primer juego"""
+    formas: Dict[str, str] = {}
+    if executemany and isinstance(parametros, (list, tuple)):
+        formas["executemany"] = str(len(parametros))
+        parametros = parametros[0] if parametros else None
+    if isinstance(parametros, dict):
+        formas.update((str(nombre), _tipo(valor)) for nombre, valor in parametros.items())
+    elif isinstance(parametros, (list, tuple)):
+        formas.update((str(posicion), _tipo(valor)) for posicion, valor in enumerate(parametros, 1))
+    return formas
+
+
+@dataclass
+class ConsultaLenta:
+    fecha: datetime
+    ruta: Optional[str]
+    ms: float
+    filas: int
+    sentencia: str
+    parametros: Dict[str, str] = field(default_factory=dict)
+    tipo_plan: Optional[str] = None
+    plan: Optional[str] = None
+
+
+class BitacoraLentas:
+    """Últimas consultas lentas y el hilo que completa sus planes"""
+
+    def __init__(self, fabrica_sesiones=None, umbral: float = UMBRAL, muestreo: float = MUESTREO_PLAN,
+                 capacidad: int = CAPACIDAD):
+        self._fabrica_sesiones = fabrica_sesiones
+        self.umbral = umbral
+        self.muestreo = muestreo
+        self._entradas: "deque[ConsultaLenta]" = deque(maxlen=capacidad)
+        self._cola: "queue.Queue" = queue.Queue(maxsize=PENDIENTES)
+        self._hilo: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self.descartadas = 0
+
+    def configurar(self, fabrica_sesiones):
+        self._fabrica_sesiones = fabrica_sesiones
+
+    @property
+    def activa(self) -> bool:
+        return self.umbral > 0
+
+    def anotar(self, sentencia: str, parametros: Any, segundos: float, executemany: bool = False,
+               filas: int = -1) -> Optional[ConsultaLenta]:
+        if not self.activa or segundos < self.umbral:
+            return None
+        registro = consultas.actual()
+        entrada = ConsultaLenta(datetime.utcnow(), registro.ruta() if registro else None, round(segundos * 1000, 3),
+                                filas, sentencia, forma_parametros(parametros, executemany))
+        with self._lock:
+            self._entradas.append(entrada)
+        logger.warning("Consulta lenta (%.1f ms) en %s: %s", entrada.ms, entrada.ruta, sentencia[:300])
+        if self._fabrica_sesiones is not None and random.random() < self.muestreo:
+            entrada.tipo_plan = tipo_plan(sentencia)
+            if entrada.tipo_plan is not None:
+                self._encolar(entrada, parametros[0] if executemany and parametros else parametros)
+        return entrada
+
+    def _encolar(self, entrada: ConsultaLenta, parametros: Any):
+        try:
+            self._cola.put_nowait((entrada, parametros))
+        except queue.Full:
+            self.descartadas += 1
+            entrada.tipo_plan = None
+            return
+        if self._hilo is None or not self._hilo.is_alive():
+            self.iniciar()
+
+    def listar(self, limite: Optional[int] = None) -> List[ConsultaLenta]:
+        """Más recientes primero"""
+        with self._lock:
+            entradas = list(reversed(self._entradas))
+        return entradas[:limite] if limite is not None else entradas
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def explicar(self, sentencia: str, parametros: Any, analizar: bool) -> str:
+        """Plan genérico (sin los valores de los parámetros) en una transacción propia que siempre se revierte"""
+        opciones = "(ANALYZE, BUFFERS) " if analizar else ""
+        preparada, valores = a_posicionales(sentencia, parametros)
+        tipos = f" ({', '.join(_tipo_sql(v) for v in valores)})" if valores else ""
+        argumentos = f" ({', '.join(['%s'] * len(valores))})" if valores else ""
+        with self._fabrica_sesiones() as sesion:
+            # Cursor DBAPI directo: no pasa por los eventos del engine, así el EXPLAIN no se registra a sí mismo
+            cursor = sesion.connection().connection.cursor()
+            try:
+                cursor.execute(f"SET LOCAL statement_timeout = {LIMITE_PLAN_MS}")
+                cursor.execute("SET LOCAL plan_cache_mode = force_generic_plan")
+                cursor.execute(f"PREPARE {_PREPARADA}{tipos} AS {preparada}")
+                # PREPARE no se revierte con la transacción: se libera aunque falle el EXPLAIN
+                cursor.execute("SAVEPOINT explicar")
+                try:
+                    cursor.execute(f"EXPLAIN {opciones}EXECUTE {_PREPARADA}{argumentos}", valores)
+                    return "\n".join(fila[0] for fila in cursor.fetchall())
+                finally:
+                    cursor.execute("ROLLBACK TO SAVEPOINT explicar")
+                    cursor.execute(f"DEALLOCATE {_PREPARADA}")
+            finally:
+                cursor.close()
+                sesion.rollback()
+
+    def iniciar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._detener.clear()
+                self._hilo = threading.Thread(target=self._ejecutar, name="planes-lentas", daemon=True)
+                self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+
+    def _ejecutar(self):
+        while not self._detener.is_set():
+            try:
+                entrada, parametros = self._cola.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                entrada.plan = self.explicar(entrada.sentencia, parametros, entrada.tipo_plan == "analyze")
+            except Exception as error:
+                # El mensaje puede incluir valores de los parámetros: solo se guarda el tipo de error
+                logger.warning("No se pudo obtener el plan de una consulta lenta: %s", type(error).__name__)
+                entrada.plan = f"Error: {type(error).__name__}"
+
+
+bitacora = BitacoraLentas()
+
+
+@consultas.suscribir
+def _anotar(cursor, sentencia, parametros, segundos, executemany):
+    if bitacora.activa:
+        bitacora.anotar(sentencia, parametros, segundos, executemany, getattr(cursor, "rowcount", -1))
@@ -0,0 +1,163 @@
+"""
+Lotes de operaciones: varias altas, modificaciones y bajas en una petición
+
+POST /api/batch recibe una lista ordenada de operaciones sobre los endpoints
+CRUD, por ejemplo:
+
+    {"metodo": "POST", "ruta": "/api/sedes", "cuerpo": {"empresa_id": 1, "nombre": "Norte"}}
+    {"metodo": "POST", "ruta": "/api/bloques", "cuerpo": {"sede_id": "$ref:0.id", "nombre": "B1"}}
+    {"metodo": "PUT", "ruta": "/api/sedes/$ref:0.id", "cuerpo": {"direccion": "Km 3"}}
+
+Cada operación se ejecuta con el mismo endpoint que atendería la petición
+suelta (validaciones, 404, 409 de solapamiento...), pero todas comparten una
+sesión y una transacción: dentro del lote el commit() de los endpoints solo
+hace flush y al final se confirma todo con un único commit. Si una operación
+falla no se confirma ninguna y la respuesta indica cuál falló.
+
+"$ref:<indice>.<campo>" se reemplaza por el campo del resultado de una
+operación anterior, tanto en el cuerpo como en la ruta.
+"""
+import os
+import re
+from typing import Any, Dict, List, Sequence, Tuple
+
+from fastapi import HTTPException
+from fastapi.dependencies.utils import request_params_to_args
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import APIRoute
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.routing import BaseRoute, Match
+
+from backend import schemas
+from backend.database import get_db
+
+MAX_OPERACIONES = int(os.getenv("API_MAX_OPERACIONES", "500"))
+
+# Solo los endpoints CRUD: POST /api/<entidad>, PUT/DELETE /api/<entidad>/{id}
+_RUTA_CRUD = re.compile(r"^/api/[a-z-]+(/\{\w+\})?$")
+_METODOS = {"POST", "PUT", "DELETE"}
+_EXCLUIDAS = {"/api/batch"}
+_REFERENCIA = re.compile(r"\$ref:(\d+)((?:\.\w+)+)")
+
+
+class _SesionLote:
+    """Sesión que ven los endpoints dentro de un lote: commit() solo hace flush"""
+
+    def __init__(self, sesion: Session):
+        self._sesion = sesion
+
+    def commit(self):
+        self._sesion.flush()
+
+    def __getattr__(self, nombre):
+        return getattr(self._sesion, nombre)
+
+
+class ErrorOperacion(Exception):
+    def __init__(self, estado: int, detalle: Any):
+        super().__init__(detalle)
+        self.estado = estado
+        self.detalle = detalle
+
+
+def _referencia(resultados: List[Any], indice: int, campos: str) -> Any:
+    if indice >= len(resultados):
+        raise ErrorOperacion(422, f"$ref:{indice}{campos} apunta a una operación que aún no se ejecutó")
+    valor = resultados[indice]
+    for campo in campos.strip(".").split("."):
+        if not isinstance(valor, dict) or campo not in valor:
+            raise ErrorOperacion(422, f"$ref:{indice}{campos}: el resultado no tiene el campo {campo!r}")
+        valor = valor[campo]
+    return valor
+
+
+def resolver_referencias(valor: Any, resultados: List[Any]) -> Any:
+    """Reemplaza las referencias $ref en `valor` (recorriendo dicts y listas)"""
+    if isinstance(valor, str):
+        completa = _REFERENCIA.fullmatch(valor)
+        if completa:
+            # Referencia sola: conserva el tipo (p. ej. el id entero)
+            return _referencia(resultados, int(completa.group(1)), completa.group(2))
+        return _REFERENCIA.sub(lambda m: str(_referencia(resultados, int(m.group(1)), m.group(2))), valor)
+    if isinstance(valor, dict):
+        return {clave: resolver_referencias(v, resultados) for clave, v in valor.items()}
+    if isinstance(valor, list):
+        return [resolver_referencias(v, resultados) for v in valor]
+    return valor
+
+
+def buscar_ruta(rutas: Sequence[BaseRoute], metodo: str, ruta: str) -> Tuple[APIRoute, Dict[str, Any]]:
+    """Endpoint CRUD que atiende `metodo ruta` y sus parámetros de ruta"""
+    if metodo not in _METODOS:
+        raise ErrorOperacion(405, f"Un lote solo admite {sorted(_METODOS)}")
+    scope = {"type": "http", "method": metodo, "path": ruta}
+    for candidata in rutas:
+        if (not isinstance(candidata, APIRoute) or candidata.path in _EXCLUIDAS
+                or not _RUTA_CRUD.match(candidata.path)):
+            continue
+        coincidencia, hijo = candidata.matches(scope)
+        if coincidencia == Match.FULL:
+            return candidata, hijo["path_params"]
+    raise ErrorOperacion(404, f"{metodo} {ruta} no es una operación permitida en un lote")
+
+
+def _argumentos(ruta: APIRoute, parametros: Dict[str, Any], cuerpo: Any, sesion: _SesionLote) -> Dict[str, Any]:
+    dependant = ruta.dependant
+    argumentos, errores = request_params_to_args(dependant.path_params, parametros)
+    for campo in dependant.body_params:
+        valor, error = campo.validate(cuerpo, {}, loc=("body",))
+        if error:
+            errores.extend(error if isinstance(error, list) else [error])
+        argumentos[campo.name] = valor
+    if errores:
+        raise ErrorOperacion(422, jsonable_encoder(errores))
+    for dependencia in dependant.dependencies:
+        if dependencia.call is not get_db:
+            raise ErrorOperacion(400, f"{ruta.path} no se puede usar dentro de un lote")
+        argumentos[dependencia.name] = sesion
+    return argumentos
+
+
+def _serializar(ruta: APIRoute, resultado: Any) -> Any:
+    if ruta.response_field is None:
+        return jsonable_encoder(resultado)
+    valor, errores = ruta.response_field.validate(resultado, {}, loc=("response",))
+    if errores:
+        raise ErrorOperacion(500, "Respuesta inválida")
+    return ruta.response_field.serialize(valor, mode="json")
+
+
+def ejecutar(rutas: Sequence[BaseRoute], db_session: Session,
+             operaciones: Sequence[schemas.OperacionLote]) -> schemas.ResultadoLote:
+    if len(operaciones) > MAX_OPERACIONES:
+        raise HTTPException(status_code=400, detail=f"Se permiten como máximo {MAX_OPERACIONES} operaciones por lote")
+    sesion = _SesionLote(db_session)
+    resultados: List[Any] = []
+    indice = 0
+    try:
+        for indice, operacion in enumerate(operaciones):
+            ruta, parametros = buscar_ruta(rutas, operacion.metodo,
+                                           resolver_referencias(operacion.ruta, resultados))
+            cuerpo = resolver_referencias(operacion.cuerpo, resultados)
+            resultado = ruta.endpoint(**_argumentos(ruta, parametros, cuerpo, sesion))
+            resultados.append(_serializar(ruta, resultado))
+        db_session.commit()
+    except HTTPException as error:
+        db_session.rollback()
+        raise _fallo(indice, error.status_code, error.detail)
+    except ErrorOperacion as error:
+        db_session.rollback()
+        raise _fallo(indice, error.estado, error.detalle)
+    except IntegrityError as error:
+        db_session.rollback()
+        raise _fallo(indice, 409, str(error.orig).strip())
+    except Exception:
+        db_session.rollback()
+        raise
+    return schemas.ResultadoLote(resultados=[
+        schemas.ResultadoOperacion(indice=i, estado=200, resultado=r) for i, r in enumerate(resultados)])
+
+
+def _fallo(indice: int, estado: int, detalle: Any) -> HTTPException:
+    return HTTPException(status_code=estado, detail={"indice": indice, "detail": detalle})
@@ -1,14 +1,39 @@
 """
 API FastAPI para el sistema hidropónico
 """
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from typing import List
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import List, Optional
+import math
+import time
 import backend.database as db
-from backend import models, schemas
+from backend import (acceso, alertas, biometria, compresion, consultas, espacial, layout, lentas, lotes, metricas,
+                     models, recientes, respuestas, resumenes, schemas, telemetria, tiempos, tokens)
 
-app = FastAPI(title="Sistema Hidropónico API", version="1.0.0")
+acceso.indice.configurar(db.SessionLocal)
+acceso.escritor.configurar(db.SessionLocal)
+telemetria.buffer.configurar(db.SessionLocal)
+resumenes.resumidor.configurar(db.SessionLocal)
+lentas.bitacora.configurar(db.SessionLocal)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    resumenes.resumidor.iniciar()
+    metricas.recolector.iniciar()
+    yield
+    acceso.escritor.detener()
+    telemetria.buffer.detener()
+    resumenes.resumidor.detener()
+    metricas.recolector.detener()
+    lentas.bitacora.detener()
+
+
+app = FastAPI(title="Sistema Hidropónico API", version="1.0.0", lifespan=lifespan,
+              default_response_class=respuestas.RespuestaJSON)
 
 # Configurar CORS
 app.add_middleware(
@@ -17,13 +42,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[respuestas.ENCABEZADO_FALTANTES, consultas.ENCABEZADO, "Server-Timing"],
 )
+app.add_middleware(compresion.Compresion)
+app.add_middleware(metricas.MedirPeticiones)
+app.add_middleware(tiempos.ServerTiming)
+app.add_middleware(consultas.MedirConsultas)
 
 # ==================== EMPRESA ====================
 @app.get("/api/empresas", response_model=List[schemas.Empresa])
-def get_empresas(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    empresas = db_session.query(models.Empresa).offset(skip).limit(limit).all()
-    return empresas
+def get_empresas(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                 db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.Empresa, schemas.Empresa, skip, limit, ids, expand)
+
+@app.post("/api/empresas/por-ids", response_model=List[schemas.Empresa])
+def get_empresas_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                         db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.Empresa, schemas.Empresa, consulta.ids, expand)
 
 @app.get("/api/empresas/{empresa_id}", response_model=schemas.Empresa)
 def get_empresa(empresa_id: int, db_session: Session = Depends(db.get_db)):
@@ -62,9 +97,14 @@ def delete_empresa(empresa_id: int, db_session: Session = Depends(db.get_db)):
 
 # ==================== PERSONA ====================
 @app.get("/api/personas", response_model=List[schemas.Persona])
-def get_personas(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    personas = db_session.query(models.Persona).offset(skip).limit(limit).all()
-    return personas
+def get_personas(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                 db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.Persona, schemas.Persona, skip, limit, ids, expand)
+
+@app.post("/api/personas/por-ids", response_model=List[schemas.Persona])
+def get_personas_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                         db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.Persona, schemas.Persona, consulta.ids, expand)
 
 @app.get("/api/personas/{persona_id}", response_model=schemas.Persona)
 def get_persona(persona_id: int, db_session: Session = Depends(db.get_db)):
@@ -103,9 +143,36 @@ def delete_persona(persona_id: int, db_session: Session = Depends(db.get_db)):
 
 # ==================== SEDE ====================
 @app.get("/api/sedes", response_model=List[schemas.Sede])
-def get_sedes(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    sedes = db_session.query(models.Sede).offset(skip).limit(limit).all()
-    return sedes
+def get_sedes(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+              db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.Sede, schemas.Sede, skip, limit, ids, expand)
+
+@app.post("/api/sedes/por-ids", response_model=List[schemas.Sede])
+def get_sedes_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                      db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.Sede, schemas.Sede, consulta.ids, expand)
+
+@app.get("/api/sedes/en-area", response_model=List[schemas.Sede])
+def get_sedes_en_area(min_lat: float = Query(..., ge=-90, le=90), min_lon: float = Query(..., ge=-180, le=180),
+                      max_lat: float = Query(..., ge=-90, le=90), max_lon: float = Query(..., ge=-180, le=180),
+                      db_session: Session = Depends(db.get_db)):
+    if min_lat > max_lat:
+        raise HTTPException(status_code=422, detail="min_lat debe ser menor o igual que max_lat")
+    if not espacial.USAR_MEMORIA:
+        return espacial.en_rectangulo_sql(db_session, min_lat, min_lon, max_lat, max_lon)
+    espacial.indice.cargar(db_session)
+    return espacial.indice.en_rectangulo(min_lat, min_lon, max_lat, max_lon)
+
+@app.get("/api/sedes/cercanas", response_model=List[schemas.SedeCercana])
+def get_sedes_cercanas(lat: float = Query(..., ge=-90, le=90), lon: float = Query(..., ge=-180, le=180),
+                       k: int = Query(5, ge=1, le=100), db_session: Session = Depends(db.get_db)):
+    if not espacial.USAR_MEMORIA:
+        cercanas = espacial.cercanas_sql(db_session, lat, lon, k)
+    else:
+        espacial.indice.cargar(db_session)
+        cercanas = espacial.indice.cercanas(lat, lon, k)
+    return [schemas.SedeCercana(sede=schemas.Sede.model_validate(sede), distancia_km=distancia)
+            for sede, distancia in cercanas]
 
 @app.get("/api/sedes/{sede_id}", response_model=schemas.Sede)
 def get_sede(sede_id: int, db_session: Session = Depends(db.get_db)):
@@ -144,9 +211,14 @@ def delete_sede(sede_id: int, db_session: Session = Depends(db.get_db)):
 
 # ==================== BLOQUE ====================
 @app.get("/api/bloques", response_model=List[schemas.Bloque])
-def get_bloques(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    bloques = db_session.query(models.Bloque).offset(skip).limit(limit).all()
-    return bloques
+def get_bloques(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.Bloque, schemas.Bloque, skip, limit, ids, expand)
+
+@app.post("/api/bloques/por-ids", response_model=List[schemas.Bloque])
+def get_bloques_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                        db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.Bloque, schemas.Bloque, consulta.ids, expand)
 
 @app.get("/api/bloques/{bloque_id}", response_model=schemas.Bloque)
 def get_bloque(bloque_id: int, db_session: Session = Depends(db.get_db)):
@@ -185,9 +257,14 @@ def delete_bloque(bloque_id: int, db_session: Session = Depends(db.get_db)):
 
 # ==================== TIPO_ESPACIO ====================
 @app.get("/api/tipos-espacio", response_model=List[schemas.TipoEspacio])
-def get_tipos_espacio(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    tipos = db_session.query(models.TipoEspacio).offset(skip).limit(limit).all()
-    return tipos
+def get_tipos_espacio(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                      db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.TipoEspacio, schemas.TipoEspacio, skip, limit, ids, expand)
+
+@app.post("/api/tipos-espacio/por-ids", response_model=List[schemas.TipoEspacio])
+def get_tipos_espacio_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                              db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.TipoEspacio, schemas.TipoEspacio, consulta.ids, expand)
 
 @app.get("/api/tipos-espacio/{tipo_id}", response_model=schemas.TipoEspacio)
 def get_tipo_espacio(tipo_id: int, db_session: Session = Depends(db.get_db)):
@@ -226,9 +303,14 @@ def delete_tipo_espacio(tipo_id: int, db_session: Session = Depends(db.get_db)):
 
 # ==================== ESPACIO ====================
 @app.get("/api/espacios", response_model=List[schemas.Espacio])
-def get_espacios(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    espacios = db_session.query(models.Espacio).offset(skip).limit(limit).all()
-    return espacios
+def get_espacios(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                 db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.Espacio, schemas.Espacio, skip, limit, ids, expand)
+
+@app.post("/api/espacios/por-ids", response_model=List[schemas.Espacio])
+def get_espacios_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                         db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.Espacio, schemas.Espacio, consulta.ids, expand)
 
 @app.get("/api/espacios/{espacio_id}", response_model=schemas.Espacio)
 def get_espacio(espacio_id: int, db_session: Session = Depends(db.get_db)):
@@ -265,11 +347,55 @@ def delete_espacio(espacio_id: int, db_session: Session = Depends(db.get_db)):
     db_session.commit()
     return {"message": "Espacio eliminado"}
 
+@app.get("/api/espacios/{espacio_id}/estructuras", response_model=List[schemas.Estructura])
+def get_estructuras_espacio(espacio_id: int, x_min: Optional[float] = None, y_min: Optional[float] = None,
+                            x_max: Optional[float] = None, y_max: Optional[float] = None,
+                            db_session: Session = Depends(db.get_db)):
+    indice = layout.indices.obtener(db_session, espacio_id)
+    ventana = (x_min, y_min, x_max, y_max)
+    if all(v is None for v in ventana):
+        return [indice.estructuras[i] for i in sorted(indice.estructuras)]
+    if any(v is None or not math.isfinite(v) for v in ventana) or x_min > x_max or y_min > y_max:
+        raise HTTPException(status_code=422,
+                            detail="La ventana requiere valores finitos con x_min <= x_max y y_min <= y_max")
+    return indice.en_ventana(ventana)
+
+@app.get("/api/espacios/{espacio_id}/solapamientos", response_model=List[schemas.Solapamiento])
+def get_solapamientos_espacio(espacio_id: int, db_session: Session = Depends(db.get_db)):
+    indice = layout.indices.obtener(db_session, espacio_id)
+    return [schemas.Solapamiento(estructura_a_id=a, estructura_b_id=b) for a, b in indice.solapamientos()]
+
+@app.post("/api/espacios/{espacio_id}/acceso", response_model=schemas.DecisionAcceso)
+def decidir_acceso_espacio(espacio_id: int, solicitud: schemas.SolicitudAcceso,
+                           claims: tokens.Claims = Depends(tokens.get_claims),
+                           db_session: Session = Depends(db.get_db)):
+    inicio = time.perf_counter()
+    decision = acceso.indice.decidir(claims.usuario_id, espacio_id, db_session)
+    if decision.permitido:
+        acceso.escritor.registrar(claims.usuario_id, espacio_id, solicitud.metodo_acceso)
+    duracion = time.perf_counter() - inicio
+    acceso.latencia.registrar(duracion)
+    return schemas.DecisionAcceso(permitido=decision.permitido, motivo=decision.motivo,
+                                  usuario_id=claims.usuario_id, espacio_id=espacio_id,
+                                  tiempo_us=duracion * 1e6)
+
+@app.get("/api/acceso/estadisticas", response_model=schemas.EstadisticasAcceso)
+def estadisticas_acceso(claims: tokens.Claims = Depends(tokens.get_claims)):
+    return schemas.EstadisticasAcceso(decisiones=acceso.latencia.total,
+                                      pendientes_escritura=acceso.escritor.pendientes(),
+                                      descartados_escritura=acceso.escritor.descartados,
+                                      **acceso.latencia.percentiles())
+
 # ==================== TIPO_ESTRUCTURA ====================
 @app.get("/api/tipos-estructura", response_model=List[schemas.TipoEstructura])
-def get_tipos_estructura(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    tipos = db_session.query(models.TipoEstructura).offset(skip).limit(limit).all()
-    return tipos
+def get_tipos_estructura(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                         db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.TipoEstructura, schemas.TipoEstructura, skip, limit, ids, expand)
+
+@app.post("/api/tipos-estructura/por-ids", response_model=List[schemas.TipoEstructura])
+def get_tipos_estructura_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                                 db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.TipoEstructura, schemas.TipoEstructura, consulta.ids, expand)
 
 @app.get("/api/tipos-estructura/{tipo_id}", response_model=schemas.TipoEstructura)
 def get_tipo_estructura(tipo_id: int, db_session: Session = Depends(db.get_db)):
@@ -307,10 +433,20 @@ def delete_tipo_estructura(tipo_id: int, db_session: Session = Depends(db.get_db
     return {"message": "Tipo de estructura eliminado"}
 
 # ==================== ESTRUCTURA ====================
+def _verificar_solapamiento(db_session: Session, estructura: models.Estructura):
+    conflictos = layout.solapados_en_base(db_session, estructura)
+    if conflictos:
+        raise HTTPException(status_code=409, detail=f"La estructura se solapa con las estructuras {conflictos}")
+
 @app.get("/api/estructuras", response_model=List[schemas.Estructura])
-def get_estructuras(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    estructuras = db_session.query(models.Estructura).offset(skip).limit(limit).all()
-    return estructuras
+def get_estructuras(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                    db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.Estructura, schemas.Estructura, skip, limit, ids, expand)
+
+@app.post("/api/estructuras/por-ids", response_model=List[schemas.Estructura])
+def get_estructuras_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                            db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.Estructura, schemas.Estructura, consulta.ids, expand)
 
 @app.get("/api/estructuras/{estructura_id}", response_model=schemas.Estructura)
 def get_estructura(estructura_id: int, db_session: Session = Depends(db.get_db)):
@@ -322,6 +458,7 @@ def get_estructura(estructura_id: int, db_session: Session = Depends(db.get_db))
 @app.post("/api/estructuras", response_model=schemas.Estructura)
 def create_estructura(estructura: schemas.EstructuraCreate, db_session: Session = Depends(db.get_db)):
     db_estructura = models.Estructura(**estructura.dict())
+    _verificar_solapamiento(db_session, db_estructura)
     db_session.add(db_estructura)
     db_session.commit()
     db_session.refresh(db_estructura)
@@ -334,6 +471,7 @@ def update_estructura(estructura_id: int, estructura: schemas.EstructuraUpdate,
         raise HTTPException(status_code=404, detail="Estructura no encontrada")
     for key, value in estructura.dict(exclude_unset=True).items():
         setattr(db_estructura, key, value)
+    _verificar_solapamiento(db_session, db_estructura)
     db_session.commit()
     db_session.refresh(db_estructura)
     return db_estructura
@@ -347,11 +485,75 @@ def delete_estructura(estructura_id: int, db_session: Session = Depends(db.get_d
     db_session.commit()
     return {"message": "Estructura eliminada"}
 
+# ==================== LECTURA_SENSOR ====================
+@app.post("/api/lecturas-sensor/lote", response_model=schemas.LoteLecturasRespuesta, status_code=202)
+def create_lote_lecturas(lote: schemas.LoteLecturas, db_session: Session = Depends(db.get_db)):
+    desconocidas = telemetria.estructuras.desconocidas(db_session, (l.estructura_id for l in lote.lecturas))
+    if desconocidas:
+        raise HTTPException(status_code=422, detail=f"Estructuras inexistentes: {desconocidas[:20]}")
+    try:
+        aceptadas = telemetria.buffer.agregar(lote.lecturas)
+    except telemetria.BufferLleno:
+        raise HTTPException(status_code=503, detail="Buffer de lecturas lleno, reintente más tarde")
+    except telemetria.DemasiadasMetricas:
+        raise HTTPException(status_code=422, detail="Demasiadas métricas distintas en el buffer")
+    alertas.motor.procesar(db_session, lote.lecturas)
+    return schemas.LoteLecturasRespuesta(aceptadas=aceptadas, pendientes=len(telemetria.buffer))
+
+@app.get("/api/lecturas-sensor", response_model=List[schemas.LecturaSensor])
+def get_lecturas_sensor(estructura_id: int, metrica: Optional[str] = None, desde: Optional[datetime] = None,
+                        hasta: Optional[datetime] = None, limit: int = Query(1000, le=100000),
+                        db_session: Session = Depends(db.get_db)):
+    consulta = db_session.query(models.LecturaSensor).filter(models.LecturaSensor.estructura_id == estructura_id)
+    if metrica is not None:
+        consulta = consulta.filter(models.LecturaSensor.metrica == metrica)
+    if desde is not None:
+        consulta = consulta.filter(models.LecturaSensor.fecha >= telemetria.a_utc(desde))
+    if hasta is not None:
+        consulta = consulta.filter(models.LecturaSensor.fecha < telemetria.a_utc(hasta))
+    return consulta.order_by(models.LecturaSensor.fecha).limit(limit).all()
+
+@app.get("/api/lecturas-sensor/serie", response_model=schemas.SerieLecturas)
+def get_serie_lecturas(estructura_id: int, metrica: str, desde: Optional[datetime] = None,
+                       hasta: Optional[datetime] = None, puntos: int = Query(1000, ge=1, le=20000),
+                       db_session: Session = Depends(db.get_db)):
+    hasta = telemetria.a_utc(hasta)
+    desde = telemetria.a_utc(desde) if desde is not None else hasta - timedelta(days=1)
+    if desde >= hasta:
+        raise HTTPException(status_code=422, detail="'desde' debe ser anterior a 'hasta'")
+    return resumenes.serie(db_session, estructura_id, metrica, desde, hasta, puntos)
+
+@app.get("/api/lecturas-sensor/recientes/memoria", response_model=schemas.MemoriaRecientes)
+def get_memoria_lecturas_recientes():
+    estructuras = [schemas.MemoriaEstructura(estructura_id=e, series=n, puntos=p, bytes=b)
+                   for e, n, p, b in recientes.recientes.memoria()]
+    return schemas.MemoriaRecientes(bytes=sum(e.bytes for e in estructuras),
+                                    max_bytes=recientes.recientes.max_bytes,
+                                    fuera_de_orden=recientes.recientes.fuera_de_orden,
+                                    recargas_tardias=recientes.recientes.recargas_tardias, estructuras=estructuras)
+
+@app.get("/api/estructuras/{estructura_id}/ultimas-lecturas", response_model=schemas.UltimasLecturas)
+def get_ultimas_lecturas(estructura_id: int, metrica: Optional[str] = None,
+                         horas: Optional[float] = Query(None, gt=0), db_session: Session = Depends(db.get_db)):
+    if telemetria.estructuras.desconocidas(db_session, [estructura_id]):
+        raise HTTPException(status_code=404, detail="Estructura no encontrada")
+    desde = datetime.utcnow() - timedelta(hours=horas) if horas is not None else None
+    series = recientes.recientes.ultimas(db_session, estructura_id, metrica, desde)
+    return schemas.UltimasLecturas(estructura_id=estructura_id, series=[
+        schemas.SerieReciente(metrica=nombre, tiempos=[recientes.desde_milisegundos(t) for t in tiempos.tolist()],
+                              valores=valores.tolist())
+        for nombre, (tiempos, valores) in series.items()])
+
 # ==================== USUARIO ====================
 @app.get("/api/usuarios", response_model=List[schemas.Usuario])
-def get_usuarios(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    usuarios = db_session.query(models.Usuario).offset(skip).limit(limit).all()
-    return usuarios
+def get_usuarios(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                 db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.Usuario, schemas.Usuario, skip, limit, ids, expand)
+
+@app.post("/api/usuarios/por-ids", response_model=List[schemas.Usuario])
+def get_usuarios_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                         db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.Usuario, schemas.Usuario, consulta.ids, expand)
 
 @app.get("/api/usuarios/{usuario_id}", response_model=schemas.Usuario)
 def get_usuario(usuario_id: int, db_session: Session = Depends(db.get_db)):
@@ -362,7 +564,9 @@ def get_usuario(usuario_id: int, db_session: Session = Depends(db.get_db)):
 
 @app.post("/api/usuarios", response_model=schemas.Usuario)
 def create_usuario(usuario: schemas.UsuarioCreate, db_session: Session = Depends(db.get_db)):
-    db_usuario = models.Usuario(**usuario.dict())
+    datos = usuario.dict()
+    password_hash = tokens.hash_password(datos.pop("password"))
+    db_usuario = models.Usuario(**datos, password_hash=password_hash)
     db_session.add(db_usuario)
     db_session.commit()
     db_session.refresh(db_usuario)
@@ -373,8 +577,13 @@ def update_usuario(usuario_id: int, usuario: schemas.UsuarioUpdate, db_session:
     db_usuario = db_session.query(models.Usuario).filter(models.Usuario.id == usuario_id).first()
     if not db_usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    for key, value in usuario.dict(exclude_unset=True).items():
+    datos = usuario.dict(exclude_unset=True)
+    password = datos.pop("password", None)
+    for key, value in datos.items():
         setattr(db_usuario, key, value)
+    if password:
+        db_usuario.password_hash = tokens.hash_password(password)
+        db_usuario.ultimo_cambio_clave = datetime.utcnow()
     db_session.commit()
     db_session.refresh(db_usuario)
     return db_usuario
@@ -390,9 +599,14 @@ def delete_usuario(usuario_id: int, db_session: Session = Depends(db.get_db)):
 
 # ==================== ROL ====================
 @app.get("/api/roles", response_model=List[schemas.Rol])
-def get_roles(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    roles = db_session.query(models.Rol).offset(skip).limit(limit).all()
-    return roles
+def get_roles(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+              db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.Rol, schemas.Rol, skip, limit, ids, expand)
+
+@app.post("/api/roles/por-ids", response_model=List[schemas.Rol])
+def get_roles_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                      db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.Rol, schemas.Rol, consulta.ids, expand)
 
 @app.get("/api/roles/{rol_id}", response_model=schemas.Rol)
 def get_rol(rol_id: int, db_session: Session = Depends(db.get_db)):
@@ -431,9 +645,14 @@ def delete_rol(rol_id: int, db_session: Session = Depends(db.get_db)):
 
 # ==================== USUARIO_ROL ====================
 @app.get("/api/usuarios-roles", response_model=List[schemas.UsuarioRol])
-def get_usuarios_roles(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    usuarios_roles = db_session.query(models.UsuarioRol).offset(skip).limit(limit).all()
-    return usuarios_roles
+def get_usuarios_roles(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                       db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.UsuarioRol, schemas.UsuarioRol, skip, limit, ids, expand)
+
+@app.post("/api/usuarios-roles/por-ids", response_model=List[schemas.UsuarioRol])
+def get_usuarios_roles_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                               db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.UsuarioRol, schemas.UsuarioRol, consulta.ids, expand)
 
 @app.get("/api/usuarios-roles/{usuario_rol_id}", response_model=schemas.UsuarioRol)
 def get_usuario_rol(usuario_rol_id: int, db_session: Session = Depends(db.get_db)):
@@ -472,9 +691,14 @@ def delete_usuario_rol(usuario_rol_id: int, db_session: Session = Depends(db.get
 
 # ==================== METODO_ACCESO ====================
 @app.get("/api/metodos-acceso", response_model=List[schemas.MetodoAcceso])
-def get_metodos_acceso(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    metodos = db_session.query(models.MetodoAcceso).offset(skip).limit(limit).all()
-    return metodos
+def get_metodos_acceso(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                       db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.MetodoAcceso, schemas.MetodoAcceso, skip, limit, ids, expand)
+
+@app.post("/api/metodos-acceso/por-ids", response_model=List[schemas.MetodoAcceso])
+def get_metodos_acceso_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                               db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.MetodoAcceso, schemas.MetodoAcceso, consulta.ids, expand)
 
 @app.get("/api/metodos-acceso/{metodo_id}", response_model=schemas.MetodoAcceso)
 def get_metodo_acceso(metodo_id: int, db_session: Session = Depends(db.get_db)):
@@ -511,11 +735,28 @@ def delete_metodo_acceso(metodo_id: int, db_session: Session = Depends(db.get_db
     db_session.commit()
     return {"message": "Método de acceso eliminado"}
 
+@app.post("/api/metodos-acceso/identificar", response_model=schemas.IdentificacionResponse)
+def identificar_metodo_acceso(solicitud: schemas.IdentificacionRequest, db_session: Session = Depends(db.get_db)):
+    inicio = time.perf_counter()
+    biometria.motor.asegurar_cargado(db_session)
+    try:
+        coincidencia = biometria.motor.identificar(solicitud.tipo, solicitud.dato_biometrico,
+                                                   solicitud.umbral, solicitud.presupuesto_ms)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return schemas.IdentificacionResponse(**vars(coincidencia),
+                                          tiempo_ms=(time.perf_counter() - inicio) * 1000)
+
 # ==================== ACCESO_ESPACIO ====================
 @app.get("/api/accesos-espacio", response_model=List[schemas.AccesoEspacio])
-def get_accesos_espacio(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    accesos = db_session.query(models.AccesoEspacio).offset(skip).limit(limit).all()
-    return accesos
+def get_accesos_espacio(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                        db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.AccesoEspacio, schemas.AccesoEspacio, skip, limit, ids, expand)
+
+@app.post("/api/accesos-espacio/por-ids", response_model=List[schemas.AccesoEspacio])
+def get_accesos_espacio_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                                db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.AccesoEspacio, schemas.AccesoEspacio, consulta.ids, expand)
 
 @app.get("/api/accesos-espacio/{acceso_id}", response_model=schemas.AccesoEspacio)
 def get_acceso_espacio(acceso_id: int, db_session: Session = Depends(db.get_db)):
@@ -554,9 +795,14 @@ def delete_acceso_espacio(acceso_id: int, db_session: Session = Depends(db.get_d
 
 # ==================== TIPO_CULTIVO ====================
 @app.get("/api/tipos-cultivo", response_model=List[schemas.TipoCultivo])
-def get_tipos_cultivo(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    tipos = db_session.query(models.TipoCultivo).offset(skip).limit(limit).all()
-    return tipos
+def get_tipos_cultivo(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                      db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.TipoCultivo, schemas.TipoCultivo, skip, limit, ids, expand)
+
+@app.post("/api/tipos-cultivo/por-ids", response_model=List[schemas.TipoCultivo])
+def get_tipos_cultivo_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                              db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.TipoCultivo, schemas.TipoCultivo, consulta.ids, expand)
 
 @app.get("/api/tipos-cultivo/{tipo_id}", response_model=schemas.TipoCultivo)
 def get_tipo_cultivo(tipo_id: int, db_session: Session = Depends(db.get_db)):
@@ -595,9 +841,14 @@ def delete_tipo_cultivo(tipo_id: int, db_session: Session = Depends(db.get_db)):
 
 # ==================== CULTIVO ====================
 @app.get("/api/cultivos", response_model=List[schemas.Cultivo])
-def get_cultivos(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    cultivos = db_session.query(models.Cultivo).offset(skip).limit(limit).all()
-    return cultivos
+def get_cultivos(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                 db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.Cultivo, schemas.Cultivo, skip, limit, ids, expand)
+
+@app.post("/api/cultivos/por-ids", response_model=List[schemas.Cultivo])
+def get_cultivos_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                         db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.Cultivo, schemas.Cultivo, consulta.ids, expand)
 
 @app.get("/api/cultivos/{cultivo_id}", response_model=schemas.Cultivo)
 def get_cultivo(cultivo_id: int, db_session: Session = Depends(db.get_db)):
@@ -636,9 +887,14 @@ def delete_cultivo(cultivo_id: int, db_session: Session = Depends(db.get_db)):
 
 # ==================== VARIEDAD_CULTIVO ====================
 @app.get("/api/variedades-cultivo", response_model=List[schemas.VariedadCultivo])
-def get_variedades_cultivo(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    variedades = db_session.query(models.VariedadCultivo).offset(skip).limit(limit).all()
-    return variedades
+def get_variedades_cultivo(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                           db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.VariedadCultivo, schemas.VariedadCultivo, skip, limit, ids, expand)
+
+@app.post("/api/variedades-cultivo/por-ids", response_model=List[schemas.VariedadCultivo])
+def get_variedades_cultivo_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                                   db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.VariedadCultivo, schemas.VariedadCultivo, consulta.ids, expand)
 
 @app.get("/api/variedades-cultivo/{variedad_id}", response_model=schemas.VariedadCultivo)
 def get_variedad_cultivo(variedad_id: int, db_session: Session = Depends(db.get_db)):
@@ -677,9 +933,14 @@ def delete_variedad_cultivo(variedad_id: int, db_session: Session = Depends(db.g
 
 # ==================== FASE_PRODUCCION ====================
 @app.get("/api/fases-produccion", response_model=List[schemas.FaseProduccion])
-def get_fases_produccion(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    fases = db_session.query(models.FaseProduccion).offset(skip).limit(limit).all()
-    return fases
+def get_fases_produccion(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                         db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.FaseProduccion, schemas.FaseProduccion, skip, limit, ids, expand)
+
+@app.post("/api/fases-produccion/por-ids", response_model=List[schemas.FaseProduccion])
+def get_fases_produccion_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                                 db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.FaseProduccion, schemas.FaseProduccion, consulta.ids, expand)
 
 @app.get("/api/fases-produccion/{fase_id}", response_model=schemas.FaseProduccion)
 def get_fase_produccion(fase_id: int, db_session: Session = Depends(db.get_db)):
@@ -718,9 +979,14 @@ def delete_fase_produccion(fase_id: int, db_session: Session = Depends(db.get_db
 
 # ==================== CULTIVO_FASE ====================
 @app.get("/api/cultivos-fases", response_model=List[schemas.CultivoFase])
-def get_cultivos_fases(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    cultivos_fases = db_session.query(models.CultivoFase).offset(skip).limit(limit).all()
-    return cultivos_fases
+def get_cultivos_fases(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                       db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.CultivoFase, schemas.CultivoFase, skip, limit, ids, expand)
+
+@app.post("/api/cultivos-fases/por-ids", response_model=List[schemas.CultivoFase])
+def get_cultivos_fases_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                               db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.CultivoFase, schemas.CultivoFase, consulta.ids, expand)
 
 @app.get("/api/cultivos-fases/{cultivo_fase_id}", response_model=schemas.CultivoFase)
 def get_cultivo_fase(cultivo_fase_id: int, db_session: Session = Depends(db.get_db)):
@@ -759,9 +1025,14 @@ def delete_cultivo_fase(cultivo_fase_id: int, db_session: Session = Depends(db.g
 
 # ==================== NUTRIENTE ====================
 @app.get("/api/nutrientes", response_model=List[schemas.Nutriente])
-def get_nutrientes(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    nutrientes = db_session.query(models.Nutriente).offset(skip).limit(limit).all()
-    return nutrientes
+def get_nutrientes(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                   db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.Nutriente, schemas.Nutriente, skip, limit, ids, expand)
+
+@app.post("/api/nutrientes/por-ids", response_model=List[schemas.Nutriente])
+def get_nutrientes_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                           db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.Nutriente, schemas.Nutriente, consulta.ids, expand)
 
 @app.get("/api/nutrientes/{nutriente_id}", response_model=schemas.Nutriente)
 def get_nutriente(nutriente_id: int, db_session: Session = Depends(db.get_db)):
@@ -800,9 +1071,14 @@ def delete_nutriente(nutriente_id: int, db_session: Session = Depends(db.get_db)
 
 # ==================== FASE_NUTRIENTE ====================
 @app.get("/api/fases-nutriente", response_model=List[schemas.FaseNutriente])
-def get_fases_nutriente(skip: int = 0, limit: int = 100, db_session: Session = Depends(db.get_db)):
-    fases_nutriente = db_session.query(models.FaseNutriente).offset(skip).limit(limit).all()
-    return fases_nutriente
+def get_fases_nutriente(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                        db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.FaseNutriente, schemas.FaseNutriente, skip, limit, ids, expand)
+
+@app.post("/api/fases-nutriente/por-ids", response_model=List[schemas.FaseNutriente])
+def get_fases_nutriente_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                                db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.FaseNutriente, schemas.FaseNutriente, consulta.ids, expand)
 
 @app.get("/api/fases-nutriente/{fase_nutriente_id}", response_model=schemas.FaseNutriente)
 def get_fase_nutriente(fase_nutriente_id: int, db_session: Session = Depends(db.get_db)):
@@ -839,6 +1115,124 @@ def delete_fase_nutriente(fase_nutriente_id: int, db_session: Session = Depends(
     db_session.commit()
     return {"message": "Fase-Nutriente eliminada"}
 
+# ==================== SIEMBRA ====================
+@app.get("/api/siembras", response_model=List[schemas.Siembra])
+def get_siembras(skip: int = 0, limit: int = 100, ids: Optional[str] = None, expand: Optional[str] = None,
+                 db_session: Session = Depends(db.get_db)):
+    return respuestas.listar(db_session, models.Siembra, schemas.Siembra, skip, limit, ids, expand)
+
+@app.post("/api/siembras/por-ids", response_model=List[schemas.Siembra])
+def get_siembras_por_ids(consulta: schemas.ConsultaIds, expand: Optional[str] = None,
+                         db_session: Session = Depends(db.get_db)):
+    return respuestas.por_ids(db_session, models.Siembra, schemas.Siembra, consulta.ids, expand)
+
+@app.get("/api/siembras/{siembra_id}", response_model=schemas.Siembra)
+def get_siembra(siembra_id: int, db_session: Session = Depends(db.get_db)):
+    siembra = db_session.query(models.Siembra).filter(models.Siembra.id == siembra_id).first()
+    if not siembra:
+        raise HTTPException(status_code=404, detail="Siembra no encontrada")
+    return siembra
+
+@app.post("/api/siembras", response_model=schemas.Siembra)
+def create_siembra(siembra: schemas.SiembraCreate, db_session: Session = Depends(db.get_db)):
+    db_siembra = models.Siembra(**siembra.dict(exclude_none=True))
+    db_session.add(db_siembra)
+    db_session.commit()
+    db_session.refresh(db_siembra)
+    return db_siembra
+
+@app.put("/api/siembras/{siembra_id}", response_model=schemas.Siembra)
+def update_siembra(siembra_id: int, siembra: schemas.SiembraUpdate, db_session: Session = Depends(db.get_db)):
+    db_siembra = db_session.query(models.Siembra).filter(models.Siembra.id == siembra_id).first()
+    if not db_siembra:
+        raise HTTPException(status_code=404, detail="Siembra no encontrada")
+    for key, value in siembra.dict(exclude_unset=True).items():
+        setattr(db_siembra, key, value)
+    db_session.commit()
+    db_session.refresh(db_siembra)
+    return db_siembra
+
+@app.delete("/api/siembras/{siembra_id}")
+def delete_siembra(siembra_id: int, db_session: Session = Depends(db.get_db)):
+    db_siembra = db_session.query(models.Siembra).filter(models.Siembra.id == siembra_id).first()
+    if not db_siembra:
+        raise HTTPException(status_code=404, detail="Siembra no encontrada")
+    db_session.delete(db_siembra)
+    db_session.commit()
+    return {"message": "Siembra eliminada"}
+
+# ==================== ALERTA_SENSOR ====================
+@app.get("/api/alertas-sensor", response_model=List[schemas.AlertaSensor])
+def get_alertas_sensor(estructura_id: Optional[int] = None, activas: bool = False, skip: int = 0,
+                       limit: int = 100, db_session: Session = Depends(db.get_db)):
+    consulta = db_session.query(models.AlertaSensor)
+    if estructura_id is not None:
+        consulta = consulta.filter(models.AlertaSensor.estructura_id == estructura_id)
+    if activas:
+        consulta = consulta.filter(models.AlertaSensor.fecha_fin.is_(None))
+    return consulta.order_by(models.AlertaSensor.fecha_inicio.desc()).offset(skip).limit(limit).all()
+
+@app.get("/api/estructuras/{estructura_id}/umbrales", response_model=List[schemas.Umbral])
+def get_umbrales_estructura(estructura_id: int, db_session: Session = Depends(db.get_db)):
+    alertas.motor.asegurar_compilado(db_session)
+    return alertas.motor.umbrales(estructura_id)
+
+# ==================== LOTES ====================
+@app.post("/api/batch", response_model=schemas.ResultadoLote)
+def ejecutar_lote(lote: schemas.Lote, db_session: Session = Depends(db.get_db)):
+    return lotes.ejecutar(app.routes, db_session, lote.operaciones)
+
+# ==================== MÉTRICAS ====================
+@app.get("/metrics", include_in_schema=False)
+def exponer_metricas():
+    return Response(metricas.recolector.texto(), media_type=metricas.TIPO_CONTENIDO)
+
+# ==================== CONSULTAS LENTAS ====================
+@app.get("/api/admin/consultas-lentas", response_model=schemas.BitacoraLentas)
+def get_consultas_lentas(limit: int = Query(100, ge=1), claims: tokens.Claims = Depends(tokens.get_claims_admin)):
+    return schemas.BitacoraLentas(activa=lentas.bitacora.activa, umbral_ms=lentas.bitacora.umbral * 1000,
+                                  planes_descartados=lentas.bitacora.descartadas,
+                                  consultas=lentas.bitacora.listar(limit))
+
+@app.delete("/api/admin/consultas-lentas")
+def limpiar_consultas_lentas(claims: tokens.Claims = Depends(tokens.get_claims_admin)):
+    lentas.bitacora.limpiar()
+    return {"message": "Bitácora de consultas lentas vaciada"}
+
+# ==================== AUTENTICACIÓN ====================
+def _emitir_token(db_session: Session, usuario: models.Usuario) -> schemas.Token:
+    rol_ids = [rol_id for (rol_id,) in db_session.query(models.UsuarioRol.rol_id)
+               .filter(models.UsuarioRol.usuario_id == usuario.id)]
+    token = tokens.firmador.emitir(usuario.id, usuario.empresa_id, rol_ids)
+    return schemas.Token(access_token=token, expires_in=tokens.firmador.duracion)
+
+def _usuario_activo(db_session: Session, *filtros) -> Optional[models.Usuario]:
+    """Usuario que cumple los filtros si su persona y su empresa están activas"""
+    return (db_session.query(models.Usuario)
+            .join(models.Persona, models.Persona.id == models.Usuario.persona_id)
+            .join(models.Empresa, models.Empresa.id == models.Usuario.empresa_id)
+            .filter(*filtros, models.Persona.activo.isnot(False), models.Empresa.activo.isnot(False))
+            .first())
+
+@app.post("/api/auth/login", response_model=schemas.Token)
+def login(credenciales: schemas.LoginRequest, db_session: Session = Depends(db.get_db)):
+    usuario = _usuario_activo(db_session, models.Usuario.username == credenciales.username)
+    if not usuario or not tokens.verificar_password(credenciales.password, usuario.password_hash):
+        raise HTTPException(status_code=401, detail="Credenciales inválidas")
+    return _emitir_token(db_session, usuario)
+
+@app.post("/api/auth/refresh", response_model=schemas.Token)
+def refresh(claims: tokens.Claims = Depends(tokens.get_claims_refresh), db_session: Session = Depends(db.get_db)):
+    usuario = _usuario_activo(db_session, models.Usuario.id == claims.usuario_id)
+    if not usuario:
+        raise HTTPException(status_code=401, detail="Usuario no encontrado o inactivo")
+    return _emitir_token(db_session, usuario)
+
+@app.get("/api/auth/me", response_model=schemas.TokenClaims)
+def me(claims: tokens.Claims = Depends(tokens.get_claims)):
+    return schemas.TokenClaims(usuario_id=claims.usuario_id, empresa_id=claims.empresa_id,
+                               roles=claims.rol_ids, exp=claims.exp)
+
 @app.get("/")
 def root():
     return {"message": "Sistema Hidropónico API", "docs": "/docs"}
@@ -0,0 +1,250 @@
+"""
+Métricas de la API en formato de texto de Prometheus (GET /metrics)
+
+El middleware MedirPeticiones registra por ruta (la plantilla, p. ej.
+/api/espacios/{espacio_id}, para no crear una serie por id):
+- http_requests_total{metodo,ruta,estado}
+- http_request_duration_seconds{metodo,ruta} (histograma)
+- http_response_size_bytes{metodo,ruta} (histograma, bytes enviados tras la compresión)
+- http_requests_in_flight
+- db_queries_total, db_query_duration_seconds y db_pool_wait_seconds por
+  ruta, tomados del Registro de consultas de la petición (consultas.py)
+
+Con varios workers de uvicorn cada proceso tiene sus propios contadores. Si
+METRICAS_DIR está definido, cada proceso guarda una instantánea en
+METRICAS_DIR/metricas-<pid>.json cada METRICAS_INTERVALO_SEGUNDOS y al
+atender /metrics se suman las de todos: contadores e histogramas de todos
+los archivos (también de procesos que ya terminaron, para que los
+contadores no retrocedan) y medidores solo de procesos vivos. El directorio
+debe vaciarse al desplegar, como el de prometheus_client en modo multiproceso.
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from backend import consultas
+
+logger = logging.getLogger(__name__)
+
+DIRECTORIO = os.getenv("METRICAS_DIR") or None
+INTERVALO = float(os.getenv("METRICAS_INTERVALO_SEGUNDOS", "5"))
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# nombre -> (tipo, ayuda, etiquetas, límites de los buckets)
+DEFINICIONES: Dict[str, Tuple[str, str, Tuple[str, ...], Optional[Tuple[float, ...]]]] = {
+    "http_requests_total": ("counter", "Peticiones atendidas", ("metodo", "ruta", "estado"), None),
+    "http_request_duration_seconds": ("histogram", "Duración de las peticiones", ("metodo", "ruta"), SEGUNDOS),
+    "http_response_size_bytes": ("histogram", "Bytes del cuerpo de respuesta enviados", ("metodo", "ruta"), BYTES),
+    "http_requests_in_flight": ("gauge", "Peticiones en curso", (), None),
+    "db_queries_total": ("counter", "Sentencias SQL ejecutadas", ("metodo", "ruta"), None),
+    "db_query_duration_seconds": ("histogram", "Tiempo en la base de datos por petición", ("metodo", "ruta"), SEGUNDOS),
+    "db_pool_wait_seconds": ("histogram", "Espera por una conexión del pool por petición", ("metodo", "ruta"), SEGUNDOS),
+}
+
+Clave = Tuple[str, Tuple[str, ...]]
+
+
+class Metricas:
+    """Contadores, medidores e histogramas de un proceso"""
+
+    def __init__(self):
+        # Contadores y medidores: valor; histogramas: [cuenta por bucket..., +Inf, suma]
+        self._valores: Dict[Clave, object] = {}
+        self._lock = threading.Lock()
+
+    def sumar(self, nombre: str, etiquetas: Tuple[str, ...] = (), valor: float = 1.0):
+        with self._lock:
+            self._valores[(nombre, etiquetas)] = self._valores.get((nombre, etiquetas), 0.0) + valor
+
+    def observar(self, nombre: str, etiquetas: Tuple[str, ...], valor: float):
+        limites = DEFINICIONES[nombre][3]
+        with self._lock:
+            cuentas = self._valores.get((nombre, etiquetas))
+            if cuentas is None:
+                cuentas = self._valores[(nombre, etiquetas)] = [0] * (len(limites) + 1) + [0.0]
+            cuentas[bisect_left(limites, valor)] += 1
+            cuentas[-1] += valor
+
+    def instantanea(self) -> List[list]:
+        with self._lock:
+            return [[nombre, list(etiquetas), list(valor) if isinstance(valor, list) else valor]
+                    for (nombre, etiquetas), valor in self._valores.items()]
+
+
+def combinar(instantaneas: Iterable[List[list]]) -> Dict[Clave, object]:
+    total: Dict[Clave, object] = {}
+    for instantanea in instantaneas:
+        for nombre, etiquetas, valor in instantanea:
+            clave = (nombre, tuple(etiquetas))
+            if isinstance(valor, list):
+                actual = total.get(clave)
+                total[clave] = list(valor) if actual is None else [a + b for a, b in zip(actual, valor)]
+            else:
+                total[clave] = total.get(clave, 0.0) + valor
+    return total
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(nombres: Iterable[str], valores: Iterable[str], extra: str = "") -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def exponer(valores: Dict[Clave, object]) -> str:
+    """Texto en el formato de exposición de Prometheus"""
+    lineas = []
+    for nombre, (tipo, ayuda, etiquetas, limites) in DEFINICIONES.items():
+        series = sorted((clave[1], valor) for clave, valor in valores.items() if clave[0] == nombre)
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        for valores_etiquetas, valor in series:
+            if tipo != "histogram":
+                lineas.append(f"{nombre}{_etiquetas(etiquetas, valores_etiquetas)} {valor:g}")
+                continue
+            acumulado = 0
+            for limite, cuenta in zip((*limites, "+Inf"), valor[:-1]):
+                acumulado += cuenta
+                le = f'le="{limite:g}"' if limite != "+Inf" else 'le="+Inf"'
+                lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, valores_etiquetas, le)} {acumulado}")
+            lineas.append(f"{nombre}_sum{_etiquetas(etiquetas, valores_etiquetas)} {valor[-1]:g}")
+            lineas.append(f"{nombre}_count{_etiquetas(etiquetas, valores_etiquetas)} {acumulado}")
+    return "\n".join(lineas) + "\n"
+
+
+def _vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Recolector:
+    """Métricas del proceso y, con `directorio`, agregación entre procesos"""
+
+    def __init__(self, directorio: Optional[str] = DIRECTORIO, intervalo: float = INTERVALO):
+        self.metricas = Metricas()
+        self.directorio = directorio
+        self.intervalo = intervalo
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def _archivo(self, pid: int) -> str:
+        return os.path.join(self.directorio, f"metricas-{pid}.json")
+
+    def guardar(self):
+        if not self.directorio:
+            return
+        archivo = self._archivo(os.getpid())
+        temporal = f"{archivo}.tmp"
+        with open(temporal, "w") as salida:
+            json.dump(self.metricas.instantanea(), salida)
+        os.replace(temporal, archivo)
+
+    def recopilar(self) -> Dict[Clave, object]:
+        propia = self.metricas.instantanea()
+        if not self.directorio:
+            return combinar([propia])
+        instantaneas = [propia]
+        for archivo in glob.glob(os.path.join(self.directorio, "metricas-*.json")):
+            pid = int(os.path.basename(archivo)[len("metricas-"):-len(".json")])
+            if pid == os.getpid():
+                continue
+            try:
+                with open(archivo) as entrada:
+                    instantanea = json.load(entrada)
+            except (OSError, ValueError):
+                continue
+            if not _vivo(pid):
+                instantanea = [serie for serie in instantanea if DEFINICIONES[serie[0]][0] != "gauge"]
+            instantaneas.append(instantanea)
+        return combinar(instantaneas)
+
+    def texto(self) -> str:
+        return exponer(self.recopilar())
+
+    def iniciar(self):
+        if not self.directorio or self.intervalo <= 0 or (self._hilo is not None and self._hilo.is_alive()):
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._ejecutar, name="metricas", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+        try:
+            self.guardar()
+        except OSError:
+            logger.exception("Error guardando las métricas del proceso")
+
+    def _ejecutar(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                self.guardar()
+            except OSError:
+                logger.exception("Error guardando las métricas del proceso; se reintentará")
+
+
+recolector = Recolector()
+
+
+class MedirPeticiones:
+    """Middleware ASGI que alimenta las métricas HTTP y de base de datos de cada petición
+
+    Debe quedar dentro de consultas.MedirConsultas (agregarse antes) para ver
+    el Registro de consultas de la petición, y fuera de la compresión para
+    medir los bytes realmente enviados.
+    """
+
+    def __init__(self, app, metricas: Optional[Metricas] = None):
+        self.app = app
+        self.metricas = metricas or recolector.metricas
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        inicio = time.perf_counter()
+        estado = [500]
+        enviados = [0]
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado[0] = mensaje["status"]
+            elif mensaje["type"] == "http.response.body":
+                enviados[0] += len(mensaje.get("body", b""))
+            await send(mensaje)
+
+        self.metricas.sumar("http_requests_in_flight")
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            self.metricas.sumar("http_requests_in_flight", valor=-1.0)
+            ruta = scope.get("route")
+            etiquetas = (scope["method"], getattr(ruta, "path", "sin_ruta"))
+            self.metricas.sumar("http_requests_total", (*etiquetas, str(estado[0])))
+            self.metricas.observar("http_request_duration_seconds", etiquetas, time.perf_counter() - inicio)
+            self.metricas.observar("http_response_size_bytes", etiquetas, enviados[0])
+            consultas_peticion = consultas.actual()
+            if consultas_peticion is not None:
+                self.metricas.sumar("db_queries_total", etiquetas, consultas_peticion.cantidad)
+                self.metricas.observar("db_query_duration_seconds", etiquetas, consultas_peticion.segundos)
+                self.metricas.observar("db_pool_wait_seconds", etiquetas, consultas_peticion.espera_pool)
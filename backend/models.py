@@ -48,6 +48,7 @@ class Sede(Base):
     latitud = Column(Float)
     longitud = Column(Float)
     responsable_id = Column(Integer, ForeignKey("persona.id"))
+    geohash = Column(String(12))
     
     # Relaciones
     empresa = relationship("Empresa", back_populates="sedes")
@@ -129,6 +130,51 @@ class Estructura(Base):
     tipo_estructura = relationship("TipoEstructura", back_populates="estructuras")
 
 
+class LecturaSensor(Base):
+    __tablename__ = "lectura_sensor"
+    
+    # Tabla particionada por fecha y sin columna id: la clave compuesta solo
+    # identifica filas en el ORM, no existe como restricción en PostgreSQL
+    estructura_id = Column(Integer, ForeignKey("estructura.id"), primary_key=True)
+    metrica = Column(String(30), primary_key=True)
+    fecha = Column(DateTime, primary_key=True, default=datetime.utcnow)
+    valor = Column(Float, nullable=False)
+    
+    # Relaciones
+    estructura = relationship("Estructura")
+
+
+class LecturaSensorResumen(Base):
+    __tablename__ = "lectura_sensor_resumen"
+    
+    # Única en PostgreSQL mediante ux_lectura_sensor_resumen (ver "indexes" en JSON.json)
+    estructura_id = Column(Integer, ForeignKey("estructura.id"), primary_key=True)
+    metrica = Column(String(30), primary_key=True)
+    resolucion = Column(Integer, primary_key=True)
+    inicio = Column(DateTime, primary_key=True)
+    minimo = Column(Float)
+    maximo = Column(Float)
+    suma = Column(Float)
+    cantidad = Column(Integer, nullable=False)
+    
+    # Relaciones
+    estructura = relationship("Estructura")
+
+
+class ResumenMarca(Base):
+    __tablename__ = "resumen_marca"
+    
+    resolucion = Column(Integer, primary_key=True)
+    hasta = Column(DateTime, nullable=False)
+
+
+class ResumenPendiente(Base):
+    __tablename__ = "resumen_pendiente"
+    
+    # Minuto anterior a la marca de 1 minuto que recibió lecturas tardías
+    inicio = Column(DateTime, primary_key=True)
+
+
 class Usuario(Base):
     __tablename__ = "usuario"
     
@@ -291,3 +337,37 @@ class FaseNutriente(Base):
     cultivo_fase = relationship("CultivoFase", back_populates="nutrientes")
     nutriente = relationship("Nutriente", back_populates="fases")
 
+
+class Siembra(Base):
+    __tablename__ = "siembra"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    estructura_id = Column(Integer, ForeignKey("estructura.id"), nullable=False)
+    variedad_cultivo_id = Column(Integer, ForeignKey("variedad_cultivo.id"), nullable=False)
+    fecha_inicio = Column(DateTime, nullable=False, default=datetime.utcnow)
+    activo = Column(Boolean, default=True)
+    
+    # Relaciones
+    estructura = relationship("Estructura")
+    variedad_cultivo = relationship("VariedadCultivo")
+
+
+class AlertaSensor(Base):
+    __tablename__ = "alerta_sensor"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    estructura_id = Column(Integer, ForeignKey("estructura.id"), nullable=False)
+    cultivo_fase_id = Column(Integer, ForeignKey("cultivo_fase.id"))
+    nutriente_id = Column(Integer, ForeignKey("nutriente.id"))
+    metrica = Column(String(30), nullable=False)
+    tipo = Column(String(10), nullable=False)
+    objetivo = Column(Float)
+    valor = Column(Float)
+    fecha_inicio = Column(DateTime, nullable=False, default=datetime.utcnow)
+    fecha_fin = Column(DateTime)
+    
+    # Relaciones
+    estructura = relationship("Estructura")
+    cultivo_fase = relationship("CultivoFase")
+    nutriente = relationship("Nutriente")
+
@@ -0,0 +1,400 @@
+"""
+Lecturas recientes de sensores comprimidas en memoria (por worker)
+
+Cada serie (estructura, métrica) guarda sus puntos en bloques comprimidos al
+estilo Gorilla: marcas de tiempo en milisegundos codificadas como delta de
+deltas y valores como XOR con el anterior, de modo que una lectura periódica
+de un valor estable ocupa unos pocos bits. El bloque abierto se mantiene sin
+comprimir en arrays tipados hasta llenarse.
+
+Las series se alimentan de `lectura_sensor` con consultas incrementales
+(solo lo posterior a la última sincronización, por el índice
+estructura_id/metrica/fecha) como mucho cada RECIENTES_RECARGA_SEGUNDOS, así
+que ven las lecturas ingresadas por cualquier worker. La sincronización se
+queda RECIENTES_RETRASO_SEGUNDOS por detrás del reloj para no perder lecturas
+que el buffer de ingesta aún no ha volcado. Se descartan los bloques fuera de
+la ventana, los más antiguos de una estructura que supera su tope de memoria
+y, si se supera el tope global, las estructuras consultadas hace más tiempo.
+
+Las filas de cada sincronización se leen y se comprimen fuera del lock; con
+él solo se instala la estructura nueva o se agregan los puntos nuevos.
+
+Una lectura que llega con fecha ya sincronizada (tardía) no la trae la
+consulta incremental: al escribirla, telemetria.py llama a `marcar_tardias`
+y la estructura se descarta para recargarse completa en la próxima consulta
+de este worker (los demás la ven cuando la estructura sale de su caché). Los
+puntos que no son posteriores al último de su serie se cuentan en
+`fuera_de_orden`.
+"""
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from backend import invalidacion, models
+
+VENTANA = timedelta(hours=float(os.getenv("RECIENTES_VENTANA_HORAS", "24")))
+RECARGA = float(os.getenv("RECIENTES_RECARGA_SEGUNDOS", "5"))
+RETRASO = timedelta(seconds=float(os.getenv("RECIENTES_RETRASO_SEGUNDOS", "5")))
+MAX_BYTES_ESTRUCTURA = int(os.getenv("RECIENTES_MAX_BYTES_ESTRUCTURA", str(512 * 1024)))
+MAX_BYTES = int(os.getenv("RECIENTES_MAX_BYTES", str(64 * 1024 * 1024)))
+
+PUNTOS_POR_BLOQUE = 256
+# Bytes por punto del bloque abierto (int64 + float64)
+_BYTES_PUNTO_ABIERTO = 16
+
+_EPOCA = datetime(1970, 1, 1)
+_MILISEGUNDO = timedelta(milliseconds=1)
+
+
+def a_milisegundos(fecha: datetime) -> int:
+    return (fecha - _EPOCA) // _MILISEGUNDO
+
+
+def desde_milisegundos(ms: int) -> datetime:
+    return _EPOCA + timedelta(milliseconds=ms)
+
+
+# ---------- Codificación Gorilla ----------
+
+class _Escritor:
+    def __init__(self):
+        self.datos = bytearray()
+        self._acumulado = 0
+        self._pendientes = 0
+
+    def escribir(self, valor: int, bits: int):
+        self._acumulado = (self._acumulado << bits) | (valor & ((1 << bits) - 1))
+        self._pendientes += bits
+        while self._pendientes >= 8:
+            self._pendientes -= 8
+            self.datos.append((self._acumulado >> self._pendientes) & 0xFF)
+        self._acumulado &= (1 << self._pendientes) - 1
+
+    def cerrar(self) -> bytes:
+        if self._pendientes:
+            self.datos.append((self._acumulado << (8 - self._pendientes)) & 0xFF)
+            self._pendientes = 0
+        return bytes(self.datos)
+
+
+class _Lector:
+    def __init__(self, datos: bytes):
+        self._numero = int.from_bytes(datos, "big")
+        self._total = len(datos) * 8
+        self._posicion = 0
+
+    def leer(self, bits: int) -> int:
+        self._posicion += bits
+        return (self._numero >> (self._total - self._posicion)) & ((1 << bits) - 1)
+
+
+# (prefijo, bits del prefijo, bits del valor) para el delta de deltas de tiempo
+_RANGOS_TIEMPO = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12))
+
+
+def _con_signo(valor: int, bits: int) -> int:
+    return valor - (1 << bits) if valor >> (bits - 1) else valor
+
+
+def comprimir(tiempos_ms, valores) -> bytes:
+    """Codifica una secuencia no vacía de tiempos crecientes (ms) y valores float64"""
+    tiempos = [int(t) for t in tiempos_ms]
+    bits_valores = np.asarray(valores, dtype=np.float64).view(np.uint64).tolist()
+    escritor = _Escritor()
+    escritor.escribir(len(tiempos), 16)
+    escritor.escribir(tiempos[0], 64)
+    escritor.escribir(bits_valores[0], 64)
+    delta_anterior = 0
+    ceros_izq, ceros_der = None, None
+    for i in range(1, len(tiempos)):
+        delta = tiempos[i] - tiempos[i - 1]
+        dod = delta - delta_anterior
+        delta_anterior = delta
+        if dod == 0:
+            escritor.escribir(0, 1)
+        else:
+            for prefijo, bits_prefijo, bits in _RANGOS_TIEMPO:
+                if -(1 << (bits - 1)) < dod <= (1 << (bits - 1)):
+                    escritor.escribir(prefijo, bits_prefijo)
+                    escritor.escribir(dod + (1 << (bits - 1)) - 1, bits)
+                    break
+            else:
+                escritor.escribir(0b1111, 4)
+                escritor.escribir(dod, 64)
+
+        xor = bits_valores[i] ^ bits_valores[i - 1]
+        if xor == 0:
+            escritor.escribir(0, 1)
+            continue
+        izq = min(64 - xor.bit_length(), 31)
+        der = (xor & -xor).bit_length() - 1
+        if ceros_izq is not None and izq >= ceros_izq and der >= ceros_der:
+            escritor.escribir(0b10, 2)
+            escritor.escribir(xor >> ceros_der, 64 - ceros_izq - ceros_der)
+        else:
+            significativos = 64 - izq - der
+            escritor.escribir(0b11, 2)
+            escritor.escribir(izq, 5)
+            escritor.escribir(significativos - 1, 6)
+            escritor.escribir(xor >> der, significativos)
+            ceros_izq, ceros_der = izq, der
+    return escritor.cerrar()
+
+
+def descomprimir(datos: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    lector = _Lector(datos)
+    n = lector.leer(16)
+    tiempos = [lector.leer(64)]
+    bits_valores = [lector.leer(64)]
+    delta = 0
+    ceros_izq, ceros_der = 0, 0
+    for _ in range(1, n):
+        if lector.leer(1):
+            for _prefijo, _bits_prefijo, bits in _RANGOS_TIEMPO:
+                if not lector.leer(1):
+                    delta += lector.leer(bits) - (1 << (bits - 1)) + 1
+                    break
+            else:
+                delta += _con_signo(lector.leer(64), 64)
+        tiempos.append(tiempos[-1] + delta)
+
+        if not lector.leer(1):
+            bits_valores.append(bits_valores[-1])
+            continue
+        if lector.leer(1):
+            ceros_izq = lector.leer(5)
+            significativos = lector.leer(6) + 1
+            ceros_der = 64 - ceros_izq - significativos
+        xor = lector.leer(64 - ceros_izq - ceros_der) << ceros_der
+        bits_valores.append(bits_valores[-1] ^ xor)
+    return (np.array(tiempos, dtype=np.int64),
+            np.array(bits_valores, dtype=np.uint64).view(np.float64))
+
+
+# ---------- Series y ring buffer ----------
+
+@dataclass
+class _Bloque:
+    inicio: int
+    fin: int
+    puntos: int
+    datos: bytes
+
+
+class SerieComprimida:
+    def __init__(self, puntos_por_bloque: int = PUNTOS_POR_BLOQUE):
+        self.puntos_por_bloque = puntos_por_bloque
+        self._bloques: Deque[_Bloque] = deque()
+        self._tiempos = array("q")
+        self._valores = array("d")
+        self._bytes_bloques = 0
+        self.ultimo: Optional[int] = None
+
+    def __len__(self):
+        return sum(b.puntos for b in self._bloques) + len(self._tiempos)
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes_bloques + _BYTES_PUNTO_ABIERTO * len(self._tiempos)
+
+    @property
+    def inicio(self) -> Optional[int]:
+        if self._bloques:
+            return self._bloques[0].inicio
+        return self._tiempos[0] if self._tiempos else None
+
+    def agregar(self, tiempo_ms: int, valor: float) -> bool:
+        """Añade un punto; los que no son posteriores al último se ignoran"""
+        if self.ultimo is not None and tiempo_ms <= self.ultimo:
+            return False
+        self._tiempos.append(tiempo_ms)
+        self._valores.append(valor)
+        self.ultimo = tiempo_ms
+        if len(self._tiempos) >= self.puntos_por_bloque:
+            self._sellar()
+        return True
+
+    def _sellar(self):
+        datos = comprimir(self._tiempos, self._valores)
+        self._bloques.append(_Bloque(self._tiempos[0], self._tiempos[-1], len(self._tiempos), datos))
+        self._bytes_bloques += len(datos)
+        self._tiempos = array("q")
+        self._valores = array("d")
+
+    def descartar_antes(self, tiempo_ms: int):
+        """Quita los bloques cerrados que terminan antes de tiempo_ms"""
+        while self._bloques and self._bloques[0].fin < tiempo_ms:
+            self._bytes_bloques -= len(self._bloques.popleft().datos)
+
+    def descartar_mas_antiguo(self) -> bool:
+        if self._bloques:
+            self._bytes_bloques -= len(self._bloques.popleft().datos)
+            return True
+        if self._tiempos:
+            self._tiempos = array("q")
+            self._valores = array("d")
+            return True
+        return False
+
+    def leer(self, desde_ms: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        partes = [descomprimir(b.datos) for b in self._bloques if desde_ms is None or b.fin >= desde_ms]
+        partes.append((np.frombuffer(self._tiempos, dtype=np.int64) if self._tiempos else np.empty(0, np.int64),
+                       np.frombuffer(self._valores, dtype=np.float64) if self._valores else np.empty(0)))
+        tiempos = np.concatenate([t for t, _ in partes])
+        valores = np.concatenate([v for _, v in partes])
+        if desde_ms is not None:
+            primero = int(np.searchsorted(tiempos, desde_ms))
+            tiempos, valores = tiempos[primero:], valores[primero:]
+        return tiempos, valores
+
+
+class _Estructura:
+    def __init__(self, hasta: datetime):
+        self.series: Dict[str, SerieComprimida] = {}
+        self.hasta = hasta  # lecturas con fecha <= hasta ya están cargadas
+        self.sincronizado = 0.0
+
+    @property
+    def bytes(self) -> int:
+        return sum(s.bytes for s in self.series.values())
+
+    @property
+    def puntos(self) -> int:
+        return sum(len(s) for s in self.series.values())
+
+    def agregar(self, por_metrica: Dict[str, Tuple[array, array]], desde_ms: Optional[int] = None) -> int:
+        """Agrega los puntos posteriores a desde_ms; devuelve cuántos no entraron por estar fuera de orden"""
+        fuera_de_orden = 0
+        for metrica, (tiempos, valores) in por_metrica.items():
+            serie = self.series.get(metrica)
+            if serie is None:
+                serie = self.series[metrica] = SerieComprimida()
+            for tiempo_ms, valor in zip(tiempos, valores):
+                if (desde_ms is None or tiempo_ms > desde_ms) and not serie.agregar(tiempo_ms, valor):
+                    fuera_de_orden += 1
+        return fuera_de_orden
+
+
+class LecturasRecientes:
+    def __init__(self, ventana: timedelta = VENTANA, recarga: float = RECARGA, retraso: timedelta = RETRASO,
+                 max_bytes_estructura: int = MAX_BYTES_ESTRUCTURA, max_bytes: int = MAX_BYTES):
+        self.ventana = ventana
+        self.recarga = recarga
+        self.retraso = retraso
+        self.max_bytes_estructura = max_bytes_estructura
+        self.max_bytes = max_bytes
+        self._estructuras: "OrderedDict[int, _Estructura]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.fuera_de_orden = 0
+        self.recargas_tardias = 0
+
+    def aplicar(self, estructura_id: int, filas, hasta: datetime):
+        """Añade filas (metrica, fecha, valor) ordenadas por fecha, cargadas hasta `hasta`"""
+        por_metrica: Dict[str, Tuple[array, array]] = {}
+        for metrica, fecha, valor in filas:
+            puntos = por_metrica.get(metrica)
+            if puntos is None:
+                puntos = por_metrica[metrica] = (array("q"), array("d"))
+            puntos[0].append(a_milisegundos(fecha))
+            puntos[1].append(valor)
+        with self._lock:
+            nueva = None if estructura_id in self._estructuras else _Estructura(hasta - self.ventana)
+        fuera_de_orden = 0
+        if nueva is not None:
+            # Carga completa: se comprime sin el lock y con él solo se instala
+            fuera_de_orden = nueva.agregar(por_metrica)
+        with self._lock:
+            estructura = self._estructuras.get(estructura_id)
+            if estructura is None:
+                if nueva is None:
+                    # Se descartó mientras se leían las filas incrementales: se recarga en la próxima consulta
+                    return
+                estructura = self._estructuras[estructura_id] = nueva
+            else:
+                # Otra sincronización pudo adelantarse: solo lo posterior a lo ya cargado
+                fuera_de_orden = estructura.agregar(por_metrica, a_milisegundos(estructura.hasta))
+            self.fuera_de_orden += fuera_de_orden
+            estructura.hasta = max(estructura.hasta, hasta)
+            estructura.sincronizado = time.monotonic()
+            self._estructuras.move_to_end(estructura_id)
+            self._recortar(estructura_id, estructura)
+
+    def _recortar(self, estructura_id: int, estructura: _Estructura):
+        limite = a_milisegundos(estructura.hasta - self.ventana)
+        for serie in estructura.series.values():
+            serie.descartar_antes(limite)
+        while estructura.bytes > self.max_bytes_estructura:
+            con_datos = [s for s in estructura.series.values() if s.inicio is not None]
+            if not con_datos:
+                break
+            min(con_datos, key=lambda s: s.inicio).descartar_mas_antiguo()
+        while len(self._estructuras) > 1 and self.bytes() > self.max_bytes:
+            self._estructuras.popitem(last=False)
+
+    def sincronizar(self, db_session: Session, estructura_id: int):
+        with self._lock:
+            estructura = self._estructuras.get(estructura_id)
+            if estructura is not None and time.monotonic() - estructura.sincronizado < self.recarga:
+                return
+        hasta = datetime.utcnow() - self.retraso
+        desde = estructura.hasta if estructura is not None else hasta - self.ventana
+        filas = (db_session.query(models.LecturaSensor.metrica, models.LecturaSensor.fecha,
+                                  models.LecturaSensor.valor)
+                 .filter(models.LecturaSensor.estructura_id == estructura_id,
+                         models.LecturaSensor.fecha > desde, models.LecturaSensor.fecha <= hasta)
+                 .order_by(models.LecturaSensor.fecha)
+                 .yield_per(10000))
+        self.aplicar(estructura_id, filas, hasta)
+
+    def ultimas(self, db_session: Session, estructura_id: int, metrica: Optional[str] = None,
+                desde: Optional[datetime] = None) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """Tiempos (ms desde 1970) y valores por métrica, desde `desde` (o toda la ventana)"""
+        self.sincronizar(db_session, estructura_id)
+        desde_ms = a_milisegundos(desde) if desde is not None else None
+        with self._lock:
+            estructura = self._estructuras.get(estructura_id)
+            if estructura is None:
+                return {}
+            return {nombre: serie.leer(desde_ms) for nombre, serie in sorted(estructura.series.items())
+                    if metrica is None or nombre == metrica}
+
+    def invalidar(self, estructura_id: int):
+        with self._lock:
+            self._estructuras.pop(estructura_id, None)
+
+    def marcar_tardias(self, primeras: Dict[int, datetime]):
+        """Descarta las estructuras que ya sincronizaron la fecha de su lectura más antigua recién escrita"""
+        with self._lock:
+            for estructura_id, fecha in primeras.items():
+                estructura = self._estructuras.get(estructura_id)
+                if estructura is not None and fecha <= estructura.hasta:
+                    del self._estructuras[estructura_id]
+                    self.recargas_tardias += 1
+
+    def bytes(self) -> int:
+        with self._lock:
+            return sum(e.bytes for e in self._estructuras.values())
+
+    def memoria(self) -> List[Tuple[int, int, int, int]]:
+        """(estructura_id, series, puntos, bytes) de cada estructura en memoria"""
+        with self._lock:
+            return [(estructura_id, len(e.series), e.puntos, e.bytes)
+                    for estructura_id, e in sorted(self._estructuras.items())]
+
+
+recientes = LecturasRecientes()
+
+
+@invalidacion.suscribir(models.Estructura)
+def _descartar_estructuras(cambios):
+    for cambio in cambios:
+        if cambio.eliminado:
+            recientes.invalidar(cambio.id)
@@ -0,0 +1,170 @@
+"""
+Serialización de respuestas JSON
+
+Por defecto FastAPI valida cada objeto ORM contra el `response_model`
+(from_attributes), lo convierte con jsonable_encoder y lo codifica con el
+módulo json. Para los listados eso domina el tiempo de respuesta, así que:
+
+- La clase de respuesta por defecto usa orjson si está instalado
+  (API_JSON=json vuelve a la estándar).
+- `listar` arma la respuesta sin pasar por ese camino, según API_LISTADOS:
+    filas    selecciona solo las columnas del esquema y codifica las tuplas
+             con orjson (sin Pydantic); requiere orjson, si no usa "esquema"
+    esquema  valida y serializa la lista en una sola llamada de un
+             TypeAdapter(List[esquema]) cacheado
+    fastapi  devuelve los objetos ORM y deja el trabajo a FastAPI (comportamiento anterior)
+
+`por_ids` resuelve muchos ids de una entidad con una sola consulta
+`WHERE id = ANY(:ids)` (GET /api/<entidad>?ids=1,2,3 y POST
+/api/<entidad>/por-ids), respeta el orden pedido e informa los ids que no
+existen en el encabezado X-Ids-Faltantes (los primeros MAX_FALTANTES; el
+total va en X-Ids-Faltantes-Total).
+
+Con `expand=` (ver expansion.py) los listados cargan y anidan los objetos
+relacionados; en ese caso siempre se usa el camino del TypeAdapter.
+"""
+import os
+from functools import lru_cache
+from typing import List, Optional, Sequence, Type
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import Integer, any_, literal
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+
+from backend import expansion, tiempos
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson es opcional
+    orjson = None
+
+USAR_ORJSON = orjson is not None and os.getenv("API_JSON", "orjson") != "json"
+LISTADOS = os.getenv("API_LISTADOS", "filas")
+MAX_IDS = int(os.getenv("API_MAX_IDS", "5000"))
+ENCABEZADO_FALTANTES = "X-Ids-Faltantes"
+ENCABEZADO_TOTAL_FALTANTES = "X-Ids-Faltantes-Total"
+# Ids faltantes listados en el encabezado (el resto solo cuenta en el total)
+MAX_FALTANTES = int(os.getenv("API_MAX_FALTANTES", "100"))
+# Rango de las columnas id (integer de PostgreSQL)
+ID_MINIMO, ID_MAXIMO = -2 ** 31, 2 ** 31 - 1
+
+if USAR_ORJSON:
+    from fastapi.responses import ORJSONResponse as _Base
+else:
+    _Base = JSONResponse
+
+
+class RespuestaJSON(_Base):
+    """Clase de respuesta por defecto; mide la codificación para Server-Timing"""
+
+    def render(self, content) -> bytes:
+        with tiempos.medir("json"):
+            return super().render(content)
+
+
+class RespuestaCodificada(Response):
+    """Respuesta cuyo cuerpo ya viene codificado en JSON"""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return content
+
+
+@lru_cache(maxsize=None)
+def adaptador(esquema: type) -> TypeAdapter:
+    return TypeAdapter(List[esquema])
+
+
+@lru_cache(maxsize=None)
+def columnas(modelo: type, esquema: type) -> tuple:
+    """Columnas del modelo que expone el esquema, en el orden de sus campos"""
+    tabla = modelo.__table__.columns
+    return tuple(getattr(modelo, campo) for campo in esquema.model_fields if campo in tabla)
+
+
+def desde_objetos(esquema: type, objetos: Sequence) -> Response:
+    tipo = adaptador(esquema)
+    with tiempos.medir("validacion"):
+        validados = tipo.validate_python(objetos, from_attributes=True)
+    with tiempos.medir("json"):
+        return RespuestaCodificada(tipo.dump_json(validados))
+
+
+def desde_filas(filas: Sequence, claves: Optional[Sequence[str]] = None) -> Response:
+    """Codifica tuplas (p. ej. Row de SQLAlchemy) como lista de objetos JSON"""
+    if claves is None:
+        claves = filas[0]._fields if filas else ()
+    with tiempos.medir("json"):
+        return RespuestaCodificada(orjson.dumps([dict(zip(claves, fila)) for fila in filas]))
+
+
+def parsear_ids(texto: str) -> List[int]:
+    """Convierte "1,2,3" en [1, 2, 3]"""
+    try:
+        return [int(parte) for parte in texto.split(",") if parte.strip()]
+    except ValueError:
+        raise HTTPException(status_code=422, detail="ids debe ser una lista de enteros separados por comas")
+
+
+def por_ids(db_session: Session, modelo: type, esquema: Type[BaseModel], ids: Sequence[int],
+            expand: Optional[str] = None) -> Response:
+    """Filas de `modelo` con los ids pedidos, en el mismo orden y sin repetir"""
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Se permiten como máximo {MAX_IDS} ids por consulta")
+    if any(i < ID_MINIMO or i > ID_MAXIMO for i in ids):
+        raise HTTPException(status_code=422, detail=f"Los ids deben estar entre {ID_MINIMO} y {ID_MAXIMO}")
+    filtro = modelo.id == any_(literal(ids, ARRAY(Integer)))
+    rutas = expansion.parsear(modelo, expand)
+    if rutas:
+        with tiempos.medir("orm"):
+            objetos = db_session.query(modelo).options(*expansion.opciones(modelo, rutas)).filter(filtro).all()
+            expansion.cargar(db_session, modelo, objetos, rutas)
+        encontrados = {objeto.id: objeto for objeto in objetos}
+        respuesta = desde_objetos(expansion.esquema(modelo, esquema, rutas),
+                                  [encontrados[i] for i in ids if i in encontrados])
+    elif LISTADOS == "filas" and orjson is not None:
+        cols = columnas(modelo, esquema)
+        claves = [c.key for c in cols]
+        posicion = claves.index("id")
+        with tiempos.medir("orm"):
+            filas = db_session.query(*cols).filter(filtro).all()
+        encontrados = {fila[posicion]: fila for fila in filas}
+        respuesta = desde_filas([encontrados[i] for i in ids if i in encontrados], claves)
+    else:
+        with tiempos.medir("orm"):
+            objetos = db_session.query(modelo).filter(filtro).all()
+        encontrados = {objeto.id: objeto for objeto in objetos}
+        respuesta = desde_objetos(esquema, [encontrados[i] for i in ids if i in encontrados])
+    faltantes = [i for i in ids if i not in encontrados]
+    if faltantes:
+        respuesta.headers[ENCABEZADO_FALTANTES] = ",".join(map(str, faltantes[:MAX_FALTANTES]))
+        respuesta.headers[ENCABEZADO_TOTAL_FALTANTES] = str(len(faltantes))
+    return respuesta
+
+
+def listar(db_session: Session, modelo: type, esquema: Type[BaseModel], skip: int = 0, limit: int = 100,
+           ids: Optional[str] = None, expand: Optional[str] = None):
+    """Listado paginado de `modelo` serializado como List[esquema] (o los `ids` indicados)"""
+    if ids is not None:
+        return por_ids(db_session, modelo, esquema, parsear_ids(ids), expand)
+    rutas = expansion.parsear(modelo, expand)
+    if rutas:
+        with tiempos.medir("orm"):
+            objetos = (db_session.query(modelo).options(*expansion.opciones(modelo, rutas))
+                       .offset(skip).limit(limit).all())
+            expansion.cargar(db_session, modelo, objetos, rutas)
+        return desde_objetos(expansion.esquema(modelo, esquema, rutas), objetos)
+    if LISTADOS == "filas" and orjson is not None:
+        cols = columnas(modelo, esquema)
+        with tiempos.medir("orm"):
+            filas = db_session.query(*cols).offset(skip).limit(limit).all()
+        return desde_filas(filas, [c.key for c in cols])
+    with tiempos.medir("orm"):
+        objetos = db_session.query(modelo).offset(skip).limit(limit).all()
+    if LISTADOS == "fastapi":
+        return objetos
+    return desde_objetos(esquema, objetos)
@@ -0,0 +1,278 @@
+"""
+Resúmenes (downsampling) de lecturas de sensores
+
+Las lecturas se resumen en `lectura_sensor_resumen` en tres niveles: 1 minuto
+(desde `lectura_sensor`), 1 hora (desde el de 1 minuto) y 1 día (desde el de
+1 hora), guardando mínimo, máximo, suma y cantidad por intervalo. Cada nivel
+tiene una marca en `resumen_marca`: todo lo anterior a la marca ya está
+resumido, así que cada pasada solo procesa intervalos completos nuevos.
+La marca del nivel de minutos va RESUMEN_RETRASO_SEGUNDOS por detrás del
+reloj para dar tiempo a que el buffer de ingesta vuelque las lecturas.
+
+Las lecturas que llegan después de resumido su minuto (anteriores a la
+marca) lo anotan en `resumen_pendiente` en la misma transacción en que se
+escriben (`marcar_tardias`); cada pasada vuelve a resumir esos minutos y las
+horas y días ya resumidos que los contienen.
+
+Las consultas de series eligen el nivel más grueso que aún respeta el
+presupuesto de puntos y completan lo posterior a la marca desde las lecturas
+crudas, de modo que el resultado no depende de que el resumidor esté al día.
+"""
+import logging
+import math
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from backend import models, schemas
+
+logger = logging.getLogger(__name__)
+
+# (resolución en segundos, resolución de origen; None = lecturas crudas)
+NIVELES: Tuple[Tuple[int, Optional[int]], ...] = ((60, None), (3600, 60), (86400, 3600))
+RESOLUCIONES = tuple(resolucion for resolucion, _ in NIVELES)
+
+INTERVALO = float(os.getenv("RESUMEN_INTERVALO_SEGUNDOS", "60"))
+RETRASO = float(os.getenv("RESUMEN_RETRASO_SEGUNDOS", "300"))
+# Intervalos procesados por transacción al ponerse al día con un histórico grande
+INTERVALOS_POR_PASO = 1440
+
+_ORIGEN = datetime(2000, 1, 1)
+_BLOQUEO = 0x7265_7375  # clave del bloqueo consultivo que serializa las pasadas entre workers
+_BLOQUEAR = text("SELECT pg_try_advisory_xact_lock(:clave)")
+
+_INSERTAR = """
+INSERT INTO lectura_sensor_resumen
+    (estructura_id, metrica, resolucion, inicio, minimo, maximo, suma, cantidad)
+SELECT estructura_id, metrica, :resolucion,
+       date_bin(make_interval(secs => :resolucion), {fecha}, TIMESTAMP '2000-01-01'),
+       {agregados}
+FROM {origen}
+WHERE {filtro} {fecha} >= :desde AND {fecha} < :hasta
+GROUP BY 1, 2, 4
+ON CONFLICT (estructura_id, metrica, resolucion, inicio) DO UPDATE
+SET minimo = EXCLUDED.minimo, maximo = EXCLUDED.maximo,
+    suma = EXCLUDED.suma, cantidad = EXCLUDED.cantidad
+"""
+
+_DESDE_CRUDAS = text(_INSERTAR.format(
+    fecha="fecha", origen="lectura_sensor", filtro="",
+    agregados="min(valor), max(valor), sum(valor), count(*)"))
+
+_DESDE_RESUMEN = text(_INSERTAR.format(
+    fecha="inicio", origen="lectura_sensor_resumen", filtro="resolucion = :origen AND",
+    agregados="min(minimo), max(maximo), sum(suma), sum(cantidad)"))
+
+_MARCAR_TARDIAS = text("""
+INSERT INTO resumen_pendiente (inicio)
+SELECT inicio FROM unnest(CAST(:inicios AS timestamp[])) AS inicio
+WHERE inicio < (SELECT hasta FROM resumen_marca WHERE resolucion = :resolucion)
+ON CONFLICT (inicio) DO NOTHING
+""")
+
+_TOMAR_PENDIENTES = text("DELETE FROM resumen_pendiente RETURNING inicio")
+
+_SERIE = text("""
+WITH datos AS (
+    SELECT inicio, minimo, maximo, suma, cantidad
+    FROM lectura_sensor_resumen
+    WHERE estructura_id = :estructura_id AND metrica = :metrica AND resolucion = :nivel
+      AND inicio >= :desde AND inicio < LEAST(:hasta, :marca)
+    UNION ALL
+    SELECT fecha, valor, valor, valor, 1
+    FROM lectura_sensor
+    WHERE estructura_id = :estructura_id AND metrica = :metrica
+      AND fecha >= GREATEST(:desde, :marca) AND fecha < :hasta
+)
+SELECT date_bin(make_interval(secs => :ancho), inicio, :desde) AS intervalo,
+       min(minimo), max(maximo), sum(suma) / sum(cantidad), sum(cantidad)
+FROM datos
+GROUP BY 1
+ORDER BY 1
+""")
+
+
+def truncar(fecha: datetime, resolucion: int) -> datetime:
+    """Inicio del intervalo de `resolucion` segundos que contiene a `fecha`"""
+    segundos = (fecha - _ORIGEN) // timedelta(seconds=1)
+    return _ORIGEN + timedelta(seconds=segundos - segundos % resolucion)
+
+
+def elegir_resolucion(segundos: float, puntos: int) -> Tuple[int, int]:
+    """
+    Devuelve (nivel, ancho): el nivel más grueso cuyo intervalo no supera
+    `segundos / puntos` y el ancho de los puntos devueltos, múltiplo del
+    nivel, para no pasar de `puntos`.
+    """
+    necesario = segundos / puntos
+    nivel = max((r for r in RESOLUCIONES if r <= necesario), default=RESOLUCIONES[0])
+    return nivel, max(nivel, math.ceil(necesario / nivel) * nivel)
+
+
+def marca(db_session: Session, resolucion: int) -> Optional[datetime]:
+    fila = db_session.get(models.ResumenMarca, resolucion)
+    return fila.hasta if fila is not None else None
+
+
+def _pendiente_desde(db_session: Session, resolucion: int, origen: Optional[int]) -> Optional[datetime]:
+    """Marca del nivel o, si aún no tiene, inicio del primer intervalo con datos de origen"""
+    desde = marca(db_session, resolucion)
+    if desde is not None:
+        return desde
+    if origen is None:
+        primera = db_session.query(func.min(models.LecturaSensor.fecha)).scalar()
+    else:
+        primera = (db_session.query(func.min(models.LecturaSensorResumen.inicio))
+                   .filter(models.LecturaSensorResumen.resolucion == origen).scalar())
+    return truncar(primera, resolucion) if primera is not None else None
+
+
+def resumir(db_session: Session, resolucion: int, desde: datetime, hasta: datetime) -> int:
+    """
+    (Re)calcula los intervalos del nivel entre desde y hasta (alineados a la
+    resolución) sin tocar la marca; sirve también para corregir lecturas tardías.
+    """
+    origen = dict(NIVELES)[resolucion]
+    consulta = _DESDE_CRUDAS if origen is None else _DESDE_RESUMEN
+    resultado = db_session.execute(consulta, {"resolucion": resolucion, "origen": origen,
+                                              "desde": desde, "hasta": hasta})
+    return max(resultado.rowcount, 0)
+
+
+def marcar_tardias(db_session: Session, fechas: Iterable[datetime]):
+    """Anota para volver a resumir los minutos de `fechas` que ya están resumidos (sin confirmar)"""
+    inicios = sorted({truncar(fecha, RESOLUCIONES[0]) for fecha in fechas})
+    if inicios:
+        db_session.execute(_MARCAR_TARDIAS, {"inicios": inicios, "resolucion": RESOLUCIONES[0]})
+
+
+def _rangos(inicios: List[datetime], resolucion: int) -> List[Tuple[datetime, datetime]]:
+    """Une los intervalos consecutivos de `inicios` (ordenados) en rangos [desde, hasta)"""
+    paso = timedelta(seconds=resolucion)
+    rangos: List[List[datetime]] = []
+    for inicio in inicios:
+        if rangos and rangos[-1][1] == inicio:
+            rangos[-1][1] = inicio + paso
+        else:
+            rangos.append([inicio, inicio + paso])
+    return [(desde, hasta) for desde, hasta in rangos]
+
+
+def resumir_tardias(db_session: Session) -> Dict[int, int]:
+    """
+    Vuelve a resumir los minutos anotados por `marcar_tardias` y los
+    intervalos ya resumidos de los niveles superiores que los contienen
+    (sin confirmar). Devuelve las filas escritas por resolución.
+    """
+    minutos = [inicio for (inicio,) in db_session.execute(_TOMAR_PENDIENTES)]
+    escritas: Dict[int, int] = {}
+    for resolucion, _ in NIVELES:
+        hasta = marca(db_session, resolucion)
+        if not minutos or hasta is None:
+            break
+        inicios = {truncar(minuto, resolucion) for minuto in minutos}
+        for desde, fin in _rangos(sorted(inicio for inicio in inicios if inicio < hasta), resolucion):
+            escritas[resolucion] = escritas.get(resolucion, 0) + resumir(db_session, resolucion, desde, fin)
+    return escritas
+
+
+def actualizar(db_session: Session, ahora: Optional[datetime] = None) -> Dict[int, int]:
+    """
+    Vuelve a resumir los minutos con lecturas tardías, luego resume los
+    intervalos completos pendientes de cada nivel y avanza su marca.
+    Cada paso es una transacción que toma un bloqueo consultivo y relee la
+    marca, así varios workers pueden llamarla a la vez sin duplicar trabajo.
+    Devuelve las filas escritas por resolución.
+    """
+    limite = (ahora or datetime.utcnow()) - timedelta(seconds=RETRASO)
+    if not db_session.execute(_BLOQUEAR, {"clave": _BLOQUEO}).scalar():
+        db_session.rollback()
+        return {}
+    escritas = resumir_tardias(db_session)
+    db_session.commit()
+    for resolucion, origen in NIVELES:
+        hasta = truncar(limite, resolucion)
+        paso = timedelta(seconds=resolucion * INTERVALOS_POR_PASO)
+        while True:
+            if not db_session.execute(_BLOQUEAR, {"clave": _BLOQUEO}).scalar():
+                db_session.rollback()
+                return escritas
+            desde = _pendiente_desde(db_session, resolucion, origen)
+            if desde is None or desde >= hasta:
+                db_session.rollback()
+                break
+            fin = min(desde + paso, hasta)
+            escritas[resolucion] = escritas.get(resolucion, 0) + resumir(db_session, resolucion, desde, fin)
+            db_session.merge(models.ResumenMarca(resolucion=resolucion, hasta=fin))
+            db_session.commit()
+        if desde is None:
+            break
+        # El nivel siguiente solo puede resumir lo que este ya cubre
+        limite = desde
+    return escritas
+
+
+def serie(db_session: Session, estructura_id: int, metrica: str, desde: datetime, hasta: datetime,
+          puntos: int) -> schemas.SerieLecturas:
+    """Serie de `metrica` entre desde y hasta con a lo sumo `puntos` puntos (aprox.)"""
+    nivel, ancho = elegir_resolucion((hasta - desde).total_seconds(), puntos)
+    if ancho <= RESOLUCIONES[0]:
+        crudas = (db_session.query(models.LecturaSensor.fecha, models.LecturaSensor.valor)
+                  .filter(models.LecturaSensor.estructura_id == estructura_id,
+                          models.LecturaSensor.metrica == metrica,
+                          models.LecturaSensor.fecha >= desde, models.LecturaSensor.fecha < hasta)
+                  .order_by(models.LecturaSensor.fecha).limit(puntos + 1).all())
+        if len(crudas) <= puntos:
+            valores = [valor for _, valor in crudas]
+            return schemas.SerieLecturas(estructura_id=estructura_id, metrica=metrica, resolucion=0,
+                                         tiempos=[fecha for fecha, _ in crudas], minimo=valores,
+                                         maximo=valores, promedio=valores, cantidad=[1] * len(crudas))
+    inicio = truncar(desde, nivel)
+    filas = db_session.execute(_SERIE, {
+        "estructura_id": estructura_id, "metrica": metrica, "nivel": nivel, "ancho": ancho,
+        "desde": inicio, "hasta": hasta, "marca": marca(db_session, nivel) or inicio,
+    }).all()
+    columnas = list(zip(*filas)) or [(), (), (), (), ()]
+    return schemas.SerieLecturas(estructura_id=estructura_id, metrica=metrica, resolucion=ancho,
+                                 tiempos=columnas[0], minimo=columnas[1], maximo=columnas[2],
+                                 promedio=columnas[3], cantidad=columnas[4])
+
+
+class ResumidorLecturas:
+    """Hilo que ejecuta `actualizar` cada RESUMEN_INTERVALO_SEGUNDOS (0 lo desactiva)"""
+
+    def __init__(self, fabrica_sesiones=None, intervalo: float = INTERVALO):
+        self._fabrica_sesiones = fabrica_sesiones
+        self.intervalo = intervalo
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def configurar(self, fabrica_sesiones):
+        self._fabrica_sesiones = fabrica_sesiones
+
+    def iniciar(self):
+        if self.intervalo <= 0 or (self._hilo is not None and self._hilo.is_alive()):
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._ejecutar, name="resumidor-lecturas", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+
+    def _ejecutar(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                with self._fabrica_sesiones() as sesion:
+                    actualizar(sesion)
+            except Exception:
+                logger.exception("Error resumiendo lecturas de sensores; se reintentará")
+
+
+resumidor = ResumidorLecturas()
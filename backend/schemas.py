@@ -1,11 +1,16 @@
 """
 Esquemas Pydantic para FastAPI
 """
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Literal, Optional
 from datetime import datetime
 
 
+class ConsultaIds(BaseModel):
+    """Cuerpo de POST /api/<entidad>/por-ids"""
+    ids: List[int] = Field(..., min_length=1)
+
+
 # Empresa
 class EmpresaBase(BaseModel):
     nombre: str
@@ -77,6 +82,10 @@ class Sede(SedeBase):
     class Config:
         from_attributes = True
 
+class SedeCercana(BaseModel):
+    sede: Sede
+    distancia_km: float
+
 
 # Bloque
 class BloqueBase(BaseModel):
@@ -195,23 +204,81 @@ class Estructura(EstructuraBase):
     class Config:
         from_attributes = True
 
+class Solapamiento(BaseModel):
+    estructura_a_id: int
+    estructura_b_id: int
+
+
+# LecturaSensor
+class LecturaSensorBase(BaseModel):
+    estructura_id: int
+    metrica: str = Field(..., min_length=1, max_length=30)
+    valor: float
+
+class LecturaSensorCreate(LecturaSensorBase):
+    fecha: Optional[datetime] = None
+
+class LecturaSensor(LecturaSensorBase):
+    fecha: datetime
+    class Config:
+        from_attributes = True
+
+class LoteLecturas(BaseModel):
+    lecturas: List[LecturaSensorCreate]
+
+class LoteLecturasRespuesta(BaseModel):
+    aceptadas: int
+    pendientes: int
+
+class SerieLecturas(BaseModel):
+    estructura_id: int
+    metrica: str
+    resolucion: int  # segundos por punto; 0 = lecturas sin resumir
+    tiempos: List[datetime]
+    minimo: List[float]
+    maximo: List[float]
+    promedio: List[float]
+    cantidad: List[int]
+
+class SerieReciente(BaseModel):
+    metrica: str
+    tiempos: List[datetime]
+    valores: List[float]
+
+class UltimasLecturas(BaseModel):
+    estructura_id: int
+    series: List[SerieReciente]
+
+class MemoriaEstructura(BaseModel):
+    estructura_id: int
+    series: int
+    puntos: int
+    bytes: int
+
+class MemoriaRecientes(BaseModel):
+    bytes: int
+    max_bytes: int
+    fuera_de_orden: int
+    recargas_tardias: int
+    estructuras: List[MemoriaEstructura]
+
 
 # Usuario
 class UsuarioBase(BaseModel):
     persona_id: int
     empresa_id: int
     username: str
-    password_hash: str
     auto_registro: bool = False
 
+# La contraseña llega en claro y se guarda derivada (tokens.hash_password); ningún esquema de respuesta la incluye
 class UsuarioCreate(UsuarioBase):
-    pass
+    password: str
 
 class UsuarioUpdate(BaseModel):
     persona_id: Optional[int] = None
     empresa_id: Optional[int] = None
     username: Optional[str] = None
-    password_hash: Optional[str] = None
+    password: Optional[str] = None
     auto_registro: Optional[bool] = None
 
 class Usuario(UsuarioBase):
@@ -279,6 +346,20 @@ class MetodoAcceso(MetodoAccesoBase):
     class Config:
         from_attributes = True
 
+class IdentificacionRequest(BaseModel):
+    tipo: str
+    dato_biometrico: str
+    umbral: float = 0.9
+    presupuesto_ms: Optional[float] = None
+
+class IdentificacionResponse(BaseModel):
+    usuario_id: Optional[int] = None
+    metodo_acceso_id: Optional[int] = None
+    similitud: float
+    candidatos: int
+    completo: bool
+    tiempo_ms: float
+
 
 # AccesoEspacio
 class AccesoEspacioBase(BaseModel):
@@ -300,6 +381,24 @@ class AccesoEspacio(AccesoEspacioBase):
     class Config:
         from_attributes = True
 
+# El usuario es el del token (Authorization: Bearer)
+class SolicitudAcceso(BaseModel):
+    metodo_acceso: Optional[str] = None
+
+class DecisionAcceso(BaseModel):
+    permitido: bool
+    motivo: str
+    usuario_id: int
+    espacio_id: int
+    tiempo_us: float
+
+class EstadisticasAcceso(BaseModel):
+    decisiones: int
+    pendientes_escritura: int
+    descartados_escritura: int = 0
+    p50_us: float
+    p99_us: float
+
 
 # TipoCultivo
 class TipoCultivoBase(BaseModel):
@@ -448,3 +547,106 @@ class FaseNutriente(FaseNutrienteBase):
     class Config:
         from_attributes = True
 
+
+# Siembra
+class SiembraBase(BaseModel):
+    estructura_id: int
+    variedad_cultivo_id: int
+    fecha_inicio: Optional[datetime] = None
+    activo: bool = True
+
+class SiembraCreate(SiembraBase):
+    pass
+
+class SiembraUpdate(BaseModel):
+    estructura_id: Optional[int] = None
+    variedad_cultivo_id: Optional[int] = None
+    fecha_inicio: Optional[datetime] = None
+    activo: Optional[bool] = None
+
+class Siembra(SiembraBase):
+    id: int
+    fecha_inicio: datetime
+    class Config:
+        from_attributes = True
+
+
+# AlertaSensor
+class AlertaSensor(BaseModel):
+    id: int
+    estructura_id: int
+    cultivo_fase_id: Optional[int] = None
+    nutriente_id: Optional[int] = None
+    metrica: str
+    tipo: str
+    objetivo: Optional[float] = None
+    valor: Optional[float] = None
+    fecha_inicio: datetime
+    fecha_fin: Optional[datetime] = None
+    class Config:
+        from_attributes = True
+
+class Umbral(BaseModel):
+    metrica: str
+    cultivo_fase_id: int
+    nutriente_id: int
+    objetivo: float
+    minimo: float
+    maximo: float
+    vigente_hasta: Optional[datetime] = None
+
+
+# Lotes
+class OperacionLote(BaseModel):
+    metodo: Literal["POST", "PUT", "DELETE"]
+    ruta: str
+    cuerpo: Optional[Dict[str, Any]] = None
+
+class Lote(BaseModel):
+    operaciones: List[OperacionLote] = Field(..., min_length=1)
+
+class ResultadoOperacion(BaseModel):
+    indice: int
+    estado: int
+    resultado: Any
+
+class ResultadoLote(BaseModel):
+    resultados: List[ResultadoOperacion]
+
+
+# Consultas lentas
+class ConsultaLenta(BaseModel):
+    fecha: datetime
+    ruta: Optional[str]
+    ms: float
+    filas: int
+    sentencia: str
+    parametros: Dict[str, str]
+    tipo_plan: Optional[str]
+    plan: Optional[str]
+
+    class Config:
+        from_attributes = True
+
+class BitacoraLentas(BaseModel):
+    activa: bool
+    umbral_ms: float
+    planes_descartados: int
+    consultas: List[ConsultaLenta]
+
+
+# Autenticación
+class LoginRequest(BaseModel):
+    username: str
+    password: str
+
+class Token(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
+class TokenClaims(BaseModel):
+    usuario_id: int
+    empresa_id: int
+    roles: List[int]
+    exp: int
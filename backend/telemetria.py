@@ -0,0 +1,364 @@
+"""
+Ingesta de lecturas de sensores (pH, EC, temperatura del agua, nivel...)
+
+Las lecturas recibidas se acumulan en un buffer columnar compacto (arrays
+tipados) y un hilo las vuelca a `lectura_sensor` con COPY cuando el buffer
+alcanza TELEMETRIA_TAMANO_LOTE filas o pasa TELEMETRIA_INTERVALO_MS. La tabla
+está particionada por mes y tiene índice BRIN sobre `fecha`
+(ver "indexes" en JSON.json).
+
+Si la base rechaza el lote por sus datos (p. ej. la estructura se borró
+después de validar la lectura) se descartan las lecturas de estructuras que
+ya no existen y, si aún falla, el lote se parte en mitades hasta aislar las
+filas rechazadas, que se descartan y se registran en el log. Si falla por
+otra causa vuelve al buffer solo la parte del lote que aún no se confirmó
+y se reintenta hasta MAX_REINTENTOS veces seguidas antes de descartarla.
+
+Las métricas se guardan en el buffer como códigos de una tabla de a lo sumo
+TELEMETRIA_MAX_METRICAS nombres distintos, que se reinicia cuando el buffer
+queda vacío; si se llena, los lotes con métricas nuevas se rechazan.
+"""
+import csv
+import io
+import logging
+import os
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+
+from backend import invalidacion, models, recientes, resumenes, schemas
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE = int(os.getenv("TELEMETRIA_TAMANO_LOTE", "20000"))
+INTERVALO = float(os.getenv("TELEMETRIA_INTERVALO_MS", "1000")) / 1000
+# Filas máximas en memoria; por encima se rechazan lotes nuevos (503)
+CAPACIDAD_MAXIMA = int(os.getenv("TELEMETRIA_CAPACIDAD_MAXIMA", "2000000"))
+MAX_REINTENTOS = int(os.getenv("TELEMETRIA_MAX_REINTENTOS", "10"))
+# Nombres de métrica distintos en el buffer (los códigos son array("H"): a lo sumo 65536)
+MAX_METRICAS = min(int(os.getenv("TELEMETRIA_MAX_METRICAS", "1024")), 65536)
+# Segundos tras los que se recargan los ids de estructura válidos (bajas hechas por otros workers)
+RECARGA_SEGUNDOS = float(os.getenv("TELEMETRIA_RECARGA_SEGUNDOS", "300"))
+
+_COLUMNAS = ("estructura_id", "metrica", "fecha", "valor")
+# Filas de ejemplo en el mensaje de lecturas descartadas
+_EJEMPLOS = 3
+
+
+class BufferLleno(Exception):
+    """El buffer superó CAPACIDAD_MAXIMA porque la base de datos no alcanza a vaciarlo"""
+
+
+class DemasiadasMetricas(Exception):
+    """El lote trae métricas nuevas y la tabla de códigos ya tiene MAX_METRICAS nombres"""
+
+
+class LoteRechazado(Exception):
+    """La base rechazó el lote por sus datos (clave foránea, valor fuera de rango...)"""
+
+
+def a_utc(fecha: Optional[datetime]) -> datetime:
+    """Normaliza a UTC sin zona horaria, como el resto de columnas TIMESTAMP"""
+    if fecha is None:
+        return datetime.utcnow()
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    return fecha
+
+
+class _Columnas:
+    """Lecturas pendientes en arrays tipados (≈ 22 bytes por lectura)"""
+
+    def __init__(self):
+        self.estructuras = array("i")
+        self.metricas = array("H")
+        self.fechas = array("d")
+        self.valores = array("d")
+
+    def __len__(self):
+        return len(self.valores)
+
+    def seleccionar(self, filas) -> "_Columnas":
+        """Columnas con las filas indicadas (un slice o una lista de posiciones)"""
+        parte = _Columnas()
+        for nombre in ("estructuras", "metricas", "fechas", "valores"):
+            origen = getattr(self, nombre)
+            if isinstance(filas, slice):
+                setattr(parte, nombre, origen[filas])
+            else:
+                getattr(parte, nombre).extend(origen[i] for i in filas)
+        return parte
+
+    @staticmethod
+    def unir(partes: Iterable["_Columnas"]) -> "_Columnas":
+        union = _Columnas()
+        for parte in partes:
+            for nombre in ("estructuras", "metricas", "fechas", "valores"):
+                getattr(union, nombre).extend(getattr(parte, nombre))
+        return union
+
+
+class BufferLecturas:
+    def __init__(self, fabrica_sesiones=None, tamano_lote: int = TAMANO_LOTE,
+                 intervalo: float = INTERVALO, capacidad_maxima: int = CAPACIDAD_MAXIMA,
+                 max_reintentos: int = MAX_REINTENTOS, max_metricas: int = MAX_METRICAS):
+        self._fabrica_sesiones = fabrica_sesiones
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self.capacidad_maxima = capacidad_maxima
+        self.max_reintentos = max_reintentos
+        self.max_metricas = max_metricas
+        self.descartadas = 0
+        self._fallos_seguidos = 0
+        self._pendientes = _Columnas()
+        self._codigos: Dict[str, int] = {}
+        self._metricas: List[str] = []
+        self._lock = threading.Lock()
+        self._volcado = threading.Lock()
+        self._hay_lote = threading.Event()
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def configurar(self, fabrica_sesiones):
+        self._fabrica_sesiones = fabrica_sesiones
+
+    def __len__(self):
+        return len(self._pendientes)
+
+    def _codigo(self, metrica: str) -> int:
+        codigo = self._codigos.get(metrica)
+        if codigo is None:
+            codigo = self._codigos[metrica] = len(self._metricas)
+            self._metricas.append(metrica)
+        return codigo
+
+    def agregar(self, lecturas: Iterable[schemas.LecturaSensorCreate]) -> int:
+        lecturas = list(lecturas)
+        with self._lock:
+            if len(self._pendientes) + len(lecturas) > self.capacidad_maxima:
+                raise BufferLleno()
+            nuevas = {lectura.metrica for lectura in lecturas} - self._codigos.keys()
+            if len(self._metricas) + len(nuevas) > self.max_metricas:
+                raise DemasiadasMetricas()
+            pendientes = self._pendientes
+            for lectura in lecturas:
+                pendientes.estructuras.append(lectura.estructura_id)
+                pendientes.metricas.append(self._codigo(lectura.metrica))
+                pendientes.fechas.append(a_utc(lectura.fecha).replace(tzinfo=timezone.utc).timestamp())
+                pendientes.valores.append(lectura.valor)
+            total = len(pendientes)
+        if total >= self.tamano_lote:
+            self._hay_lote.set()
+        self.iniciar()
+        return len(lecturas)
+
+    def _tomar(self) -> _Columnas:
+        with self._lock:
+            tomadas, self._pendientes = self._pendientes, _Columnas()
+            return tomadas
+
+    def _devolver(self, columnas: _Columnas):
+        """Reencola lecturas que no se pudieron escribir (delante de las nuevas)"""
+        with self._lock:
+            for nombre in ("estructuras", "metricas", "fechas", "valores"):
+                getattr(columnas, nombre).extend(getattr(self._pendientes, nombre))
+            self._pendientes = columnas
+
+    def _filas(self, columnas: _Columnas):
+        metricas = self._metricas
+        for i in range(len(columnas)):
+            yield (columnas.estructuras[i], metricas[columnas.metricas[i]],
+                   datetime.utcfromtimestamp(columnas.fechas[i]), columnas.valores[i])
+
+    def _escribir(self, columnas: _Columnas):
+        with self._fabrica_sesiones() as sesion:
+            conexion = sesion.connection()
+            if conexion.dialect.driver == "psycopg2":
+                texto = io.StringIO()
+                escritor = csv.writer(texto)
+                for estructura_id, metrica, fecha, valor in self._filas(columnas):
+                    escritor.writerow((estructura_id, metrica, fecha.isoformat(), repr(valor)))
+                texto.seek(0)
+                cursor = conexion.connection.cursor()
+                dbapi = conexion.dialect.dbapi
+                try:
+                    cursor.copy_expert(
+                        f'COPY "lectura_sensor" ({", ".join(_COLUMNAS)}) FROM STDIN WITH (FORMAT csv)', texto)
+                except (dbapi.IntegrityError, dbapi.DataError) as error:
+                    raise LoteRechazado(str(error).strip()) from error
+                finally:
+                    cursor.close()
+            else:
+                try:
+                    sesion.execute(insert(models.LecturaSensor),
+                                   [dict(zip(_COLUMNAS, fila)) for fila in self._filas(columnas)])
+                except (IntegrityError, DataError) as error:
+                    raise LoteRechazado(str(error.orig).strip()) from error
+            # Solo las anteriores a la marca de 1 minuto (que va RETRASO detrás del reloj) son tardías
+            limite = time.time() - resumenes.RETRASO
+            resumenes.marcar_tardias(sesion, (datetime.utcfromtimestamp(fecha)
+                                              for fecha in columnas.fechas if fecha < limite))
+            sesion.commit()
+        # La caché de lecturas recientes ya pudo sincronizar esas fechas (va recientes.RETRASO detrás del reloj)
+        limite = time.time() - recientes.RETRASO.total_seconds()
+        primeras: Dict[int, float] = {}
+        for estructura_id, fecha in zip(columnas.estructuras, columnas.fechas):
+            if fecha < limite and fecha < primeras.get(estructura_id, limite):
+                primeras[estructura_id] = fecha
+        if primeras:
+            recientes.recientes.marcar_tardias({estructura_id: datetime.utcfromtimestamp(fecha)
+                                                for estructura_id, fecha in primeras.items()})
+
+    def _descartar(self, columnas: _Columnas, motivo: str):
+        self.descartadas += len(columnas)
+        ejemplos = [fila for _, fila in zip(range(_EJEMPLOS), self._filas(columnas))]
+        logger.error("%d lecturas descartadas (%s); p. ej. %s", len(columnas), motivo, ejemplos)
+
+    def _sin_estructuras_borradas(self, columnas: _Columnas) -> _Columnas:
+        """Descarta las lecturas de estructuras que ya no existen"""
+        with self._fabrica_sesiones() as sesion:
+            existentes = {i for (i,) in sesion.query(models.Estructura.id)
+                          .filter(models.Estructura.id.in_(set(columnas.estructuras)))}
+        borradas = [i for i, estructura_id in enumerate(columnas.estructuras) if estructura_id not in existentes]
+        if not borradas:
+            return columnas
+        self._descartar(columnas.seleccionar(borradas), "la estructura ya no existe")
+        return columnas.seleccionar([i for i, e in enumerate(columnas.estructuras) if e in existentes])
+
+    def _escribir_partes(self, partes: List[_Columnas]):
+        """
+        Escribe las partes (la última primero) hasta aislar las filas que la base rechaza
+
+        Cada parte sale de la lista solo cuando se confirmó o se descartó: si
+        algo falla por otra causa, en `partes` queda exactamente lo que falta.
+        """
+        filtrado = False
+        while partes:
+            parte = partes[-1]
+            try:
+                self._escribir(parte)
+                nuevas = []
+            except LoteRechazado as error:
+                if not filtrado:
+                    logger.warning("Lote de %d lecturas rechazado (%s); se aíslan las filas inválidas",
+                                   len(parte), error)
+                    filtrado = True
+                    restantes = self._sin_estructuras_borradas(parte)
+                    nuevas = [restantes] if len(restantes) else []
+                elif len(parte) == 1:
+                    self._descartar(parte, str(error))
+                    nuevas = []
+                else:
+                    mitad = len(parte) // 2
+                    nuevas = [parte.seleccionar(slice(mitad, None)), parte.seleccionar(slice(None, mitad))]
+            partes[-1:] = nuevas
+
+    def vaciar(self) -> int:
+        """Escribe todo lo pendiente; devuelve el número de lecturas procesadas (escritas o descartadas)"""
+        with self._volcado:
+            columnas = self._tomar()
+            if not len(columnas):
+                return 0
+            partes = [columnas]
+            try:
+                self._escribir_partes(partes)
+            except Exception:
+                # Las partes ya confirmadas no se reintentan (lectura_sensor no rechazaría duplicados)
+                restantes = _Columnas.unir(reversed(partes))
+                self._fallos_seguidos += 1
+                if self._fallos_seguidos > self.max_reintentos:
+                    self._fallos_seguidos = 0
+                    self._descartar(restantes, f"sin escribir tras {self.max_reintentos + 1} intentos")
+                else:
+                    self._devolver(restantes)
+                raise
+            self._fallos_seguidos = 0
+            with self._lock:
+                # Ninguna lectura pendiente usa la tabla de códigos: se reinicia si creció
+                if not len(self._pendientes) and len(self._metricas) > self.max_metricas // 2:
+                    self._codigos, self._metricas = {}, []
+            return len(columnas)
+
+    def iniciar(self):
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._detener.clear()
+                self._hilo = threading.Thread(target=self._ejecutar, name="buffer-lecturas", daemon=True)
+                self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        self._hay_lote.set()
+        if self._hilo is not None:
+            self._hilo.join()
+        self.vaciar()
+
+    def _ejecutar(self):
+        while not self._detener.is_set():
+            self._hay_lote.wait(self.intervalo)
+            self._hay_lote.clear()
+            if self._detener.is_set():
+                return
+            try:
+                self.vaciar()
+            except Exception:
+                logger.exception("Error volcando lecturas de sensores; se reintentará")
+
+
+class EstructurasValidas:
+    """
+    Ids de estructura existentes, para validar lotes sin consultar la BD
+
+    Las altas de otros workers se buscan en la base la primera vez que
+    llega una lectura suya; las bajas se ven al recargar (RECARGA_SEGUNDOS).
+    """
+
+    def __init__(self):
+        self._ids: Optional[Set[int]] = None
+        self._cargado_en = 0.0
+        self._lock = threading.Lock()
+
+    def _vencido(self) -> bool:
+        return RECARGA_SEGUNDOS > 0 and time.monotonic() - self._cargado_en > RECARGA_SEGUNDOS
+
+    def desconocidas(self, db_session: Session, ids: Iterable[int]) -> List[int]:
+        if self._ids is None or self._vencido():
+            with self._lock:
+                if self._ids is None or self._vencido():
+                    self._ids = {i for (i,) in db_session.query(models.Estructura.id)}
+                    self._cargado_en = time.monotonic()
+        conocidas = self._ids
+        faltantes = {i for i in ids if i not in conocidas}
+        if faltantes:
+            # Creadas por otro worker después de la carga
+            encontradas = {i for (i,) in db_session.query(models.Estructura.id)
+                           .filter(models.Estructura.id.in_(faltantes))}
+            conocidas.update(encontradas)
+            faltantes -= encontradas
+        return sorted(faltantes)
+
+    def aplicar(self, cambios: List[invalidacion.Cambio]):
+        if self._ids is None:
+            return
+        for cambio in cambios:
+            if cambio.eliminado:
+                self._ids.discard(cambio.id)
+            else:
+                self._ids.add(cambio.id)
+
+
+buffer = BufferLecturas()
+estructuras = EstructurasValidas()
+
+
+@invalidacion.suscribir(models.Estructura)
+def _actualizar_estructuras(cambios):
+    estructuras.aplicar(cambios)
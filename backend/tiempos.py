@@ -0,0 +1,127 @@
+"""
+Desglose del tiempo de cada petición (encabezado Server-Timing)
+
+Fases que se informan:
+    pool        espera por una conexión del pool (consultas.PoolMedido)
+    db          ejecución de sentencias SQL (consultas.py)
+    orm         armado de objetos/filas a partir del resultado, sin el tiempo de db
+    validacion  validación de los esquemas Pydantic
+    json        codificación JSON
+    app         el resto hasta empezar a enviar la respuesta
+
+orm, validacion y json se miden donde el código las marca con `medir(fase)`
+(respuestas.py: listados, ids, expand y la clase de respuesta por defecto);
+el tiempo de base de datos transcurrido dentro de un bloque se descuenta
+porque ya figura en db.
+
+Las peticiones que tardan TIEMPOS_UMBRAL_LENTO_MS o más se registran con su
+desglose como JSON, para una fracción TIEMPOS_MUESTREO de ellas.
+"""
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from backend import consultas
+
+logger = logging.getLogger(__name__)
+
+UMBRAL_LENTO = float(os.getenv("TIEMPOS_UMBRAL_LENTO_MS", "500")) / 1000
+MUESTREO = float(os.getenv("TIEMPOS_MUESTREO", "1.0"))
+
+# Descripciones en ASCII: los valores de los encabezados HTTP no admiten UTF-8
+FASES = {
+    "pool": "Pool de conexiones",
+    "db": "Base de datos",
+    "orm": "ORM",
+    "validacion": "Pydantic",
+    "json": "JSON",
+    "app": "Endpoint",
+}
+
+_actual: ContextVar[Optional[Dict[str, float]]] = ContextVar("tiempos_peticion", default=None)
+
+
+def _en_db(registro: Optional[consultas.Registro]) -> float:
+    return registro.segundos + registro.espera_pool if registro is not None else 0.0
+
+
+@contextmanager
+def medir(fase: str) -> Iterator[None]:
+    """Suma a `fase` el tiempo del bloque (sin el de base de datos) en la petición en curso"""
+    fases = _actual.get()
+    if fases is None:
+        yield
+        return
+    registro = consultas.actual()
+    db_antes = _en_db(registro)
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio - (_en_db(registro) - db_antes)
+        fases[fase] = fases.get(fase, 0.0) + max(duracion, 0.0)
+
+
+def desglose(fases: Dict[str, float], total: float, registro: Optional[consultas.Registro]) -> Dict[str, float]:
+    """Segundos por fase; `app` es lo que queda del total"""
+    resultado = {"pool": registro.espera_pool if registro else 0.0, "db": registro.segundos if registro else 0.0}
+    resultado.update(fases)
+    resultado["app"] = max(total - sum(resultado.values()), 0.0)
+    return resultado
+
+
+def encabezado(partes: Dict[str, float], total: float) -> str:
+    valores = [f'{fase};dur={segundos * 1000:.1f};desc="{FASES.get(fase, fase)}"'
+               for fase, segundos in partes.items() if segundos > 0 or fase in ("db", "app")]
+    valores.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(valores)
+
+
+class ServerTiming:
+    """Middleware ASGI: agrega Server-Timing y registra las peticiones lentas
+
+    Debe quedar dentro de consultas.MedirConsultas para ver el Registro de la petición.
+    """
+
+    def __init__(self, app, umbral_lento: float = UMBRAL_LENTO, muestreo: float = MUESTREO):
+        self.app = app
+        self.umbral_lento = umbral_lento
+        self.muestreo = muestreo
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        fases: Dict[str, float] = {}
+        token = _actual.set(fases)
+        inicio = time.perf_counter()
+        estado = [500]
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado[0] = mensaje["status"]
+                total = time.perf_counter() - inicio
+                valor = encabezado(desglose(fases, total, consultas.actual()), total)
+                mensaje = {**mensaje, "headers": [*mensaje.get("headers", []),
+                                                  (b"server-timing", valor.encode()),
+                                                  (b"timing-allow-origin", b"*")]}
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _actual.reset(token)
+            total = time.perf_counter() - inicio
+            if total >= self.umbral_lento and random.random() < self.muestreo:
+                ruta = scope.get("route")
+                partes = desglose(fases, total, consultas.actual())
+                logger.warning("Petición lenta %s", json.dumps({
+                    "metodo": scope["method"], "ruta": getattr(ruta, "path", scope.get("path")),
+                    "estado": estado[0], "total_ms": round(total * 1000, 1),
+                    **{f"{fase}_ms": round(segundos * 1000, 1) for fase, segundos in partes.items()},
+                }))
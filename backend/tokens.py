@@ -0,0 +1,227 @@
+"""
+Tokens de sesión firmados con HMAC-SHA256
+
+El token es autocontenido (usuario, empresa, roles como bitset y expiración),
+por lo que verificarlo no requiere consultar la base de datos. Solo el login
+y el refresh cargan Usuario/UsuarioRol.
+
+Formato: <kid>.<payload base64url>.<firma base64url>
+
+Las contraseñas se guardan en usuario.password_hash derivadas con scrypt y
+una sal aleatoria (`hash_password`); el login recibe la contraseña en claro y
+la compara con `verificar_password`, de modo que conocer el hash guardado no
+basta para iniciar sesión.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+
+class TokenInvalido(Exception):
+    """El token está mal formado, tiene firma inválida o expiró"""
+
+
+@dataclass(frozen=True)
+class Claims:
+    usuario_id: int
+    empresa_id: int
+    roles: int
+    exp: int
+
+    def tiene_rol(self, rol_id: int) -> bool:
+        return bool(self.roles >> rol_id & 1)
+
+    @property
+    def rol_ids(self) -> List[int]:
+        return bitset_a_roles(self.roles)
+
+
+def roles_a_bitset(rol_ids: Iterable[int]) -> int:
+    """Convierte una lista de ids de rol en un entero con un bit por rol"""
+    bits = 0
+    for rol_id in rol_ids:
+        bits |= 1 << rol_id
+    return bits
+
+
+def bitset_a_roles(bits: int) -> List[int]:
+    """Operación inversa de roles_a_bitset"""
+    rol_ids = []
+    rol_id = 0
+    while bits:
+        if bits & 1:
+            rol_ids.append(rol_id)
+        bits >>= 1
+        rol_id += 1
+    return rol_ids
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+# Costo de scrypt para contraseñas nuevas (las guardadas llevan el suyo)
+SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+
+def hash_password(password: str) -> str:
+    """Deriva el valor a guardar en usuario.password_hash: scrypt$n$r$p$sal$hash"""
+    sal = secrets.token_bytes(16)
+    derivada = hashlib.scrypt(password.encode("utf-8"), salt=sal, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64encode(sal)}${_b64encode(derivada)}"
+
+
+def verificar_password(password: str, almacenado: str) -> bool:
+    """Compara en tiempo constante; un valor guardado en otro formato nunca coincide"""
+    try:
+        algoritmo, n, r, p, sal, esperada = almacenado.split("$")
+        if algoritmo != "scrypt":
+            return False
+        esperada = _b64decode(esperada)
+        derivada = hashlib.scrypt(password.encode("utf-8"), salt=_b64decode(sal), n=int(n), r=int(r), p=int(p),
+                                  dklen=len(esperada))
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(derivada, esperada)
+
+
+class FirmadorTokens:
+    """Emite y verifica tokens; admite varias claves para rotación"""
+
+    def __init__(self, claves: Dict[str, bytes], clave_activa: str, duracion: int = 3600):
+        if clave_activa not in claves:
+            raise ValueError(f"La clave activa '{clave_activa}' no está registrada")
+        self._claves = dict(claves)
+        self.clave_activa = clave_activa
+        self.duracion = duracion
+
+    def rotar(self, kid: str, secreto: bytes):
+        """Registra una clave nueva y la usa para firmar; las anteriores siguen verificando"""
+        if "." in kid:
+            raise ValueError("El identificador de clave no puede contener '.'")
+        self._claves[kid] = secreto
+        self.clave_activa = kid
+
+    def retirar(self, kid: str):
+        """Elimina una clave: los tokens firmados con ella dejan de ser válidos"""
+        if kid == self.clave_activa:
+            raise ValueError("No se puede retirar la clave activa")
+        self._claves.pop(kid, None)
+
+    def _firmar(self, secreto: bytes, mensaje: bytes) -> str:
+        return _b64encode(hmac.new(secreto, mensaje, hashlib.sha256).digest())
+
+    def emitir(self, usuario_id: int, empresa_id: int, rol_ids: Iterable[int],
+               ahora: Optional[int] = None) -> str:
+        ahora = int(time.time()) if ahora is None else ahora
+        payload = {
+            "u": usuario_id,
+            "e": empresa_id,
+            "r": roles_a_bitset(rol_ids),
+            "x": ahora + self.duracion,
+        }
+        cuerpo = _b64encode(json.dumps(payload, separators=(",", ":")).encode("ascii"))
+        mensaje = f"{self.clave_activa}.{cuerpo}"
+        firma = self._firmar(self._claves[self.clave_activa], mensaje.encode("ascii"))
+        return f"{mensaje}.{firma}"
+
+    def verificar(self, token: str, ahora: Optional[int] = None, margen: int = 0) -> Claims:
+        """Valida firma y expiración; `margen` tolera tokens expirados hace poco (refresh)"""
+        try:
+            kid, cuerpo, firma = token.split(".")
+        except ValueError:
+            raise TokenInvalido("Formato de token inválido")
+        secreto = self._claves.get(kid)
+        if secreto is None:
+            raise TokenInvalido("Clave de firma desconocida")
+        try:
+            esperada = self._firmar(secreto, f"{kid}.{cuerpo}".encode("ascii"))
+            firma = firma.encode("ascii")
+        except UnicodeEncodeError:
+            raise TokenInvalido("Formato de token inválido")
+        if not hmac.compare_digest(esperada.encode("ascii"), firma):
+            raise TokenInvalido("Firma inválida")
+        try:
+            payload = json.loads(_b64decode(cuerpo))
+            claims = Claims(usuario_id=payload["u"], empresa_id=payload["e"],
+                            roles=payload["r"], exp=payload["x"])
+        except (ValueError, KeyError, TypeError):
+            raise TokenInvalido("Payload inválido")
+        ahora = int(time.time()) if ahora is None else ahora
+        if claims.exp + margen < ahora:
+            raise TokenInvalido("Token expirado")
+        return claims
+
+
+def _cargar_claves() -> FirmadorTokens:
+    """
+    Lee TOKEN_KEYS ("kid1:secreto1,kid2:secreto2") y TOKEN_ACTIVE_KID.
+    Sin TOKEN_KEYS se genera una clave aleatoria por proceso, válida solo
+    con un único worker de uvicorn.
+    """
+    claves = {}
+    for entrada in filter(None, os.getenv("TOKEN_KEYS", "").split(",")):
+        kid, _, secreto = entrada.strip().partition(":")
+        if "." in kid:
+            raise ValueError(f"TOKEN_KEYS: el identificador de clave '{kid}' no puede contener '.'")
+        claves[kid] = secreto.encode("utf-8")
+    if not claves:
+        claves = {"local": secrets.token_bytes(32)}
+    activa = os.getenv("TOKEN_ACTIVE_KID", next(reversed(claves)))
+    duracion = int(os.getenv("TOKEN_TTL_SECONDS", "3600"))
+    return FirmadorTokens(claves, activa, duracion)
+
+
+firmador = _cargar_claves()
+
+# Tiempo (segundos) durante el cual un token expirado aún puede refrescarse
+MARGEN_REFRESH = int(os.getenv("TOKEN_REFRESH_GRACE_SECONDS", "300"))
+# Rol requerido por las rutas /api/admin
+ROL_ADMIN = int(os.getenv("TOKEN_ADMIN_ROLE_ID", "1"))
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+def _credenciales(credenciales: Optional[HTTPAuthorizationCredentials]) -> str:
+    if credenciales is None:
+        raise HTTPException(status_code=401, detail="Token requerido",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return credenciales.credentials
+
+
+# Dependency para FastAPI: autentica sin tocar la base de datos
+def get_claims(credenciales: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)) -> Claims:
+    try:
+        return firmador.verificar(_credenciales(credenciales))
+    except TokenInvalido as e:
+        raise HTTPException(status_code=401, detail=str(e),
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+def get_claims_admin(claims: Claims = Depends(get_claims)) -> Claims:
+    if not claims.tiene_rol(ROL_ADMIN):
+        raise HTTPException(status_code=403, detail="Se requiere el rol de administrador")
+    return claims
+
+
+def get_claims_refresh(credenciales: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)) -> Claims:
+    try:
+        return firmador.verificar(_credenciales(credenciales), margen=MARGEN_REFRESH)
+    except TokenInvalido as e:
+        raise HTTPException(status_code=401, detail=str(e),
+                            headers={"WWW-Authenticate": "Bearer"})
@@ -0,0 +1,59 @@
+"""
+Benchmark del motor de identificación biométrica 1:N
+
+Mide la latencia de IndiceBiometrico.identificar con 10k y 100k plantillas
+sintéticas (no requiere base de datos).
+
+Uso:
+    python benchmarks/bench_biometria.py [--repeticiones 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.biometria import DIMENSION, IndiceBiometrico  # noqa: E402
+
+
+def construir_indice(n, rng):
+    plantillas = rng.integers(0, 256, size=(n, DIMENSION), dtype=np.uint8).astype(np.float32)
+    plantillas /= np.linalg.norm(plantillas, axis=1, keepdims=True)
+    indice = IndiceBiometrico(capacidad=n)
+    for i, vector in enumerate(plantillas):
+        indice.insertar(i + 1, i + 1, vector)
+    return indice, plantillas
+
+
+def medir(n, repeticiones, rng):
+    indice, plantillas = construir_indice(n, rng)
+    consultas = rng.integers(0, n, size=repeticiones)
+    tiempos = []
+    for fila in consultas:
+        ruido = rng.normal(0, 0.01, DIMENSION).astype(np.float32)
+        consulta = plantillas[fila] + ruido
+        consulta /= np.linalg.norm(consulta)
+        inicio = time.perf_counter()
+        resultado = indice.identificar(consulta, umbral=0.9)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        assert resultado.metodo_acceso_id == fila + 1
+    tiempos = np.array(tiempos)
+    print(f"{n:>7} plantillas | p50 {np.percentile(tiempos, 50):7.3f} ms"
+          f" | p99 {np.percentile(tiempos, 99):7.3f} ms"
+          f" | {repeticiones / tiempos.sum() * 1000:8.0f} consultas/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeticiones", type=int, default=200)
+    args = parser.parse_args()
+    rng = np.random.default_rng(42)
+    print(f"Dimensión de plantilla: {DIMENSION} bytes")
+    for n in (10_000, 100_000):
+        medir(n, args.repeticiones, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark de serialización de listados
+
+Compara, para listas de 10k estructuras sintéticas (no requiere base de datos):
+  fastapi  serialize_response (validación contra response_model + jsonable_encoder) y JSONResponse
+  orjson   el mismo camino de FastAPI pero codificando con ORJSONResponse
+  esquema  TypeAdapter(List[Estructura]) cacheado (respuestas.desde_objetos)
+  filas    tuplas de columnas codificadas con orjson (respuestas.desde_filas)
+
+Uso:
+    python benchmarks/bench_serializacion.py [--filas 10000] [--repeticiones 20]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import List
+
+import numpy as np
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend import models, schemas  # noqa: E402
+from backend.respuestas import columnas, desde_filas, desde_objetos  # noqa: E402
+
+
+def generar(n):
+    objetos = [models.Estructura(id=i, espacio_id=1 + i % 50, tipo_estructura_id=1 + i % 4, codigo=f"E-{i:05d}",
+                                 nombre=f"Canal {i}", capacidad=48, ancho=0.12, largo=6.0,
+                                 posicion_x=float(i % 100), posicion_y=float(i // 100))
+               for i in range(1, n + 1)]
+    claves = [c.key for c in columnas(models.Estructura, schemas.Estructura)]
+    filas = [tuple(getattr(o, clave) for clave in claves) for o in objetos]
+    return objetos, filas, claves
+
+
+def camino_fastapi(clase):
+    campo = create_response_field(name="respuesta", type_=List[schemas.Estructura])
+
+    def serializar(objetos):
+        contenido = asyncio.run(serialize_response(field=campo, response_content=objetos))
+        return clase(contenido).body
+    return serializar
+
+
+def medir(nombre, funcion, datos, repeticiones):
+    funcion(datos)
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        cuerpo = funcion(datos)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos = np.array(tiempos)
+    print(f"{nombre:>8} | p50 {np.percentile(tiempos, 50):8.2f} ms | min {tiempos.min():8.2f} ms"
+          f" | {len(cuerpo) / 1024:7.0f} KiB")
+    return np.percentile(tiempos, 50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--filas", type=int, default=10_000)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+    objetos, filas, claves = generar(args.filas)
+    print(f"{args.filas} estructuras, {args.repeticiones} repeticiones")
+    base = medir("fastapi", camino_fastapi(JSONResponse), objetos, args.repeticiones)
+    for nombre, funcion, datos in (
+        ("orjson", camino_fastapi(ORJSONResponse), objetos),
+        ("esquema", lambda o: desde_objetos(schemas.Estructura, o).body, objetos),
+        ("filas", lambda f: desde_filas(f, claves).body, filas),
+    ):
+        print(f"{'':>8}   {base / medir(nombre, funcion, datos, args.repeticiones):5.1f}x más rápido")
+
+
+if __name__ == "__main__":
+    main()
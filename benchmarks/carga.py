@@ -0,0 +1,210 @@
+"""
+Generador de carga HTTP para la API
+
+Lanza `--concurrencia` clientes asyncio/httpx que durante `--duracion`
+segundos eligen operaciones al azar según una mezcla de pesos por entidad:
+
+    listar      GET /api/<entidad>?limit=100
+    obtener     GET /api/<entidad>/<id> (ids tomados de la base al empezar)
+    crear       POST /api/<entidad> (empresas, personas, roles, tipos-espacio, tipos-estructura)
+    actualizar  PUT /api/<entidad>/<id> sobre filas creadas en esta misma ejecución
+    lecturas:lote, lecturas:serie, estructuras:ultimas  telemetría
+
+Reporta peticiones por segundo y latencias p50/p95/p99 por operación en
+resultados/benchmark_carga.json y .html y las compara con la línea base
+(benchmarks/reporte.py). Las filas creadas se borran al terminar salvo con
+--conservar. Conviene correrlo sobre datos de generar_datos.py.
+
+Uso:
+    python benchmarks/carga.py --url http://localhost:8000 --duracion 30 --concurrencia 32
+    python benchmarks/carga.py --mezcla "estructuras:listar=50,estructuras:obtener=30,lecturas:lote=20"
+    python benchmarks/carga.py --en-proceso --duracion 5   # sin servidor, contra backend.main.app
+    python benchmarks/carga.py --guardar-linea-base
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks import reporte  # noqa: E402
+
+MEZCLA = ("estructuras:listar=20,estructuras:obtener=25,empresas:listar=10,empresas:obtener=10,sedes:listar=5,"
+          "lecturas:lote=15,lecturas:serie=10,empresas:crear=3,empresas:actualizar=2")
+LECTURAS_POR_LOTE = 100
+METRICAS = ["ph", "ec", "temperatura", "humedad"]
+
+# Cuerpo de POST /api/<entidad> para la n-ésima fila creada por la ejecución `marca`
+CREAR = {
+    "empresas": lambda n, marca: {"nombre": f"Carga {marca} {n}", "nit": f"CARGA-{marca}-{n}"},
+    "personas": lambda n, marca: {"nombre": "Carga", "apellido": f"{marca} {n}", "documento": f"CARGA-{marca}-{n}",
+                                  "email": f"carga-{marca}-{n}@ejemplo.co"},
+    "roles": lambda n, marca: {"nombre": f"Carga {marca} {n}"},
+    "tipos-espacio": lambda n, marca: {"nombre": f"Carga {marca} {n}"},
+    "tipos-estructura": lambda n, marca: {"nombre": f"Carga {marca} {n}"},
+}
+ESPECIALES = {"lecturas:lote", "lecturas:serie", "estructuras:ultimas"}
+
+
+def leer_mezcla(texto: str) -> Dict[str, float]:
+    """'entidad:operacion=peso,...' -> {operación: peso}"""
+    mezcla = {}
+    for parte in filter(None, (p.strip() for p in texto.split(","))):
+        operacion, _, peso = parte.partition("=")
+        entidad, _, accion = operacion.partition(":")
+        if operacion not in ESPECIALES and accion not in ("listar", "obtener", "crear", "actualizar"):
+            raise ValueError(f"Operación desconocida: {operacion}")
+        if accion in ("crear", "actualizar") and entidad not in CREAR:
+            raise ValueError(f"No se sabe crear filas de '{entidad}'; entidades con escritura: {sorted(CREAR)}")
+        mezcla[operacion] = float(peso or 1)
+    if not mezcla:
+        raise ValueError("La mezcla está vacía")
+    return mezcla
+
+
+class Carga:
+    """Estado compartido por los clientes: ids conocidos, filas creadas y tiempos por operación"""
+
+    def __init__(self, cliente: httpx.AsyncClient, mezcla: Dict[str, float], semilla: int = 42):
+        self.cliente = cliente
+        self.operaciones = list(mezcla)
+        self.pesos = list(mezcla.values())
+        self.semilla = semilla
+        self.marca = uuid.uuid4().hex[:8]
+        self.ids: Dict[str, List[int]] = {}
+        self.creadas: Dict[str, List[int]] = defaultdict(list)
+        self.tiempos: Dict[str, List[float]] = defaultdict(list)
+        self.errores: Dict[str, int] = defaultdict(int)
+        self.midiendo = False
+        self._contador = itertools.count(1)
+
+    async def preparar(self):
+        """Ids existentes de cada entidad de la mezcla (las de telemetría usan estructuras)"""
+        entidades = {"estructuras" if op in ESPECIALES else op.split(":")[0] for op in self.operaciones}
+        for entidad in sorted(entidades):
+            respuesta = await self.cliente.get(f"/api/{entidad}", params={"limit": 1000})
+            respuesta.raise_for_status()
+            self.ids[entidad] = [fila["id"] for fila in respuesta.json()]
+        if any(op in ESPECIALES for op in self.operaciones) and not self.ids["estructuras"]:
+            raise RuntimeError("No hay estructuras para las operaciones de telemetría (ver generar_datos.py)")
+
+    async def peticion(self, operacion: str, rng: random.Random) -> httpx.Response:
+        entidad, _, accion = operacion.partition(":")
+        if operacion == "lecturas:lote":
+            ahora = datetime.utcnow().isoformat()
+            lecturas = [{"estructura_id": rng.choice(self.ids["estructuras"]), "metrica": rng.choice(METRICAS),
+                         "valor": round(rng.uniform(0, 100), 3), "fecha": ahora} for _ in range(LECTURAS_POR_LOTE)]
+            return await self.cliente.post("/api/lecturas-sensor/lote", json={"lecturas": lecturas})
+        if operacion == "lecturas:serie":
+            return await self.cliente.get("/api/lecturas-sensor/serie", params={
+                "estructura_id": rng.choice(self.ids["estructuras"]), "metrica": rng.choice(METRICAS), "puntos": 200})
+        if operacion == "estructuras:ultimas":
+            return await self.cliente.get(f"/api/estructuras/{rng.choice(self.ids['estructuras'])}/ultimas-lecturas")
+        if accion == "listar":
+            return await self.cliente.get(f"/api/{entidad}", params={"limit": 100, "skip": rng.randrange(0, 1000, 100)})
+        if accion == "obtener":
+            return await self.cliente.get(f"/api/{entidad}/{rng.choice(self.ids[entidad] or [0])}")
+        if accion == "actualizar" and self.creadas[entidad]:
+            fila = rng.choice(self.creadas[entidad])
+            return await self.cliente.put(f"/api/{entidad}/{fila}", json={"nombre": f"Carga {self.marca} {fila}*"})
+        # crear (y actualizar mientras no haya filas propias)
+        respuesta = await self.cliente.post(f"/api/{entidad}", json=CREAR[entidad](next(self._contador), self.marca))
+        if respuesta.status_code < 400:
+            self.creadas[entidad].append(respuesta.json()["id"])
+        return respuesta
+
+    async def cliente_virtual(self, numero: int, fin: float):
+        rng = random.Random(self.semilla * 1000 + numero)
+        while time.perf_counter() < fin:
+            operacion = rng.choices(self.operaciones, self.pesos)[0]
+            inicio = time.perf_counter()
+            try:
+                respuesta = await self.peticion(operacion, rng)
+                fallo = respuesta.status_code >= 400
+            except httpx.HTTPError:
+                fallo = True
+            if self.midiendo:
+                self.tiempos[operacion].append((time.perf_counter() - inicio) * 1000)
+                self.errores[operacion] += fallo
+
+    async def ejecutar(self, concurrencia: int, duracion: float, calentamiento: float = 0.0) -> Dict[str, dict]:
+        """Corre la carga y devuelve el resumen por operación (más 'total')"""
+        fin = time.perf_counter() + calentamiento + duracion
+        clientes = [asyncio.create_task(self.cliente_virtual(i, fin)) for i in range(concurrencia)]
+        await asyncio.sleep(calentamiento)
+        self.midiendo = True
+        inicio = time.perf_counter()
+        await asyncio.gather(*clientes)
+        segundos = time.perf_counter() - inicio
+        casos = {op: reporte.resumir(self.tiempos[op], segundos, self.errores[op]) for op in self.operaciones}
+        casos["total"] = reporte.resumir([t for op in self.operaciones for t in self.tiempos[op]], segundos,
+                                         sum(self.errores.values()))
+        return casos
+
+    async def limpiar(self):
+        for entidad, filas in self.creadas.items():
+            for fila in filas:
+                await self.cliente.delete(f"/api/{entidad}/{fila}")
+
+
+async def correr(cliente: httpx.AsyncClient, mezcla: Dict[str, float], concurrencia: int, duracion: float,
+                 calentamiento: float = 0.0, semilla: int = 42, conservar: bool = False) -> Dict[str, dict]:
+    carga = Carga(cliente, mezcla, semilla)
+    await carga.preparar()
+    try:
+        return await carga.ejecutar(concurrencia, duracion, calentamiento)
+    finally:
+        if not conservar:
+            await carga.limpiar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default=os.getenv("API_URL", "http://localhost:8000"))
+    parser.add_argument("--en-proceso", action="store_true", help="Usar backend.main.app sin servidor HTTP")
+    parser.add_argument("--mezcla", default=MEZCLA)
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--duracion", type=float, default=30)
+    parser.add_argument("--calentamiento", type=float, default=3)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--conservar", action="store_true", help="No borrar las filas creadas")
+    parser.add_argument("--tolerancia", type=float, default=reporte.TOLERANCIA)
+    parser.add_argument("--guardar-linea-base", action="store_true")
+    args = parser.parse_args()
+
+    mezcla = leer_mezcla(args.mezcla)
+    if args.en_proceso:
+        from backend.main import app
+        transporte, url = httpx.ASGITransport(app=app), "http://en-proceso"
+    else:
+        transporte, url = None, args.url
+    limites = httpx.Limits(max_connections=args.concurrencia, max_keepalive_connections=args.concurrencia)
+
+    async def ejecutar():
+        async with httpx.AsyncClient(base_url=url, transport=transporte, limits=limites, timeout=60) as cliente:
+            return await correr(cliente, mezcla, args.concurrencia, args.duracion, args.calentamiento, args.semilla,
+                                args.conservar)
+
+    casos = asyncio.run(ejecutar())
+    configuracion = {"url": url, "mezcla": mezcla, "concurrencia": args.concurrencia, "duracion": args.duracion}
+    actual = reporte.resultado("carga", casos, configuracion)
+    base = reporte.cargar_linea_base("carga")
+    regresiones = reporte.comparar(actual, base, args.tolerancia) if base else []
+    reporte.imprimir(actual, regresiones)
+    print(f"Reportes generados: {', '.join(reporte.guardar(actual, base, regresiones))}")
+    if args.guardar_linea_base:
+        print(f"✓ Línea base guardada en {reporte.guardar_linea_base(actual)}")
+    sys.exit(1 if regresiones else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Resultados de benchmarks: resumen, comparación con la línea base y reportes
+
+Cada ejecución (micro-benchmarks o carga HTTP) produce un resultado con la
+misma forma:
+
+    {"nombre": "carga", "fecha": "...", "configuracion": {...},
+     "casos": {"empresas:listar": {"n": 1200, "errores": 0, "por_segundo": 40.1,
+                                   "media_ms": 24.3, "p50_ms": 21.0, "p95_ms": 48.2, "p99_ms": 70.5}}}
+
+que se guarda en resultados/benchmark_<nombre>.json y .html. La línea base
+es un resultado anterior guardado en resultados/linea_base_<nombre>.json;
+un caso es una regresión si su p95 sube o su rendimiento baja más que la
+tolerancia (BENCHMARK_TOLERANCIA, 0.15 = 15%). Cada regresión es un par
+(caso, mensaje): los nombres de caso pueden llevar ":" ("empresas:listar").
+"""
+import html
+import json
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+CARPETA = os.getenv("BENCHMARK_CARPETA", "resultados")
+TOLERANCIA = float(os.getenv("BENCHMARK_TOLERANCIA", "0.15"))
+# Por debajo de este p95 las variaciones son ruido del reloj y no se marcan
+MINIMO_MS = 0.05
+
+# (caso, mensaje)
+Regresion = Tuple[str, str]
+
+
+def resumir(tiempos_ms: Sequence[float], segundos: float, errores: int = 0) -> Dict[str, float]:
+    """Rendimiento y percentiles de latencia de un caso"""
+    tiempos = np.asarray(tiempos_ms, dtype=float)
+    if not len(tiempos):
+        return {"n": 0, "errores": errores, "por_segundo": 0.0, "media_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0,
+                "p99_ms": 0.0}
+    p50, p95, p99 = np.percentile(tiempos, [50, 95, 99])
+    return {"n": int(len(tiempos)), "errores": errores, "por_segundo": round(len(tiempos) / segundos, 3),
+            "media_ms": round(float(tiempos.mean()), 4), "p50_ms": round(float(p50), 4),
+            "p95_ms": round(float(p95), 4), "p99_ms": round(float(p99), 4)}
+
+
+def resultado(nombre: str, casos: Dict[str, Dict[str, float]], configuracion: Optional[dict] = None) -> dict:
+    return {"nombre": nombre, "fecha": datetime.now().isoformat(timespec="seconds"),
+            "configuracion": configuracion or {}, "casos": casos}
+
+
+def comparar(actual: dict, base: dict, tolerancia: float = TOLERANCIA) -> List[Regresion]:
+    """Regresiones de `actual` frente a `base` (los casos que no están en ambos se ignoran)"""
+    regresiones = []
+    for caso, medida in actual["casos"].items():
+        anterior = base["casos"].get(caso)
+        if anterior is None or not medida["n"]:
+            continue
+        if medida["p95_ms"] > MINIMO_MS and medida["p95_ms"] > anterior["p95_ms"] * (1 + tolerancia):
+            regresiones.append((caso, f"p95 {anterior['p95_ms']:.3f} -> {medida['p95_ms']:.3f} ms"))
+        if medida["por_segundo"] < anterior["por_segundo"] * (1 - tolerancia):
+            regresiones.append((caso, f"{anterior['por_segundo']:.1f} -> {medida['por_segundo']:.1f} por segundo"))
+        if medida["errores"] > anterior["errores"]:
+            regresiones.append((caso, f"errores {anterior['errores']} -> {medida['errores']}"))
+    return regresiones
+
+
+def texto(regresion: Regresion) -> str:
+    caso, mensaje = regresion
+    return f"{caso}: {mensaje}"
+
+
+def ruta_linea_base(nombre: str, carpeta: str = CARPETA) -> str:
+    return os.path.join(carpeta, f"linea_base_{nombre}.json")
+
+
+def cargar_linea_base(nombre: str, carpeta: str = CARPETA) -> Optional[dict]:
+    ruta = ruta_linea_base(nombre, carpeta)
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def guardar_linea_base(actual: dict, carpeta: str = CARPETA) -> str:
+    os.makedirs(carpeta, exist_ok=True)
+    ruta = ruta_linea_base(actual["nombre"], carpeta)
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(actual, f, indent=2, ensure_ascii=False)
+    return ruta
+
+
+def _html(actual: dict, base: Optional[dict], regresiones: List[Regresion]) -> str:
+    columnas = ["n", "errores", "por_segundo", "media_ms", "p50_ms", "p95_ms", "p99_ms"]
+    marcados = {caso for caso, _ in regresiones}
+    filas = []
+    for caso, medida in actual["casos"].items():
+        anterior = (base or {}).get("casos", {}).get(caso)
+        celdas = "".join(
+            f"<td>{medida[c]}" + (f" <small>({anterior[c]})</small>" if anterior else "") + "</td>"
+            for c in columnas)
+        estilo = ' style="color: #d00"' if caso in marcados else ""
+        filas.append(f"<tr{estilo}><td>{html.escape(caso)}</td>{celdas}</tr>")
+    encabezado = "".join(f"<th>{c}</th>" for c in ["caso", *columnas])
+    lista = "".join(f"<li>{html.escape(texto(r))}</li>" for r in regresiones) or "<li>Ninguna</li>"
+    referencia = f"Línea base del {base['fecha']} entre paréntesis." if base else "Sin línea base."
+    return (
+        '<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+        f'<title>Benchmark {html.escape(actual["nombre"])}</title>'
+        '<link rel="stylesheet" href="assets/style.css"></head><body>'
+        f'<h1>Benchmark {html.escape(actual["nombre"])}</h1>'
+        f'<p>{actual["fecha"]} · {html.escape(json.dumps(actual["configuracion"], ensure_ascii=False))}</p>'
+        f'<p>{referencia}</p><h2>Regresiones</h2><ul>{lista}</ul>'
+        f'<table id="results-table"><thead><tr>{encabezado}</tr></thead><tbody>{"".join(filas)}</tbody></table>'
+        '</body></html>\n')
+
+
+def guardar(actual: dict, base: Optional[dict] = None, regresiones: Sequence[Regresion] = (),
+            carpeta: str = CARPETA) -> List[str]:
+    """Escribe resultados/benchmark_<nombre>.json y .html; devuelve sus rutas"""
+    os.makedirs(carpeta, exist_ok=True)
+    ruta_json = os.path.join(carpeta, f"benchmark_{actual['nombre']}.json")
+    ruta_html = os.path.join(carpeta, f"benchmark_{actual['nombre']}.html")
+    with open(ruta_json, "w", encoding="utf-8") as f:
+        json.dump({**actual, "regresiones": [{"caso": caso, "mensaje": mensaje} for caso, mensaje in regresiones]},
+                  f, indent=2, ensure_ascii=False)
+    with open(ruta_html, "w", encoding="utf-8") as f:
+        f.write(_html(actual, base, list(regresiones)))
+    return [ruta_json, ruta_html]
+
+
+def imprimir(actual: dict, regresiones: Sequence[Regresion]):
+    print(f"{'caso':<36} {'n':>8} {'err':>5} {'por s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for caso, m in actual["casos"].items():
+        print(f"{caso:<36} {m['n']:>8} {m['errores']:>5} {m['por_segundo']:>10.1f} {m['p50_ms']:>9.3f}"
+              f" {m['p95_ms']:>9.3f} {m['p99_ms']:>9.3f}")
+    for regresion in regresiones:
+        print(f"✗ Regresión: {texto(regresion)}")
@@ -0,0 +1,89 @@
+"""
+Micro-benchmarks (pytest-benchmark) de serialización, validación y handlers
+
+Se ejecutan con run_benchmarks.py, que guarda el resultado en
+resultados/benchmark_micro.json/.html y lo compara con la línea base. Los de
+handlers pasan por la app completa (middlewares incluidos) con TestClient y
+usan la base configurada en DB_*; el resto no necesita base de datos.
+
+    python -m pytest benchmarks/test_micro.py --benchmark-only
+"""
+from datetime import datetime
+
+import numpy as np
+import pytest
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.testclient import TestClient
+
+from bench_biometria import construir_indice
+from bench_serializacion import camino_fastapi, generar
+from backend import schemas
+from backend.biometria import DIMENSION
+from backend.espacial import geohash, haversine_km
+from backend.respuestas import desde_filas, desde_objetos
+
+FILAS = 1_000
+
+
+@pytest.fixture(scope="module")
+def estructuras():
+    return generar(FILAS)
+
+
+class TestSerializacion:
+    def test_fastapi(self, benchmark, estructuras):
+        benchmark(camino_fastapi(JSONResponse), estructuras[0])
+
+    def test_orjson(self, benchmark, estructuras):
+        benchmark(camino_fastapi(ORJSONResponse), estructuras[0])
+
+    def test_esquema(self, benchmark, estructuras):
+        benchmark(desde_objetos, schemas.Estructura, estructuras[0])
+
+    def test_filas(self, benchmark, estructuras):
+        benchmark(desde_filas, estructuras[1], estructuras[2])
+
+
+class TestValidacion:
+    def test_lote_lecturas(self, benchmark):
+        cuerpo = {"lecturas": [{"estructura_id": i % 50 + 1, "metrica": "ph", "valor": 6.1,
+                                "fecha": datetime(2025, 1, 1).isoformat()} for i in range(FILAS)]}
+        benchmark(schemas.LoteLecturas.model_validate, cuerpo)
+
+    def test_crear_estructura(self, benchmark):
+        cuerpo = {"espacio_id": 1, "tipo_estructura_id": 1, "codigo": "E-1", "nombre": "Canal 1", "capacidad": 48,
+                  "ancho": 0.12, "largo": 6.0, "posicion_x": 1.0, "posicion_y": 2.0}
+        benchmark(schemas.EstructuraCreate.model_validate, cuerpo)
+
+
+class TestCalculo:
+    def test_identificar_10k(self, benchmark):
+        rng = np.random.default_rng(42)
+        indice, plantillas = construir_indice(10_000, rng)
+        consulta = plantillas[123] + rng.normal(0, 0.01, DIMENSION).astype(np.float32)
+        consulta /= np.linalg.norm(consulta)
+        resultado = benchmark(indice.identificar, consulta, 0.9)
+        assert resultado.metodo_acceso_id == 124
+
+    def test_haversine_10k(self, benchmark):
+        rng = np.random.default_rng(42)
+        latitudes, longitudes = rng.uniform(-4, 12, 10_000), rng.uniform(-79, -67, 10_000)
+        benchmark(haversine_km, 4.71, -74.07, latitudes, longitudes)
+
+    def test_geohash(self, benchmark):
+        benchmark(geohash, 4.7110, -74.0721)
+
+
+@pytest.fixture(scope="module")
+def cliente():
+    from backend.main import app
+    with TestClient(app) as cliente:
+        yield cliente
+
+
+class TestHandlers:
+    @pytest.mark.parametrize("ruta", ["/api/empresas?limit=100", "/api/estructuras?limit=100",
+                                      "/api/sedes/cercanas?lat=4.71&lon=-74.07&k=10"])
+    def test_get(self, benchmark, cliente, ruta):
+        respuesta = benchmark(cliente.get, ruta)
+        assert respuesta.status_code == 200
@@ -1,7 +1,17 @@
 import json
 import psycopg2
 import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.pool import ThreadedConnectionPool
+
+# Meses hacia adelante para los que se crean particiones (tablas con partition_by)
+MESES_PARTICION = int(os.getenv('MESES_PARTICION', '12'))
+
+# Conexiones usadas en paralelo para crear tablas e índices
+DDL_PARALELISMO = int(os.getenv('DDL_PARALELISMO', '4'))
 
 # Cargar configuración desde variables de entorno o valores por defecto
 DB_CONFIG = {
@@ -23,76 +33,121 @@ def mapear_tipo_dato(data_type, length):
     }
     return tipo_map.get(data_type, 'TEXT')
 
-def crear_tabla(conn, clase):
-    """Crea una tabla basada en la definición de clase del JSON"""
-    cursor = conn.cursor()
-    
-    # Construir columnas
-    columnas = []
-    foreign_keys = []
+# Reglas aplicadas por nombre de columna
+COLUMNAS_NOT_NULL = ['nombre', 'empresa_id', 'sede_id', 'bloque_id',
+                     'espacio_id', 'persona_id', 'usuario_id', 'username',
+                     'password_hash', 'tipo_cultivo_id', 'cultivo_id',
+                     'estructura_id', 'metrica', 'fecha', 'valor',
+                     'resolucion', 'inicio', 'cantidad', 'hasta',
+                     'variedad_cultivo_id', 'fecha_inicio']
+COLUMNAS_UNIQUE = ['nit', 'documento', 'email', 'username', 'codigo']
+TIMESTAMPS_CON_DEFAULT = ['fecha_creacion', 'fecha_acceso', 'fecha', 'fecha_inicio']
+
+class CicloDependencias(Exception):
+    """Las referencias de JSON.json forman un ciclo: no hay orden de creación posible"""
+
+def orden_tablas(clases):
+    """
+    Niveles de creación según el grafo de "references": cada tabla queda en
+    el primer nivel posterior a todas las tablas a las que referencia, así
+    que las de un mismo nivel se pueden crear a la vez. Dentro de cada nivel
+    se respeta el orden de JSON.json. Las autorreferencias no cuentan.
+    """
+    nombres = [clase['class'] for clase in clases]
+    dependencias = {}
+    for clase in clases:
+        destinos = {ref['tabla_destino'] for ref in clase.get('references', [])} - {clase['class']}
+        faltantes = destinos - set(nombres)
+        if faltantes:
+            raise ValueError(f'"{clase["class"]}" referencia tablas que no están en JSON.json: {sorted(faltantes)}')
+        dependencias[clase['class']] = destinos
     
-    for attr in clase['attributes']:
-        nombre = attr['name']
-        tipo = mapear_tipo_dato(attr['data_type'], attr['length'])
-        
-        # Construir definición de columna
-        col_def = f'"{nombre}" {tipo}'
-        
-        # Agregar PRIMARY KEY
-        if attr.get('primary_key') == 'True':
-            col_def += ' PRIMARY KEY'
-        
-        # Agregar AUTOINCREMENT (SERIAL en PostgreSQL)
-        if attr.get('autoincrement') == 'True':
-            if attr['data_type'] == 'int':
-                col_def = f'"{nombre}" SERIAL PRIMARY KEY'
-        
-        # Agregar NOT NULL para campos importantes
-        if nombre in ['nombre', 'empresa_id', 'sede_id', 'bloque_id', 
-                      'espacio_id', 'persona_id', 'usuario_id', 'username', 
-                      'password_hash', 'tipo_cultivo_id', 'cultivo_id']:
-            if 'PRIMARY KEY' not in col_def:
-                col_def += ' NOT NULL'
-        
-        # Agregar UNIQUE para campos únicos
-        if nombre in ['nit', 'documento', 'email', 'username', 'codigo']:
-            if 'PRIMARY KEY' not in col_def:
-                col_def += ' UNIQUE'
-        
-        # Agregar DEFAULT para campos booleanos
-        if attr['data_type'] == 'boolean' and nombre in ['activo', 'auto_registro']:
-            default_value = 'true' if nombre == 'activo' else 'false'
-            col_def += f' DEFAULT {default_value}'
-        
-        # Agregar DEFAULT para timestamps
-        if attr['data_type'] == 'timestamp' and nombre in ['fecha_creacion', 'fecha_acceso']:
-            col_def += ' DEFAULT CURRENT_TIMESTAMP'
-        
-        columnas.append(col_def)
-        
-        # Preparar foreign keys
-        if attr.get('foreign_key') == 'True':
-            foreign_keys.append(nombre)
+    niveles = []
+    creadas = set()
+    pendientes = list(nombres)
+    while pendientes:
+        nivel = [tabla for tabla in pendientes if dependencias[tabla] <= creadas]
+        if not nivel:
+            raise CicloDependencias('Ciclo de dependencias entre tablas: ' + ' -> '.join(_ciclo(dependencias, pendientes)))
+        niveles.append(nivel)
+        creadas.update(nivel)
+        pendientes = [tabla for tabla in pendientes if tabla not in creadas]
+    return niveles
+
+def _ciclo(dependencias, pendientes):
+    """Recorre dependencias entre tablas pendientes hasta repetir una: ese tramo es el ciclo"""
+    camino = [pendientes[0]]
+    while True:
+        siguiente = sorted(dependencias[camino[-1]] & set(pendientes))[0]
+        if siguiente in camino:
+            return camino[camino.index(siguiente):] + [siguiente]
+        camino.append(siguiente)
+
+def definir_columna(attr):
+    """Definición de una columna del JSON: tipo, PK, NOT NULL, UNIQUE y DEFAULT"""
+    nombre = attr['name']
+    serial = attr.get('autoincrement') == 'True' and attr['data_type'] == 'int'
+    primary_key = serial or attr.get('primary_key') == 'True'
+    default = None
+    # DEFAULT para campos booleanos
+    if attr['data_type'] == 'boolean' and nombre in ['activo', 'auto_registro']:
+        default = 'true' if nombre == 'activo' else 'false'
+    # DEFAULT para timestamps
+    if attr['data_type'] == 'timestamp' and nombre in TIMESTAMPS_CON_DEFAULT:
+        default = 'CURRENT_TIMESTAMP'
+    return {
+        'nombre': nombre,
+        'tipo': 'SERIAL' if serial else mapear_tipo_dato(attr['data_type'], attr['length']),
+        'primary_key': primary_key,
+        # NOT NULL y UNIQUE para campos importantes (la PK ya los implica)
+        'not_null': nombre in COLUMNAS_NOT_NULL and not primary_key,
+        'unique': nombre in COLUMNAS_UNIQUE and not primary_key,
+        'default': default,
+    }
+
+def sql_columna(columna):
+    col_def = f'"{columna["nombre"]}" {columna["tipo"]}'
+    if columna['primary_key']:
+        col_def += ' PRIMARY KEY'
+    if columna['not_null']:
+        col_def += ' NOT NULL'
+    if columna['unique']:
+        col_def += ' UNIQUE'
+    if columna['default'] is not None:
+        col_def += f' DEFAULT {columna["default"]}'
+    return col_def
+
+def sql_foreign_key(tabla, ref, valida=True):
+    query = f'CONSTRAINT fk_{tabla}_{ref["campo_origen"]} '
+    query += f'FOREIGN KEY ("{ref["campo_origen"]}") '
+    query += f'REFERENCES "{ref["tabla_destino"]}" ("{ref["campo_destino"]}") '
+    query += 'ON DELETE CASCADE'
+    return query if valida else query + ' NOT VALID'
+
+def sentencia_tabla(clase):
+    """CREATE TABLE IF NOT EXISTS para la definición de clase del JSON"""
+    columnas = [sql_columna(definir_columna(attr)) for attr in clase['attributes']]
     
     # Construir query CREATE TABLE
     query = f'CREATE TABLE IF NOT EXISTS "{clase["class"]}" (\n'
     query += ',\n'.join(columnas)
     
     # Agregar foreign keys desde la sección references
-    if 'references' in clase:
-        for ref in clase['references']:
-            campo_origen = ref['campo_origen']
-            tabla_destino = ref['tabla_destino']
-            campo_destino = ref['campo_destino']
-            query += f',\nCONSTRAINT fk_{clase["class"]}_{campo_origen} '
-            query += f'FOREIGN KEY ("{campo_origen}") '
-            query += f'REFERENCES "{tabla_destino}" ("{campo_destino}") '
-            query += 'ON DELETE CASCADE'
+    for ref in clase.get('references', []):
+        query += ',\n' + sql_foreign_key(clase['class'], ref)
     
-    query += '\n);'
+    query += '\n)'
     
+    # Tablas de series de tiempo particionadas por rango
+    if 'partition_by' in clase:
+        query += f' PARTITION BY RANGE ("{clase["partition_by"]["column"]}")'
+    return query + ';'
+
+def crear_tabla(conn, clase):
+    """Crea una tabla basada en la definición de clase del JSON"""
+    cursor = conn.cursor()
     try:
-        cursor.execute(query)
+        cursor.execute(sentencia_tabla(clase))
         conn.commit()
         print(f'✓ Tabla "{clase["class"]}" creada exitosamente')
     except psycopg2.Error as e:
@@ -101,33 +156,185 @@ def crear_tabla(conn, clase):
     finally:
         cursor.close()
 
-def crear_indices(conn):
-    """Crea índices para mejorar el rendimiento"""
+def crear_particiones(conn, clase):
+    """Crea particiones mensuales (mes anterior .. MESES_PARTICION adelante) y la partición DEFAULT"""
     cursor = conn.cursor()
-    
-    indices = [
-        'CREATE INDEX IF NOT EXISTS idx_sede_empresa_id ON "sede"("empresa_id");',
-        'CREATE INDEX IF NOT EXISTS idx_sede_responsable_id ON "sede"("responsable_id");',
-        'CREATE INDEX IF NOT EXISTS idx_bloque_sede_id ON "bloque"("sede_id");',
-        'CREATE INDEX IF NOT EXISTS idx_espacio_bloque_id ON "espacio"("bloque_id");',
-        'CREATE INDEX IF NOT EXISTS idx_espacio_tipo_espacio_id ON "espacio"("tipo_espacio_id");',
-        'CREATE INDEX IF NOT EXISTS idx_estructura_espacio_id ON "estructura"("espacio_id");',
-        'CREATE INDEX IF NOT EXISTS idx_usuario_persona_id ON "usuario"("persona_id");',
-        'CREATE INDEX IF NOT EXISTS idx_usuario_empresa_id ON "usuario"("empresa_id");',
-        'CREATE INDEX IF NOT EXISTS idx_acceso_espacio_usuario_id ON "acceso_espacio"("usuario_id");',
-        'CREATE INDEX IF NOT EXISTS idx_acceso_espacio_espacio_id ON "acceso_espacio"("espacio_id");',
-    ]
-    
-    for idx_query in indices:
+    tabla = clase['class']
+    hoy = date.today()
+    for desplazamiento in range(-1, MESES_PARTICION + 1):
+        indice_mes = hoy.year * 12 + hoy.month - 1 + desplazamiento
+        inicio = date(indice_mes // 12, indice_mes % 12 + 1, 1)
+        fin = date((indice_mes + 1) // 12, (indice_mes + 1) % 12 + 1, 1)
+        nombre = f'{tabla}_{inicio.year}_{inicio.month:02d}'
         try:
-            cursor.execute(idx_query)
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS "{nombre}" PARTITION OF "{tabla}" '
+                f"FOR VALUES FROM ('{inicio.isoformat()}') TO ('{fin.isoformat()}');"
+            )
             conn.commit()
-            print(f'✓ Índice creado: {idx_query.split("ON")[1].split("(")[0].strip()}')
         except psycopg2.Error as e:
-            print(f'✗ Error creando índice: {e}')
+            conn.rollback()
+            print(f'✗ Error creando partición "{nombre}": {e}')
+    try:
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS "{tabla}_default" PARTITION OF "{tabla}" DEFAULT;')
+        conn.commit()
+        print(f'✓ Particiones de "{tabla}" creadas hasta {MESES_PARTICION} meses adelante')
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f'✗ Error creando partición por defecto de "{tabla}": {e}')
+    finally:
+        cursor.close()
+
+def definir_indices(clases):
+    """
+    Lista de índices a crear: los declarados en "indexes" de cada clase más
+    uno por cada columna de "references" (los ON DELETE CASCADE buscan las
+    filas hijas por esa columna). El índice de una FK se omite si otro índice
+    no parcial de la tabla ya empieza por esa columna.
+    """
+    indices = []
+    for clase in clases:
+        tabla = clase['class']
+        declarados = [{
+            'tabla': tabla,
+            'nombre': spec['name'],
+            'columnas': spec['columns'],
+            'unique': spec.get('unique') == 'True',
+            'where': spec.get('where'),
+            'using': spec.get('using'),
+        } for spec in clase.get('indexes', [])]
+        nombres = {indice['nombre'] for indice in declarados}
+        cubiertas = {indice['columnas'][0].split()[0] for indice in declarados if not indice['where']}
+        indices.extend(declarados)
+        for ref in clase.get('references', []):
+            columna = ref['campo_origen']
+            if columna in cubiertas:
+                continue
+            nombre = f'idx_{tabla}_{columna}'
+            if nombre in nombres:
+                nombre += '_fk'
+            indices.append({'tabla': tabla, 'nombre': nombre, 'columnas': [columna],
+                            'unique': False, 'where': None, 'using': None})
+            nombres.add(nombre)
+            cubiertas.add(columna)
+    return indices
+
+def sentencia_indice(indice, concurrente=False, tabla=None, nombre=None, solo=False):
+    """CREATE INDEX para la definición (opcionalmente sobre otra tabla/nombre, p. ej. una partición)"""
+    columnas = []
+    for columna in indice['columnas']:
+        nombre_columna, *opciones = columna.split()
+        columnas.append(' '.join([f'"{nombre_columna}"', *opciones]))
+    query = 'CREATE UNIQUE INDEX' if indice['unique'] else 'CREATE INDEX'
+    if concurrente:
+        query += ' CONCURRENTLY'
+    query += f' IF NOT EXISTS {nombre or indice["nombre"]} ON '
+    query += 'ONLY ' if solo else ''
+    query += f'"{tabla or indice["tabla"]}"'
+    if indice['using']:
+        query += f' USING {indice["using"].upper()}'
+    query += f' ({", ".join(columnas)})'
+    if indice['where']:
+        query += f' WHERE {indice["where"]}'
+    return query + ';'
+
+def _tiene_filas(cursor, tabla):
+    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM "{tabla}")')
+    return cursor.fetchone()[0]
+
+def _descartar_invalido(cursor, nombre):
+    """Un CREATE INDEX CONCURRENTLY fallido deja un índice inválido que IF NOT EXISTS no reintentaría"""
+    cursor.execute(
+        "SELECT NOT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = %s AND pg_table_is_visible(c.oid)", (nombre,))
+    fila = cursor.fetchone()
+    if fila and fila[0]:
+        print(f'  Reconstruyendo índice inválido {nombre}')
+        cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {nombre};')
+
+def _particiones(cursor, tabla):
+    cursor.execute("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = %s::regclass",
+                   (f'"{tabla}"',))
+    return [fila[0].strip('"') for fila in cursor.fetchall()]
+
+def crear_indice(cursor, indice, particionada=False):
+    """
+    Crea el índice sin bloquear escrituras cuando la tabla ya tiene datos
+    (CREATE INDEX CONCURRENTLY, que necesita autocommit). Las tablas
+    particionadas no admiten CONCURRENTLY: se crea el índice solo en la
+    tabla padre, cada partición lo construye de forma concurrente y se adjunta.
+    """
+    if not _tiene_filas(cursor, indice['tabla']):
+        cursor.execute(sentencia_indice(indice))
+        return
+    if not particionada:
+        _descartar_invalido(cursor, indice['nombre'])
+        cursor.execute(sentencia_indice(indice, concurrente=True))
+        return
+    cursor.execute(sentencia_indice(indice, solo=True))
+    for particion in _particiones(cursor, indice['tabla']):
+        cursor.execute(
+            "SELECT 1 FROM pg_inherits h JOIN pg_index i ON i.indexrelid = h.inhrelid "
+            "WHERE h.inhparent = %s::regclass AND i.indrelid = %s::regclass",
+            (indice['nombre'], f'"{particion}"'))
+        if cursor.fetchone() is not None:
+            continue
+        nombre = f'{indice["nombre"]}_{particion.removeprefix(indice["tabla"] + "_")}'[:63]
+        _descartar_invalido(cursor, nombre)
+        cursor.execute(sentencia_indice(indice, concurrente=True, tabla=particion, nombre=nombre))
+        cursor.execute(f'ALTER INDEX {indice["nombre"]} ATTACH PARTITION {nombre};')
+
+def ejecutar_en_paralelo(pool, tareas, paralelismo=DDL_PARALELISMO):
+    """Ejecuta cada `tarea(conn)` con una conexión en autocommit del pool"""
+    def ejecutar(tarea):
+        conn = pool.getconn()
+        try:
+            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            tarea(conn)
+        finally:
+            pool.putconn(conn)
     
+    with ThreadPoolExecutor(max_workers=paralelismo) as ejecutor:
+        list(ejecutor.map(ejecutar, tareas))
+
+def _crear_tabla_completa(conn, clase):
+    crear_tabla(conn, clase)
+    if 'partition_by' in clase:
+        crear_particiones(conn, clase)
+
+def crear_tablas(pool, clases, paralelismo=DDL_PARALELISMO):
+    """Crea las tablas nivel por nivel (orden_tablas); las de un mismo nivel en paralelo"""
+    por_nombre = {clase['class']: clase for clase in clases}
+    for nivel in orden_tablas(clases):
+        tareas = [lambda conn, clase=por_nombre[tabla]: _crear_tabla_completa(conn, clase) for tabla in nivel]
+        ejecutar_en_paralelo(pool, tareas, paralelismo)
+
+def _crear_indices_tabla(conn, indices, particionada):
+    cursor = conn.cursor()
+    for indice in indices:
+        try:
+            crear_indice(cursor, indice, particionada)
+            print(f'✓ Índice {indice["nombre"]} en {indice["tabla"]}({", ".join(indice["columnas"])})')
+        except psycopg2.Error as e:
+            print(f'✗ Error creando índice {indice["nombre"]}: {e}')
     cursor.close()
 
+def crear_indices(pool, clases, paralelismo=DDL_PARALELISMO):
+    """
+    Crea los índices declarados en JSON.json y los de todas las claves
+    foráneas. Cada tabla construye los suyos uno tras otro (dos CREATE INDEX
+    CONCURRENTLY sobre la misma tabla se esperan entre sí) y las tablas van
+    en paralelo.
+    """
+    particionadas = {clase['class'] for clase in clases if 'partition_by' in clase}
+    por_tabla = defaultdict(list)
+    for indice in definir_indices(clases):
+        por_tabla[indice['tabla']].append(indice)
+    
+    tareas = [lambda conn, tabla=tabla, indices=indices: _crear_indices_tabla(conn, indices, tabla in particionadas)
+              for tabla, indices in por_tabla.items()]
+    ejecutar_en_paralelo(pool, tareas, paralelismo)
+
 def main():
     """Función principal"""
     print("=" * 60)
@@ -145,44 +352,35 @@ def main():
         print(f"✗ Error: JSON inválido - {e}")
         return
     
+    # Orden de creación a partir de las dependencias entre tablas
+    try:
+        niveles = orden_tablas(data['classes'])
+    except (CicloDependencias, ValueError) as e:
+        print(f"✗ Error: {e}")
+        return
+    
     # Conectar a PostgreSQL
     try:
         print(f"\nConectando a PostgreSQL...")
         print(f"Host: {DB_CONFIG['host']}")
         print(f"Database: {DB_CONFIG['database']}")
         
-        conn = psycopg2.connect(**DB_CONFIG)
-        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        pool = ThreadedConnectionPool(1, DDL_PARALELISMO, **DB_CONFIG)
         print("✓ Conexión exitosa\n")
     except psycopg2.Error as e:
         print(f"✗ Error conectando a PostgreSQL: {e}")
         return
     
-    # Crear tablas en orden (respetando dependencias)
-    print("Creando tablas...\n")
-    
-    # Orden de creación basado en dependencias
-    orden_creacion = [
-        'empresa', 'persona', 'tipo_espacio', 'tipo_estructura',
-        'tipo_cultivo', 'fase_produccion', 'nutriente', 'rol',
-        'sede', 'bloque', 'espacio', 'estructura',
-        'usuario', 'usuario_rol', 'metodo_acceso', 'acceso_espacio',
-        'cultivo', 'variedad_cultivo', 'cultivo_fase', 'fase_nutriente'
-    ]
-    
-    # Crear diccionario de clases por nombre
-    clases_dict = {clase['class']: clase for clase in data['classes']}
-    
-    # Crear tablas en orden
-    for nombre_clase in orden_creacion:
-        if nombre_clase in clases_dict:
-            crear_tabla(conn, clases_dict[nombre_clase])
+    # Crear tablas por niveles de dependencia, en paralelo dentro de cada nivel
+    print(f"Creando tablas ({len(niveles)} niveles, hasta {DDL_PARALELISMO} en paralelo)...\n")
+    crear_tablas(pool, data['classes'])
     
     # Crear índices
     print("\nCreando índices...\n")
-    crear_indices(conn)
+    crear_indices(pool, data['classes'])
     
     # Verificar tablas creadas
+    conn = pool.getconn()
     cursor = conn.cursor()
     cursor.execute("""
         SELECT table_name 
@@ -201,7 +399,8 @@ def main():
         print(f"  - {tabla[0]}")
     print("=" * 60)
     
-    conn.close()
+    pool.putconn(conn)
+    pool.closeall()
 
 if __name__ == '__main__':
     main()
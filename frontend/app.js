@@ -1,5 +1,5 @@
-// Configuración
-const API_BASE_URL = 'http://localhost:8000/api';
+// Configuración (?api=<url> permite apuntar a otra API, p. ej. la de cada worker en las pruebas en paralelo)
+const API_BASE_URL = new URLSearchParams(window.location.search).get('api') || 'http://localhost:8000/api';
 let currentEntity = 'empresas';
 let currentEditId = null;
 
@@ -13,7 +13,7 @@ const entityFields = {
     'espacios': ['bloque_id', 'tipo_espacio_id', 'nombre', 'capacidad', 'ancho', 'largo', 'alto', 'ubicacion'],
     'tipos-estructura': ['nombre', 'descripcion'],
     'estructuras': ['espacio_id', 'tipo_estructura_id', 'codigo', 'nombre', 'capacidad', 'ancho', 'largo', 'posicion_x', 'posicion_y'],
-    'usuarios': ['persona_id', 'empresa_id', 'username', 'password_hash', 'auto_registro'],
+    'usuarios': ['persona_id', 'empresa_id', 'username', 'password', 'auto_registro'],
     'roles': ['nombre', 'descripcion'],
     'usuarios-roles': ['usuario_id', 'rol_id'],
     'metodos-acceso': ['usuario_id', 'tipo', 'dato_biometrico', 'activo'],
@@ -24,7 +24,8 @@ const entityFields = {
     'fases-produccion': ['nombre', 'duracion_estimada_dias', 'descripcion'],
     'cultivos-fases': ['variedad_cultivo_id', 'fase_produccion_id', 'orden', 'duracion_dias'],
     'nutrientes': ['nombre', 'formula_quimica', 'descripcion'],
-    'fases-nutriente': ['cultivo_fase_id', 'nutriente_id', 'cantidad', 'unidad_medida', 'frecuencia']
+    'fases-nutriente': ['cultivo_fase_id', 'nutriente_id', 'cantidad', 'unidad_medida', 'frecuencia'],
+    'siembras': ['estructura_id', 'variedad_cultivo_id', 'fecha_inicio', 'activo']
 };
 
 // Tipos de campos
@@ -42,7 +43,7 @@ const fieldTypes = {
     'ubicacion': 'text',
     'codigo': 'text',
     'username': 'text',
-    'password_hash': 'text',
+    'password': 'password',
     'tipo': 'text',
     'dato_biometrico': 'text',
     'metodo_acceso': 'text',
@@ -66,6 +67,8 @@ const fieldTypes = {
     'fase_produccion_id': 'number',
     'cultivo_fase_id': 'number',
     'nutriente_id': 'number',
+    'estructura_id': 'number',
+    'fecha_inicio': 'datetime-local',
     'responsable_id': 'number',
     'latitud': 'number',
     'longitud': 'number',
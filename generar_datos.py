@@ -0,0 +1,507 @@
+"""
+Generador de datos sintéticos a gran escala para pruebas de carga
+
+Llena las tablas de JSON.json con datos realistas y referencialmente
+consistentes a la escala pedida (p. ej. 100 empresas, 10k espacios, 1M
+estructuras, 100M accesos), para que los benchmarks corran contra volúmenes
+representativos de producción:
+
+- Cada tabla se genera por lotes de LOTE filas con numpy y se carga con COPY.
+  Cada lote usa su propio generador aleatorio, derivado de la semilla, la
+  tabla y el número de lote, así que el resultado depende solo de la semilla,
+  la escala y la fecha de referencia (--fecha, fija por defecto), no del
+  paralelismo ni del orden de ejecución.
+- Los ids son explícitos (1..n) y las filas hijas quedan agrupadas por padre,
+  como si se hubieran cargado en el tiempo. Cada padre tiene al menos un
+  hijo (toda empresa tiene sedes, todo espacio estructuras, ...), así que la
+  escala debe cumplir empresas <= sedes <= bloques <= espacios <= estructuras.
+- Los accesos van a espacios de la empresa del usuario, con usuarios y
+  espacios sesgados (unos pocos concentran la mayoría de los accesos).
+- Las lecturas son series regulares por estructura y métrica en los últimos
+  `dias` días; lectura_sensor_resumen, resumen_marca, resumen_pendiente y
+  alerta_sensor no se generan: los calculan el resumidor y el motor de alertas.
+
+Los lotes de las tablas grandes se cargan en paralelo por un pool de
+DDL_PARALELISMO conexiones. Antes de cargar se quitan los índices
+secundarios (create_database.definir_indices) y las FOREIGN KEY; al final se
+reconstruyen en paralelo y las FK se validan con un recorrido por tabla
+(NOT VALID + VALIDATE CONSTRAINT), bastante más rápido que comprobar y
+mantener todo fila a fila. Los índices y las FK se reconstruyen aunque la
+carga falle o se interrumpa.
+
+Uso:
+    python generar_datos.py --perfil pequeno --truncar
+    python generar_datos.py --perfil produccion --semilla 7 --truncar
+    python generar_datos.py --perfil mediano --estructuras 500000 --accesos 20000000
+    python generar_datos.py --perfil pequeno --fecha 2026-10-01 --truncar
+"""
+import argparse
+import base64
+import io
+import json
+import time
+import zlib
+from dataclasses import asdict, dataclass, fields, replace
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+from backend.espacial import geohash
+from create_database import (DB_CONFIG, DDL_PARALELISMO, crear_indices, definir_indices, ejecutar_en_paralelo,
+                             sql_foreign_key)
+
+# Filas por lote (fijo: cambiarlo cambia los datos generados para una semilla)
+LOTE = 100_000
+# Fecha de referencia por defecto: las fechas generadas son anteriores a ella
+FECHA_REFERENCIA = datetime(2025, 1, 1)
+
+
+@dataclass(frozen=True)
+class Escala:
+    empresas: int
+    sedes: int
+    bloques: int
+    espacios: int
+    estructuras: int
+    personas: int
+    usuarios: int
+    accesos: int
+    lecturas: int
+    dias: int = 30
+
+
+PERFILES = {
+    'pequeno': Escala(empresas=5, sedes=20, bloques=60, espacios=300, estructuras=3_000,
+                      personas=1_000, usuarios=500, accesos=50_000, lecturas=100_000),
+    'mediano': Escala(empresas=20, sedes=200, bloques=1_000, espacios=2_000, estructuras=100_000,
+                      personas=20_000, usuarios=10_000, accesos=5_000_000, lecturas=10_000_000),
+    'produccion': Escala(empresas=100, sedes=1_000, bloques=3_000, espacios=10_000, estructuras=1_000_000,
+                         personas=100_000, usuarios=50_000, accesos=100_000_000, lecturas=100_000_000),
+}
+
+# Catálogos (nombre, descripción / datos)
+TIPOS_ESPACIO = ['Invernadero', 'Cuarto de cultivo', 'Vivero', 'Laboratorio', 'Bodega', 'Oficina']
+TIPOS_ESTRUCTURA = ['Torre NFT', 'Mesa DWC', 'Canal NFT', 'Bandeja de germinación', 'Sistema aeropónico']
+ROLES = ['Administrador', 'Agrónomo', 'Operario', 'Técnico', 'Auditor']
+TIPOS_CULTIVO = {
+    'Hortalizas de hoja': [('Lechuga', 'Lactuca sativa'), ('Espinaca', 'Spinacia oleracea'),
+                           ('Acelga', 'Beta vulgaris'), ('Rúgula', 'Eruca vesicaria')],
+    'Aromáticas': [('Albahaca', 'Ocimum basilicum'), ('Cilantro', 'Coriandrum sativum'),
+                   ('Menta', 'Mentha spicata'), ('Perejil', 'Petroselinum crispum')],
+    'Frutos': [('Tomate', 'Solanum lycopersicum'), ('Pimentón', 'Capsicum annuum'),
+               ('Pepino', 'Cucumis sativus'), ('Fresa', 'Fragaria ananassa')],
+    'Microverdes': [('Rábano', 'Raphanus sativus'), ('Girasol', 'Helianthus annuus')],
+}
+VARIEDADES = ['Clásica', 'Crespa', 'Morada', 'Gigante', 'Enana']
+FASES = [('Germinación', 7), ('Plántula', 14), ('Crecimiento vegetativo', 21), ('Floración', 14), ('Cosecha', 7)]
+NUTRIENTES = [('Nitrato', 'NO3'), ('Fósforo', 'P'), ('Potasio', 'K'), ('Calcio', 'Ca'), ('Magnesio', 'Mg'),
+              ('Azufre', 'S'), ('Hierro', 'Fe'), ('Manganeso', 'Mn'), ('Zinc', 'Zn'), ('Boro', 'B'),
+              ('Cobre', 'Cu'), ('Molibdeno', 'Mo')]
+# Métrica de lectura -> (media, desviación)
+METRICAS = {'ph': (6.0, 0.4), 'ec': (1.8, 0.3), 'temperatura': (22.0, 3.0), 'humedad': (65.0, 10.0),
+            'no3': (150.0, 30.0), 'k': (200.0, 40.0), 'ca': (160.0, 30.0)}
+NOMBRES = ['Ana', 'Luis', 'María', 'Carlos', 'Laura', 'Andrés', 'Sofía', 'Jorge', 'Valentina', 'Diego',
+           'Camila', 'Felipe', 'Daniela', 'Juan', 'Paula', 'Santiago', 'Natalia', 'Mateo', 'Isabela', 'Sebastián']
+APELLIDOS = ['García', 'Rodríguez', 'Martínez', 'López', 'González', 'Pérez', 'Sánchez', 'Ramírez', 'Torres',
+             'Flores', 'Rivera', 'Gómez', 'Díaz', 'Reyes', 'Morales', 'Castro', 'Ortiz', 'Vargas', 'Rojas', 'Muñoz']
+CIUDADES = [('Bogotá', 4.71, -74.07), ('Medellín', 6.24, -75.58), ('Cali', 3.45, -76.53),
+            ('Bucaramanga', 7.12, -73.12), ('Pereira', 4.81, -75.69), ('Manizales', 5.07, -75.52)]
+METODOS = ['tarjeta', 'huella', 'facial', 'pin']
+
+# Tablas en orden de carga (respeta las referencias)
+TABLAS = ['empresa', 'persona', 'tipo_espacio', 'tipo_estructura', 'rol', 'tipo_cultivo', 'fase_produccion',
+          'nutriente', 'sede', 'usuario', 'cultivo', 'bloque', 'usuario_rol', 'metodo_acceso',
+          'variedad_cultivo', 'espacio', 'cultivo_fase', 'estructura', 'acceso_espacio', 'fase_nutriente',
+          'lectura_sensor', 'siembra']
+
+
+# Niveles de la jerarquía de ubicaciones, de padre a hijo
+JERARQUIA = ('empresas', 'sedes', 'bloques', 'espacios', 'estructuras')
+
+
+def errores_escala(escala: 'Escala') -> List[str]:
+    """Incoherencias de la escala: cada nivel de JERARQUIA necesita al menos tantas filas como su padre"""
+    errores = [f'{campo.name} no puede ser negativo' for campo in fields(Escala) if getattr(escala, campo.name) < 0]
+    if escala.empresas < 1:
+        errores.append('empresas debe ser al menos 1')
+    for padre, hijo in zip(JERARQUIA, JERARQUIA[1:]):
+        hijos, padres = getattr(escala, hijo), getattr(escala, padre)
+        if hijos < padres:
+            errores.append(f'{hijo} ({hijos}) no puede ser menor que {padre} ({padres}): '
+                           f'cada uno de {padre} necesita al menos uno de {hijo}')
+    return errores
+
+
+def asignar_padres(rng, hijos: int, padres: int) -> np.ndarray:
+    """Id de padre (1..padres) de cada hijo, agrupados por padre y con al menos un hijo por padre"""
+    if hijos <= padres:
+        return np.sort(rng.choice(np.arange(1, padres + 1), size=hijos, replace=False))
+    return np.sort(np.concatenate([np.arange(1, padres + 1), rng.integers(1, padres + 1, hijos - padres)]))
+
+
+def sesgado(rng, tamano: int, n: int) -> np.ndarray:
+    """Ids 1..n con distribución sesgada hacia los primeros (u³): pocos concentran la mayoría"""
+    return (rng.random(tamano) ** 3 * n).astype(np.int64) + 1
+
+
+def _texto(prefijo: str, ids: np.ndarray) -> np.ndarray:
+    return np.char.add(prefijo, ids.astype(str))
+
+
+def _elegir(rng, opciones: List[str], tamano: int) -> np.ndarray:
+    return np.array(opciones)[rng.integers(0, len(opciones), tamano)]
+
+
+def a_csv(columnas: Dict[str, np.ndarray]) -> str:
+    """Columnas -> texto CSV para COPY (None o NaT -> NULL). Los textos generados no llevan comas ni comillas"""
+    partes = []
+    for valores in columnas.values():
+        if valores.dtype == bool:
+            texto = np.where(valores, 't', 'f')
+        elif np.issubdtype(valores.dtype, np.datetime64):
+            texto = np.where(np.isnat(valores), '', valores.astype('datetime64[s]').astype(str))
+        elif np.issubdtype(valores.dtype, np.floating):
+            texto = valores.astype(str)
+        elif valores.dtype == object:
+            texto = np.array(['' if v is None else str(v) for v in valores])
+        else:
+            texto = valores.astype(str)
+        partes.append(texto.tolist())
+    return '\n'.join(map(','.join, zip(*partes))) + '\n'
+
+
+class Generador:
+    """Filas de cada tabla para una escala y semilla; `lote(tabla, numero)` es determinista"""
+
+    def __init__(self, escala: Escala, semilla: int = 42, ahora: datetime = None):
+        self.escala = escala
+        self.semilla = semilla
+        self.ahora = np.datetime64((ahora or FECHA_REFERENCIA).replace(microsecond=0), 's')
+        self.n_cultivos = sum(len(c) for c in TIPOS_CULTIVO.values())
+        self.n_variedades = self.n_cultivos * 3
+        self.n_cultivo_fases = self.n_variedades * len(FASES)
+        # Relaciones que otras tablas necesitan consultar
+        self.sede_empresa = asignar_padres(self.rng('sede'), escala.sedes, escala.empresas)
+        self.bloque_sede = asignar_padres(self.rng('bloque'), escala.bloques, escala.sedes)
+        self.espacio_bloque = asignar_padres(self.rng('espacio'), escala.espacios, escala.bloques)
+        self.estructura_espacio = asignar_padres(self.rng('estructura'), escala.estructuras, escala.espacios)
+        self.usuario_empresa = asignar_padres(self.rng('usuario'), escala.usuarios, escala.empresas)
+        self.espacio_empresa = self.sede_empresa[self.bloque_sede[self.espacio_bloque - 1] - 1]
+        # Espacios ordenados por empresa: los de la empresa e son orden[inicio[e]:inicio[e] + cuenta[e]]
+        self._espacios_por_empresa = np.argsort(self.espacio_empresa, kind='stable') + 1
+        self._cuenta = np.bincount(self.espacio_empresa, minlength=escala.empresas + 1)
+        self._inicio = np.concatenate([[0], np.cumsum(self._cuenta)[:-1]])
+
+    def rng(self, tabla: str, numero: int = 0) -> np.random.Generator:
+        return np.random.default_rng([self.semilla, zlib.crc32(tabla.encode()), numero])
+
+    def filas(self, tabla: str) -> int:
+        e = self.escala
+        return {
+            'empresa': e.empresas, 'persona': e.personas, 'tipo_espacio': len(TIPOS_ESPACIO),
+            'tipo_estructura': len(TIPOS_ESTRUCTURA), 'rol': len(ROLES), 'tipo_cultivo': len(TIPOS_CULTIVO),
+            'fase_produccion': len(FASES), 'nutriente': len(NUTRIENTES), 'sede': e.sedes, 'usuario': e.usuarios,
+            'cultivo': self.n_cultivos, 'bloque': e.bloques, 'usuario_rol': e.usuarios,
+            'metodo_acceso': e.usuarios, 'variedad_cultivo': self.n_variedades, 'espacio': e.espacios,
+            'cultivo_fase': self.n_cultivo_fases, 'estructura': e.estructuras, 'acceso_espacio': e.accesos,
+            'fase_nutriente': self.n_cultivo_fases * 4, 'lectura_sensor': e.lecturas, 'siembra': e.estructuras,
+        }[tabla]
+
+    def lotes(self, tabla: str) -> int:
+        return -(-self.filas(tabla) // LOTE)
+
+    def lote(self, tabla: str, numero: int) -> Dict[str, np.ndarray]:
+        """Columnas de las filas [numero * LOTE, (numero + 1) * LOTE) de la tabla"""
+        inicio = numero * LOTE
+        ids = np.arange(inicio + 1, min(inicio + LOTE, self.filas(tabla)) + 1, dtype=np.int64)
+        return getattr(self, f'_{tabla}')(self.rng(tabla, numero + 1), ids)
+
+    def _fechas_pasadas(self, rng, tamano: int, dias: int) -> np.ndarray:
+        return self.ahora - (rng.random(tamano) * dias * 86400).astype('timedelta64[s]')
+
+    # ---------- Catálogos ----------
+
+    def _catalogo(self, ids, nombres, descripcion):
+        return {'id': ids, 'nombre': np.array(nombres)[ids - 1], 'descripcion': np.char.add(descripcion, np.array(nombres)[ids - 1])}
+
+    def _tipo_espacio(self, rng, ids):
+        return self._catalogo(ids, TIPOS_ESPACIO, 'Espacio de tipo ')
+
+    def _tipo_estructura(self, rng, ids):
+        return self._catalogo(ids, TIPOS_ESTRUCTURA, 'Estructura de tipo ')
+
+    def _rol(self, rng, ids):
+        return self._catalogo(ids, ROLES, 'Rol ')
+
+    def _tipo_cultivo(self, rng, ids):
+        return self._catalogo(ids, list(TIPOS_CULTIVO), 'Cultivos de tipo ')
+
+    def _fase_produccion(self, rng, ids):
+        return {'id': ids, 'nombre': np.array([f for f, _ in FASES])[ids - 1],
+                'duracion_estimada_dias': np.array([d for _, d in FASES])[ids - 1]}
+
+    def _nutriente(self, rng, ids):
+        return {'id': ids, 'nombre': np.array([n for n, _ in NUTRIENTES])[ids - 1],
+                'formula_quimica': np.array([f for _, f in NUTRIENTES])[ids - 1]}
+
+    def _cultivo(self, rng, ids):
+        cultivos = [(tipo, nombre, cientifico) for tipo, (_, lista) in enumerate(TIPOS_CULTIVO.items(), 1)
+                    for nombre, cientifico in lista]
+        return {'id': ids, 'tipo_cultivo_id': np.array([c[0] for c in cultivos])[ids - 1],
+                'nombre': np.array([c[1] for c in cultivos])[ids - 1],
+                'nombre_cientifico': np.array([c[2] for c in cultivos])[ids - 1]}
+
+    def _variedad_cultivo(self, rng, ids):
+        return {'id': ids, 'cultivo_id': (ids - 1) // 3 + 1,
+                'nombre': np.array(VARIEDADES)[rng.integers(0, len(VARIEDADES), len(ids))]}
+
+    def _cultivo_fase(self, rng, ids):
+        fase = (ids - 1) % len(FASES)
+        base = np.array([d for _, d in FASES])[fase]
+        return {'id': ids, 'variedad_cultivo_id': (ids - 1) // len(FASES) + 1, 'fase_produccion_id': fase + 1,
+                'orden': fase + 1, 'duracion_dias': base + rng.integers(-2, 3, len(ids))}
+
+    def _fase_nutriente(self, rng, ids):
+        nutriente = (ids - 1) % 4 + 1 + rng.integers(0, 2, len(ids)) * 4
+        return {'id': ids, 'cultivo_fase_id': (ids - 1) // 4 + 1, 'nutriente_id': nutriente,
+                'cantidad': np.round(rng.uniform(20, 250, len(ids)), 1),
+                'unidad_medida': np.full(len(ids), 'ppm'), 'frecuencia': np.full(len(ids), 'diaria')}
+
+    # ---------- Organización ----------
+
+    def _empresa(self, rng, ids):
+        return {'id': ids, 'nombre': _texto('Agrícola ', ids), 'nit': np.char.add(_texto('900', ids + 100000), '-1'),
+                'activo': rng.random(len(ids)) < 0.95}
+
+    def _persona(self, rng, ids):
+        return {'id': ids, 'nombre': _elegir(rng, NOMBRES, len(ids)), 'apellido': _elegir(rng, APELLIDOS, len(ids)),
+                'documento': (ids + 10_000_000).astype(str),
+                'email': np.char.add(_texto('persona', ids), '@ejemplo.co'),
+                'telefono': (rng.integers(3_000_000_000, 3_299_999_999, len(ids))).astype(str),
+                'activo': rng.random(len(ids)) < 0.97}
+
+    def _sede(self, rng, ids):
+        ciudad = rng.integers(0, len(CIUDADES), len(ids))
+        latitudes = np.array([c[1] for c in CIUDADES])[ciudad] + rng.normal(0, 0.08, len(ids))
+        longitudes = np.array([c[2] for c in CIUDADES])[ciudad] + rng.normal(0, 0.08, len(ids))
+        return {'id': ids, 'empresa_id': self.sede_empresa[ids - 1],
+                'nombre': np.char.add(np.char.add(np.array([c[0] for c in CIUDADES])[ciudad], ' '), _texto('', ids)),
+                'direccion': np.char.add(_texto('Calle ', rng.integers(1, 200, len(ids))),
+                                         _texto(' # ', rng.integers(1, 120, len(ids)))),
+                'latitud': np.round(latitudes, 5), 'longitud': np.round(longitudes, 5),
+                'responsable_id': rng.integers(1, self.escala.personas + 1, len(ids)),
+                'geohash': np.array([geohash(round(a, 5), round(o, 5)) for a, o in zip(latitudes, longitudes)])}
+
+    def _bloque(self, rng, ids):
+        return {'id': ids, 'sede_id': self.bloque_sede[ids - 1], 'nombre': _texto('Bloque ', ids)}
+
+    def _espacio(self, rng, ids):
+        return {'id': ids, 'bloque_id': self.espacio_bloque[ids - 1],
+                'tipo_espacio_id': rng.integers(1, len(TIPOS_ESPACIO) + 1, len(ids)),
+                'nombre': _texto('Espacio ', ids), 'capacidad': rng.integers(10, 500, len(ids)),
+                'ancho': np.round(rng.uniform(5, 40, len(ids)), 1), 'largo': np.round(rng.uniform(5, 80, len(ids)), 1),
+                'alto': np.round(rng.uniform(2.5, 6, len(ids)), 1)}
+
+    def _estructura(self, rng, ids):
+        # Posiciones en una grilla del plano del espacio (sin solapamientos entre vecinas)
+        espacios = self.estructura_espacio[ids - 1]
+        primera = np.searchsorted(self.estructura_espacio, espacios)
+        posicion = ids - 1 - primera
+        return {'id': ids, 'espacio_id': espacios,
+                'tipo_estructura_id': rng.integers(1, len(TIPOS_ESTRUCTURA) + 1, len(ids)),
+                'codigo': _texto('E-', ids), 'nombre': _texto('Estructura ', posicion + 1),
+                'capacidad': rng.integers(20, 200, len(ids)),
+                'ancho': np.full(len(ids), 1.0), 'largo': np.full(len(ids), 2.0),
+                'posicion_x': (posicion % 20) * 1.5, 'posicion_y': (posicion // 20) * 2.5}
+
+    # ---------- Usuarios y accesos ----------
+
+    def _usuario(self, rng, ids):
+        return {'id': ids, 'persona_id': (ids - 1) % self.escala.personas + 1,
+                'empresa_id': self.usuario_empresa[ids - 1], 'username': _texto('usuario', ids),
+                'password_hash': np.char.add('sha256$', _texto('', rng.integers(10 ** 15, 10 ** 16, len(ids)))),
+                'auto_registro': rng.random(len(ids)) < 0.2,
+                'fecha_creacion': self._fechas_pasadas(rng, len(ids), 365)}
+
+    def _usuario_rol(self, rng, ids):
+        # Pocos administradores y auditores, la mayoría operarios
+        rol = rng.choice(np.arange(1, len(ROLES) + 1), size=len(ids), p=[0.05, 0.15, 0.6, 0.15, 0.05])
+        return {'id': ids, 'usuario_id': ids, 'rol_id': rol}
+
+    def _metodo_acceso(self, rng, ids):
+        tipos = _elegir(rng, METODOS, len(ids))
+        plantillas = rng.integers(0, 256, (len(ids), 256), dtype=np.uint8)
+        datos = np.array([base64.b64encode(p.tobytes()).decode() if t in ('huella', 'facial') else None
+                          for t, p in zip(tipos, plantillas)], dtype=object)
+        return {'id': ids, 'usuario_id': ids, 'tipo': tipos, 'dato_biometrico': datos,
+                'activo': rng.random(len(ids)) < 0.9}
+
+    def _acceso_espacio(self, rng, ids):
+        usuarios = sesgado(rng, len(ids), self.escala.usuarios)
+        empresas = self.usuario_empresa[usuarios - 1]
+        # Espacio al azar (sesgado) entre los de la empresa del usuario
+        desplazamiento = (rng.random(len(ids)) ** 2 * self._cuenta[empresas]).astype(np.int64)
+        espacios = self._espacios_por_empresa[self._inicio[empresas] + desplazamiento]
+        return {'id': ids, 'usuario_id': usuarios, 'espacio_id': espacios,
+                'fecha_acceso': self._fechas_pasadas(rng, len(ids), self.escala.dias),
+                'metodo_acceso': _elegir(rng, METODOS, len(ids))}
+
+    # ---------- Telemetría y siembras ----------
+
+    def _lectura_sensor(self, rng, ids):
+        # Serie regular: fila r -> estructura r % E, métrica (r // E) % M, paso r // (E * M) hacia atrás
+        estructuras, metricas = self.escala.estructuras, list(METRICAS)
+        filas = ids - 1
+        pasos = -(-self.escala.lecturas // (estructuras * len(metricas)))
+        intervalo = max(self.escala.dias * 86400 // max(pasos, 1), 1)
+        metrica = (filas // estructuras) % len(metricas)
+        medias = np.array([METRICAS[m][0] for m in metricas])[metrica]
+        desviaciones = np.array([METRICAS[m][1] for m in metricas])[metrica]
+        return {'estructura_id': filas % estructuras + 1, 'metrica': np.array(metricas)[metrica],
+                'fecha': self.ahora - (filas // (estructuras * len(metricas)) * intervalo).astype('timedelta64[s]'),
+                'valor': np.round(rng.normal(medias, desviaciones), 3)}
+
+    def _siembra(self, rng, ids):
+        return {'id': ids, 'estructura_id': ids, 'variedad_cultivo_id': rng.integers(1, self.n_variedades + 1, len(ids)),
+                'fecha_inicio': self._fechas_pasadas(rng, len(ids), 90), 'activo': rng.random(len(ids)) < 0.8}
+
+
+def copiar(conn, tabla: str, columnas: Dict[str, np.ndarray]):
+    cursor = conn.cursor()
+    try:
+        cursor.copy_expert(f'COPY "{tabla}" ({", ".join(columnas)}) FROM STDIN WITH (FORMAT csv)',
+                           io.StringIO(a_csv(columnas)))
+    finally:
+        cursor.close()
+
+
+def cargar(pool, generador: Generador, tablas: List[str] = TABLAS, paralelismo: int = DDL_PARALELISMO):
+    """Carga cada tabla lote a lote (los lotes de una tabla en paralelo) y ajusta sus secuencias"""
+    for tabla in tablas:
+        inicio = time.perf_counter()
+        tareas = [lambda conn, numero=numero, tabla=tabla: copiar(conn, tabla, generador.lote(tabla, numero))
+                  for numero in range(generador.lotes(tabla))]
+        ejecutar_en_paralelo(pool, tareas, paralelismo)
+        segundos = time.perf_counter() - inicio
+        filas = generador.filas(tabla)
+        print(f'✓ {tabla}: {filas:,} filas en {segundos:.1f} s ({filas / max(segundos, 1e-9):,.0f} filas/s)')
+    ejecutar_en_paralelo(pool, [_ajustar_secuencias(tablas)], 1)
+
+
+def _ajustar_secuencias(tablas):
+    def ajustar(conn):
+        cursor = conn.cursor()
+        for tabla in tablas:
+            cursor.execute("SELECT pg_get_serial_sequence(attrelid::regclass::text, 'id') FROM pg_attribute "
+                           "WHERE attrelid = %s::regclass AND attname = 'id'", (f'"{tabla}"',))
+            secuencia = cursor.fetchone()
+            if secuencia and secuencia[0]:
+                cursor.execute(f'SELECT setval(%s, COALESCE((SELECT max(id) FROM "{tabla}"), 0) + 1, false)',
+                               (secuencia[0],))
+            cursor.execute(f'ANALYZE "{tabla}"')
+        cursor.close()
+    return ajustar
+
+
+def quitar_restricciones(pool, clases):
+    """Quita las FOREIGN KEY y los índices secundarios antes de la carga"""
+    conn = pool.getconn()
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        # Las FK se comprueban fila a fila durante COPY; validarlas al final es un solo recorrido por tabla
+        for clase in clases:
+            for ref in clase.get('references', []):
+                cursor.execute(f'ALTER TABLE "{clase["class"]}" DROP CONSTRAINT IF EXISTS '
+                               f'fk_{clase["class"]}_{ref["campo_origen"]}')
+        indices = definir_indices(clases)
+        print(f'Quitando {len(indices)} índices secundarios durante la carga...')
+        for indice in indices:
+            cursor.execute(f'DROP INDEX IF EXISTS "{indice["nombre"]}"')
+    finally:
+        cursor.close()
+        pool.putconn(conn)
+
+
+def restaurar_claves_foraneas(pool, clases, paralelismo: int = DDL_PARALELISMO):
+    """Vuelve a crear las FOREIGN KEY quitadas para la carga: NOT VALID y luego una validación por tabla"""
+    def restaurar(conn, clase):
+        cursor = conn.cursor()
+        for ref in clase['references']:
+            nombre = f'fk_{clase["class"]}_{ref["campo_origen"]}'
+            # Las tablas particionadas no admiten FK NOT VALID: se crean ya validadas
+            particionada = 'partition_by' in clase
+            try:
+                cursor.execute(f'ALTER TABLE "{clase["class"]}" ADD {sql_foreign_key(clase["class"], ref, particionada)};')
+                if not particionada:
+                    cursor.execute(f'ALTER TABLE "{clase["class"]}" VALIDATE CONSTRAINT {nombre};')
+                print(f'✓ {nombre} validada')
+            except psycopg2.Error as e:
+                print(f'✗ Error restaurando {nombre}: {e}')
+        cursor.close()
+
+    tareas = [lambda conn, clase=clase: restaurar(conn, clase) for clase in clases if clase.get('references')]
+    ejecutar_en_paralelo(pool, tareas, paralelismo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--perfil', choices=sorted(PERFILES), default='pequeno')
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--truncar', action='store_true', help='Vaciar las tablas antes de cargar')
+    parser.add_argument('--paralelismo', type=int, default=DDL_PARALELISMO)
+    parser.add_argument('--fecha', type=datetime.fromisoformat, default=FECHA_REFERENCIA,
+                        help='Fecha de referencia (ISO, p. ej. 2026-10-01): las fechas generadas son anteriores a ella. '
+                             f'Por defecto {FECHA_REFERENCIA:%Y-%m-%d}; conviene una reciente para que las lecturas '
+                             'caigan en las particiones mensuales')
+    for campo in fields(Escala):
+        parser.add_argument(f'--{campo.name}', type=int, help=f'Reemplaza {campo.name} del perfil')
+    args = parser.parse_args()
+
+    escala = replace(PERFILES[args.perfil], **{campo.name: getattr(args, campo.name) for campo in fields(Escala)
+                                               if getattr(args, campo.name) is not None})
+    errores = errores_escala(escala)
+    if errores:
+        parser.error('escala incoherente: ' + '; '.join(errores))
+    print(f'Escala: {json.dumps(asdict(escala))} semilla={args.semilla} fecha={args.fecha.isoformat()}')
+    with open('JSON.json', 'r', encoding='utf-8') as f:
+        clases = json.load(f)['classes']
+
+    pool = ThreadedConnectionPool(1, args.paralelismo, **DB_CONFIG)
+    try:
+        conn = pool.getconn()
+        conn.autocommit = True
+        cursor = conn.cursor()
+        try:
+            if args.truncar:
+                tablas = ', '.join(f'"{tabla}"' for tabla in TABLAS)
+                cursor.execute(f'TRUNCATE {tablas} RESTART IDENTITY CASCADE')
+            else:
+                for tabla in TABLAS:
+                    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM "{tabla}")')
+                    if cursor.fetchone()[0]:
+                        print(f'✗ La tabla "{tabla}" ya tiene datos; usar --truncar para reemplazarlos')
+                        return
+        finally:
+            cursor.close()
+            pool.putconn(conn)
+
+        inicio = time.perf_counter()
+        try:
+            quitar_restricciones(pool, clases)
+            cargar(pool, Generador(escala, args.semilla, args.fecha), paralelismo=args.paralelismo)
+        finally:
+            # También si la carga falla: la base no debe quedar sin índices ni FK
+            print('\nReconstruyendo índices y claves foráneas...\n')
+            crear_indices(pool, clases, args.paralelismo)
+            restaurar_claves_foraneas(pool, clases, args.paralelismo)
+        print(f'\n✓ Datos generados en {time.perf_counter() - inicio:.1f} s')
+    finally:
+        pool.closeall()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,496 @@
+"""
+Migraciones en línea desde JSON.json
+
+create_database.py solo crea lo que no existe (CREATE TABLE IF NOT EXISTS),
+así que los cambios de columnas o restricciones en JSON.json no llegan a
+una base ya creada. Este script lee el esquema real (information_schema y
+pg_catalog), lo compara con JSON.json y arma un plan ordenado de operaciones
+que no bloquean la tabla mientras recorren sus filas:
+
+- tablas nuevas con CREATE TABLE (y sus particiones)
+- columnas nuevas como nullables; con DEFAULT constante PostgreSQL no
+  reescribe la tabla
+- DEFAULT que falta con SET DEFAULT y relleno de los NULL existentes en
+  lotes de MIGRACION_TAMANO_LOTE filas
+- columnas que la aplicación calcula en Python (DERIVADAS, p. ej.
+  sede.geohash) rellenadas en lotes para las filas que aún no la tienen
+- VARCHAR más largos o TEXT (solo cambia el catálogo)
+- NOT NULL como CHECK ... NOT VALID, VALIDATE CONSTRAINT (sin bloquear
+  escrituras) y SET NOT NULL, que aprovecha el CHECK validado en vez de
+  recorrer la tabla
+- claves foráneas NOT VALID y luego VALIDATE
+- UNIQUE a partir de un índice creado con CONCURRENTLY (si un intento
+  anterior dejó el índice inválido, se borra y se vuelve a crear)
+- índices faltantes con CREATE INDEX CONCURRENTLY (create_database.crear_indice)
+
+Nunca se borran tablas ni columnas y los cambios de tipo que reescriben la
+tabla no se aplican: se informan como advertencias, junto con las
+diferencias entre JSON.json y los modelos SQLAlchemy (backend/models.py).
+Cada sentencia corre con lock_timeout = MIGRACION_LOCK_TIMEOUT para no
+quedar en cola detrás de una transacción larga bloqueando a las demás.
+
+El plan se recalcula en cada ejecución, así que si una operación falla se
+puede volver a correr: lo ya aplicado no reaparece y los CHECK o FK que
+quedaron NOT VALID se validan.
+
+Uso:
+    python migrar.py             # muestra el plan sin tocar la base
+    python migrar.py --aplicar   # lo ejecuta
+"""
+import argparse
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extras import execute_values
+
+from create_database import (DB_CONFIG, _descartar_invalido, crear_indice, crear_particiones, definir_columna,
+                             definir_indices, orden_tablas, sentencia_indice, sentencia_tabla, sql_foreign_key)
+
+TAMANO_LOTE = int(os.getenv('MIGRACION_TAMANO_LOTE', '5000'))
+LOCK_TIMEOUT = os.getenv('MIGRACION_LOCK_TIMEOUT', '5s')
+
+
+def _geohash(latitud, longitud):
+    from backend.espacial import geohash
+    return geohash(latitud, longitud)
+
+
+# Columnas que la aplicación calcula al escribir la fila: (tabla, columna) -> (columnas de origen, función)
+DERIVADAS = {
+    ('sede', 'geohash'): (('latitud', 'longitud'), _geohash),
+}
+
+# Fases en el orden en que se ejecutan
+FASES = ['tablas', 'columnas', 'defaults', 'relleno', 'tipos', 'nulos',
+         'restricciones', 'validacion', 'not_null', 'unicas', 'indices']
+
+_TIPOS = {
+    'integer': 'INTEGER',
+    'text': 'TEXT',
+    'boolean': 'BOOLEAN',
+    'real': 'REAL',
+    'timestamp without time zone': 'TIMESTAMP',
+}
+
+
+@dataclass
+class Operacion:
+    fase: str
+    tabla: str
+    descripcion: str
+    sentencias: List[str] = field(default_factory=list)
+    # Relleno: la sentencia se repite hasta que no afecte filas
+    repetir: bool = False
+    # En lugar de las sentencias (que entonces solo se muestran)
+    ejecutar: Optional[Callable] = None
+
+
+@dataclass
+class Plan:
+    operaciones: List[Operacion] = field(default_factory=list)
+    advertencias: List[str] = field(default_factory=list)
+
+    def agregar(self, *operaciones: Operacion):
+        self.operaciones.extend(operaciones)
+
+    def ordenar(self):
+        self.operaciones.sort(key=lambda op: FASES.index(op.fase))
+
+
+def tipo_actual(data_type, largo):
+    """Tipo de information_schema.columns en la notación de create_database.mapear_tipo_dato"""
+    if data_type == 'character varying':
+        return f'VARCHAR({largo})' if largo else 'TEXT'
+    return _TIPOS.get(data_type, data_type.upper())
+
+
+def _largo(tipo):
+    return int(tipo[len('VARCHAR('):-1]) if tipo.startswith('VARCHAR(') else None
+
+
+def introspeccionar(conn, esquema=None):
+    """
+    Estado real del esquema:
+    {'tablas': {tabla: {'particionada', 'vacia', 'pk', 'columnas': {columna: {'tipo', 'not_null', 'default'}}}},
+     'restricciones': {(tabla, nombre): {'tipo', 'columnas', 'validada'}},
+     'indices': {nombre: valido}}
+    """
+    cursor = conn.cursor()
+    if esquema is None:
+        cursor.execute('SELECT current_schema()')
+        esquema = cursor.fetchone()[0]
+    tablas = {}
+    cursor.execute("""
+        SELECT c.relname, c.relkind = 'p'
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relkind IN ('r', 'p') AND NOT c.relispartition
+    """, (esquema,))
+    for nombre, particionada in cursor.fetchall():
+        tablas[nombre] = {'particionada': particionada, 'pk': [], 'columnas': {}}
+    cursor.execute("""
+        SELECT table_name, column_name, data_type, character_maximum_length, is_nullable, column_default
+        FROM information_schema.columns
+        WHERE table_schema = %s
+        ORDER BY table_name, ordinal_position
+    """, (esquema,))
+    for tabla, columna, data_type, largo, nullable, default in cursor.fetchall():
+        if tabla in tablas:
+            tablas[tabla]['columnas'][columna] = {'tipo': tipo_actual(data_type, largo),
+                                                  'not_null': nullable == 'NO', 'default': default}
+    restricciones = {}
+    cursor.execute("""
+        SELECT t.relname, r.conname, r.contype, r.convalidated,
+               ARRAY(SELECT a.attname FROM unnest(r.conkey) WITH ORDINALITY k(num, orden)
+                     JOIN pg_attribute a ON a.attrelid = r.conrelid AND a.attnum = k.num
+                     ORDER BY k.orden)
+        FROM pg_constraint r
+        JOIN pg_class t ON t.oid = r.conrelid
+        JOIN pg_namespace n ON n.oid = t.relnamespace
+        WHERE n.nspname = %s AND r.contype IN ('p', 'u', 'f', 'c') AND r.conparentid = 0
+    """, (esquema,))
+    for tabla, nombre, tipo, validada, columnas in cursor.fetchall():
+        if tabla not in tablas:
+            continue
+        restricciones[(tabla, nombre)] = {'tipo': tipo, 'columnas': list(columnas), 'validada': validada}
+        if tipo == 'p':
+            tablas[tabla]['pk'] = list(columnas)
+    cursor.execute("""
+        SELECT c.relname, i.indisvalid
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s
+    """, (esquema,))
+    indices = dict(cursor.fetchall())
+    for tabla, datos in tablas.items():
+        cursor.execute(f'SELECT NOT EXISTS (SELECT 1 FROM "{esquema}"."{tabla}")')
+        datos['vacia'] = cursor.fetchone()[0]
+    # Columnas derivadas con filas por calcular
+    derivadas = set()
+    for (tabla, columna), (origen, _) in DERIVADAS.items():
+        existentes = tablas.get(tabla, {}).get('columnas', {})
+        if columna in existentes and all(c in existentes for c in origen):
+            cursor.execute(f'SELECT EXISTS (SELECT 1 FROM "{esquema}"."{tabla}" WHERE {_pendientes(columna, origen)})')
+            if cursor.fetchone()[0]:
+                derivadas.add((tabla, columna))
+    cursor.close()
+    return {'tablas': tablas, 'restricciones': restricciones, 'indices': indices, 'derivadas': derivadas}
+
+
+def _restriccion(estado, tabla, tipo, columnas):
+    """Nombre y datos de una restricción de la tabla con ese tipo y columnas"""
+    for (tabla_restriccion, nombre), datos in estado['restricciones'].items():
+        if tabla_restriccion == tabla and datos['tipo'] == tipo and datos['columnas'] == columnas:
+            return nombre, datos
+    return None, None
+
+
+def _check_not_null(tabla, columna):
+    return f'chk_{tabla}_{columna}_not_null'[:63]
+
+
+def _relleno(tabla, columna, pk):
+    """UPDATE de a TAMANO_LOTE filas con NULL (por clave primaria: ctid no es único entre particiones)"""
+    if pk:
+        claves = ', '.join(f'"{c}"' for c in pk)
+        filtro = f'({claves}) IN (SELECT {claves} FROM "{tabla}" WHERE "{columna}" IS NULL LIMIT {TAMANO_LOTE})'
+    else:
+        filtro = f'ctid = ANY(ARRAY(SELECT ctid FROM "{tabla}" WHERE "{columna}" IS NULL LIMIT {TAMANO_LOTE}))'
+    return f'UPDATE "{tabla}" SET "{columna}" = DEFAULT WHERE {filtro};'
+
+
+def _pendientes(columna, origen):
+    return ' AND '.join([f'"{columna}" IS NULL'] + [f'"{c}" IS NOT NULL' for c in origen])
+
+
+def rellenar_derivada(conn, tabla, columna, origen, funcion, pk='id'):
+    """Calcula `columna` con `funcion(*origen)` para las filas pendientes, de a TAMANO_LOTE por id"""
+    cursor = conn.cursor()
+    columnas = ', '.join(f'"{c}"' for c in origen)
+    ultimo, total = None, 0
+    while True:
+        desde = '' if ultimo is None else f' AND "{pk}" > {int(ultimo)}'
+        cursor.execute(f'SELECT "{pk}", {columnas} FROM "{tabla}" WHERE {_pendientes(columna, origen)}{desde} '
+                       f'ORDER BY "{pk}" LIMIT {TAMANO_LOTE}')
+        filas = cursor.fetchall()
+        if not filas:
+            break
+        execute_values(cursor, f'UPDATE "{tabla}" SET "{columna}" = v.valor FROM (VALUES %s) AS v(id, valor) '
+                               f'WHERE "{tabla}"."{pk}" = v.id AND "{tabla}"."{columna}" IS NULL',
+                       [(fila[0], funcion(*fila[1:])) for fila in filas])
+        if not conn.autocommit:
+            conn.commit()
+        ultimo, total = filas[-1][0], total + len(filas)
+    cursor.close()
+    return total
+
+
+def _planificar_derivadas(plan, clase, actual_tabla, estado):
+    tabla = clase['class']
+    atributos = {attr['name'] for attr in clase['attributes']}
+    for (tabla_derivada, columna), (origen, funcion) in DERIVADAS.items():
+        if tabla_derivada != tabla or columna not in atributos:
+            continue
+        nueva = columna not in actual_tabla['columnas'] and not actual_tabla['vacia']
+        if nueva or (tabla, columna) in estado.get('derivadas', ()):
+            plan.agregar(Operacion(
+                'relleno', tabla, f'calcular "{columna}" de las filas existentes en lotes de {TAMANO_LOTE}',
+                ejecutar=lambda conn, tabla=tabla, columna=columna, origen=origen, funcion=funcion:
+                    rellenar_derivada(conn, tabla, columna, origen, funcion)))
+
+
+def _planificar_columna(plan, tabla, actual_tabla, deseada, estado):
+    nombre = deseada['nombre']
+    actual = actual_tabla['columnas'].get(nombre)
+    particionada = actual_tabla['particionada']
+    prefijo = f'ALTER TABLE "{tabla}"'
+
+    if actual is None:
+        if deseada['primary_key']:
+            plan.advertencias.append(f'{tabla}.{nombre}: columna de clave primaria nueva; requiere migración manual')
+            return
+        definicion = f'"{nombre}" {deseada["tipo"]}'
+        if deseada['default'] is not None:
+            definicion += f' DEFAULT {deseada["default"]}'
+        # Sin DEFAULT las filas existentes quedan en NULL: NOT NULL directo solo si la tabla está vacía
+        directo = deseada['not_null'] and actual_tabla['vacia']
+        if directo:
+            definicion += ' NOT NULL'
+        plan.agregar(Operacion('columnas', tabla, f'agregar columna "{nombre}"',
+                               [f'{prefijo} ADD COLUMN IF NOT EXISTS {definicion};']))
+        if deseada['not_null'] and not directo:
+            if deseada['default'] is None:
+                plan.advertencias.append(
+                    f'{tabla}.{nombre}: NOT NULL sin DEFAULT en una tabla con filas; rellenar y volver a migrar')
+            else:
+                _planificar_not_null(plan, tabla, nombre, particionada, estado, actual_tabla['pk'], False)
+        if deseada['unique']:
+            _planificar_unique(plan, tabla, nombre, particionada, estado)
+        return
+
+    if deseada['default'] is not None and not deseada['primary_key'] and \
+            (actual['default'] or '').lower() != deseada['default'].lower():
+        plan.agregar(Operacion('defaults', tabla, f'DEFAULT de "{nombre}"',
+                               [f'{prefijo} ALTER COLUMN "{nombre}" SET DEFAULT {deseada["default"]};']))
+
+    tipo_deseado = 'INTEGER' if deseada['tipo'] == 'SERIAL' else deseada['tipo']
+    if actual['tipo'] != tipo_deseado:
+        largo_actual, largo_deseado = _largo(actual['tipo']), _largo(tipo_deseado)
+        if largo_actual and (tipo_deseado == 'TEXT' or (largo_deseado or 0) > largo_actual):
+            plan.agregar(Operacion('tipos', tabla, f'ampliar "{nombre}" a {tipo_deseado}',
+                                   [f'{prefijo} ALTER COLUMN "{nombre}" TYPE {tipo_deseado};']))
+        else:
+            plan.advertencias.append(f'{tabla}.{nombre}: {actual["tipo"]} -> {tipo_deseado} reescribe la tabla; '
+                                     'no se aplica automáticamente')
+
+    en_pk = nombre in actual_tabla['pk']
+    if deseada['not_null'] and not actual['not_null']:
+        _planificar_not_null(plan, tabla, nombre, particionada, estado, actual_tabla['pk'],
+                             deseada['default'] is not None)
+    elif not deseada['not_null'] and not deseada['primary_key'] and actual['not_null'] and not en_pk:
+        plan.agregar(Operacion('nulos', tabla, f'permitir NULL en "{nombre}"',
+                               [f'{prefijo} ALTER COLUMN "{nombre}" DROP NOT NULL;']))
+    elif actual['not_null'] and (tabla, _check_not_null(tabla, nombre)) in estado['restricciones']:
+        # Quedó de una migración interrumpida después de SET NOT NULL
+        plan.agregar(Operacion('not_null', tabla, f'quitar CHECK auxiliar de "{nombre}"',
+                               [f'{prefijo} DROP CONSTRAINT IF EXISTS {_check_not_null(tabla, nombre)};']))
+
+    if deseada['unique'] and _restriccion(estado, tabla, 'u', [nombre])[0] is None:
+        _planificar_unique(plan, tabla, nombre, particionada, estado)
+
+
+def _planificar_not_null(plan, tabla, columna, particionada, estado, pk, rellenar):
+    prefijo = f'ALTER TABLE "{tabla}"'
+    if rellenar:
+        plan.agregar(Operacion('relleno', tabla, f'rellenar NULL de "{columna}" en lotes de {TAMANO_LOTE}',
+                               [_relleno(tabla, columna, pk)], repetir=True))
+    if particionada:
+        # Las tablas particionadas no admiten CHECK NOT VALID: SET NOT NULL recorre cada partición
+        plan.agregar(Operacion('not_null', tabla, f'NOT NULL en "{columna}"',
+                               [f'{prefijo} ALTER COLUMN "{columna}" SET NOT NULL;']))
+        return
+    check = _check_not_null(tabla, columna)
+    existente = estado['restricciones'].get((tabla, check))
+    if existente is None:
+        plan.agregar(Operacion('restricciones', tabla, f'CHECK NOT VALID de NULL en "{columna}"',
+                               [f'{prefijo} ADD CONSTRAINT {check} CHECK ("{columna}" IS NOT NULL) NOT VALID;']))
+    if existente is None or not existente['validada']:
+        plan.agregar(Operacion('validacion', tabla, f'validar {check}', [f'{prefijo} VALIDATE CONSTRAINT {check};']))
+    plan.agregar(Operacion('not_null', tabla, f'NOT NULL en "{columna}"',
+                           [f'{prefijo} ALTER COLUMN "{columna}" SET NOT NULL;',
+                            f'{prefijo} DROP CONSTRAINT IF EXISTS {check};']))
+
+
+def _planificar_unique(plan, tabla, columna, particionada, estado):
+    if particionada:
+        plan.advertencias.append(f'{tabla}.{columna}: UNIQUE en tabla particionada debe incluir la clave de partición')
+        return
+    nombre = f'{tabla}_{columna}_key'
+    sentencias = [
+        f'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {nombre} ON "{tabla}" ("{columna}");',
+        f'ALTER TABLE "{tabla}" ADD CONSTRAINT {nombre} UNIQUE USING INDEX {nombre};',
+    ]
+
+    def ejecutar(conn):
+        # Un CREATE UNIQUE INDEX CONCURRENTLY fallido (p. ej. por duplicados) deja el índice inválido
+        cursor = conn.cursor()
+        _descartar_invalido(cursor, nombre)
+        for sentencia in sentencias:
+            cursor.execute(sentencia)
+
+    mostradas = sentencias
+    if estado['indices'].get(nombre) is False:
+        mostradas = [f'DROP INDEX CONCURRENTLY IF EXISTS {nombre};'] + sentencias
+    plan.agregar(Operacion('unicas', tabla, f'UNIQUE en "{columna}"', mostradas, ejecutar=ejecutar))
+
+
+def _planificar_foreign_keys(plan, clase, actual_tabla, estado):
+    tabla = clase['class']
+    for ref in clase.get('references', []):
+        nombre, existente = _restriccion(estado, tabla, 'f', [ref['campo_origen']])
+        if existente is None:
+            nombre = f'fk_{tabla}_{ref["campo_origen"]}'
+            valida = actual_tabla['particionada']
+            plan.agregar(Operacion('restricciones', tabla, f'clave foránea {nombre}',
+                                   [f'ALTER TABLE "{tabla}" ADD {sql_foreign_key(tabla, ref, valida=valida)};']))
+            if valida:
+                continue
+        elif existente['validada']:
+            continue
+        plan.agregar(Operacion('validacion', tabla, f'validar {nombre}',
+                               [f'ALTER TABLE "{tabla}" VALIDATE CONSTRAINT {nombre};']))
+
+
+def comparar_modelos(clases, metadata):
+    """Diferencias de tablas y columnas entre JSON.json y los modelos SQLAlchemy"""
+    advertencias = []
+    json_tablas = {clase['class']: {attr['name'] for attr in clase['attributes']} for clase in clases}
+    for nombre, tabla in metadata.tables.items():
+        if nombre not in json_tablas:
+            advertencias.append(f'modelo {nombre}: la tabla no está en JSON.json')
+            continue
+        columnas_modelo = {columna.name for columna in tabla.columns}
+        for columna in sorted(columnas_modelo - json_tablas[nombre]):
+            advertencias.append(f'modelo {nombre}.{columna}: la columna no está en JSON.json')
+        for columna in sorted(json_tablas[nombre] - columnas_modelo):
+            advertencias.append(f'JSON.json {nombre}.{columna}: la columna no está en el modelo')
+    for nombre in sorted(set(json_tablas) - set(metadata.tables)):
+        advertencias.append(f'JSON.json {nombre}: la tabla no tiene modelo')
+    return advertencias
+
+
+def planificar(clases, estado, metadata=None):
+    """Plan de operaciones para llevar `estado` (introspeccionar) a la definición de `clases`"""
+    plan = Plan()
+    por_nombre = {clase['class']: clase for clase in clases}
+    particionadas = {clase['class'] for clase in clases if 'partition_by' in clase}
+
+    for clase in [por_nombre[tabla] for nivel in orden_tablas(clases) for tabla in nivel]:
+        tabla = clase['class']
+        actual_tabla = estado['tablas'].get(tabla)
+        if actual_tabla is None:
+            plan.agregar(Operacion('tablas', tabla, f'crear tabla "{tabla}"', [sentencia_tabla(clase)]))
+            if tabla in particionadas:
+                plan.agregar(Operacion('tablas', tabla, f'crear particiones de "{tabla}"',
+                                       ejecutar=lambda conn, clase=clase: crear_particiones(conn, clase)))
+            continue
+        deseadas = [definir_columna(attr) for attr in clase['attributes']]
+        for deseada in deseadas:
+            _planificar_columna(plan, tabla, actual_tabla, deseada, estado)
+        _planificar_foreign_keys(plan, clase, actual_tabla, estado)
+        _planificar_derivadas(plan, clase, actual_tabla, estado)
+        nombres = {deseada['nombre'] for deseada in deseadas}
+        for columna in actual_tabla['columnas']:
+            if columna not in nombres:
+                plan.advertencias.append(f'{tabla}.{columna}: existe en la base pero no en JSON.json (no se borra)')
+
+    for tabla in sorted(set(estado['tablas']) - {clase['class'] for clase in clases}):
+        plan.advertencias.append(f'{tabla}: existe en la base pero no en JSON.json (no se borra)')
+
+    for indice in definir_indices(clases):
+        if estado['indices'].get(indice['nombre']):
+            continue
+        particionada = indice['tabla'] in particionadas
+        plan.agregar(Operacion(
+            'indices', indice['tabla'], f'índice {indice["nombre"]}',
+            [sentencia_indice(indice, concurrente=not particionada)],
+            ejecutar=lambda conn, indice=indice, particionada=particionada:
+                crear_indice(conn.cursor(), indice, particionada)))
+
+    if metadata is not None:
+        plan.advertencias.extend(comparar_modelos(clases, metadata))
+    plan.ordenar()
+    return plan
+
+
+def mostrar(plan):
+    if not plan.operaciones:
+        print('✓ El esquema ya coincide con JSON.json')
+    for numero, operacion in enumerate(plan.operaciones, 1):
+        print(f'{numero:3d}. [{operacion.fase}] {operacion.tabla}: {operacion.descripcion}')
+        for sentencia in operacion.sentencias:
+            print('       ' + sentencia.replace('\n', '\n       '))
+        if operacion.repetir:
+            print('       (se repite hasta que no quedan filas)')
+    if plan.advertencias:
+        print('\nAdvertencias:')
+        for advertencia in plan.advertencias:
+            print(f'  ! {advertencia}')
+
+
+def aplicar(conn, plan) -> Tuple[int, Optional[str]]:
+    """Ejecuta el plan en orden; se detiene en el primer error. Devuelve (operaciones aplicadas, error)"""
+    cursor = conn.cursor()
+    cursor.execute(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+    for numero, operacion in enumerate(plan.operaciones):
+        try:
+            if operacion.ejecutar is not None:
+                operacion.ejecutar(conn)
+            else:
+                for sentencia in operacion.sentencias:
+                    cursor.execute(sentencia)
+                    while operacion.repetir and cursor.rowcount > 0:
+                        cursor.execute(sentencia)
+            print(f'✓ {operacion.tabla}: {operacion.descripcion}')
+        except psycopg2.Error as e:
+            print(f'✗ {operacion.tabla}: {operacion.descripcion}: {e}')
+            cursor.close()
+            return numero, str(e)
+    cursor.close()
+    return len(plan.operaciones), None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--aplicar', action='store_true', help='Ejecutar el plan (por defecto solo se muestra)')
+    parser.add_argument('--json', default='JSON.json', help='Definición del esquema')
+    args = parser.parse_args()
+
+    with open(args.json, 'r', encoding='utf-8') as f:
+        clases = json.load(f)['classes']
+    try:
+        from backend.models import Base
+        metadata = Base.metadata
+    except ImportError:
+        metadata = None
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    try:
+        plan = planificar(clases, introspeccionar(conn), metadata)
+        mostrar(plan)
+        if args.aplicar and plan.operaciones:
+            print('\nAplicando...\n')
+            aplicadas, error = aplicar(conn, plan)
+            print(f'\n{aplicadas} de {len(plan.operaciones)} operaciones aplicadas')
+            if error:
+                raise SystemExit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
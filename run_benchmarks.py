@@ -0,0 +1,79 @@
+"""
+Script: run_benchmarks.py
+--------------------------------
+Ejecuta los micro-benchmarks (benchmarks/test_micro.py, con pytest-benchmark),
+resume rendimiento y latencias p50/p95/p99 de cada caso y los compara con la
+línea base para detectar regresiones. Para la prueba de carga HTTP ver
+benchmarks/carga.py, que genera los mismos reportes.
+
+Ubicación de los reportes generados:
+    - resultados/benchmark_micro.json
+    - resultados/benchmark_micro.html
+    - resultados/linea_base_micro.json (con --guardar-linea-base)
+
+Uso:
+    python run_benchmarks.py
+    python run_benchmarks.py --guardar-linea-base
+    python run_benchmarks.py -k Serializacion --tolerancia 0.25
+
+Termina con código 1 si algún caso empeora más que la tolerancia.
+Requiere pytest-benchmark; los benchmarks de handlers usan la base de DB_*.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks import reporte
+
+
+def desde_pytest_benchmark(datos):
+    """Casos del JSON de pytest-benchmark (con --benchmark-save-data) en el formato de reporte.py"""
+    casos = {}
+    for benchmark in datos['benchmarks']:
+        stats = benchmark['stats']
+        tiempos_ms = [t * 1000 for t in stats['data']]
+        caso = benchmark['fullname'].split('::', 1)[-1]
+        # Rendimiento a partir de la mediana: la media (stats['ops']) la mueven unas pocas pausas del GC
+        casos[caso] = {**reporte.resumir(tiempos_ms, stats['total']), 'por_segundo': round(1 / stats['median'], 3)}
+    return casos
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks con comparación contra la línea base')
+    parser.add_argument('-k', dest='filtro', help='Expresión -k de pytest para elegir benchmarks')
+    parser.add_argument('--tolerancia', type=float, default=reporte.TOLERANCIA)
+    parser.add_argument('--guardar-linea-base', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        ruta = os.path.join(carpeta, 'benchmark.json')
+        pytest_args = [sys.executable, '-m', 'pytest', 'benchmarks/test_micro.py', '--benchmark-only',
+                       '--benchmark-save-data', f'--benchmark-json={ruta}', '-q', '-p', 'no:cacheprovider']
+        if args.filtro:
+            pytest_args += ['-k', args.filtro]
+        resultado = subprocess.run(pytest_args)
+        if not os.path.exists(ruta):
+            print('✗ pytest no generó resultados de benchmark')
+            sys.exit(resultado.returncode or 1)
+        with open(ruta, 'r', encoding='utf-8') as f:
+            datos = json.load(f)
+
+    configuracion = {'maquina': datos['machine_info'].get('node'), 'python': datos['machine_info'].get('python_version'),
+                     'commit': datos.get('commit_info', {}).get('id')}
+    actual = reporte.resultado('micro', desde_pytest_benchmark(datos), configuracion)
+    base = reporte.cargar_linea_base('micro')
+    regresiones = reporte.comparar(actual, base, args.tolerancia) if base else []
+    reporte.imprimir(actual, regresiones)
+    print(f'Reportes generados: {", ".join(reporte.guardar(actual, base, regresiones))}')
+    if args.guardar_linea_base:
+        print(f'✓ Línea base guardada en {reporte.ruta_linea_base("micro")}')
+        reporte.guardar_linea_base(actual)
+    sys.exit(1 if regresiones or resultado.returncode else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,9 +8,11 @@ genera un reporte HTML visual e interactivo y un reporte TXT detallado con toda
 Ubicación de los reportes generados:
     - resultados/report_all_tests.html
     - resultados/report_all_tests.txt
+    - resultados/tiempos_pruebas.json (duración y worker de cada prueba)
 
 Uso:
     python run_tests_with_txt.py
+    PRUEBAS_WORKERS=auto python run_tests_with_txt.py   # en paralelo con pytest-xdist, una base por worker
 
 Requiere tener pytest y pytest-html instalados en el entorno.
 """
@@ -27,6 +29,7 @@ os.makedirs(carpeta_resultados, exist_ok=True)
 # Rutas de los reportes
 html_path = os.path.join(carpeta_resultados, 'report_all_tests.html')
 txt_path = os.path.join(carpeta_resultados, 'report_all_tests.txt')
+tiempos_path = os.path.join(carpeta_resultados, 'tiempos_pruebas.json')
 
 # Argumentos para pytest (salida detallada y reporte HTML)
 pytest_args = [
@@ -38,8 +41,14 @@ pytest_args = [
     '--durations=10' # Muestra los 10 tests más lentos
 ]
 
+# Ejecución en paralelo (cada worker de pytest-xdist usa su propia base, ver tests/conftest.py)
+workers = os.getenv('PRUEBAS_WORKERS')
+if workers:
+    pytest_args += ['-n', workers, '--dist', 'loadfile']
+
 # Ejecutar pytest y guardar la salida en el archivo TXT
 with open(txt_path, 'w', encoding='utf-8') as txt_file:
-    result = subprocess.run(pytest_args, stdout=txt_file, stderr=subprocess.STDOUT, text=True)
+    result = subprocess.run(pytest_args, stdout=txt_file, stderr=subprocess.STDOUT, text=True,
+                            env={**os.environ, 'PRUEBAS_TIEMPOS_JSON': tiempos_path})
 
-print(f'Reportes generados: {html_path} y {txt_path}')
+print(f'Reportes generados: {html_path}, {txt_path} y {tiempos_path}')
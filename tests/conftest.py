@@ -4,12 +4,22 @@ Configuración y fixtures compartidas para pytest
 import pytest
 import os
 import uuid
+import hashlib
+import json
+import re
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from fastapi.testclient import TestClient
-from backend.database import get_db
+from backend.database import SessionLocal, get_db
 from backend.models import Base
 from backend.main import app
+from backend import acceso, alertas, biometria, consultas, espacial, layout, recientes, telemetria
+from create_database import MESES_PARTICION, crear_indices, crear_tablas
 
 # Configuración de base de datos de prueba
 TEST_DB_CONFIG = {
@@ -20,22 +30,192 @@ TEST_DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD', 'hello!')
 }
 
-TEST_DATABASE_URL = (
-    f"postgresql://{TEST_DB_CONFIG['user']}:{TEST_DB_CONFIG['password']}"
-    f"@{TEST_DB_CONFIG['host']}:{TEST_DB_CONFIG['port']}/{TEST_DB_CONFIG['database']}"
-)
+# Base indicada en DB_NAME: la de los workers de pytest-xdist y las plantillas se nombran a partir de ella
+BASE_COMPARTIDA = TEST_DB_CONFIG['database']
 
 
-@pytest.fixture(scope="function")
-def db_session():
-    """Fixture para crear una sesión de base de datos de prueba"""
+def _url(config):
+    return (f"postgresql://{config['user']}:{config['password']}"
+            f"@{config['host']}:{config['port']}/{config['database']}")
+
+
+TEST_DATABASE_URL = _url(TEST_DB_CONFIG)
+
+# Índices en memoria que se actualizan al confirmar (invalidacion.suscribir). Los commit() de las pruebas
+# solo liberan un SAVEPOINT: al revertir la transacción externa se quedarían con filas que ya no existen
+INDICES_EN_MEMORIA = [(acceso, "indice"), (alertas, "motor"), (biometria, "motor"), (espacial, "indice"),
+                      (layout, "indices"), (recientes, "recientes"), (telemetria, "estructuras")]
+
+# SAVEPOINT de la transacción de cada prueba (join_transaction_mode="create_savepoint"): no son consultas del código
+_SAVEPOINT = re.compile(r"^\s*(?:RELEASE |ROLLBACK TO )?SAVEPOINT\b", re.I)
+
+
+def reiniciar_indices():
+    """Reemplaza cada índice en memoria por uno vacío, que se vuelve a cargar desde la base al usarse"""
+    for modulo, nombre in INDICES_EN_MEMORIA:
+        setattr(modulo, nombre, type(getattr(modulo, nombre))())
+    acceso.indice.configurar(SessionLocal)
+
+
+@pytest.fixture(scope="session")
+def engine():
+    """Engine compartido por toda la sesión de pruebas (un solo pool de conexiones)"""
     engine = create_engine(TEST_DATABASE_URL)
-    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(scope="function")
+def db_session(engine):
+    """
+    Sesión dentro de una transacción que se revierte al terminar la prueba
+
+    La sesión se une a la transacción externa con SAVEPOINT
+    (join_transaction_mode="create_savepoint"): los commit() y rollback() de
+    la prueba y de los handlers solo liberan o revierten un SAVEPOINT, así
+    que las filas creadas se ven durante la prueba y no quedan en la base.
+    Lo que se ejecute por otras conexiones (hilos de fondo, otro engine) no
+    ve esas filas. Al terminar se reinician los índices en memoria, que
+    recibieron esos commit() como cambios confirmados.
+    """
+    conexion = engine.connect()
+    transaccion = conexion.begin()
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=conexion,
+                                       join_transaction_mode="create_savepoint")
     session = TestingSessionLocal()
     try:
         yield session
     finally:
         session.close()
+        transaccion.rollback()
+        conexion.close()
+        reiniciar_indices()
+
+
+def _conexion_admin():
+    conn = psycopg2.connect(**{**TEST_DB_CONFIG, "database": BASE_COMPARTIDA})
+    conn.autocommit = True
+    return conn
+
+
+def construir_plantilla() -> str:
+    """
+    Base con el esquema de JSON.json recién creado, para clonar con CREATE DATABASE ... TEMPLATE
+
+    Se construye una vez y se reutiliza entre ejecuciones mientras no cambien
+    JSON.json ni el mes (las particiones dependen de la fecha): el nombre
+    lleva un hash de ambos y las plantillas viejas se borran al crear otra.
+    """
+    with open("JSON.json", "rb") as f:
+        huella = hashlib.sha1(f.read() + f"{date.today():%Y-%m}/{MESES_PARTICION}".encode()).hexdigest()[:10]
+    prefijo = f"{BASE_COMPARTIDA}_plantilla_"
+    nombre = prefijo + huella
+    conn = _conexion_admin()
+    cursor = conn.cursor()
+    try:
+        # Varios procesos de prueba a la vez (pytest-xdist): solo uno construye la plantilla
+        cursor.execute("SELECT pg_advisory_lock(hashtext(%s))", (prefijo,))
+        cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (nombre,))
+        if cursor.fetchone() is None:
+            cursor.execute("SELECT datname FROM pg_database WHERE datname LIKE %s", (prefijo + "%",))
+            for (vieja,) in cursor.fetchall():
+                cursor.execute(f'DROP DATABASE IF EXISTS "{vieja}" WITH (FORCE)')
+            temporal = f"{nombre}_construyendo"
+            cursor.execute(f'CREATE DATABASE "{temporal}"')
+            with open("JSON.json", "r", encoding="utf-8") as f:
+                clases = json.load(f)["classes"]
+            pool = ThreadedConnectionPool(1, 4, **{**TEST_DB_CONFIG, "database": temporal})
+            try:
+                crear_tablas(pool, clases)
+                crear_indices(pool, clases)
+            finally:
+                pool.closeall()
+            cursor.execute(f'ALTER DATABASE "{temporal}" RENAME TO "{nombre}"')
+        cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", (prefijo,))
+    finally:
+        cursor.close()
+        conn.close()
+    return nombre
+
+
+def clonar_base(nombre: str, plantilla: str):
+    conn = _conexion_admin()
+    try:
+        conn.cursor().execute(f'DROP DATABASE IF EXISTS "{nombre}" WITH (FORCE)')
+        conn.cursor().execute(f'CREATE DATABASE "{nombre}" TEMPLATE "{plantilla}"')
+    finally:
+        conn.close()
+
+
+def borrar_base(nombre: str):
+    conn = _conexion_admin()
+    try:
+        conn.cursor().execute(f'DROP DATABASE IF EXISTS "{nombre}" WITH (FORCE)')
+    finally:
+        conn.close()
+
+
+def pytest_configure(config):
+    """
+    Con pytest-xdist (`pytest -n 4`) cada worker usa su propia base, clonada
+    de la plantilla: TEST_DB_CONFIG y TEST_DATABASE_URL apuntan a
+    <DB_NAME>_<worker> antes de importar los módulos de prueba.
+    """
+    global TEST_DATABASE_URL
+    worker = os.getenv("PYTEST_XDIST_WORKER")
+    if worker:
+        TEST_DB_CONFIG["database"] = f"{BASE_COMPARTIDA}_{worker}"
+        clonar_base(TEST_DB_CONFIG["database"], construir_plantilla())
+        TEST_DATABASE_URL = _url(TEST_DB_CONFIG)
+
+
+def pytest_unconfigure(config):
+    if os.getenv("PYTEST_XDIST_WORKER") and TEST_DB_CONFIG["database"] != BASE_COMPARTIDA:
+        borrar_base(TEST_DB_CONFIG["database"])
+
+
+# Tiempo total (setup + prueba + teardown) y worker de cada prueba, para el resumen de las más lentas
+PRUEBAS_MAS_LENTAS = int(os.getenv("PRUEBAS_MAS_LENTAS", "15"))
+_tiempos = {}
+
+
+def pytest_runtest_logreport(report):
+    """Con xdist llegan al proceso principal los reportes de todos los workers (report.node)"""
+    if os.getenv("PYTEST_XDIST_WORKER"):
+        return
+    gateway = getattr(getattr(report, "node", None), "gateway", None)
+    total, worker = _tiempos.get(report.nodeid, (0.0, gateway.id if gateway else "-"))
+    _tiempos[report.nodeid] = (total + report.duration, worker)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _tiempos or PRUEBAS_MAS_LENTAS <= 0:
+        return
+    lentas = sorted(_tiempos.items(), key=lambda item: item[1][0], reverse=True)
+    terminalreporter.write_sep("=", f"{min(PRUEBAS_MAS_LENTAS, len(lentas))} pruebas más lentas")
+    for nodeid, (segundos, worker) in lentas[:PRUEBAS_MAS_LENTAS]:
+        terminalreporter.write_line(f"{segundos:8.2f}s  {worker:<5} {nodeid}")
+    ruta = os.getenv("PRUEBAS_TIEMPOS_JSON")
+    if ruta:
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump([{"prueba": nodeid, "segundos": round(segundos, 4), "worker": worker}
+                       for nodeid, (segundos, worker) in lentas], f, indent=2, ensure_ascii=False)
+
+
+@pytest.fixture(scope="session")
+def plantilla():
+    return construir_plantilla()
+
+
+@pytest.fixture(scope="function")
+def base_limpia(plantilla):
+    """Configuración (como TEST_DB_CONFIG) de una base nueva clonada de la plantilla; se borra al terminar"""
+    nombre = f"{BASE_COMPARTIDA}_prueba_{uuid.uuid4().hex[:8]}"
+    clonar_base(nombre, plantilla)
+    try:
+        yield {**TEST_DB_CONFIG, "database": nombre}
+    finally:
+        borrar_base(nombre)
 
 
 @pytest.fixture(scope="function")
@@ -53,6 +233,28 @@ def client(db_session):
     app.dependency_overrides.clear()
 
 
+@pytest.fixture
+def assert_max_queries():
+    """Falla si el bloque ejecuta más de `n` sentencias SQL (en el hilo de la prueba o en las peticiones)
+
+    No cuenta los SAVEPOINT con los que db_session aísla los commit() de la prueba.
+
+    Uso:
+        with assert_max_queries(2):
+            client.get("/api/sedes?expand=empresa")
+    """
+    @contextmanager
+    def verificar(n):
+        with consultas.observar() as registro:
+            yield registro
+        sentencias = [s for s in registro.sentencias if not _SAVEPOINT.match(s)]
+        if len(sentencias) > n:
+            formas = Counter(consultas.forma(s) for s in sentencias)
+            detalle = "\n".join(f"  {veces}x {forma}" for forma, veces in formas.most_common())
+            pytest.fail(f"Se esperaban como máximo {n} consultas y se ejecutaron {len(sentencias)}:\n{detalle}")
+    return verificar
+
+
 @pytest.fixture(scope="function")
 def sample_empresa_data():
     """Datos de ejemplo para una empresa con valores únicos"""
@@ -5,7 +5,11 @@ Respeta dependencias entre entidades.
 """
 import pytest
 import time
+import socket
+import subprocess
 import sys
+import urllib.parse
+import urllib.request
 import uuid
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -15,6 +19,7 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from webdriver_manager.chrome import ChromeDriverManager
 import os
+from tests.conftest import TEST_DB_CONFIG
 
 # Tiempos de espera optimizados para velocidad pero manteniendo visualización
 VISUAL_DELAY = 0.2  # Reducido de 2.0 a 0.5
@@ -92,13 +97,53 @@ def driver():
     print_step("Cerrando navegador")
     driver.quit()
 
+def free_port():
+    """Puerto TCP libre en localhost"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture(scope="module")
+def api_url():
+    """
+    URL de la API. Con pytest-xdist cada worker levanta su propio uvicorn
+    sobre su base (TEST_DB_CONFIG apunta a ella), así el flujo no comparte
+    datos con otros workers; sin xdist se usa API_URL (localhost:8000).
+    """
+    if not os.getenv("PYTEST_XDIST_WORKER"):
+        yield os.getenv("API_URL", "http://localhost:8000")
+        return
+    port = free_port()
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "DB_HOST": TEST_DB_CONFIG["host"], "DB_PORT": str(TEST_DB_CONFIG["port"]),
+           "DB_NAME": TEST_DB_CONFIG["database"], "DB_USER": TEST_DB_CONFIG["user"],
+           "DB_PASSWORD": TEST_DB_CONFIG["password"]}
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port)],
+                              cwd=project_root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    print_step(f"API del worker {os.getenv('PYTEST_XDIST_WORKER')} en {url} (base {TEST_DB_CONFIG['database']})")
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                with urllib.request.urlopen(f"{url}/api/empresas?limit=1", timeout=1):
+                    break
+            except OSError:
+                if server.poll() is not None or time.time() > deadline:
+                    pytest.fail(f"No arrancó la API de prueba en {url}")
+                time.sleep(0.2)
+        yield url
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
 @pytest.fixture(scope="function")
-def frontend_url():
-    """URL del frontend"""
+def frontend_url(api_url):
+    """URL del frontend, apuntando a la API de la prueba"""
     current_dir = os.path.dirname(os.path.abspath(__file__))
     project_root = os.path.dirname(current_dir)
     html_path = os.path.join(project_root, "frontend", "index.html")
-    return f"file://{html_path}"
+    return f"file://{html_path}?api={urllib.parse.quote(api_url + '/api', safe='')}"
 
 @pytest.mark.integration
 class TestIntegrationFlow:
@@ -269,7 +314,7 @@ class TestIntegrationFlow:
         fill_number_field(driver, "persona_id", self.ids['persona'])
         fill_number_field(driver, "empresa_id", self.ids['empresa'])
         fill_text_field(driver, "username", f"user_{self.unique_suffix}")
-        fill_text_field(driver, "password_hash", "123456")
+        fill_text_field(driver, "password", "123456")
         self.save_form(driver)
         self.ids['usuario'] = self._get_first_row_id(driver)
         safe_print("  [+] Usuario creado")
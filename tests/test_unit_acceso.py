@@ -0,0 +1,146 @@
+"""
+Pruebas unitarias para las decisiones de acceso a espacios
+"""
+import time
+import uuid
+import pytest
+from sqlalchemy.orm import sessionmaker
+from backend import acceso, models, tokens
+from backend.acceso import EscritorAccesos, IndiceAutorizacion, MedidorLatencia, _Snapshot
+
+
+@pytest.fixture
+def indice():
+    indice = IndiceAutorizacion()
+    # espacio -> (sede, empresa); usuario -> (empresa con rol, sedes como responsable)
+    indice._snapshot = _Snapshot(
+        usuarios={1: (10, frozenset()), 2: (None, frozenset({200})), 3: (None, frozenset())},
+        espacios={100: (100, 10), 201: (200, 20)},
+    )
+    return indice
+
+
+class TestIndiceAutorizacion:
+    def test_usuario_con_rol_en_empresa(self, indice):
+        decision = indice.decidir(1, 100)
+        print(f"Decisión: {decision}")
+        assert decision.permitido
+
+    def test_usuario_con_rol_otra_empresa(self, indice):
+        assert not indice.decidir(1, 201).permitido
+
+    def test_responsable_de_sede(self, indice):
+        assert indice.decidir(2, 201).permitido
+        assert not indice.decidir(2, 100).permitido
+
+    def test_usuario_sin_roles(self, indice):
+        assert not indice.decidir(3, 100).permitido
+
+    def test_espacio_o_usuario_inexistente(self, indice):
+        assert indice.decidir(1, 999).motivo == "Espacio no encontrado"
+        assert indice.decidir(999, 100).motivo == "Usuario no encontrado"
+
+
+class TestMedidorLatencia:
+    def test_percentiles(self):
+        medidor = MedidorLatencia(capacidad=100)
+        for i in range(1, 101):
+            medidor.registrar(i / 1e6)
+        percentiles = medidor.percentiles()
+        assert medidor.total == 100
+        assert percentiles["p50_us"] == pytest.approx(50.5)
+        assert percentiles["p99_us"] == pytest.approx(99.01)
+
+    def test_sin_muestras(self):
+        assert MedidorLatencia().percentiles() == {"p50_us": 0.0, "p99_us": 0.0}
+
+
+class TestRecarga:
+    def test_indice_vencido_se_reconstruye(self, indice, monkeypatch):
+        print("Probando la recarga periódica del índice de autorización")
+        monkeypatch.setattr(acceso, "RECARGA_SEGUNDOS", 10)
+        reconstrucciones = []
+        monkeypatch.setattr(indice, "invalidar", lambda: reconstrucciones.append(1))
+        indice._cargado_en = time.monotonic()
+        indice.decidir(1, 100)
+        assert not reconstrucciones
+        indice._cargado_en = time.monotonic() - 11
+        assert indice.decidir(1, 100).permitido  # responde con la versión anterior mientras recarga
+        assert reconstrucciones
+
+
+@pytest.fixture
+def usuario_y_espacio(db_session):
+    empresa = models.Empresa(nombre="Accesos")
+    persona = models.Persona(nombre="Ana", apellido="Accesos", documento=f"ACC{uuid.uuid4().hex[:8]}")
+    usuario = models.Usuario(persona=persona, empresa=empresa, username=f"acc_{uuid.uuid4().hex[:8]}",
+                             password_hash="-")
+    sede = models.Sede(empresa=empresa, nombre="Sede")
+    espacio = models.Espacio(bloque=models.Bloque(sede=sede, nombre="Bloque"),
+                             tipo_espacio=models.TipoEspacio(nombre="Invernadero"), nombre="Espacio")
+    db_session.add_all([usuario, espacio])
+    db_session.flush()
+    return usuario.id, espacio.id
+
+
+class TestConstruir:
+    def test_ignora_personas_y_empresas_inactivas(self, db_session, usuario_y_espacio):
+        print("Probando que una persona desactivada pierde el acceso aunque conserve su token")
+        usuario_id, _ = usuario_y_espacio
+        assert usuario_id in IndiceAutorizacion.construir(db_session).usuarios
+        usuario = db_session.get(models.Usuario, usuario_id)
+        usuario.persona.activo = False
+        db_session.flush()
+        assert usuario_id not in IndiceAutorizacion.construir(db_session).usuarios
+        usuario.persona.activo, usuario.empresa.activo = True, False
+        db_session.flush()
+        assert usuario_id not in IndiceAutorizacion.construir(db_session).usuarios
+
+
+class TestEscritorAccesos:
+    def test_fila_invalida_no_bloquea_el_lote(self, db_session, usuario_y_espacio):
+        print("Probando que un acceso con FK inválida se descarta sin perder el resto del lote")
+        usuario_id, espacio_id = usuario_y_espacio
+        fabrica = sessionmaker(bind=db_session.get_bind(), join_transaction_mode="create_savepoint")
+        escritor = EscritorAccesos(fabrica, intervalo=0)
+        for espacio in (espacio_id, 2_000_000_000, espacio_id):
+            escritor.registrar(usuario_id, espacio, "tarjeta")
+        escritor.detener()
+        assert escritor.pendientes() == 0 and escritor.descartados == 1
+        assert db_session.query(models.AccesoEspacio).filter_by(usuario_id=usuario_id).count() == 2
+
+    def test_reintentos_limitados(self):
+        class SinBase:
+            def __call__(self):
+                raise ConnectionError("sin base")
+
+        escritor = EscritorAccesos(SinBase(), intervalo=0, max_reintentos=2)
+        escritor._cola.put({"usuario_id": 1})
+        escritor.vaciar()
+        assert escritor.pendientes() == 0 and escritor.descartados == 1
+
+    def test_cola_acotada(self, monkeypatch):
+        escritor = EscritorAccesos(max_pendientes=1)
+        monkeypatch.setattr(escritor, "iniciar", lambda: None)
+        escritor.registrar(1, 1, None)
+        escritor.registrar(1, 2, None)
+        assert escritor.pendientes() == 1 and escritor.descartados == 1
+
+
+class TestEndpointAcceso:
+    def test_requiere_token(self, client, usuario_y_espacio):
+        usuario_id, espacio_id = usuario_y_espacio
+        respuesta = client.post(f"/api/espacios/{espacio_id}/acceso", json={"usuario_id": usuario_id})
+        assert respuesta.status_code == 401
+        assert client.get("/api/acceso/estadisticas").status_code == 401
+        token = tokens.firmador.emitir(usuario_id, 0, [])
+        assert client.get("/api/acceso/estadisticas",
+                          headers={"Authorization": f"Bearer {token}"}).status_code == 200
+
+    def test_usuario_del_token(self, client, usuario_y_espacio):
+        usuario_id, espacio_id = usuario_y_espacio
+        token = tokens.firmador.emitir(usuario_id, 0, [])
+        respuesta = client.post(f"/api/espacios/{espacio_id}/acceso", json={"metodo_acceso": "tarjeta"},
+                                headers={"Authorization": f"Bearer {token}"})
+        assert respuesta.status_code == 200
+        assert respuesta.json()["usuario_id"] == usuario_id
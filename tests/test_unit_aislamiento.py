@@ -0,0 +1,47 @@
+"""
+Pruebas unitarias para el aislamiento de la base en las fixtures (conftest.py)
+"""
+import uuid
+import psycopg2
+from sqlalchemy import text
+from backend import models
+
+
+class TestTransaccionPorPrueba:
+    def test_commit_no_llega_a_la_base(self, db_session, engine):
+        print("Probando que un commit dentro de la prueba solo libera un SAVEPOINT")
+        nit = f"AISLADA{uuid.uuid4().hex[:8]}"
+        db_session.add(models.Empresa(nombre="Aislada", nit=nit))
+        db_session.commit()
+        assert db_session.query(models.Empresa).filter_by(nit=nit).count() == 1
+        with engine.connect() as otra:
+            assert otra.execute(text("SELECT count(*) FROM empresa WHERE nit = :nit"), {"nit": nit}).scalar() == 0
+
+    def test_rollback_conserva_lo_confirmado(self, db_session):
+        confirmada, revertida = f"OK{uuid.uuid4().hex[:8]}", f"NO{uuid.uuid4().hex[:8]}"
+        db_session.add(models.Empresa(nombre="Confirmada", nit=confirmada))
+        db_session.commit()
+        db_session.add(models.Empresa(nombre="Revertida", nit=revertida))
+        db_session.flush()
+        db_session.rollback()
+        nits = {e.nit for e in db_session.query(models.Empresa).filter(models.Empresa.nit.in_([confirmada, revertida]))}
+        assert nits == {confirmada}
+
+    def test_handler_confirma_dentro_de_la_prueba(self, client, db_session, sample_empresa_data):
+        response = client.post("/api/empresas", json=sample_empresa_data)
+        assert response.status_code == 200
+        assert client.get(f"/api/empresas/{response.json()['id']}").status_code == 200
+
+
+class TestBaseLimpia:
+    def test_esquema_completo_y_vacio(self, base_limpia):
+        print(f"Probando la base clonada {base_limpia['database']}")
+        conn = psycopg2.connect(**base_limpia)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT count(*) FROM empresa")
+            assert cursor.fetchone()[0] == 0
+            cursor.execute("SELECT to_regclass('idx_lectura_sensor_estructura_metrica_fecha') IS NOT NULL")
+            assert cursor.fetchone()[0]
+        finally:
+            conn.close()
@@ -0,0 +1,119 @@
+"""
+Pruebas unitarias para el motor de umbrales de lecturas
+"""
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from backend import alertas, invalidacion, models, schemas
+from backend.alertas import ALTO, BAJO, NORMAL, MotorUmbrales, Regla, fase_actual, metrica_de
+
+
+def lectura(valor, estructura_id=1, metrica="ec"):
+    return schemas.LecturaSensorCreate(estructura_id=estructura_id, metrica=metrica, valor=valor,
+                                       fecha=datetime(2026, 10, 19, 12, 0))
+
+
+def motor_con_ec(objetivo=2.0):
+    motor = MotorUmbrales(tolerancia=0.10, histeresis=0.5, consecutivas=3)
+    motor.instalar({1: [Regla("ec", cultivo_fase_id=10, nutriente_id=5, objetivo=objetivo)]})
+    return motor
+
+
+class TestMetrica:
+    def test_usa_formula_normalizada(self):
+        assert metrica_de(SimpleNamespace(formula_quimica="NO3-", nombre="Nitrato")) == "no3"
+
+    def test_sin_formula_usa_nombre(self):
+        assert metrica_de(SimpleNamespace(formula_quimica=None, nombre="Conductividad eléctrica")) == "conductividad_electrica"
+
+
+class TestFaseActual:
+    fases = [(1, 10), (2, 20), (3, 30)]
+    inicio = datetime(2026, 10, 1)
+
+    def test_fase_por_dias_transcurridos(self):
+        assert fase_actual(self.fases, self.inicio, self.inicio + timedelta(days=15)) == (2, self.inicio + timedelta(days=30))
+
+    def test_despues_de_la_ultima(self):
+        assert fase_actual(self.fases, self.inicio, self.inicio + timedelta(days=90)) == (3, None)
+
+    def test_sin_fases(self):
+        assert fase_actual([], self.inicio, self.inicio) == (None, None)
+
+
+class TestMotorUmbrales:
+    def test_lecturas_en_rango_no_generan_alertas(self):
+        motor = motor_con_ec()
+        assert motor.evaluar([lectura(2.0 + 0.01 * i) for i in range(10)]) == []
+
+    def test_antirrebote(self):
+        print("Probando que se exigen 3 lecturas seguidas fuera de rango")
+        motor = motor_con_ec()
+        assert motor.evaluar([lectura(1.5), lectura(1.5), lectura(2.0), lectura(1.5), lectura(1.5)]) == []
+        transiciones = motor.evaluar([lectura(1.5)])
+        assert [(t.anterior, t.nuevo, t.regla.objetivo) for t in transiciones] == [(NORMAL, BAJO, 2.0)]
+
+    def test_histeresis(self):
+        motor = motor_con_ec()
+        motor.evaluar([lectura(2.5)] * 3)
+        # 1.85 está dentro de la banda de ±10% pero fuera de la de ±5%: la alerta sigue abierta
+        assert motor.evaluar([lectura(1.85)] * 5) == []
+        transiciones = motor.evaluar([lectura(2.01)] * 3)
+        assert [(t.anterior, t.nuevo) for t in transiciones] == [(ALTO, NORMAL)]
+
+    def test_metricas_sin_regla_se_ignoran(self):
+        motor = motor_con_ec()
+        assert motor.evaluar([lectura(100.0, metrica="ph"), lectura(100.0, estructura_id=2)] * 5) == []
+
+    def test_reinstalar_conserva_estado_de_otras_estructuras(self):
+        motor = motor_con_ec()
+        motor.evaluar([lectura(1.0)] * 3)
+        motor.instalar({2: [Regla("ph", 11, 6, 6.0)]})
+        assert motor.evaluar([lectura(1.0)] * 3) == []
+        assert [t.nuevo for t in motor.evaluar([lectura(2.0)] * 3)] == [NORMAL]
+
+    def test_cambio_de_fase_nutriente_marca_solo_las_afectadas(self):
+        motor = motor_con_ec()
+        motor._cargado = True
+        motor._variedad_de.update({1: 100, 2: 200})
+        motor._variedad_de_fase.update({10: 100, 20: 200})
+        motor.aplicar(invalidacion.Cambio(models.FaseNutriente, 7, False, {"cultivo_fase_id": 20}))
+        assert motor._sucias == {2}
+
+
+class TestRecarga:
+    def test_recompila_todo_al_vencer(self, monkeypatch):
+        motor = motor_con_ec()
+        llamadas = []
+        monkeypatch.setattr(motor, "compilar", lambda db_session, ids, ahora: llamadas.append(ids))
+        motor._cargado, motor._cargado_en = True, time.monotonic()
+        motor.asegurar_compilado(None)
+        assert llamadas == []
+        monkeypatch.setattr(alertas, "RECARGA_SEGUNDOS", 1)
+        motor._cargado_en -= 5
+        motor.asegurar_compilado(None)
+        assert llamadas == [None]
+
+
+class TestAlertasHuerfanas:
+    def test_se_cierran_al_procesar_no_al_compilar(self, db_session):
+        print("Probando que compilar no escribe y el siguiente lote cierra las alertas sin objetivo")
+        empresa = models.Empresa(nombre="Alertas")
+        espacio = models.Espacio(bloque=models.Bloque(sede=models.Sede(empresa=empresa, nombre="Sede"),
+                                                      nombre="Bloque"),
+                                 tipo_espacio=models.TipoEspacio(nombre="Invernadero"), nombre="Espacio")
+        estructura = models.Estructura(espacio=espacio, tipo_estructura=models.TipoEstructura(nombre="NFT"),
+                                       nombre="Canal")
+        alerta = models.AlertaSensor(estructura=estructura, metrica="ec", tipo="alto", valor=3.0,
+                                     fecha_inicio=datetime(2026, 10, 19))
+        db_session.add(alerta)
+        db_session.commit()
+
+        motor = MotorUmbrales()
+        motor.asegurar_compilado(db_session)
+        assert motor.umbrales(estructura.id) == []
+        assert not db_session.dirty and alerta.fecha_fin is None
+        assert motor.procesar(db_session, []) == 0
+        db_session.refresh(alerta)
+        assert alerta.fecha_fin is not None
+        assert motor.cerrar_huerfanas(db_session) == 0
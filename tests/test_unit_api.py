@@ -13,6 +13,7 @@ Incluye asserts y logs para reporte HTML.
 # Se usan fixtures de pytest para inyectar el cliente y datos de ejemplo.
 import pytest
 from fastapi import status
+from backend import models, respuestas, tokens
 
 
 @pytest.mark.unit
@@ -145,6 +146,44 @@ class TestPersonaAPI:
         assert isinstance(data, list)
         assert len(data) > 0
 
+    def test_get_personas_por_ids(self, client, sample_persona_data):
+        print("Probando resolver varios ids en una sola petición")
+        ids = []
+        for i in range(3):
+            datos = dict(sample_persona_data, documento=f"{sample_persona_data['documento']}{i}",
+                         email=f"{i}.{sample_persona_data['email']}")
+            ids.append(client.post("/api/personas", json=datos).json()["id"])
+        pedidos = [ids[2], 99999999, ids[0], ids[2], ids[1]]
+        response = client.get("/api/personas", params={"ids": ",".join(map(str, pedidos))})
+        assert response.status_code == status.HTTP_200_OK
+        assert [p["id"] for p in response.json()] == [ids[2], ids[0], ids[1]]
+        assert response.headers["x-ids-faltantes"] == "99999999"
+        response = client.post("/api/personas/por-ids", json={"ids": pedidos})
+        assert [p["id"] for p in response.json()] == [ids[2], ids[0], ids[1]]
+
+    def test_get_personas_consultas(self, client, assert_max_queries, sample_persona_data):
+        persona_id = client.post("/api/personas", json=sample_persona_data).json()["id"]
+        with assert_max_queries(1):
+            assert client.get("/api/personas", params={"limit": 500}).status_code == status.HTTP_200_OK
+        with assert_max_queries(1):
+            assert client.get(f"/api/personas/{persona_id}").status_code == status.HTTP_200_OK
+
+    def test_get_personas_ids_invalidos(self, client):
+        response = client.get("/api/personas", params={"ids": "1,a"})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        for fuera_de_rango in (2 ** 31, -2 ** 31 - 1):
+            response = client.get("/api/personas", params={"ids": f"1,{fuera_de_rango}"})
+            assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+            response = client.post("/api/personas/por-ids", json={"ids": [1, fuera_de_rango]})
+            assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_get_personas_faltantes_acotados(self, client):
+        pedidos = list(range(2_000_000_000, 2_000_000_000 + respuestas.MAX_FALTANTES + 50))
+        response = client.post("/api/personas/por-ids", json={"ids": pedidos})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["x-ids-faltantes"].split(",") == [str(i) for i in pedidos[:respuestas.MAX_FALTANTES]]
+        assert response.headers["x-ids-faltantes-total"] == str(len(pedidos))
+
 
 @pytest.mark.unit
 class TestTipoCultivoAPI:
@@ -197,6 +236,53 @@ class TestNutrienteAPI:
         assert len(data) > 0
 
 
+@pytest.fixture
+def usuario_login(client, sample_empresa_data, sample_persona_data):
+    empresa = client.post("/api/empresas", json=sample_empresa_data).json()
+    persona = client.post("/api/personas", json=sample_persona_data).json()
+    datos = {"persona_id": persona["id"], "empresa_id": empresa["id"],
+             "username": f"login_{sample_persona_data['documento']}", "password": "clave-segura"}
+    usuario = client.post("/api/usuarios", json=datos).json()
+    return {**datos, "id": usuario["id"]}
+
+
+@pytest.mark.unit
+class TestAutenticacionAPI:
+    """Pruebas para login y refresh"""
+
+    def test_usuario_no_expone_hash(self, client, usuario_login):
+        print("Probando que los listados de usuarios no devuelven el hash de la contraseña")
+        assert "password_hash" not in client.get(f"/api/usuarios/{usuario_login['id']}").json()
+        listado = client.get(f"/api/usuarios?ids={usuario_login['id']}").json()
+        assert listado and all("password_hash" not in fila and "password" not in fila for fila in listado)
+
+    def test_login(self, client, db_session, usuario_login):
+        print("Probando login con contraseña en claro")
+        guardado = db_session.get(models.Usuario, usuario_login["id"]).password_hash
+        response = client.post("/api/auth/login", json={"username": usuario_login["username"],
+                                                        "password": "clave-segura"})
+        assert response.status_code == status.HTTP_200_OK
+        token = response.json()["access_token"]
+        assert client.get("/api/auth/me", headers={"Authorization": f"Bearer {token}"}).json()["usuario_id"] \
+            == usuario_login["id"]
+        # El hash guardado no sirve como contraseña
+        response = client.post("/api/auth/login", json={"username": usuario_login["username"], "password": guardado})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_login_empresa_inactiva(self, client, usuario_login):
+        credenciales = {"username": usuario_login["username"], "password": "clave-segura"}
+        token = client.post("/api/auth/login", json=credenciales).json()["access_token"]
+        client.put(f"/api/empresas/{usuario_login['empresa_id']}", json={"activo": False})
+        assert client.post("/api/auth/login", json=credenciales).status_code == status.HTTP_401_UNAUTHORIZED
+        response = client.post("/api/auth/refresh", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_token_no_ascii(self, client):
+        token = f"Bearer {tokens.firmador.clave_activa}.ñ.x"
+        response = client.get("/api/auth/me", headers={"Authorization": token.encode("utf-8")})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
 @pytest.mark.unit
 class TestRootEndpoint:
     """Pruebas para el endpoint raíz"""
@@ -0,0 +1,103 @@
+"""
+Pruebas unitarias para los reportes de benchmarks y el generador de carga
+"""
+import asyncio
+import json
+import httpx
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from tests.conftest import TEST_DATABASE_URL
+from backend.database import get_db
+from backend.main import app
+from benchmarks import reporte
+from benchmarks.carga import Carga, leer_mezcla
+from run_benchmarks import desde_pytest_benchmark
+
+
+def medida(p95_ms, por_segundo, errores=0):
+    return {"n": 100, "errores": errores, "por_segundo": por_segundo, "media_ms": p95_ms / 2, "p50_ms": p95_ms / 2,
+            "p95_ms": p95_ms, "p99_ms": p95_ms * 1.5}
+
+
+class TestReporte:
+    def test_resumir(self):
+        resumen = reporte.resumir(list(range(1, 101)), 2.0, errores=3)
+        assert resumen["n"] == 100 and resumen["errores"] == 3
+        assert resumen["por_segundo"] == 50.0
+        assert resumen["p50_ms"] == 50.5 and resumen["p99_ms"] == pytest.approx(99.01)
+        assert reporte.resumir([], 1.0)["n"] == 0
+
+    def test_comparar(self):
+        base = reporte.resultado("micro", {"a": medida(10, 100), "b": medida(10, 100), "c": medida(0.01, 100)})
+        actual = reporte.resultado("micro", {"a": medida(11, 95), "b": medida(13, 80, errores=2),
+                                             "c": medida(0.03, 100), "nuevo": medida(1, 1)})
+        regresiones = reporte.comparar(actual, base, tolerancia=0.15)
+        print(regresiones)
+        assert regresiones == [("b", "p95 10.000 -> 13.000 ms"), ("b", "100.0 -> 80.0 por segundo"),
+                               ("b", "errores 0 -> 2")]
+
+    def test_guardar_y_linea_base(self, tmp_path):
+        actual = reporte.resultado("carga", {"empresas:listar": medida(5, 200)}, {"concurrencia": 4})
+        rutas = reporte.guardar(actual, None, [("empresas:listar", "p95 1 -> 2 ms")], carpeta=str(tmp_path))
+        with open(rutas[0], encoding="utf-8") as f:
+            assert json.load(f)["regresiones"] == [{"caso": "empresas:listar", "mensaje": "p95 1 -> 2 ms"}]
+        with open(rutas[1], encoding="utf-8") as f:
+            pagina = f.read()
+        # El caso lleva ":" en el nombre y aun así se marca en la tabla
+        assert '<tr style="color: #d00"><td>empresas:listar</td>' in pagina
+        assert "<li>empresas:listar: p95 1 -&gt; 2 ms</li>" in pagina
+        assert reporte.cargar_linea_base("carga", str(tmp_path)) is None
+        reporte.guardar_linea_base(actual, str(tmp_path))
+        assert reporte.cargar_linea_base("carga", str(tmp_path))["casos"] == actual["casos"]
+
+    def test_desde_pytest_benchmark(self):
+        datos = {"benchmarks": [{"fullname": "benchmarks/test_micro.py::TestCalculo::test_geohash",
+                                 "stats": {"data": [0.001, 0.002, 0.003], "total": 0.006, "median": 0.002}}]}
+        caso = desde_pytest_benchmark(datos)["TestCalculo::test_geohash"]
+        assert caso["n"] == 3 and caso["p50_ms"] == 2.0 and caso["por_segundo"] == 500.0
+
+
+class TestCarga:
+    def test_leer_mezcla(self):
+        assert leer_mezcla("empresas:listar=3, lecturas:lote") == {"empresas:listar": 3.0, "lecturas:lote": 1.0}
+        with pytest.raises(ValueError):
+            leer_mezcla("sedes:crear=1")
+        with pytest.raises(ValueError):
+            leer_mezcla("empresas:borrar=1")
+
+    def test_carga_en_proceso(self):
+        print("Probando una carga corta de lecturas y escrituras contra la app en proceso")
+        engine = create_engine(TEST_DATABASE_URL)
+        Sesiones = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        def override_get_db():
+            sesion = Sesiones()
+            try:
+                yield sesion
+            finally:
+                sesion.close()
+
+        async def correr():
+            transporte = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(base_url="http://en-proceso", transport=transporte) as cliente:
+                carga = Carga(cliente, leer_mezcla("empresas:listar=2,empresas:crear=1,empresas:actualizar=1"))
+                await carga.preparar()
+                casos = await carga.ejecutar(concurrencia=2, duracion=0.5)
+                await carga.limpiar()
+                return carga, casos
+
+        app.dependency_overrides[get_db] = override_get_db
+        try:
+            carga, casos = asyncio.run(correr())
+        finally:
+            app.dependency_overrides.clear()
+        print(casos["total"])
+        assert set(casos) == {"empresas:listar", "empresas:crear", "empresas:actualizar", "total"}
+        assert casos["total"]["n"] > 0 and casos["total"]["errores"] == 0
+        assert carga.creadas["empresas"]
+        with engine.connect() as conn:
+            restantes = conn.execute(text("SELECT count(*) FROM empresa WHERE nit LIKE :marca"),
+                                     {"marca": f"CARGA-{carga.marca}-%"}).scalar()
+        engine.dispose()
+        assert restantes == 0
@@ -0,0 +1,61 @@
+"""
+Pruebas unitarias para el motor de identificación biométrica
+"""
+import base64
+import numpy as np
+from backend.biometria import IndiceBiometrico, decodificar_plantilla
+
+
+def plantilla(semilla, dimension=16):
+    rng = np.random.default_rng(semilla)
+    return base64.b64encode(rng.integers(1, 256, dimension, dtype=np.uint8).tobytes()).decode()
+
+
+class TestDecodificarPlantilla:
+    def test_plantilla_valida_normalizada(self):
+        vector = decodificar_plantilla(plantilla(1), dimension=16)
+        assert vector.dtype == np.float32
+        assert np.isclose(np.linalg.norm(vector), 1.0)
+
+    def test_plantilla_invalida(self):
+        assert decodificar_plantilla(None, dimension=16) is None
+        assert decodificar_plantilla("no es base64!", dimension=16) is None
+        assert decodificar_plantilla(plantilla(1, dimension=8), dimension=16) is None
+
+
+class TestIndiceBiometrico:
+    def test_identifica_mejor_coincidencia(self):
+        print("Probando identificación 1:N")
+        indice = IndiceBiometrico(dimension=16, capacidad=2)
+        for metodo_id in range(1, 6):
+            indice.insertar(metodo_id, metodo_id * 10, decodificar_plantilla(plantilla(metodo_id), 16))
+        resultado = indice.identificar(decodificar_plantilla(plantilla(3), 16), umbral=0.99)
+        print(f"Resultado: {resultado}")
+        assert resultado.usuario_id == 30
+        assert resultado.metodo_acceso_id == 3
+        assert resultado.candidatos == 5
+        assert resultado.completo
+
+    def test_sin_coincidencia_bajo_umbral(self):
+        indice = IndiceBiometrico(dimension=16)
+        indice.insertar(1, 10, decodificar_plantilla(plantilla(1), 16))
+        consulta = np.zeros(16, dtype=np.float32)
+        consulta[0] = 1.0
+        resultado = indice.identificar(consulta, umbral=0.999)
+        assert resultado.usuario_id is None
+
+    def test_eliminar_mantiene_filas_compactas(self):
+        indice = IndiceBiometrico(dimension=16)
+        for metodo_id in range(1, 4):
+            indice.insertar(metodo_id, metodo_id * 10, decodificar_plantilla(plantilla(metodo_id), 16))
+        indice.eliminar(1)
+        assert len(indice) == 2
+        assert indice.identificar(decodificar_plantilla(plantilla(3), 16), umbral=0.99).usuario_id == 30
+        assert indice.identificar(decodificar_plantilla(plantilla(1), 16), umbral=0.99).metodo_acceso_id != 1
+
+    def test_actualizar_reemplaza_fila(self):
+        indice = IndiceBiometrico(dimension=16)
+        indice.insertar(1, 10, decodificar_plantilla(plantilla(1), 16))
+        indice.insertar(1, 10, decodificar_plantilla(plantilla(2), 16))
+        assert len(indice) == 1
+        assert indice.identificar(decodificar_plantilla(plantilla(2), 16), umbral=0.99).metodo_acceso_id == 1
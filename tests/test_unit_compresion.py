@@ -0,0 +1,82 @@
+"""
+Pruebas unitarias para el middleware de compresión de respuestas
+"""
+import gzip
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+from backend.compresion import CacheComprimidos, Compresion, negociar
+
+GRANDE = '{"id": 1, "nombre": "Canal"}\n' * 200
+
+
+def cliente(minimo=1024):
+    app = FastAPI()
+    cache = CacheComprimidos(max_bytes=1024 * 1024)
+
+    @app.get("/grande")
+    def grande():
+        return PlainTextResponse(GRANDE, media_type="application/json")
+
+    @app.get("/chica")
+    def chica():
+        return PlainTextResponse("{}", media_type="application/json")
+
+    @app.get("/imagen")
+    def imagen():
+        return PlainTextResponse(GRANDE, media_type="image/png")
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse((linea + "\n" for linea in GRANDE.splitlines()), media_type="application/x-ndjson")
+
+    app.add_middleware(Compresion, minimo=minimo, cache=cache)
+    return TestClient(app), cache
+
+
+class TestNegociar:
+    def test_preferencia_del_servidor(self):
+        assert negociar("gzip, br, zstd", ["zstd", "br", "gzip"]) == "zstd"
+        assert negociar("gzip, deflate", ["zstd", "br", "gzip"]) == "gzip"
+
+    def test_pesos_q(self):
+        assert negociar("gzip;q=1.0, br;q=0.5", ["br", "gzip"]) == "gzip"
+        assert negociar("gzip;q=0, *", ["br", "gzip"]) == "br"
+
+    def test_sin_coincidencias(self):
+        assert negociar("identity", ["br", "gzip"]) is None
+        assert negociar("*;q=0", ["gzip"]) is None
+
+
+class TestMiddleware:
+    def test_comprime_y_cachea(self):
+        print("Probando que un cuerpo repetido se comprime una sola vez")
+        client, cache = cliente()
+        for _ in range(3):
+            response = client.get("/grande", headers={"Accept-Encoding": "gzip"})
+            assert response.headers["content-encoding"] == "gzip"
+            assert response.headers["vary"] == "Accept-Encoding"
+            assert int(response.headers["content-length"]) < len(GRANDE) / 10
+            assert response.text == GRANDE
+        assert (len(cache), cache.fallos, cache.aciertos) == (1, 1, 2)
+
+    def test_umbral_y_tipos(self):
+        client, _ = cliente()
+        for ruta in ("/chica", "/imagen"):
+            response = client.get(ruta, headers={"Accept-Encoding": "gzip"})
+            assert "content-encoding" not in response.headers
+
+    def test_sin_accept_encoding(self):
+        client, _ = cliente()
+        response = client.get("/grande", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+        assert response.text == GRANDE
+
+    def test_streaming(self):
+        client, cache = cliente()
+        with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+            assert response.headers["content-encoding"] == "gzip"
+            assert "content-length" not in response.headers
+            crudo = b"".join(response.iter_raw())
+        assert gzip.decompress(crudo).decode() == GRANDE
+        assert len(cache) == 0
@@ -0,0 +1,52 @@
+"""
+Pruebas unitarias para el conteo de consultas SQL y la detección de N+1
+"""
+import logging
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from backend.consultas import ENCABEZADO, MedirConsultas, Registro, forma
+
+
+class TestForma:
+    def test_normaliza_parametros_y_literales(self):
+        assert forma("SELECT *  FROM sede\n WHERE id = %(id_1)s AND nombre = 'O''Higgins' LIMIT 10") == \
+            "SELECT * FROM sede WHERE id = ? AND nombre = ? LIMIT ?"
+
+    def test_listas_in(self):
+        assert forma("SELECT 1 WHERE id IN (%(id_1_1)s, %(id_1_2)s, %(id_1_3)s)") == forma("SELECT 1 WHERE id IN (7)")
+
+
+class TestRegistro:
+    def test_repetidas(self):
+        registro = Registro()
+        for i in range(6):
+            registro.anotar(f"SELECT * FROM bloque WHERE sede_id = {i}", 0.001)
+        registro.anotar("SELECT * FROM sede", 0.001)
+        assert registro.cantidad == 7
+        assert registro.repetidas(5) == [("SELECT * FROM bloque WHERE sede_id = ?", 6)]
+        assert registro.encabezado() == "n=7; ms=7.0; repetidas=1"
+
+
+class TestMedirConsultas:
+    def test_encabezado_y_aviso(self, db_session, caplog):
+        print("Probando la detección de sentencias repetidas en una petición")
+        app = FastAPI()
+
+        @app.get("/bucle")
+        def bucle(veces: int):
+            for i in range(veces):
+                db_session.execute(text("SELECT :x"), {"x": i})
+            return {"ok": True}
+
+        app.add_middleware(MedirConsultas, debug=True, umbral=5)
+        client = TestClient(app)
+        # Abre antes el SAVEPOINT de db_session, que si no se contaría en la primera petición
+        db_session.execute(text("SELECT 1"))
+        with caplog.at_level(logging.WARNING, logger="backend.consultas"):
+            response = client.get("/bucle", params={"veces": 3})
+            assert response.headers[ENCABEZADO].startswith("n=3;")
+            assert not caplog.records
+            response = client.get("/bucle", params={"veces": 6})
+        assert response.headers[ENCABEZADO].endswith("repetidas=1")
+        assert "Posible N+1 en GET /bucle: 6 veces" in caplog.text
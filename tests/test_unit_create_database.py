@@ -0,0 +1,97 @@
+"""
+Pruebas unitarias para create_database.py: orden de creación, DDL en paralelo e índices
+"""
+import json
+import os
+import uuid
+import psycopg2
+import pytest
+from psycopg2.pool import ThreadedConnectionPool
+from create_database import (CicloDependencias, crear_indices, crear_tablas, definir_indices, orden_tablas,
+                             sentencia_indice)
+from tests.conftest import TEST_DB_CONFIG
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def clases():
+    with open(os.path.join(RAIZ, "JSON.json"), encoding="utf-8") as archivo:
+        return json.load(archivo)["classes"]
+
+
+def clase(nombre, *destinos):
+    return {"class": nombre, "attributes": [],
+            "references": [{"campo_origen": f"{d}_id", "tabla_destino": d, "campo_destino": "id"} for d in destinos]}
+
+
+class TestOrdenTablas:
+    def test_niveles_respetan_referencias(self):
+        print("Verificando el orden topológico de las tablas de JSON.json")
+        niveles = orden_tablas(clases())
+        posicion = {tabla: i for i, nivel in enumerate(niveles) for tabla in nivel}
+        assert len(posicion) == len(clases())
+        for c in clases():
+            for ref in c.get("references", []):
+                assert posicion[ref["tabla_destino"]] < posicion[c["class"]]
+        assert "empresa" in niveles[0] and "lectura_sensor" in niveles[-1]
+
+    def test_autorreferencia(self):
+        assert orden_tablas([clase("b", "a", "b"), clase("a")]) == [["a"], ["b"]]
+
+    def test_ciclo(self):
+        with pytest.raises(CicloDependencias, match="b -> c -> b"):
+            orden_tablas([clase("a"), clase("b", "a", "c"), clase("c", "b")])
+
+    def test_referencia_desconocida(self):
+        with pytest.raises(ValueError, match="no están en JSON.json"):
+            orden_tablas([clase("a", "x")])
+
+
+class TestCrearEnParalelo:
+    def test_crea_todo_en_un_esquema_nuevo(self):
+        print("Creando todas las tablas e índices en paralelo en un esquema temporal")
+        esquema = f"ddl_{uuid.uuid4().hex[:8]}"
+        conn = psycopg2.connect(**TEST_DB_CONFIG)
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute(f"CREATE SCHEMA {esquema}")
+        pool = ThreadedConnectionPool(1, 4, **TEST_DB_CONFIG, options=f"-c search_path={esquema}")
+        try:
+            crear_tablas(pool, clases())
+            crear_indices(pool, clases())
+            cursor.execute("SELECT count(*) FROM pg_tables WHERE schemaname = %s AND tablename = ANY(%s)",
+                           (esquema, [c["class"] for c in clases()]))
+            assert cursor.fetchone()[0] == len(clases())
+            cursor.execute("SELECT count(*) FROM pg_indexes WHERE schemaname = %s AND indexname = ANY(%s)",
+                           (esquema, [i["nombre"] for i in definir_indices(clases())]))
+            assert cursor.fetchone()[0] == len(definir_indices(clases()))
+        finally:
+            pool.closeall()
+            cursor.execute(f"DROP SCHEMA {esquema} CASCADE")
+            conn.close()
+
+
+class TestDefinirIndices:
+    def test_toda_fk_tiene_indice(self):
+        print("Verificando que cada columna de references tenga un índice que empiece por ella")
+        indices = definir_indices(clases())
+        for clase in clases():
+            for ref in clase.get("references", []):
+                assert any(i["tabla"] == clase["class"] and not i["where"]
+                           and i["columnas"][0].split()[0] == ref["campo_origen"] for i in indices), \
+                    f'{clase["class"]}.{ref["campo_origen"]} sin índice'
+
+    def test_no_duplica_indices_compuestos(self):
+        nombres = [i["nombre"] for i in definir_indices(clases())]
+        assert len(nombres) == len(set(nombres))
+        assert "idx_lectura_sensor_estructura_id" not in nombres
+        assert "idx_siembra_estructura_id_fk" in nombres
+
+    def test_sentencia(self):
+        indices = {i["nombre"]: i for i in definir_indices(clases())}
+        assert sentencia_indice(indices["idx_cultivo_tipo_cultivo_id"], concurrente=True) == \
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_cultivo_tipo_cultivo_id ON "cultivo" ("tipo_cultivo_id");'
+        assert sentencia_indice(indices["idx_sede_geohash"]) == \
+            'CREATE INDEX IF NOT EXISTS idx_sede_geohash ON "sede" ("geohash" varchar_pattern_ops);'
+        assert sentencia_indice(indices["idx_alerta_sensor_abiertas"], solo=True).endswith(
+            'ON ONLY "alerta_sensor" ("estructura_id", "metrica") WHERE "fecha_fin" IS NULL;')
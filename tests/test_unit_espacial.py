@@ -0,0 +1,102 @@
+"""
+Pruebas unitarias para el índice espacial de sedes
+"""
+import numpy as np
+import pytest
+from backend import espacial, schemas
+from backend.espacial import IndiceSedes, geohash, haversine_km, _prefijos_rectangulo
+
+
+def sede(sede_id, latitud, longitud):
+    return schemas.Sede(id=sede_id, empresa_id=1, nombre=f"Sede {sede_id}", latitud=latitud, longitud=longitud)
+
+
+@pytest.fixture
+def indice():
+    indice = IndiceSedes(celda=1.0)
+    indice.construir([
+        sede(1, 4.6097, -74.0817),    # Bogotá
+        sede(2, 6.2442, -75.5812),    # Medellín
+        sede(3, 3.4516, -76.5320),    # Cali
+        sede(4, 0.5, 179.5),
+        sede(5, 0.5, -179.5),
+        sede(6, None, None),
+    ])
+    return indice
+
+
+class TestGeohash:
+    def test_valor_conocido(self):
+        assert geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+    def test_prefijos_cubren_rectangulo(self):
+        prefijos = _prefijos_rectangulo(4.5, -74.2, 4.8, -73.9)
+        assert any(geohash(4.6097, -74.0817).startswith(p) for p in prefijos)
+
+
+class TestHaversine:
+    def test_distancia_bogota_medellin(self):
+        distancia = haversine_km(4.6097, -74.0817, np.array([6.2442]), np.array([-75.5812]))
+        print(f"Distancia: {distancia[0]:.1f} km")
+        assert distancia[0] == pytest.approx(246, abs=2)
+
+
+class TestIndiceSedes:
+    def test_sedes_sin_coordenadas_excluidas(self, indice):
+        assert len(indice.cercanas(0, 0, 10)) == 5
+
+    def test_cercanas(self, indice):
+        resultado = indice.cercanas(4.7, -74.1, 2)
+        assert [s.id for s, _ in resultado] == [1, 2]
+        assert resultado[0][1] < resultado[1][1]
+
+    def test_en_rectangulo(self, indice):
+        assert [s.id for s in indice.en_rectangulo(3, -77, 5, -74)] == [1, 3]
+
+    def test_en_rectangulo_antimeridiano(self, indice):
+        assert [s.id for s in indice.en_rectangulo(0, 179, 1, -179)] == [4, 5]
+
+    def test_indice_vacio(self):
+        assert IndiceSedes().en_rectangulo(0, 0, 1, 1) == []
+        assert IndiceSedes().cercanas(0, 0, 3) == []
+
+
+class SesionFalsa:
+    """Solo lo que usa IndiceSedes.cargar: query(...).filter(...).all()"""
+
+    def __init__(self, sedes=None, error=None):
+        self.sedes, self.error, self.consultas = sedes or [], error, 0
+
+    def query(self, *args):
+        return self
+
+    def filter(self, *args):
+        return self
+
+    def all(self):
+        self.consultas += 1
+        if self.error:
+            raise self.error
+        return self.sedes
+
+
+class TestCargaIndice:
+    def test_carga_fallida_no_queda_vigente(self):
+        print("Probando que una carga fallida se reintenta en la siguiente consulta")
+        indice = IndiceSedes()
+        with pytest.raises(RuntimeError):
+            indice.cargar(SesionFalsa(error=RuntimeError("sin base")))
+        sesion = SesionFalsa([sede(1, 4.6, -74.1)])
+        indice.cargar(sesion)
+        assert sesion.consultas == 1 and len(indice.cercanas(4.6, -74.1, 1)) == 1
+
+    def test_recarga_periodica(self, monkeypatch):
+        indice = IndiceSedes()
+        sesion = SesionFalsa([sede(1, 4.6, -74.1)])
+        indice.cargar(sesion)
+        indice.cargar(sesion)
+        assert sesion.consultas == 1
+        monkeypatch.setattr(espacial, "RECARGA_SEGUNDOS", 10)
+        indice._cargado_en -= 11
+        indice.cargar(sesion)
+        assert sesion.consultas == 2
@@ -0,0 +1,75 @@
+"""
+Pruebas unitarias para la expansión de objetos relacionados (expand=)
+"""
+import pytest
+from fastapi import HTTPException, status
+from backend import expansion, models, schemas
+from backend.expansion import MAX_PROFUNDIDAD, esquema, parsear
+
+
+class TestParsear:
+    def test_rutas_ordenadas_sin_repetir(self):
+        assert parsear(models.Estructura, "tipo_estructura, espacio.bloque,tipo_estructura") == \
+            (("espacio", "bloque"), ("tipo_estructura",))
+
+    def test_relacion_inexistente(self):
+        with pytest.raises(HTTPException) as error:
+            parsear(models.Usuario, "persona,clave")
+        assert "persona" in error.value.detail
+
+    def test_profundidad_maxima(self):
+        with pytest.raises(HTTPException):
+            parsear(models.Estructura, ".".join(["espacio", "bloque", "sede", "empresa"][:MAX_PROFUNDIDAD + 1]))
+
+
+class TestEsquema:
+    def test_campos_anidados(self):
+        expandido = esquema(models.Estructura, schemas.Estructura, (("espacio", "bloque"), ("tipo_estructura",)))
+        assert issubclass(expandido, schemas.Estructura)
+        espacio = expandido.model_fields["espacio"].annotation.__args__[0]
+        assert "bloque" in espacio.model_fields
+        assert esquema(models.Estructura, schemas.Estructura, (("espacio", "bloque"), ("tipo_estructura",))) is expandido
+
+    def test_colecciones_como_listas(self):
+        expandido = esquema(models.Empresa, schemas.Empresa, (("sedes",),))
+        assert expandido(id=1, nombre="E").sedes == []
+
+
+
+@pytest.mark.unit
+class TestExpansionAPI:
+    def test_consultas_fijas(self, client, assert_max_queries, sample_empresa_data, sample_persona_data):
+        print("Probando que expand no depende del número de filas")
+        empresa_id = client.post("/api/empresas", json=sample_empresa_data).json()["id"]
+        persona_id = client.post("/api/personas", json=sample_persona_data).json()["id"]
+        sedes = [client.post("/api/sedes", json={"empresa_id": empresa_id, "nombre": f"Sede {i}",
+                                                 "responsable_id": persona_id}).json()["id"] for i in range(5)]
+        with assert_max_queries(1):
+            response = client.get("/api/sedes", params={"ids": ",".join(map(str, sedes)),
+                                                        "expand": "empresa,responsable"})
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert [s["empresa"]["id"] for s in data] == [empresa_id] * 5
+        assert data[0]["responsable"]["documento"] == sample_persona_data["documento"]
+        with assert_max_queries(2):
+            response = client.post("/api/empresas/por-ids", params={"expand": "sedes"}, json={"ids": [empresa_id]})
+        assert sorted(s["id"] for s in response.json()[0]["sedes"]) == sedes
+
+    def test_colecciones_acotadas_por_objeto(self, db_session, assert_max_queries, monkeypatch):
+        print("Probando que cada colección expandida se limita en la consulta, por objeto")
+        monkeypatch.setattr(expansion, "MAX_FILAS_COLECCION", 3)
+        empresas = [models.Empresa(nombre=f"E{i}", sedes=[models.Sede(nombre=f"S{j}") for j in range(5)])
+                    for i in range(2)]
+        db_session.add_all(empresas)
+        db_session.flush()
+        esperadas = {e.id: sorted(s.id for s in e.sedes)[:3] for e in empresas}
+        db_session.expire_all()
+        rutas = (("sedes", "empresa"),)
+        with assert_max_queries(2):
+            objetos = (db_session.query(models.Empresa).options(*expansion.opciones(models.Empresa, rutas))
+                       .filter(models.Empresa.id.in_(esperadas)).all())
+            expansion.cargar(db_session, models.Empresa, objetos, rutas)
+            datos = [esquema(models.Empresa, schemas.Empresa, rutas).model_validate(e, from_attributes=True)
+                     for e in objetos]
+        assert {e.id: [s.id for s in e.sedes] for e in datos} == esperadas
+        assert all(s.empresa.id == e.id for e in datos for s in e.sedes)
@@ -0,0 +1,110 @@
+"""
+Pruebas unitarias para el generador de datos sintéticos (generar_datos.py)
+"""
+from dataclasses import replace
+from datetime import datetime
+import numpy as np
+import psycopg2
+import pytest
+from psycopg2.pool import ThreadedConnectionPool
+import generar_datos
+from generar_datos import LOTE, PERFILES, TABLAS, Generador, a_csv, cargar, errores_escala
+
+ESCALA = replace(PERFILES['pequeno'], accesos=3_000, lecturas=5_000)
+AHORA = datetime(2025, 1, 1)
+
+
+class TestGenerador:
+    def test_determinista_por_semilla(self):
+        uno = Generador(ESCALA, 7, AHORA)
+        otro = Generador(ESCALA, 7, AHORA)
+        distinto = Generador(ESCALA, 8, AHORA)
+        assert a_csv(uno.lote('acceso_espacio', 0)) == a_csv(otro.lote('acceso_espacio', 0))
+        assert a_csv(uno.lote('acceso_espacio', 0)) != a_csv(distinto.lote('acceso_espacio', 0))
+
+    def test_lotes_independientes(self):
+        escala = replace(ESCALA, accesos=LOTE + 10)
+        generador = Generador(escala, 1, AHORA)
+        assert generador.lotes('acceso_espacio') == 2
+        segundo = generador.lote('acceso_espacio', 1)
+        assert segundo['id'].tolist() == list(range(LOTE + 1, LOTE + 11))
+        assert a_csv(segundo) == a_csv(Generador(escala, 1, AHORA).lote('acceso_espacio', 1))
+
+    def test_todo_padre_tiene_hijos(self):
+        generador = Generador(ESCALA, 3, AHORA)
+        assert set(generador.sede_empresa) == set(range(1, ESCALA.empresas + 1))
+        assert set(generador.estructura_espacio) == set(range(1, ESCALA.espacios + 1))
+        assert np.all(np.diff(generador.estructura_espacio) >= 0)
+
+    def test_accesos_en_espacios_de_la_empresa(self):
+        generador = Generador(ESCALA, 3, AHORA)
+        accesos = generador.lote('acceso_espacio', 0)
+        empresas_usuario = generador.usuario_empresa[accesos['usuario_id'] - 1]
+        empresas_espacio = generador.espacio_empresa[accesos['espacio_id'] - 1]
+        assert np.array_equal(empresas_usuario, empresas_espacio)
+
+    def test_escala_coherente(self):
+        assert all(errores_escala(escala) == [] for escala in PERFILES.values())
+        errores = errores_escala(replace(ESCALA, bloques=ESCALA.sedes - 1))
+        assert len(errores) == 1 and errores[0].startswith("bloques")
+        assert errores_escala(replace(ESCALA, empresas=0))
+
+    def test_csv(self):
+        texto = a_csv({'id': np.array([1, 2]), 'activo': np.array([True, False]),
+                       'fecha': np.array(['2025-01-01T10:00:00', 'NaT'], dtype='datetime64[s]'),
+                       'dato': np.array(['x', None], dtype=object)})
+        assert texto == '1,t,2025-01-01T10:00:00,x\n2,f,,\n'
+
+
+@pytest.fixture
+def pool_base(base_limpia):
+    pool = ThreadedConnectionPool(1, 4, **base_limpia)
+    try:
+        yield pool
+    finally:
+        pool.closeall()
+
+
+class TestCarga:
+    def test_carga_consistente(self, pool_base):
+        print("Probando la carga por COPY de un conjunto pequeño en una base clonada de la plantilla")
+        cargar(pool_base, Generador(ESCALA, 5, AHORA))
+
+        conn = pool_base.getconn()
+        try:
+            cursor = conn.cursor()
+            generador = Generador(ESCALA, 5, AHORA)
+            for tabla in TABLAS:
+                cursor.execute(f'SELECT count(*) FROM "{tabla}"')
+                assert cursor.fetchone()[0] == generador.filas(tabla), tabla
+            cursor.execute(
+                "SELECT count(*) FROM acceso_espacio a JOIN usuario u ON u.id = a.usuario_id "
+                "JOIN espacio e ON e.id = a.espacio_id JOIN bloque b ON b.id = e.bloque_id "
+                "JOIN sede s ON s.id = b.sede_id WHERE s.empresa_id <> u.empresa_id")
+            assert cursor.fetchone()[0] == 0
+            # Las secuencias siguen después de los ids cargados
+            cursor.execute("INSERT INTO empresa (nombre) VALUES ('nueva') RETURNING id")
+            assert cursor.fetchone()[0] == ESCALA.empresas + 1
+        finally:
+            pool_base.putconn(conn)
+
+    def test_restaura_indices_y_fk_si_la_carga_falla(self, base_limpia, monkeypatch):
+        print("Probando que una carga interrumpida no deja la base sin índices ni claves foráneas")
+
+        def fallar(*args, **kwargs):
+            raise RuntimeError("carga interrumpida")
+        monkeypatch.setattr(generar_datos, "cargar", fallar)
+        monkeypatch.setattr(generar_datos, "DB_CONFIG", base_limpia)
+        monkeypatch.setattr("sys.argv", ["generar_datos.py", "--truncar", "--paralelismo", "2"])
+        with pytest.raises(RuntimeError):
+            generar_datos.main()
+
+        conn = psycopg2.connect(**base_limpia)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT to_regclass('idx_lectura_sensor_estructura_metrica_fecha') IS NOT NULL")
+            assert cursor.fetchone()[0]
+            cursor.execute("SELECT count(*) FROM pg_constraint WHERE conname = 'fk_sede_empresa_id' AND convalidated")
+            assert cursor.fetchone()[0] == 1
+        finally:
+            conn.close()
@@ -0,0 +1,130 @@
+"""
+Pruebas unitarias para el índice 2D de estructuras
+"""
+import random
+import time
+import pytest
+from sqlalchemy import insert
+from backend import layout, models, schemas
+from backend.layout import IndiceEspacio, IndicesLayout, se_solapan
+
+
+def estructura(estructura_id, x=None, y=None, ancho=2.0, largo=1.0):
+    return schemas.Estructura(id=estructura_id, espacio_id=1, tipo_estructura_id=1,
+                              posicion_x=x, posicion_y=y, ancho=ancho, largo=largo)
+
+
+class TestSolapamiento:
+    def test_rectangulos_solapados(self):
+        assert se_solapan((0, 0, 2, 1), (1, 0.5, 3, 1.5))
+
+    def test_bordes_compartidos_no_solapan(self):
+        assert not se_solapan((0, 0, 2, 1), (2, 0, 4, 1))
+
+
+class TestIndiceEspacio:
+    def test_ventana(self):
+        print("Probando consulta por ventana")
+        indice = IndiceEspacio([estructura(1, 0, 0), estructura(2, 5, 5), estructura(3, 20, 20), estructura(4)])
+        assert [e.id for e in indice.en_ventana((0, 0, 6, 6))] == [1, 2]
+        assert len(indice) == 4
+
+    def test_solapados_con_excluye_la_misma(self):
+        indice = IndiceEspacio([estructura(1, 0, 0), estructura(2, 1, 0.5)])
+        assert indice.solapados_con((0, 0, 2, 1)) == [1, 2]
+        assert indice.solapados_con((0, 0, 2, 1), excluir=1) == [2]
+
+    def test_mover_estructura(self):
+        indice = IndiceEspacio([estructura(1, 0, 0), estructura(2, 10, 10)])
+        indice.insertar(estructura(2, 1, 0))
+        assert indice.solapamientos() == [(1, 2)]
+        indice.eliminar(1)
+        assert indice.solapamientos() == []
+
+    def test_coincide_con_fuerza_bruta(self):
+        print("Comparando con búsqueda exhaustiva en 2000 estructuras")
+        rng = random.Random(7)
+        estructuras = [estructura(i, rng.uniform(0, 200), rng.uniform(0, 200),
+                                  rng.uniform(0.5, 4), rng.uniform(0.5, 4)) for i in range(1, 2001)]
+        indice = IndiceEspacio(estructuras)
+        rects = {e.id: (e.posicion_x, e.posicion_y, e.posicion_x + e.ancho, e.posicion_y + e.largo)
+                 for e in estructuras}
+        esperado = sorted((a, b) for a in rects for b in rects if a < b and se_solapan(rects[a], rects[b]))
+        assert indice.solapamientos() == esperado
+        ventana = (50, 50, 70, 60)
+        esperado_ventana = sorted(i for i, r in rects.items()
+                                  if r[0] <= ventana[2] and ventana[0] <= r[2]
+                                  and r[1] <= ventana[3] and ventana[1] <= r[3])
+        assert [e.id for e in indice.en_ventana(ventana)] == esperado_ventana
+
+    def test_estructura_desproporcionada(self):
+        print("Probando que una estructura enorme va a la lista aparte y no a la rejilla")
+        inicio = time.perf_counter()
+        indice = IndiceEspacio([estructura(1, 0, 0, 1, 1), estructura(2, 5, 5, 1, 1), estructura(3, 10, 10, 1, 1),
+                                estructura(4, 0, 0, 2000, 2000)])
+        assert time.perf_counter() - inicio < 0.1
+        assert len(indice._celdas) < 10
+        assert indice.solapamientos() == [(1, 4), (2, 4), (3, 4)]
+        assert indice.solapados_con((5.5, 5.5, 6, 6)) == [2, 4]
+        assert [e.id for e in indice.en_ventana((1500, 1500, 1600, 1600))] == [4]
+        indice.eliminar(4)
+        assert indice.solapamientos() == []
+
+
+class SesionFalsa:
+    def __init__(self):
+        self.info, self.cargas = {}, 0
+
+
+class TestIndicesLayout:
+    def test_recarga_vencida(self, monkeypatch):
+        indices = IndicesLayout()
+        sesion = SesionFalsa()
+
+        def cargar(db_session, espacio_id):
+            db_session.cargas += 1
+            return IndiceEspacio()
+
+        monkeypatch.setattr(indices, "_cargar", cargar)
+        monkeypatch.setattr(layout, "RECARGA_SEGUNDOS", 10)
+        indice = indices.obtener(sesion, 1)
+        assert indices.obtener(sesion, 1) is indice and sesion.cargas == 1
+        indice.cargado_en -= 11
+        assert indices.obtener(sesion, 1) is not indice and sesion.cargas == 2
+
+
+@pytest.fixture
+def espacio_id(db_session):
+    empresa = models.Empresa(nombre="Layout")
+    espacio = models.Espacio(bloque=models.Bloque(sede=models.Sede(empresa=empresa, nombre="Sede"), nombre="Bloque"),
+                             tipo_espacio=models.TipoEspacio(nombre="Invernadero"), nombre="Espacio")
+    db_session.add(espacio)
+    db_session.flush()
+    return espacio.id
+
+
+class TestSolapamientoEnBase:
+    def test_ve_estructuras_de_otro_worker(self, client, db_session, espacio_id):
+        print("Probando que el 409 de solapamiento considera filas que el índice en memoria no vio")
+        tipo = models.TipoEstructura(nombre="Mesa")
+        db_session.add(tipo)
+        db_session.flush()
+        base = {"espacio_id": espacio_id, "tipo_estructura_id": tipo.id, "nombre": "Mesa", "ancho": 2.0, "largo": 1.0}
+        assert client.post("/api/estructuras", json={**base, "posicion_x": 0, "posicion_y": 0}).status_code == 200
+        client.get(f"/api/espacios/{espacio_id}/estructuras")  # carga el índice del espacio
+        # Otro worker inserta sin pasar por este proceso (INSERT sin eventos del ORM)
+        db_session.execute(insert(models.Estructura).values(**base, posicion_x=10.0, posicion_y=0.0))
+        respuesta = client.post("/api/estructuras", json={**base, "posicion_x": 11, "posicion_y": 0.5})
+        assert respuesta.status_code == 409
+        # Bordes compartidos (incluso con valores no exactos en REAL) no son solapamiento
+        respuesta = client.post("/api/estructuras", json={**base, "posicion_x": 30, "posicion_y": 0, "ancho": 0.1})
+        assert respuesta.status_code == 200
+        assert client.post("/api/estructuras", json={**base, "posicion_x": 30.1, "posicion_y": 0}).status_code == 200
+
+    def test_ventana_invalida(self, client, espacio_id):
+        url = f"/api/espacios/{espacio_id}/estructuras"
+        for ventana in ({"x_min": 0, "y_min": 0, "x_max": "inf", "y_max": 1},
+                        {"x_min": "nan", "y_min": 0, "x_max": 1, "y_max": 1},
+                        {"x_min": 2, "y_min": 0, "x_max": 1, "y_max": 1}):
+            assert client.get(url, params=ventana).status_code == 422
+        assert client.get(url, params={"x_min": 0, "y_min": 0, "x_max": 1, "y_max": 1}).status_code == 200
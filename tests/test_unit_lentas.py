@@ -0,0 +1,101 @@
+"""
+Pruebas unitarias para la bitácora de consultas lentas
+"""
+import time
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from backend import lentas, tokens
+from backend.consultas import MedirConsultas
+from backend.lentas import BitacoraLentas, a_posicionales, forma_parametros, tipo_plan
+
+
+class TestClasificacion:
+    def test_tipo_plan(self):
+        assert tipo_plan("SELECT * FROM cultivo WHERE tipo_cultivo_id = %(id)s") == "analyze"
+        assert tipo_plan("/* listado */ WITH x AS (SELECT 1) SELECT * FROM x") == "analyze"
+        assert tipo_plan("WITH x AS (DELETE FROM siembra RETURNING id) SELECT * FROM x") == "estimado"
+        assert tipo_plan("UPDATE sede SET nombre = %(nombre)s") == "estimado"
+        assert tipo_plan("COPY lectura_sensor FROM STDIN") is None
+
+    def test_sin_analyze_si_bloquea_o_tiene_efectos(self):
+        assert tipo_plan("SELECT * FROM espacio WHERE id = %(id)s FOR UPDATE") == "estimado"
+        assert tipo_plan("SELECT id FROM siembra FOR NO KEY UPDATE SKIP LOCKED") == "estimado"
+        assert tipo_plan("SELECT nextval('empresa_id_seq')") == "estimado"
+        assert tipo_plan("SELECT pg_try_advisory_xact_lock(%(clave)s)") == "estimado"
+        assert tipo_plan("SELECT * FROM sede WHERE nombre = 'for update'") == "analyze"
+
+    def test_a_posicionales(self):
+        assert a_posicionales("SELECT %(a)s, %(b)s, %(a)s, '100%%'", {"a": 1, "b": "x"}) == \
+            ("SELECT $1, $2, $1, '100%'", [1, "x"])
+        assert a_posicionales("SELECT %s, %s", (1, 2)) == ("SELECT $1, $2", [1, 2])
+
+    def test_forma_parametros_sin_valores(self):
+        formas = forma_parametros({"id_1": 7, "ids": [1, 2, 3], "nombre": "secreto", "fin": None})
+        assert formas == {"id_1": "int", "ids": "list[int]x3", "nombre": "str", "fin": "null"}
+        assert forma_parametros([{"a": 1}, {"a": 2}], executemany=True) == {"executemany": "2", "a": "int"}
+
+
+class TestBitacora:
+    def test_desactivada_por_defecto(self):
+        bitacora = BitacoraLentas(umbral=0.0)
+        assert bitacora.anotar("SELECT 1", {}, 10.0) is None
+        assert bitacora.listar() == []
+
+    def test_circular(self):
+        bitacora = BitacoraLentas(umbral=0.001, capacidad=3)
+        for i in range(5):
+            bitacora.anotar(f"SELECT {i}", {}, 0.002)
+        assert [e.sentencia for e in bitacora.listar()] == ["SELECT 4", "SELECT 3", "SELECT 2"]
+
+    def test_ruta_y_plan(self, db_session, engine, monkeypatch):
+        print("Probando la captura de una consulta lenta con su EXPLAIN ANALYZE")
+        bitacora = BitacoraLentas(sessionmaker(bind=engine), umbral=0.01, muestreo=1.0)
+        monkeypatch.setattr(lentas, "bitacora", bitacora)
+        app = FastAPI()
+
+        @app.get("/api/cultivos/{cultivo_id}/lento")
+        def lento(cultivo_id: int):
+            db_session.execute(text("SELECT pg_sleep(0.02), :id"), {"id": cultivo_id})
+            db_session.execute(text("SELECT :id"), {"id": cultivo_id})
+            return {"ok": True}
+
+        app.add_middleware(MedirConsultas)
+        TestClient(app).get("/api/cultivos/5/lento")
+        try:
+            entradas = bitacora.listar()
+            assert len(entradas) == 1
+            entrada = entradas[0]
+            assert entrada.ruta == "GET /api/cultivos/{cultivo_id}/lento"
+            assert entrada.ms >= 20 and entrada.parametros == {"id": "int"}
+            for _ in range(100):
+                if entrada.plan is not None:
+                    break
+                time.sleep(0.05)
+            print(entrada.plan)
+            assert "actual time" in entrada.plan
+        finally:
+            bitacora.detener()
+
+    def test_plan_sin_valores(self, engine):
+        print("Probando que el plan guardado no incluye los valores de los parámetros")
+        bitacora = BitacoraLentas(sessionmaker(bind=engine), umbral=0.01, muestreo=1.0)
+        for _ in range(2):
+            plan = bitacora.explicar("SELECT * FROM empresa WHERE nit = %(nit)s AND id = ANY(%(ids)s)",
+                                     {"nit": "secreto-123", "ids": [1, 2]}, analizar=True)
+            print(plan)
+            assert "actual time" in plan and "$1" in plan
+            assert "secreto-123" not in plan
+
+
+class TestEndpoint:
+    def test_requiere_rol_admin(self, client):
+        assert client.get("/api/admin/consultas-lentas").status_code == 401
+        assert client.delete("/api/admin/consultas-lentas").status_code == 401
+        sin_rol = {"Authorization": f"Bearer {tokens.firmador.emitir(1, 1, [])}"}
+        assert client.get("/api/admin/consultas-lentas", headers=sin_rol).status_code == 403
+        assert client.delete("/api/admin/consultas-lentas", headers=sin_rol).status_code == 403
+        cabeceras = {"Authorization": f"Bearer {tokens.firmador.emitir(1, 1, [tokens.ROL_ADMIN])}"}
+        assert client.get("/api/admin/consultas-lentas", headers=cabeceras).status_code == 200
+        assert client.delete("/api/admin/consultas-lentas", headers=cabeceras).status_code == 200
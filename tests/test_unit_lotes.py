@@ -0,0 +1,67 @@
+"""
+Pruebas unitarias para los lotes de operaciones (POST /api/batch)
+"""
+import pytest
+from fastapi import status
+from backend import models
+from backend.lotes import ErrorOperacion, buscar_ruta, resolver_referencias
+from backend.main import app
+
+
+class TestReferencias:
+    resultados = [{"id": 7, "sede": {"id": 3}}]
+
+    def test_referencia_completa_conserva_tipo(self):
+        assert resolver_referencias({"sede_id": "$ref:0.id", "x": ["$ref:0.sede.id"]}, self.resultados) == \
+            {"sede_id": 7, "x": [3]}
+
+    def test_referencia_en_ruta(self):
+        assert resolver_referencias("/api/sedes/$ref:0.id", self.resultados) == "/api/sedes/7"
+
+    def test_referencia_a_operacion_posterior(self):
+        with pytest.raises(ErrorOperacion):
+            resolver_referencias("$ref:1.id", self.resultados)
+
+
+class TestBuscarRuta:
+    def test_rutas_crud(self):
+        ruta, parametros = buscar_ruta(app.routes, "PUT", "/api/sedes/5")
+        assert ruta.path == "/api/sedes/{sede_id}" and parametros == {"sede_id": "5"}
+
+    def test_rutas_no_crud(self):
+        for metodo, ruta in (("POST", "/api/batch"), ("POST", "/api/auth/login"), ("GET", "/api/sedes")):
+            with pytest.raises(ErrorOperacion):
+                buscar_ruta(app.routes, metodo, ruta)
+
+
+@pytest.mark.unit
+class TestLoteAPI:
+    def test_crea_jerarquia_en_una_transaccion(self, client, sample_empresa_data):
+        print("Probando crear empresa, sede y bloques en un solo lote")
+        response = client.post("/api/batch", json={"operaciones": [
+            {"metodo": "POST", "ruta": "/api/empresas", "cuerpo": sample_empresa_data},
+            {"metodo": "POST", "ruta": "/api/sedes", "cuerpo": {"empresa_id": "$ref:0.id", "nombre": "Norte"}},
+            {"metodo": "POST", "ruta": "/api/bloques", "cuerpo": {"sede_id": "$ref:1.id", "nombre": "B1"}},
+            {"metodo": "PUT", "ruta": "/api/sedes/$ref:1.id", "cuerpo": {"direccion": "Km 3"}},
+        ]})
+        print(f"Respuesta: {response.json()}")
+        assert response.status_code == status.HTTP_200_OK
+        resultados = [r["resultado"] for r in response.json()["resultados"]]
+        assert resultados[2]["sede_id"] == resultados[1]["id"]
+        assert resultados[3]["direccion"] == "Km 3"
+        assert client.get(f"/api/bloques/{resultados[2]['id']}").status_code == status.HTTP_200_OK
+
+    def test_fallo_no_confirma_nada(self, client, db_session, sample_empresa_data):
+        response = client.post("/api/batch", json={"operaciones": [
+            {"metodo": "POST", "ruta": "/api/empresas", "cuerpo": sample_empresa_data},
+            {"metodo": "DELETE", "ruta": "/api/sedes/99999999"},
+        ]})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.json()["detail"]["indice"] == 1
+        assert db_session.query(models.Empresa).filter(models.Empresa.nit == sample_empresa_data["nit"]).count() == 0
+
+    def test_cuerpo_invalido(self, client):
+        response = client.post("/api/batch", json={"operaciones": [
+            {"metodo": "POST", "ruta": "/api/sedes", "cuerpo": {"nombre": "Sin empresa"}}]})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert response.json()["detail"]["indice"] == 0
@@ -0,0 +1,65 @@
+"""
+Pruebas unitarias para las métricas en formato Prometheus
+"""
+import os
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+from backend.metricas import Metricas, MedirPeticiones, Recolector, combinar, exponer
+
+
+class TestExposicion:
+    def test_histograma_acumulado(self):
+        metricas = Metricas()
+        for valor in (0.002, 0.002, 0.3, 20.0):
+            metricas.observar("http_request_duration_seconds", ("GET", "/api/sedes"), valor)
+        texto = exponer(combinar([metricas.instantanea()]))
+        print(texto)
+        assert 'http_request_duration_seconds_bucket{metodo="GET",ruta="/api/sedes",le="0.005"} 2' in texto
+        assert 'http_request_duration_seconds_bucket{metodo="GET",ruta="/api/sedes",le="0.5"} 3' in texto
+        assert 'http_request_duration_seconds_bucket{metodo="GET",ruta="/api/sedes",le="+Inf"} 4' in texto
+        assert 'http_request_duration_seconds_count{metodo="GET",ruta="/api/sedes"} 4' in texto
+
+    def test_combinar_suma_procesos(self):
+        a, b = Metricas(), Metricas()
+        a.sumar("http_requests_total", ("GET", "/x", "200"), 3)
+        b.sumar("http_requests_total", ("GET", "/x", "200"), 2)
+        b.observar("http_response_size_bytes", ("GET", "/x"), 100)
+        total = combinar([a.instantanea(), b.instantanea()])
+        assert total[("http_requests_total", ("GET", "/x", "200"))] == 5
+        assert total[("http_response_size_bytes", ("GET", "/x"))][0] == 1
+
+
+class TestRecolector:
+    def test_varios_procesos(self, tmp_path):
+        print("Probando la agregación de métricas entre workers")
+        muerto = tmp_path / "metricas-999999999.json"
+        muerto.write_text('[["http_requests_total", ["GET", "/x", "200"], 4], ["http_requests_in_flight", [], 2]]')
+        recolector = Recolector(directorio=str(tmp_path))
+        recolector.metricas.sumar("http_requests_total", ("GET", "/x", "200"))
+        recolector.guardar()
+        assert os.path.exists(tmp_path / f"metricas-{os.getpid()}.json")
+        total = recolector.recopilar()
+        assert total[("http_requests_total", ("GET", "/x", "200"))] == 5
+        assert ("http_requests_in_flight", ()) not in total
+
+
+class TestMiddleware:
+    def test_ruta_plantilla(self):
+        metricas = Metricas()
+        app = FastAPI()
+
+        @app.get("/api/espacios/{espacio_id}")
+        def espacio(espacio_id: int):
+            return PlainTextResponse("x" * 300)
+
+        app.add_middleware(MedirPeticiones, metricas=metricas)
+        client = TestClient(app)
+        for espacio_id in (1, 2, 3):
+            client.get(f"/api/espacios/{espacio_id}")
+        client.get("/no-existe")
+        total = combinar([metricas.instantanea()])
+        assert total[("http_requests_total", ("GET", "/api/espacios/{espacio_id}", "200"))] == 3
+        assert total[("http_requests_total", ("GET", "sin_ruta", "404"))] == 1
+        assert total[("http_response_size_bytes", ("GET", "/api/espacios/{espacio_id}"))][1] == 3
+        assert total[("http_requests_in_flight", ())] == 0
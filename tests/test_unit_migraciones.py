@@ -0,0 +1,171 @@
+"""
+Pruebas unitarias para el motor de migraciones (migrar.py)
+"""
+import uuid
+import psycopg2
+import pytest
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from tests.conftest import TEST_DB_CONFIG
+from backend.espacial import geohash
+from migrar import aplicar, introspeccionar, planificar
+
+EMPRESA = {
+    "class": "empresa",
+    "attributes": [
+        {"name": "id", "data_type": "int", "length": 0, "autoincrement": "True", "primary_key": "True"},
+        {"name": "nombre", "data_type": "string", "length": 150},
+        {"name": "nit", "data_type": "string", "length": 50},
+        {"name": "activo", "data_type": "boolean", "length": 0},
+        {"name": "fecha_inicio", "data_type": "timestamp", "length": 0},
+    ],
+}
+SEDE = {
+    "class": "sede",
+    "attributes": [
+        {"name": "id", "data_type": "int", "length": 0, "autoincrement": "True", "primary_key": "True"},
+        {"name": "empresa_id", "data_type": "int", "length": 0},
+        {"name": "nombre", "data_type": "string", "length": 150},
+    ],
+    "references": [{"campo_origen": "empresa_id", "tabla_destino": "empresa", "campo_destino": "id"}],
+}
+
+
+def estado(tablas, restricciones=None, indices=None):
+    return {"tablas": tablas, "restricciones": restricciones or {}, "indices": indices or {}}
+
+
+def tabla(columnas, pk=("id",), vacia=False, particionada=False):
+    return {"particionada": particionada, "vacia": vacia, "pk": list(pk), "columnas": {
+        nombre: {"tipo": tipo, "not_null": not_null, "default": default}
+        for nombre, (tipo, not_null, default) in columnas.items()}}
+
+
+class TestPlanificar:
+    def test_tabla_nueva(self):
+        plan = planificar([EMPRESA, SEDE], estado({}))
+        assert [op.fase for op in plan.operaciones] == ["tablas", "tablas", "indices"]
+        assert plan.operaciones[0].tabla == "empresa"
+
+    def test_columna_not_null_con_default(self):
+        print("Probando el plan para una columna NOT NULL con DEFAULT en una tabla con datos")
+        empresa = tabla({"id": ("INTEGER", True, "nextval('empresa_id_seq'::regclass)"),
+                         "nombre": ("VARCHAR(100)", True, None), "nit": ("VARCHAR(50)", False, None),
+                         "activo": ("BOOLEAN", False, None), "fecha_inicio": ("TIMESTAMP", False, None)})
+        plan = planificar([EMPRESA], estado({"empresa": empresa}))
+        descripciones = [(op.fase, op.descripcion) for op in plan.operaciones]
+        print(descripciones)
+        assert descripciones == [
+            ("defaults", 'DEFAULT de "activo"'),
+            ("defaults", 'DEFAULT de "fecha_inicio"'),
+            ("relleno", 'rellenar NULL de "fecha_inicio" en lotes de 5000'),
+            ("tipos", 'ampliar "nombre" a VARCHAR(150)'),
+            ("restricciones", 'CHECK NOT VALID de NULL en "fecha_inicio"'),
+            ("validacion", "validar chk_empresa_fecha_inicio_not_null"),
+            ("not_null", 'NOT NULL en "fecha_inicio"'),
+            ("unicas", 'UNIQUE en "nit"'),
+        ]
+        assert plan.operaciones[2].repetir
+        assert "CONCURRENTLY" in plan.operaciones[-1].sentencias[0]
+
+    def test_not_null_por_fases(self):
+        empresa = tabla({"id": ("INTEGER", True, None), "nombre": ("VARCHAR(150)", False, None),
+                         "nit": ("VARCHAR(50)", False, None), "activo": ("BOOLEAN", False, "true"),
+                         "fecha_inicio": ("TIMESTAMP", True, "CURRENT_TIMESTAMP")})
+        plan = planificar([EMPRESA], estado({"empresa": empresa},
+                                            {("empresa", "empresa_nit_key"): {"tipo": "u", "columnas": ["nit"],
+                                                                              "validada": True}}))
+        assert [op.fase for op in plan.operaciones] == ["restricciones", "validacion", "not_null"]
+        assert plan.operaciones[0].sentencias[0].endswith('CHECK ("nombre" IS NOT NULL) NOT VALID;')
+
+    def test_fk_not_valid_y_advertencias(self):
+        empresa = tabla({"id": ("INTEGER", True, None), "nombre": ("VARCHAR(150)", True, None),
+                         "nit": ("INTEGER", False, None), "activo": ("BOOLEAN", False, "true"),
+                         "fecha_inicio": ("TIMESTAMP", True, "CURRENT_TIMESTAMP"), "vieja": ("TEXT", False, None)})
+        sede = tabla({"id": ("INTEGER", True, None), "empresa_id": ("INTEGER", True, None),
+                      "nombre": ("VARCHAR(150)", True, None)})
+        restricciones = {("empresa", "empresa_nit_key"): {"tipo": "u", "columnas": ["nit"], "validada": True}}
+        plan = planificar([EMPRESA, SEDE], estado({"empresa": empresa, "sede": sede}, restricciones,
+                                                  {"idx_sede_empresa_id": True}))
+        assert [op.sentencias[0] for op in plan.operaciones] == [
+            'ALTER TABLE "sede" ADD CONSTRAINT fk_sede_empresa_id FOREIGN KEY ("empresa_id") '
+            'REFERENCES "empresa" ("id") ON DELETE CASCADE NOT VALID;',
+            'ALTER TABLE "sede" VALIDATE CONSTRAINT fk_sede_empresa_id;',
+        ]
+        assert any("INTEGER -> VARCHAR(50)" in a for a in plan.advertencias)
+        assert any("empresa.vieja" in a for a in plan.advertencias)
+
+
+@pytest.fixture
+def conexion_esquema():
+    esquema = f"migracion_{uuid.uuid4().hex[:8]}"
+    conn = psycopg2.connect(**TEST_DB_CONFIG, options=f"-c search_path={esquema}")
+    conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    conn.cursor().execute(f"CREATE SCHEMA {esquema}")
+    try:
+        yield conn
+    finally:
+        conn.cursor().execute(f"DROP SCHEMA {esquema} CASCADE")
+        conn.close()
+
+
+class TestAplicar:
+    def test_migra_y_converge(self, conexion_esquema, monkeypatch):
+        print("Probando una migración en línea sobre una tabla con datos")
+        monkeypatch.setattr("migrar.TAMANO_LOTE", 2)
+        cursor = conexion_esquema.cursor()
+        cursor.execute('CREATE TABLE empresa (id SERIAL PRIMARY KEY, nombre VARCHAR(100) NOT NULL, '
+                       'activo BOOLEAN, fecha_inicio TIMESTAMP)')
+        cursor.execute("INSERT INTO empresa (nombre, fecha_inicio) VALUES ('a', NULL), ('b', now()), ('c', NULL)")
+        cursor.execute('CREATE TABLE sede (id SERIAL PRIMARY KEY, empresa_id INTEGER NOT NULL, nombre VARCHAR(150) NOT NULL)')
+        cursor.execute("INSERT INTO sede (empresa_id, nombre) SELECT id, 's' FROM empresa")
+
+        plan = planificar([EMPRESA, SEDE], introspeccionar(conexion_esquema))
+        aplicadas, error = aplicar(conexion_esquema, plan)
+        assert error is None and aplicadas == len(plan.operaciones)
+
+        cursor.execute("SELECT count(*) FROM empresa WHERE fecha_inicio IS NULL")
+        assert cursor.fetchone()[0] == 0
+        final = introspeccionar(conexion_esquema)
+        assert final["tablas"]["empresa"]["columnas"]["nombre"]["tipo"] == "VARCHAR(150)"
+        assert final["tablas"]["empresa"]["columnas"]["fecha_inicio"]["not_null"]
+        assert "nit" in final["tablas"]["empresa"]["columnas"]
+        assert final["restricciones"][("sede", "fk_sede_empresa_id")]["validada"]
+        assert planificar([EMPRESA, SEDE], final).operaciones == []
+
+    def test_rellena_columna_derivada(self, conexion_esquema, monkeypatch):
+        print("Probando el relleno de sede.geohash para sedes anteriores a la columna")
+        monkeypatch.setattr("migrar.TAMANO_LOTE", 2)
+        cursor = conexion_esquema.cursor()
+        cursor.execute("CREATE TABLE sede (id SERIAL PRIMARY KEY, latitud REAL, longitud REAL)")
+        cursor.execute("INSERT INTO sede (latitud, longitud) VALUES (4.61, -74.08), (NULL, NULL), (6.24, -75.58), "
+                       "(3.45, -76.53)")
+        clase = {"class": "sede", "attributes": [
+            {"name": "id", "data_type": "int", "length": 0, "autoincrement": "True", "primary_key": "True"},
+            {"name": "latitud", "data_type": "float", "length": 0},
+            {"name": "longitud", "data_type": "float", "length": 0},
+            {"name": "geohash", "data_type": "string", "length": 12}]}
+        plan = planificar([clase], introspeccionar(conexion_esquema))
+        assert [op.fase for op in plan.operaciones] == ["columnas", "relleno"]
+        assert aplicar(conexion_esquema, plan)[1] is None
+        cursor.execute("SELECT latitud, longitud, geohash FROM sede ORDER BY id")
+        for latitud, longitud, valor in cursor.fetchall():
+            assert valor == (None if latitud is None else geohash(latitud, longitud))
+        assert planificar([clase], introspeccionar(conexion_esquema)).operaciones == []
+
+    def test_unique_tras_indice_invalido(self, conexion_esquema):
+        print("Probando que el UNIQUE reconstruye el índice que dejó inválido un intento con duplicados")
+        cursor = conexion_esquema.cursor()
+        cursor.execute("CREATE TABLE empresa (id SERIAL PRIMARY KEY, nombre VARCHAR(150) NOT NULL, "
+                       "nit VARCHAR(50), activo BOOLEAN DEFAULT true, fecha_inicio TIMESTAMP NOT NULL DEFAULT now())")
+        cursor.execute("INSERT INTO empresa (nombre, nit) VALUES ('a', '1'), ('b', '1')")
+        with pytest.raises(psycopg2.errors.UniqueViolation):
+            cursor.execute('CREATE UNIQUE INDEX CONCURRENTLY empresa_nit_key ON empresa (nit)')
+        cursor.execute("UPDATE empresa SET nit = '2' WHERE nombre = 'b'")
+
+        plan = planificar([EMPRESA], introspeccionar(conexion_esquema))
+        assert plan.operaciones[-1].sentencias[0] == "DROP INDEX CONCURRENTLY IF EXISTS empresa_nit_key;"
+        aplicadas, error = aplicar(conexion_esquema, plan)
+        assert error is None and aplicadas == len(plan.operaciones)
+        final = introspeccionar(conexion_esquema)
+        assert final["restricciones"][("empresa", "empresa_nit_key")]["tipo"] == "u"
+        assert final["indices"]["empresa_nit_key"]
@@ -0,0 +1,111 @@
+"""
+Pruebas unitarias para la caché comprimida de lecturas recientes
+"""
+from datetime import datetime, timedelta
+import random
+import threading
+import numpy as np
+from backend.recientes import LecturasRecientes, SerieComprimida, a_milisegundos, comprimir, descomprimir
+
+
+class TestCompresion:
+    def test_ida_y_vuelta_irregular(self):
+        print("Probando compresión Gorilla con datos irregulares")
+        rng = random.Random(7)
+        tiempos, t = [], 1_760_000_000_000
+        for _ in range(500):
+            t += rng.choice([10_000, 10_000, 10_003, 9_990, 60_000, 5_000_000, 10 ** 10])
+            tiempos.append(t)
+        valores = [rng.choice([6.1, 6.1, -3.25, 0.0, float("inf"), rng.uniform(-1e6, 1e6)]) for _ in tiempos]
+        t_leidos, v_leidos = descomprimir(comprimir(tiempos, valores))
+        assert t_leidos.tolist() == tiempos
+        assert v_leidos.tolist() == valores
+
+    def test_un_punto(self):
+        t_leidos, v_leidos = descomprimir(comprimir([1000], [1.5]))
+        assert t_leidos.tolist() == [1000] and v_leidos.tolist() == [1.5]
+
+    def test_lectura_periodica_ocupa_poco(self):
+        tiempos = [1_760_000_000_000 + 10_000 * i for i in range(256)]
+        # Sensor que reporta el mismo valor hasta que cambia
+        valores = [6.2 if (i // 16) % 2 else 6.3 for i in range(256)]
+        datos = comprimir(tiempos, valores)
+        print(f"{len(datos)} bytes para 256 puntos")
+        assert len(datos) < 256 * 16 / 10
+
+
+class TestSerieComprimida:
+    def test_sella_bloques_y_lee_desde(self):
+        serie = SerieComprimida(puntos_por_bloque=10)
+        for i in range(35):
+            assert serie.agregar(1000 * i, float(i))
+        assert not serie.agregar(1000 * 34, 0.0)
+        assert len(serie) == 35
+        tiempos, valores = serie.leer(20_500)
+        assert tiempos[0] == 21_000 and valores.tolist() == [float(i) for i in range(21, 35)]
+
+    def test_descartar_antes(self):
+        serie = SerieComprimida(puntos_por_bloque=10)
+        for i in range(35):
+            serie.agregar(1000 * i, float(i))
+        serie.descartar_antes(15_000)
+        assert serie.inicio == 10_000
+        assert len(serie) == 25
+
+
+class TestLecturasRecientes:
+    ahora = datetime(2026, 10, 19, 12, 0)
+
+    def _filas(self, inicio, n, metrica="ph"):
+        return [(metrica, inicio + timedelta(seconds=10 * i), 6.0) for i in range(n)]
+
+    def test_ventana(self):
+        recientes = LecturasRecientes(ventana=timedelta(hours=1))
+        recientes.aplicar(1, self._filas(self.ahora - timedelta(hours=3), 3 * 360), self.ahora)
+        tiempos, _ = recientes._estructuras[1].series["ph"].leer()
+        # Solo se descartan bloques completos fuera de la ventana
+        assert tiempos[0] >= a_milisegundos(self.ahora - timedelta(hours=1)) - 256 * 10_000
+        assert tiempos[-1] == a_milisegundos(self.ahora - timedelta(seconds=10))
+
+    def test_tope_por_estructura(self):
+        recientes = LecturasRecientes(max_bytes_estructura=2000)
+        filas = [("ec", self.ahora - timedelta(seconds=10 * i), float(i) * 1.37) for i in range(3000, 0, -1)]
+        recientes.aplicar(1, filas, self.ahora)
+        memoria = recientes.memoria()
+        print(f"Memoria: {memoria}")
+        assert memoria[0][3] <= 2000
+        assert memoria[0][2] < 3000
+
+    def test_tope_global_descarta_la_menos_usada(self):
+        recientes = LecturasRecientes(max_bytes=1000)
+        for estructura_id in (1, 2, 3):
+            recientes.aplicar(estructura_id, self._filas(self.ahora - timedelta(minutes=30), 50), self.ahora)
+        assert [e[0] for e in recientes.memoria()] == [3]
+        assert np.all(recientes._estructuras[3].series["ph"].leer()[1] == 6.0)
+
+    def test_lee_las_filas_sin_el_lock(self):
+        print("Probando que otras estructuras se pueden leer mientras se cargan las filas de una")
+        recientes = LecturasRecientes()
+        recientes.aplicar(1, self._filas(self.ahora - timedelta(minutes=5), 10), self.ahora)
+        leidas = []
+
+        def filas():
+            lector = threading.Thread(target=lambda: leidas.append(recientes.memoria()))
+            lector.start()
+            lector.join(timeout=2)
+            yield from self._filas(self.ahora - timedelta(minutes=5), 10)
+        recientes.aplicar(2, filas(), self.ahora)
+        assert len(leidas) == 1 and [e[0] for e in leidas[0]] == [1]
+        assert [e[0] for e in recientes.memoria()] == [1, 2]
+
+    def test_lecturas_tardias(self):
+        recientes = LecturasRecientes()
+        recientes.aplicar(1, self._filas(self.ahora - timedelta(minutes=5), 10), self.ahora)
+        recientes.aplicar(2, self._filas(self.ahora - timedelta(minutes=5), 10), self.ahora)
+        recientes.marcar_tardias({1: self.ahora - timedelta(minutes=1), 2: self.ahora + timedelta(seconds=1)})
+        assert [e[0] for e in recientes.memoria()] == [2]
+        assert recientes.recargas_tardias == 1
+        # Dentro de una misma carga, los puntos que no avanzan se cuentan
+        recientes.aplicar(3, [("ph", self.ahora - timedelta(seconds=5), 1.0),
+                              ("ph", self.ahora - timedelta(seconds=9), 2.0)], self.ahora)
+        assert recientes.fuera_de_orden == 1
@@ -0,0 +1,49 @@
+"""
+Pruebas unitarias para la serialización rápida de listados
+"""
+import json
+from datetime import datetime
+from fastapi.encoders import jsonable_encoder
+from backend import models, schemas
+from backend.respuestas import columnas, desde_filas, desde_objetos
+
+
+def estructuras(n):
+    return [models.Estructura(id=i, nombre=f"Canal {i}", tipo_estructura_id=1, espacio_id=2,
+                              ancho=0.1 * i if i % 2 else None, largo=12.0)
+            for i in range(1, n + 1)]
+
+
+def siembras(n):
+    return [models.Siembra(id=i, estructura_id=i, variedad_cultivo_id=3, activo=i % 2 == 0,
+                           fecha_inicio=datetime(2026, 10, 19, 12, 0, 0, 1000 * i))
+            for i in range(1, n + 1)]
+
+
+def camino_anterior(esquema, objetos):
+    return json.loads(json.dumps(jsonable_encoder([esquema.model_validate(o) for o in objetos])))
+
+
+def como_filas(modelo, esquema, objetos):
+    claves = [c.key for c in columnas(modelo, esquema)]
+    return [tuple(getattr(o, clave) for clave in claves) for o in objetos], claves
+
+
+class TestListados:
+    def test_columnas_en_orden_del_esquema(self):
+        claves = [c.key for c in columnas(models.Estructura, schemas.Estructura)]
+        assert claves == [campo for campo in schemas.Estructura.model_fields]
+
+    def test_desde_objetos_igual_al_camino_anterior(self):
+        for esquema, objetos in ((schemas.Estructura, estructuras(20)), (schemas.Siembra, siembras(20))):
+            assert json.loads(desde_objetos(esquema, objetos).body) == camino_anterior(esquema, objetos)
+
+    def test_desde_filas_igual_al_camino_anterior(self):
+        print("Probando que las tuplas codificadas con orjson equivalen a la validación Pydantic")
+        for modelo, esquema, objetos in ((models.Estructura, schemas.Estructura, estructuras(20)),
+                                         (models.Siembra, schemas.Siembra, siembras(20))):
+            filas, claves = como_filas(modelo, esquema, objetos)
+            assert json.loads(desde_filas(filas, claves).body) == camino_anterior(esquema, objetos)
+
+    def test_lista_vacia(self):
+        assert desde_filas([]).body == b"[]"
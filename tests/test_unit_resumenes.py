@@ -0,0 +1,128 @@
+"""
+Pruebas unitarias para los resúmenes de lecturas de sensores
+"""
+from datetime import datetime, timedelta
+import uuid
+import pytest
+from sqlalchemy.orm import sessionmaker
+from backend import models, resumenes, schemas
+from backend.telemetria import BufferLecturas
+
+
+class TestTruncar:
+    def test_alinea_al_intervalo(self):
+        fecha = datetime(2026, 10, 19, 15, 37, 42, 500000)
+        assert resumenes.truncar(fecha, 60) == datetime(2026, 10, 19, 15, 37)
+        assert resumenes.truncar(fecha, 3600) == datetime(2026, 10, 19, 15, 0)
+        assert resumenes.truncar(fecha, 86400) == datetime(2026, 10, 19)
+
+    def test_inicio_exacto_no_cambia(self):
+        assert resumenes.truncar(datetime(2026, 10, 19, 15, 0), 3600) == datetime(2026, 10, 19, 15, 0)
+
+
+class TestElegirResolucion:
+    def test_rango_corto_usa_minutos(self):
+        # 1 hora con 1000 puntos: cabe todo a resolución de minuto (o crudas)
+        assert resumenes.elegir_resolucion(3600, 1000) == (60, 60)
+
+    def test_mes_con_presupuesto_pequeno(self):
+        print("Probando selección de nivel para un mes")
+        nivel, ancho = resumenes.elegir_resolucion(30 * 86400, 500)
+        print(f"Nivel: {nivel}, ancho: {ancho}")
+        assert nivel == 3600
+        assert ancho % nivel == 0
+        assert 30 * 86400 / ancho <= 500
+
+    def test_anos_usan_nivel_diario(self):
+        nivel, ancho = resumenes.elegir_resolucion(3 * 365 * 86400, 100)
+        assert nivel == 86400
+        assert ancho == 11 * 86400
+
+
+@pytest.fixture
+def estructura(db_session):
+    """Estructura nueva (con su empresa, sede, bloque y espacio) para aislar las lecturas"""
+    sufijo = uuid.uuid4().hex[:8]
+    empresa = models.Empresa(nombre=f"Empresa {sufijo}", nit=f"RES{sufijo}")
+    sede = models.Sede(empresa=empresa, nombre="Sede")
+    bloque = models.Bloque(sede=sede, nombre="Bloque")
+    espacio = models.Espacio(bloque=bloque, tipo_espacio=models.TipoEspacio(nombre="Invernadero"), nombre="Espacio")
+    estructura = models.Estructura(espacio=espacio, tipo_estructura=models.TipoEstructura(nombre="NFT"),
+                                   codigo=f"RES-{sufijo}", nombre="Canal")
+    db_session.add(estructura)
+    db_session.commit()
+    yield estructura.id
+    db_session.query(models.LecturaSensorResumen).filter_by(estructura_id=estructura.id).delete()
+    db_session.query(models.LecturaSensor).filter_by(estructura_id=estructura.id).delete()
+    db_session.delete(estructura)
+    db_session.commit()
+
+
+class TestSerie:
+    inicio = datetime(2020, 1, 1)
+
+    def _cargar(self, db_session, estructura_id, minutos):
+        db_session.add_all(models.LecturaSensor(estructura_id=estructura_id, metrica="ph",
+                                                fecha=self.inicio + timedelta(seconds=10 * i), valor=float(i % 6))
+                           for i in range(minutos * 6))
+        db_session.commit()
+
+    def test_crudas_si_caben(self, db_session, estructura):
+        self._cargar(db_session, estructura, 2)
+        serie = resumenes.serie(db_session, estructura, "ph", self.inicio, self.inicio + timedelta(hours=1), 1000)
+        assert serie.resolucion == 0
+        assert len(serie.tiempos) == 12
+        assert serie.minimo == serie.maximo == serie.promedio
+
+    def test_resumida_respeta_presupuesto(self, db_session, estructura):
+        print("Probando serie resumida de 2 horas en 12 puntos")
+        self._cargar(db_session, estructura, 120)
+        fin = self.inicio + timedelta(hours=2)
+        resumenes.resumir(db_session, 60, self.inicio, fin)
+        db_session.commit()
+        serie = resumenes.serie(db_session, estructura, "ph", self.inicio, fin, 12)
+        print(f"Resolución: {serie.resolucion}, puntos: {len(serie.tiempos)}")
+        assert serie.resolucion == 600
+        assert len(serie.tiempos) == 12
+        assert serie.tiempos[1] - serie.tiempos[0] == timedelta(minutes=10)
+        assert serie.minimo[0] == 0 and serie.maximo[0] == 5
+        assert serie.promedio[0] == pytest.approx(2.5)
+        assert sum(serie.cantidad) == 720
+
+
+class TestLecturasTardias:
+    inicio = datetime(2020, 1, 1)
+
+    def test_se_vuelven_a_resumir(self, db_session, estructura):
+        print("Probando que una lectura anterior a la marca corrige los resúmenes de minuto, hora y día")
+        fin = self.inicio + timedelta(hours=2)
+        db_session.add_all(models.LecturaSensor(estructura_id=estructura, metrica="ph",
+                                                fecha=self.inicio + timedelta(minutes=i), valor=6.0)
+                           for i in range(120))
+        db_session.flush()
+        for resolucion in resumenes.RESOLUCIONES:
+            resumenes.resumir(db_session, resolucion, self.inicio, fin)
+            db_session.merge(models.ResumenMarca(resolucion=resolucion, hasta=resumenes.truncar(fin, resolucion)))
+        db_session.commit()
+
+        fabrica = sessionmaker(bind=db_session.get_bind(), join_transaction_mode="create_savepoint")
+        buffer = BufferLecturas(fabrica, tamano_lote=1000)
+        buffer.agregar([schemas.LecturaSensorCreate(estructura_id=estructura, metrica="ph", valor=9.0,
+                                                    fecha=self.inicio + timedelta(minutes=90, seconds=30))])
+        buffer.vaciar()
+        assert db_session.query(models.ResumenPendiente).count() == 1
+
+        escritas = resumenes.actualizar(db_session, ahora=fin + timedelta(seconds=resumenes.RETRASO))
+        print(f"Filas reescritas: {escritas}")
+        assert escritas == {60: 1, 3600: 1}
+        assert db_session.query(models.ResumenPendiente).count() == 0
+        hora = db_session.get(models.LecturaSensorResumen, (estructura, "ph", 3600, self.inicio + timedelta(hours=1)))
+        assert hora.maximo == 9.0 and hora.cantidad == 61
+        serie = resumenes.serie(db_session, estructura, "ph", self.inicio, fin, 2)
+        assert serie.maximo == [6.0, 9.0]
+
+    def test_posteriores_a_la_marca_no_se_anotan(self, db_session):
+        db_session.merge(models.ResumenMarca(resolucion=60, hasta=self.inicio))
+        db_session.flush()
+        resumenes.marcar_tardias(db_session, [self.inicio, self.inicio - timedelta(seconds=1)])
+        assert [p.inicio for p in db_session.query(models.ResumenPendiente)] == [self.inicio - timedelta(minutes=1)]
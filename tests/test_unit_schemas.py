@@ -147,13 +147,13 @@ class TestUsuarioSchemas:
             persona_id=1,
             empresa_id=1,
             username="testuser",
-            password_hash="hashed_password",
+            password="secreta",
             auto_registro=False
         )
         assert usuario.persona_id == 1
         assert usuario.empresa_id == 1
         assert usuario.username == "testuser"
-        assert usuario.password_hash == "hashed_password"
+        assert usuario.password == "secreta"
         assert usuario.auto_registro is False
     
     def test_usuario_create_required_fields(self):
@@ -163,7 +163,7 @@ class TestUsuarioSchemas:
                 persona_id=1,
                 empresa_id=1,
                 username="test"
-                # Falta password_hash
+                # Falta password
             )
 
 
@@ -0,0 +1,145 @@
+"""
+Pruebas unitarias para el buffer de lecturas de sensores
+"""
+from datetime import datetime, timedelta, timezone
+import logging
+import pytest
+from sqlalchemy.orm import sessionmaker
+from backend import models, schemas
+from backend.telemetria import (BufferLecturas, BufferLleno, DemasiadasMetricas, EstructurasValidas, LoteRechazado,
+                                a_utc)
+
+
+def lectura(estructura_id=1, metrica="ph", valor=6.0, fecha=None):
+    return schemas.LecturaSensorCreate(estructura_id=estructura_id, metrica=metrica, valor=valor, fecha=fecha)
+
+
+class TestAUtc:
+    def test_convierte_zona_horaria(self):
+        fecha = datetime(2026, 10, 19, 10, 0, tzinfo=timezone(timedelta(hours=-5)))
+        assert a_utc(fecha) == datetime(2026, 10, 19, 15, 0)
+
+    def test_fecha_nula_es_ahora(self):
+        assert abs(a_utc(None) - datetime.utcnow()) < timedelta(seconds=5)
+
+
+class TestBufferLecturas:
+    def test_agregar_y_recuperar_filas(self):
+        print("Probando buffer columnar de lecturas")
+        buffer = BufferLecturas(tamano_lote=1000)
+        fecha = datetime(2026, 10, 19, 15, 0, 0, 250000)
+        buffer.agregar([lectura(1, "ph", 6.2, fecha), lectura(2, "ec", 1.5, fecha), lectura(1, "ph", 6.3, fecha)])
+        assert len(buffer) == 3
+        filas = list(buffer._filas(buffer._tomar()))
+        print(f"Filas: {filas}")
+        assert filas[0] == (1, "ph", fecha, 6.2)
+        assert filas[1] == (2, "ec", fecha, 1.5)
+        assert len(buffer) == 0
+
+    def test_devolver_conserva_orden(self):
+        buffer = BufferLecturas(tamano_lote=1000)
+        buffer.agregar([lectura(valor=1.0)])
+        tomadas = buffer._tomar()
+        buffer.agregar([lectura(valor=2.0)])
+        buffer._devolver(tomadas)
+        assert [fila[3] for fila in buffer._filas(buffer._tomar())] == [1.0, 2.0]
+
+    def test_buffer_lleno(self):
+        buffer = BufferLecturas(tamano_lote=1000, capacidad_maxima=2)
+        buffer.agregar([lectura(), lectura()])
+        with pytest.raises(BufferLleno):
+            buffer.agregar([lectura()])
+
+    def test_tope_de_metricas(self):
+        buffer = BufferLecturas(tamano_lote=1000, max_metricas=2)
+        buffer.agregar([lectura(metrica="ph"), lectura(metrica="ec")])
+        buffer.agregar([lectura(metrica="ph")])
+        with pytest.raises(DemasiadasMetricas):
+            buffer.agregar([lectura(metrica="temperatura")])
+        assert len(buffer) == 3
+
+    def test_reintentos_limitados(self):
+        def sin_base():
+            raise ConnectionError("sin base")
+        buffer = BufferLecturas(sin_base, tamano_lote=1000, max_reintentos=2)
+        buffer.agregar([lectura(), lectura()])
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                buffer.vaciar()
+            assert len(buffer) == 2
+        with pytest.raises(ConnectionError):
+            buffer.vaciar()
+        assert len(buffer) == 0 and buffer.descartadas == 2
+
+    def test_descarte_en_una_linea(self, caplog):
+        def sin_base():
+            raise ConnectionError("sin base")
+        buffer = BufferLecturas(sin_base, tamano_lote=1000, max_reintentos=0)
+        buffer.agregar([lectura(valor=float(v)) for v in range(50)])
+        with caplog.at_level(logging.ERROR, logger="backend.telemetria"), pytest.raises(ConnectionError):
+            buffer.vaciar()
+        assert buffer.descartadas == 50
+        assert len(caplog.records) == 1 and caplog.records[0].getMessage().startswith("50 lecturas descartadas")
+
+    def test_no_reencola_lo_confirmado(self, monkeypatch):
+        print("Probando que un fallo a mitad de la bisección solo devuelve lo que no se confirmó")
+        buffer = BufferLecturas(tamano_lote=1000)
+        buffer.agregar([lectura(valor=float(v)) for v in range(4)])
+        escritas = []
+
+        def escribir(columnas):
+            valores = list(columnas.valores)
+            if len(valores) == 4:
+                raise LoteRechazado("fila inválida")
+            if valores == [2.0, 3.0]:
+                raise ConnectionError("se cayó la conexión")
+            escritas.extend(valores)
+        monkeypatch.setattr(buffer, "_escribir", escribir)
+        monkeypatch.setattr(buffer, "_sin_estructuras_borradas", lambda columnas: columnas)
+        with pytest.raises(ConnectionError):
+            buffer.vaciar()
+        assert escritas == [0.0, 1.0]
+        assert [fila[3] for fila in buffer._filas(buffer._tomar())] == [2.0, 3.0]
+        assert buffer.descartadas == 0
+
+
+@pytest.fixture
+def estructura_id(db_session):
+    empresa = models.Empresa(nombre="Telemetría")
+    espacio = models.Espacio(bloque=models.Bloque(sede=models.Sede(empresa=empresa, nombre="Sede"), nombre="Bloque"),
+                             tipo_espacio=models.TipoEspacio(nombre="Invernadero"), nombre="Espacio")
+    estructura = models.Estructura(espacio=espacio, tipo_estructura=models.TipoEstructura(nombre="Mesa"),
+                                   nombre="Mesa")
+    db_session.add(estructura)
+    db_session.flush()
+    return estructura.id
+
+
+class TestEscrituraEnBase:
+    def test_filas_invalidas_no_bloquean_el_lote(self, db_session, estructura_id):
+        print("Probando que una lectura de una estructura borrada no devuelve el lote al buffer")
+        fabrica = sessionmaker(bind=db_session.get_bind(), join_transaction_mode="create_savepoint")
+        buffer = BufferLecturas(fabrica, tamano_lote=1000)
+        buffer.agregar([lectura(estructura_id, valor=1.0), lectura(2_000_000_000, valor=2.0),
+                        lectura(estructura_id, valor=3.0)])
+        assert buffer.vaciar() == 3
+        assert len(buffer) == 0 and buffer.descartadas == 1
+        valores = [v for (v,) in db_session.query(models.LecturaSensor.valor).filter_by(estructura_id=estructura_id)]
+        assert sorted(valores) == [1.0, 3.0]
+
+    def test_aisla_filas_rechazadas_por_la_base(self, db_session, estructura_id):
+        fabrica = sessionmaker(bind=db_session.get_bind(), join_transaction_mode="create_savepoint")
+        buffer = BufferLecturas(fabrica, tamano_lote=1000)
+        # Una métrica más larga que la columna: la rechaza la base, no la clave foránea
+        buffer.agregar([lectura(estructura_id, valor=v) for v in (1.0, 2.0, 3.0)])
+        buffer.agregar([lectura(estructura_id, metrica="larga", valor=4.0)])
+        buffer._metricas[buffer._codigos["larga"]] = "x" * 300
+        assert buffer.vaciar() == 4
+        assert buffer.descartadas == 1
+        assert db_session.query(models.LecturaSensor).filter_by(estructura_id=estructura_id).count() == 3
+
+    def test_estructura_de_otro_worker(self, db_session, estructura_id):
+        validas = EstructurasValidas()
+        validas._ids, validas._cargado_en = set(), float("inf")
+        assert validas.desconocidas(db_session, [estructura_id, 2_000_000_000]) == [2_000_000_000]
+        assert estructura_id in validas._ids
@@ -0,0 +1,62 @@
+"""
+Pruebas unitarias para el desglose Server-Timing
+"""
+import logging
+import time
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from backend.consultas import MedirConsultas, Registro
+from backend.tiempos import ServerTiming, desglose, encabezado, medir
+
+
+def app_con(db_session, umbral_lento=10.0):
+    app = FastAPI()
+
+    @app.get("/lenta")
+    def lenta():
+        with medir("orm"):
+            db_session.execute(text("SELECT pg_sleep(0.02)"))
+            time.sleep(0.01)
+        with medir("json"):
+            time.sleep(0.005)
+        return {"ok": True}
+
+    app.add_middleware(ServerTiming, umbral_lento=umbral_lento, muestreo=1.0)
+    app.add_middleware(MedirConsultas)
+    return TestClient(app)
+
+
+class TestDesglose:
+    def test_app_es_el_resto(self):
+        registro = Registro(segundos=0.030, espera_pool=0.001)
+        partes = desglose({"orm": 0.010, "json": 0.004}, 0.050, registro)
+        assert abs(partes["app"] - 0.005) < 1e-9
+
+    def test_encabezado(self):
+        valor = encabezado({"pool": 0.0, "db": 0.0123, "json": 0.002, "app": 0.001}, 0.0153)
+        assert valor == ('db;dur=12.3;desc="Base de datos", json;dur=2.0;desc="JSON", '
+                         'app;dur=1.0;desc="Endpoint", total;dur=15.3')
+
+    def test_medir_fuera_de_peticion(self):
+        with medir("orm"):
+            pass
+
+
+class TestServerTiming:
+    def test_descuenta_db_de_orm(self, db_session):
+        print("Probando que el tiempo de la consulta no se cuenta dos veces")
+        db_session.execute(text("SELECT 1"))  # abrir la conexión antes: el pool de prueba no mide la espera
+        response = app_con(db_session).get("/lenta")
+        fases = {parte.split(";")[0].strip(): float(parte.split("dur=")[1].split(";")[0])
+                 for parte in response.headers["server-timing"].split(",")}
+        print(f"Fases: {fases}")
+        assert fases["db"] >= 20
+        assert 10 <= fases["orm"] < 20
+        assert fases["json"] >= 5
+        assert response.headers["timing-allow-origin"] == "*"
+
+    def test_registra_peticiones_lentas(self, db_session, caplog):
+        with caplog.at_level(logging.WARNING, logger="backend.tiempos"):
+            app_con(db_session, umbral_lento=0.0).get("/lenta")
+        assert '"ruta": "/lenta"' in caplog.text and '"db_ms"' in caplog.text
@@ -0,0 +1,96 @@
+"""
+Pruebas unitarias para los tokens de sesión firmados
+"""
+import pytest
+from backend import tokens
+from backend.tokens import (FirmadorTokens, TokenInvalido, roles_a_bitset, bitset_a_roles, hash_password,
+                           verificar_password)
+
+
+@pytest.fixture
+def firmador():
+    return FirmadorTokens({"k1": b"secreto-1"}, "k1", duracion=60)
+
+
+class TestBitsetRoles:
+    def test_ida_y_vuelta(self):
+        print("Probando conversión de roles a bitset")
+        bits = roles_a_bitset([1, 3, 70])
+        assert bitset_a_roles(bits) == [1, 3, 70]
+
+    def test_sin_roles(self):
+        assert roles_a_bitset([]) == 0
+        assert bitset_a_roles(0) == []
+
+
+class TestFirmadorTokens:
+    def test_emitir_y_verificar(self, firmador):
+        print("Probando emisión y verificación de token")
+        token = firmador.emitir(7, 2, [1, 4], ahora=1000)
+        claims = firmador.verificar(token, ahora=1010)
+        print(f"Claims: {claims}")
+        assert claims.usuario_id == 7
+        assert claims.empresa_id == 2
+        assert claims.rol_ids == [1, 4]
+        assert claims.tiene_rol(4)
+        assert not claims.tiene_rol(2)
+        assert claims.exp == 1060
+
+    def test_token_expirado(self, firmador):
+        token = firmador.emitir(7, 2, [], ahora=1000)
+        with pytest.raises(TokenInvalido):
+            firmador.verificar(token, ahora=1061)
+        assert firmador.verificar(token, ahora=1061, margen=10).usuario_id == 7
+
+    def test_firma_alterada(self, firmador):
+        kid, cuerpo, firma = firmador.emitir(7, 2, [1]).split(".")
+        otro_cuerpo = firmador.emitir(8, 2, [1]).split(".")[1]
+        with pytest.raises(TokenInvalido):
+            firmador.verificar(f"{kid}.{otro_cuerpo}.{firma}")
+
+    def test_token_mal_formado(self, firmador):
+        with pytest.raises(TokenInvalido):
+            firmador.verificar("no-es-un-token")
+
+    def test_token_no_ascii(self, firmador):
+        kid, cuerpo, firma = firmador.emitir(7, 2, [1]).split(".")
+        with pytest.raises(TokenInvalido):
+            firmador.verificar(f"{kid}.{cuerpo}ñ.{firma}")
+        with pytest.raises(TokenInvalido):
+            firmador.verificar(f"{kid}.{cuerpo}.{firma}ñ")
+
+    def test_rotacion_de_claves(self, firmador):
+        print("Probando rotación de claves")
+        viejo = firmador.emitir(7, 2, [1])
+        firmador.rotar("k2", b"secreto-2")
+        nuevo = firmador.emitir(7, 2, [1])
+        assert nuevo.startswith("k2.")
+        assert firmador.verificar(viejo).usuario_id == 7
+        assert firmador.verificar(nuevo).usuario_id == 7
+        firmador.retirar("k1")
+        with pytest.raises(TokenInvalido):
+            firmador.verificar(viejo)
+
+    def test_no_retirar_clave_activa(self, firmador):
+        with pytest.raises(ValueError):
+            firmador.retirar("k1")
+
+    def test_token_keys_con_punto(self, monkeypatch):
+        monkeypatch.setenv("TOKEN_KEYS", "k.1:secreto")
+        with pytest.raises(ValueError):
+            tokens._cargar_claves()
+
+
+class TestPassword:
+    def test_hash_y_verificacion(self):
+        print("Probando derivación y verificación de contraseñas con scrypt")
+        guardado = hash_password("clave segura")
+        assert guardado.startswith("scrypt$") and "clave segura" not in guardado
+        assert guardado != hash_password("clave segura")  # sal distinta
+        assert verificar_password("clave segura", guardado)
+        assert not verificar_password("otra", guardado)
+
+    def test_hash_como_password_no_sirve(self):
+        guardado = hash_password("clave")
+        assert not verificar_password(guardado, guardado)
+        assert not verificar_password("hashed_password", "hashed_password")